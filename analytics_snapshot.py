@@ -0,0 +1,270 @@
+"""
+Columnar in-process analytics over a cached Arrow snapshot of the requests.
+
+The request columns the dashboards group by are downloaded (as Arrow record
+batches, see export.py) into an Arrow IPC file on local disk every
+ANALYTICS_SNAPSHOT_SECONDS. The file is memory-mapped rather than loaded, so
+it costs page cache instead of heap and workers on the same host share it.
+Group-bys by branch, card, requester, status and month are answered with
+vectorized pyarrow compute over the mapped columns, in milliseconds and with
+no BigQuery job.
+
+The snapshot is taken from `source`: discount_requests, or request_state
+when the app runs with EVENT_SOURCED_REQUESTS=true.
+
+A stale snapshot keeps serving while a background thread refreshes it.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, time as dt_time, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from export import iter_record_batches
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_SNAPSHOT_PATH = os.getenv('ANALYTICS_SNAPSHOT_PATH', '/tmp/discount_analytics_snapshot.arrow')
+ANALYTICS_SNAPSHOT_SECONDS = int(os.getenv('ANALYTICS_SNAPSHOT_SECONDS', 900))
+
+SNAPSHOT_SCHEMA = pa.schema([
+    ('enquiry_no', pa.string()),
+    ('branch_name', pa.string()),
+    ('card_name', pa.string()),
+    ('requester_email', pa.string()),
+    ('status', pa.string()),
+    ('created_at', pa.timestamp('us', tz='UTC')),
+    ('month', pa.string()),
+    ('mrp', pa.float64()),
+    ('installment', pa.float64()),
+    ('discount_percentage', pa.float64()),
+    ('net_discount', pa.float64()),
+    ('is_approved', pa.int64()),
+    ('is_rejected', pa.int64()),
+    ('is_pending', pa.int64()),
+])
+
+# API names for the columns a summary can be grouped by
+GROUP_COLUMNS = {
+    'branch': 'branch_name',
+    'card': 'card_name',
+    'requester': 'requester_email',
+    'status': 'status',
+    'month': 'month',
+}
+
+
+def snapshot_query(project_id, dataset_id, source='discount_requests'):
+    """Legacy-view columns of a request table plus the derived month and status flags, computed by BigQuery."""
+    return f"""
+        SELECT
+            enquiry_no, branch_name, card_name, requester_email, status,
+            CAST(created_at AS TIMESTAMP) AS created_at,
+            FORMAT_TIMESTAMP('%Y-%m', CAST(created_at AS TIMESTAMP)) AS month,
+            CAST(mrp AS FLOAT64) AS mrp,
+            CAST(installment AS FLOAT64) AS installment,
+            CAST(discount_percentage AS FLOAT64) AS discount_percentage,
+            CAST(net_discount AS FLOAT64) AS net_discount,
+            IF(status = 'APPROVED', 1, 0) AS is_approved,
+            IF(status = 'REJECTED', 1, 0) AS is_rejected,
+            IF(STARTS_WITH(status, 'PENDING'), 1, 0) AS is_pending
+        FROM `{project_id}.{dataset_id}.{source}`
+    """
+
+
+def write_snapshot(batches, path):
+    """Write record batches to an Arrow IPC file atomically. Returns the row count."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    rows = 0
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, SNAPSHOT_SCHEMA) as writer:
+            for batch in batches:
+                writer.write_table(pa.Table.from_batches([batch]).select(SNAPSHOT_SCHEMA.names)
+                                   .cast(SNAPSHOT_SCHEMA))
+                rows += batch.num_rows
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+
+def read_snapshot(path):
+    """Memory-map a snapshot file as a Table (zero-copy)."""
+    source = pa.memory_map(path, 'r')
+    return pa.ipc.open_file(source).read_all()
+
+
+def _day_start(day):
+    return pa.scalar(datetime.combine(day, dt_time.min, tzinfo=timezone.utc), pa.timestamp('us', tz='UTC'))
+
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+class AnalyticsSnapshot:
+    """Refreshing, memory-mapped snapshot of the requests with aggregate queries."""
+
+    def __init__(self, client_getter, project_id, dataset_id, path=ANALYTICS_SNAPSHOT_PATH,
+                 ttl=ANALYTICS_SNAPSHOT_SECONDS, source='discount_requests'):
+        self.client_getter = client_getter
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.source = source
+        self.path = path
+        self.ttl = ttl
+        self._table = None
+        self._snapshot_at = 0.0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+
+    def _file_age(self):
+        try:
+            return time.time() - os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def refresh(self):
+        """Download a fresh snapshot and map it. Returns False when it could not be refreshed."""
+        client = self.client_getter()
+        if not client:
+            logger.error("BigQuery client not available for analytics snapshot")
+            return False
+        try:
+            started = time.monotonic()
+            query = snapshot_query(self.project_id, self.dataset_id, self.source)
+            rows = write_snapshot(iter_record_batches(client, query, []), self.path)
+            table = read_snapshot(self.path)
+        except Exception as e:
+            logger.error(f"Error refreshing analytics snapshot: {e}")
+            return False
+        with self._lock:
+            self._table = table
+            self._snapshot_at = time.time()
+        logger.info(f"Analytics snapshot refreshed: {rows} rows in {time.monotonic() - started:.1f}s")
+        return True
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def table(self):
+        """The current snapshot, refreshing it if stale. None only if none was ever loaded."""
+        with self._lock:
+            table, fresh = self._table, time.time() - self._snapshot_at < self.ttl
+        if table is not None and fresh:
+            return table
+
+        if table is None:
+            # First use in this process: concurrent callers wait for one load
+            with self._load_lock:
+                if self._table is not None:
+                    return self._table
+                # Another worker (or an earlier run) may have left a fresh file on disk
+                age = self._file_age()
+                if age is not None and age < self.ttl:
+                    try:
+                        table = read_snapshot(self.path)
+                        with self._lock:
+                            self._table = table
+                            self._snapshot_at = time.time() - age
+                        return table
+                    except Exception as e:
+                        logger.warning(f"Ignoring unreadable analytics snapshot {self.path}: {e}")
+                self.refresh()
+                return self._table
+
+        with self._lock:
+            if self._refreshing:
+                return table
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return table
+
+    def snapshot_at(self):
+        return self._snapshot_at or None
+
+    def summarize(self, group_by=(), branch=None, status=None, date_from=None, date_to=None, scope=None):
+        """
+        Aggregate the snapshot, grouped by GROUP_COLUMNS names.
+
+        Each result has the group values plus total, approved, rejected,
+        pending, approval_rate (approved / decided), avg_discount_percentage,
+        total_net_discount and approved_net_discount. date_to is inclusive;
+        scope (a QueueScope) limits the branches counted.
+        """
+        unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Cannot group by: {', '.join(unknown)}")
+        if date_from and date_to and date_from > date_to:
+            raise ValueError("The start date must not be after the end date")
+
+        table = self.table()
+        if table is None:
+            return []
+
+        mask = None
+
+        def narrow(condition):
+            nonlocal mask
+            mask = condition if mask is None else pc.and_(mask, condition)
+
+        if branch:
+            narrow(pc.equal(table['branch_name'], branch))
+        if status:
+            narrow(pc.equal(table['status'], status))
+        if date_from:
+            narrow(pc.greater_equal(table['created_at'], _day_start(date_from)))
+        if date_to:
+            narrow(pc.less(table['created_at'], _day_start(date_to + timedelta(days=1))))
+        if scope is not None and scope.branch_in is not None:
+            narrow(pc.is_in(table['branch_name'], value_set=pa.array(list(scope.branch_in), pa.string())))
+        if scope is not None and scope.branch_not_in is not None:
+            narrow(pc.invert(pc.is_in(table['branch_name'],
+                                      value_set=pa.array(list(scope.branch_not_in), pa.string()))))
+        if mask is not None:
+            table = table.filter(mask)
+
+        table = table.append_column('approved_net_discount',
+                                    pc.multiply(table['net_discount'], table['is_approved']))
+        keys = [GROUP_COLUMNS[name] for name in group_by]
+        aggregated = table.group_by(keys).aggregate([
+            ([], 'count_all'),
+            ('is_approved', 'sum'),
+            ('is_rejected', 'sum'),
+            ('is_pending', 'sum'),
+            ('discount_percentage', 'mean'),
+            ('net_discount', 'sum'),
+            ('approved_net_discount', 'sum'),
+        ])
+        if keys:
+            aggregated = aggregated.sort_by([(key, 'ascending') for key in keys])
+
+        results = []
+        for row in aggregated.to_pylist():
+            if not row['count_all']:
+                continue
+            approved, rejected = row['is_approved_sum'] or 0, row['is_rejected_sum'] or 0
+            result = {name: row[GROUP_COLUMNS[name]] for name in group_by}
+            result.update({
+                'total': row['count_all'],
+                'approved': approved,
+                'rejected': rejected,
+                'pending': row['is_pending_sum'] or 0,
+                'approval_rate': _ratio(approved, approved + rejected),
+                'avg_discount_percentage': (round(row['discount_percentage_mean'], 2)
+                                            if row['discount_percentage_mean'] is not None else None),
+                'total_net_discount': round(row['net_discount_sum'] or 0, 2),
+                'approved_net_discount': round(row['approved_net_discount_sum'] or 0, 2),
+            })
+            results.append(result)
+        return results
@@ -0,0 +1,259 @@
+"""
+Risk scoring of discount requests at submission time.
+
+The scorer keeps rolling statistics in memory and compares each new request
+against them, with no BigQuery query on the submit path:
+
+- per branch/card (falling back to the branch while a card has little
+  history): running mean and variance of the discount percentage (Welford)
+  and a percentile sketch (one-point buckets of the discount percentage);
+- per requester: the same sketch, to spot a discount far above their usual,
+  and their submission times over the last RISK_RATE_WINDOW_SECONDS;
+- recent submissions by mobile number and by requester/card/discount, to
+  spot near-duplicates under a different enquiry number.
+
+score() returns a 0-100 risk score with the reasons behind it; it is stored
+with the request (risk_score, risk_reasons) and shown on the approval queue.
+Like the search index, the scorer is seeded from the request event log's
+projection and kept current by subscribing to its submissions, so requests
+from every worker count. Seeding runs on a background thread; until it
+finishes, requests are scored against empty statistics. Near-duplicate
+entries older than RISK_DUPLICATE_WINDOW_SECONDS are dropped as new
+submissions arrive.
+"""
+
+import os
+import math
+import logging
+import threading
+from collections import deque
+
+from request_events import EVENT_SUBMITTED
+from sla_tracker import to_epoch
+
+logger = logging.getLogger(__name__)
+
+RISK_RATE_WINDOW_SECONDS = int(os.getenv('RISK_RATE_WINDOW_SECONDS', 3600))
+# Submissions per requester within the window considered normal
+RISK_RATE_LIMIT = int(os.getenv('RISK_RATE_LIMIT', 10))
+RISK_DUPLICATE_WINDOW_SECONDS = int(os.getenv('RISK_DUPLICATE_WINDOW_SECONDS', 7 * 86400))
+# Requests a group needs before its statistics are trusted
+RISK_MIN_HISTORY = int(os.getenv('RISK_MIN_HISTORY', 20))
+# Scores at or above this are highlighted for approvers
+RISK_REVIEW_SCORE = int(os.getenv('RISK_REVIEW_SCORE', 50))
+
+# Maximum points each signal adds to the score
+WEIGHTS = {'outlier': 35, 'requester_outlier': 15, 'rate': 25, 'duplicate': 25}
+
+
+def _clamp(value):
+    return min(1.0, max(0.0, value))
+
+
+class RunningStats:
+    """Count, mean and variance of a stream of values (Welford's algorithm)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def z_score(self, value):
+        std = self.std
+        return (value - self.mean) / std if std > 0 else 0.0
+
+
+class PercentileSketch:
+    """Fixed one-point buckets over 0-100%; percentile ranks in O(buckets)."""
+
+    BUCKETS = 101
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+
+    def _bucket(self, value):
+        return min(self.BUCKETS - 1, max(0, int(value)))
+
+    def add(self, value):
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+
+    def rank(self, value):
+        """Fraction of values below value (half of its own bucket counts as below)."""
+        if not self.count:
+            return 0.0
+        bucket = self._bucket(value)
+        return (sum(self.counts[:bucket]) + self.counts[bucket] / 2) / self.count
+
+
+class GroupStats:
+    def __init__(self):
+        self.stats = RunningStats()
+        self.sketch = PercentileSketch()
+
+    def add(self, value):
+        self.stats.add(value)
+        self.sketch.add(value)
+
+
+class RiskScorer:
+    """Rolling per-group statistics of submitted requests, and the scores derived from them."""
+
+    def __init__(self, event_log=None):
+        self.event_log = event_log
+        self.seeded = False
+        self._groups = {}
+        self._requester_times = {}
+        self._by_mobile = {}
+        self._by_offer = {}
+        self._lock = threading.RLock()
+        self._seeding = threading.Lock()
+
+    @staticmethod
+    def _percentage(row):
+        value = row.get('discount_percentage')
+        return float(value) if value is not None else None
+
+    @staticmethod
+    def _offer_key(row):
+        return (row.get('requester_email'), row.get('branch_name'), row.get('card_name'),
+                round(float(row.get('discount_amount') or 0)))
+
+    @staticmethod
+    def _remember(index, key, when, enquiry_no):
+        """Index a submission and drop entries older than the duplicate window."""
+        # Re-inserted keys move to the end, so the oldest entries come first
+        index.pop(key, None)
+        index[key] = (when, enquiry_no)
+        cutoff = when - RISK_DUPLICATE_WINDOW_SECONDS
+        while index:
+            oldest = next(iter(index))
+            if index[oldest][0] >= cutoff:
+                break
+            del index[oldest]
+
+    def observe(self, row, when=None):
+        """Add one submitted request to the statistics."""
+        when = when if when is not None else to_epoch(row.get('created_at'))
+        percentage = self._percentage(row)
+        with self._lock:
+            if percentage is not None:
+                for key in (('card', row.get('branch_name'), row.get('card_name')),
+                            ('branch', row.get('branch_name')),
+                            ('requester', row.get('requester_email'))):
+                    group = self._groups.get(key)
+                    if group is None:
+                        group = self._groups[key] = GroupStats()
+                    group.add(percentage)
+            if when is None:
+                return
+            times = self._requester_times.setdefault(row.get('requester_email'), deque())
+            times.append(when)
+            while times and times[0] < when - RISK_RATE_WINDOW_SECONDS:
+                times.popleft()
+            if row.get('mobile_no'):
+                self._remember(self._by_mobile, row['mobile_no'], when, row['enquiry_no'])
+            self._remember(self._by_offer, self._offer_key(row), when, row['enquiry_no'])
+
+    def _seed(self, rows):
+        if self.seeded:
+            return
+        # Built aside and swapped in, so scoring is not held up while seeding
+        seed = RiskScorer()
+        for row in sorted(rows, key=lambda row: row.get('created_at') or ''):
+            seed.observe(row)
+        with self._lock:
+            self._groups, self._requester_times = seed._groups, seed._requester_times
+            self._by_mobile, self._by_offer = seed._by_mobile, seed._by_offer
+            self.seeded = True
+        logger.info(f"Risk scorer seeded with {len(rows)} requests")
+
+    def ensure_seeded(self):
+        """Seed from the event log's projection once it is loaded."""
+        if self.event_log is None or self.seeded:
+            return True
+        if not self.event_log.ensure_loaded():
+            return False
+        self.event_log.with_rows(self._seed)
+        return True
+
+    def _seed_in_background(self):
+        try:
+            self.ensure_seeded()
+        except Exception as e:
+            logger.error(f"Risk scorer seeding failed: {e}")
+        finally:
+            self._seeding.release()
+
+    def seed_in_background(self):
+        """Start seeding on a background thread, unless seeded or already seeding (cheap to call per request)."""
+        if self.seeded or self.event_log is None or not self._seeding.acquire(blocking=False):
+            return
+        threading.Thread(target=self._seed_in_background, name='risk-scorer-seed', daemon=True).start()
+
+    def on_request_event(self, event, row, previous_status):
+        """RequestEventLog listener: count new submissions."""
+        if self.seeded and event['event_type'] == EVENT_SUBMITTED:
+            self.observe(row)
+
+    def _recent(self, index, key, now, enquiry_no):
+        match = index.get(key)
+        if match and match[1] != enquiry_no and now - match[0] <= RISK_DUPLICATE_WINDOW_SECONDS:
+            return match[1]
+        return None
+
+    def score(self, data, now):
+        """(score 0-100, reasons) for a request about to be submitted at epoch seconds now."""
+        percentage = self._percentage(data) or 0.0
+        signals = {}
+        reasons = []
+        with self._lock:
+            group = self._groups.get(('card', data.get('branch_name'), data.get('card_name')))
+            if group is None or group.stats.count < RISK_MIN_HISTORY:
+                group = self._groups.get(('branch', data.get('branch_name')))
+            if group is not None and group.stats.count >= RISK_MIN_HISTORY:
+                z_score = group.stats.z_score(percentage)
+                rank = group.sketch.rank(percentage)
+                signals['outlier'] = max(_clamp((z_score - 2) / 2), _clamp((rank - 0.95) / 0.05))
+                if signals['outlier'] > 0:
+                    reasons.append(f"Discount {percentage:.1f}% is above {rank:.0%} of similar requests "
+                                   f"(average {group.stats.mean:.1f}%)")
+
+            requester = self._groups.get(('requester', data.get('requester_email')))
+            if requester is not None and requester.stats.count >= RISK_MIN_HISTORY:
+                rank = requester.sketch.rank(percentage)
+                signals['requester_outlier'] = _clamp((rank - 0.9) / 0.1)
+                if signals['requester_outlier'] > 0:
+                    reasons.append(f"Higher than {rank:.0%} of this requester's discounts")
+
+            times = self._requester_times.get(data.get('requester_email'), ())
+            recent = sum(1 for when in times if when >= now - RISK_RATE_WINDOW_SECONDS)
+            signals['rate'] = _clamp((recent + 1 - RISK_RATE_LIMIT / 2) / (RISK_RATE_LIMIT / 2))
+            if recent + 1 > RISK_RATE_LIMIT / 2:
+                reasons.append(f"{recent + 1} requests from this requester in the last "
+                               f"{RISK_RATE_WINDOW_SECONDS // 60} minutes")
+
+            enquiry_no = data.get('enquiry_no')
+            duplicate = (self._recent(self._by_mobile, data.get('mobile_no'), now, enquiry_no)
+                         if data.get('mobile_no') else None)
+            if duplicate:
+                reasons.append(f"Same mobile number as {duplicate}")
+            else:
+                duplicate = self._recent(self._by_offer, self._offer_key(data), now, enquiry_no)
+                if duplicate:
+                    reasons.append(f"Same card and discount as {duplicate}")
+            signals['duplicate'] = 1.0 if duplicate else 0.0
+
+        score = sum(WEIGHTS[name] * value for name, value in signals.items())
+        return int(round(score)), reasons
@@ -1,14 +1,50 @@
 import os
+import base64
+import json
 import logging
 import re
-from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, session
+import time
+import threading
+from flask import Flask, Response, request, render_template, redirect, url_for, flash, jsonify, session
 from google.cloud import bigquery
 from google.cloud import secretmanager
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
 import smtplib
-from email.mime.text import MIMEText
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 from functools import wraps
+from approval_workflow import get_transition, apply_legacy_transition
+from request_events import RequestEventLog
+from catalog import CatalogCache
+from pricing_index import PricingIndex, reprice_course
+from discount_policy import DiscountPolicy
+from discount_simulator import DiscountSimulator, candidate_policy, SIMULATION_GROUPS
+from bulk_import import BulkImporter, iter_upload_rows, error_report_csv, REQUIRED_COLUMNS, OPTIONAL_COLUMNS
+from export import export_stream, export_filename, parse_date, EXPORT_SOURCES, EXPORT_FORMATS
+from analytics_snapshot import AnalyticsSnapshot
+from rollups import load_trends, local_today, ROLLUP_TIMEZONE
+from sla_tracker import SLATracker
+from search_index import SearchIndex
+from anomaly_scoring import RiskScorer, RISK_REVIEW_SCORE
+from approver_assignment import ApproverPools, ApproverAssigner
+from rate_limit import RateLimiter, client_ip, retry_after_header
+from cost_guard import GuardedClient
+from metrics import add_labels
+from student_profile import StudentHistoryCache, summarize_history
+from shadow_cutover import ShadowWriter, ShadowReader, CUTOVER_MODE, SHADOW_READ_SAMPLE_RATE
+from enhanced_data_access import DiscountDataAccess
+from notifications import (
+    build_request_context, render_notification, build_message,
+    L1_APPROVAL_REQUIRED, L2_APPROVAL_REQUIRED
+)
+from notification_digest import DigestScheduler
+from live_updates import LiveUpdateBroker, QueueScope
+from request_changes import (
+    decode_watermark, encode_watermark, settled_until, build_changes_response, CHANGES_PAGE_SIZE
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -44,33 +80,163 @@ app.config['SESSION_PERMANENT'] = False
 project_id = 'gewportal2025'
 dataset_id = 'discount_management'
 client = None
+_client_lock = threading.Lock()
+
+# In async serving mode (gevent, see gunicorn.conf.py) many requests share one
+# process, so the BigQuery HTTP connection pool must be sized to match
+SERVING_MODE = os.getenv('SERVING_MODE', 'sync').lower()
+
+
+def bigquery_http_pool_size(serving_mode=SERVING_MODE):
+    """Pooled HTTPS connections for the BigQuery client: BIGQUERY_HTTP_POOL_SIZE, else sized by serving mode."""
+    default = os.getenv('GUNICORN_WORKER_CONNECTIONS', 200) if serving_mode == 'async' else 10
+    return int(os.getenv('BIGQUERY_HTTP_POOL_SIZE', default))
+
+
+BIGQUERY_HTTP_POOL_SIZE = bigquery_http_pool_size()
+
+
+def bigquery_http_session(credentials, pool_size):
+    """Authorized session for bigquery.Client(_http=...) keeping pool_size connections per host."""
+    session = AuthorizedSession(credentials)
+    session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return session
+
 
 # Update BigQuery client initialization
 def get_bigquery_client():
     global client
     if client is None:
-        try:
-            # Try to use service account credentials first
-            credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-            if credentials_path and os.path.exists(credentials_path):
-                logger.info(f"Using service account credentials from: {credentials_path}")
-                credentials = service_account.Credentials.from_service_account_file(credentials_path)
-                client = bigquery.Client(project=project_id, credentials=credentials)
-            else:
-                # Fall back to Application Default Credentials
-                logger.info("Using Application Default Credentials")
-                client = bigquery.Client(project=project_id)
-            
-            # Test the connection
-            client.query("SELECT 1 as test").result()
-            logger.info(f"BigQuery client initialized successfully with project: {project_id}")
-        except Exception as e:
-            logger.error(f"Error initializing BigQuery client: {e}")
-            logger.warning("BigQuery operations will be disabled")
-            client = None
+        with _client_lock:
+            if client is not None:
+                return client
+            try:
+                # Try to use service account credentials first
+                credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+                if credentials_path and os.path.exists(credentials_path):
+                    logger.info(f"Using service account credentials from: {credentials_path}")
+                    credentials = service_account.Credentials.from_service_account_file(
+                        credentials_path, scopes=bigquery.Client.SCOPE)
+                else:
+                    # Fall back to Application Default Credentials
+                    logger.info("Using Application Default Credentials")
+                    credentials, _ = google.auth.default(scopes=bigquery.Client.SCOPE)
+                new_client = bigquery.Client(project=project_id, credentials=credentials,
+                                             _http=bigquery_http_session(credentials, BIGQUERY_HTTP_POOL_SIZE))
+                
+                # Test the connection
+                new_client.query("SELECT 1 as test").result()
+                client = GuardedClient(new_client)
+                logger.info(f"BigQuery client initialized successfully with project: {project_id}")
+            except Exception as e:
+                logger.error(f"Error initializing BigQuery client: {e}")
+                logger.warning("BigQuery operations will be disabled")
+                client = None
     return client
 
 
+# Append-only request event log (see request_events.py). Events are always
+# written; with EVENT_SOURCED_REQUESTS=true the request queue, dashboard and
+# approval transitions read from the in-memory projection instead of issuing
+# SELECT/UPDATE jobs against discount_requests
+EVENT_SOURCED_REQUESTS = os.getenv('EVENT_SOURCED_REQUESTS', 'false').lower() == 'true'
+REQUEST_EVENTS_SYNC_SECONDS = int(os.getenv('REQUEST_EVENTS_SYNC_SECONDS', 5))
+event_log = RequestEventLog(get_bigquery_client, project_id, dataset_id, sync_interval=REQUEST_EVENTS_SYNC_SECONDS)
+
+# Branch/card fee catalog, cached in process (CATALOG_CACHE_SECONDS)
+catalog = CatalogCache(get_bigquery_client, project_id, dataset_id)
+
+# Price-as-of-date lookups over pricing_history (PRICING_CACHE_SECONDS)
+pricing = PricingIndex(get_bigquery_client, project_id, dataset_id)
+
+# Discount rules per branch/card/approver level (DISCOUNT_POLICY_PATH)
+discount_policy = DiscountPolicy.load()
+
+# Memory-mapped Arrow snapshot of the requests for dashboard group-bys
+# (ANALYTICS_SNAPSHOT_PATH, refreshed every ANALYTICS_SNAPSHOT_SECONDS)
+analytics = AnalyticsSnapshot(get_bigquery_client, project_id, dataset_id,
+                              source='request_state' if EVENT_SOURCED_REQUESTS else 'discount_requests')
+
+# What-if policies over the same snapshot, as NumPy arrays
+simulator = DiscountSimulator(analytics)
+
+# Server-Sent Events for live queue/dashboard updates, fed by the event log
+live_updates = LiveUpdateBroker()
+event_log.subscribe(live_updates.on_request_event)
+
+
+def sla_queue_for(status, branch_name, assigned_to=None):
+    """Approver queue a pending request waits in (L2 approvers share one queue)."""
+    if status == 'PENDING_L1':
+        return assigned_to or 'unassigned'
+    return 'L2'
+
+
+def log_sla_breach(request_info, status, age_seconds, threshold_seconds):
+    logger.warning(f"SLA breach: {request_info['enquiry_no']} ({request_info['branch_name']}) has been "
+                   f"{status} in queue {request_info['queue']} for {age_seconds / 3600:.1f}h "
+                   f"(SLA {threshold_seconds / 3600:.0f}h)")
+
+
+# Approval SLA tracking (SLA_L1_HOURS / SLA_L2_HOURS), fed by the event log
+sla_tracker = SLATracker(event_log, sla_queue_for)
+event_log.subscribe(sla_tracker.on_request_event)
+sla_tracker.add_escalation_hook(log_sla_breach)
+
+# In-process search over requests, seeded from and kept current by the event log
+search_index = SearchIndex(event_log)
+event_log.subscribe(search_index.on_request_event)
+
+# Submission-time risk scores (RISK_*) from rolling statistics kept current by the event log
+risk_scorer = RiskScorer(event_log)
+event_log.subscribe(risk_scorer.on_request_event)
+
+# New requests go to one L1 approver of their branch's pool (APPROVER_POOLS_PATH),
+# balanced on live queue depth from the event log
+approver_pools = ApproverPools.load()
+approver_assigner = ApproverAssigner(approver_pools, event_log)
+event_log.subscribe(approver_assigner.on_request_event)
+
+
+def assign_approvers(branch_names):
+    """L1 approver for each new request in these branches."""
+    approver_assigner.ensure_seeded()
+    return approver_assigner.assign_many(branch_names)
+
+
+# Token buckets per IP and per user on logins and the unauthenticated APIs (RATE_LIMITS)
+rate_limiter = RateLimiter.from_env()
+
+
+def get_data_access():
+    """DiscountDataAccess over the normalized tables."""
+    return DiscountDataAccess(get_bigquery_client(), project_id, dataset_id)
+
+
+def load_student_history(enquiry_no):
+    return get_data_access().get_student_history(enquiry_no)
+
+
+# Per-student request history (STUDENT_HISTORY_CACHE_SIZE / _SECONDS), dropped on new events
+student_histories = StudentHistoryCache(load_student_history)
+event_log.subscribe(student_histories.on_request_event)
+
+# Normalized-schema cutover (CUTOVER_MODE): requests and approvals recorded here are
+# mirrored in the background, and in shadow mode a sample of reads is compared
+shadow_writer = ShadowWriter(get_data_access)
+shadow_reads = ShadowReader(SHADOW_READ_SAMPLE_RATE if CUTOVER_MODE == 'shadow' else 0)
+if CUTOVER_MODE in ('dual_write', 'shadow'):
+    event_log.subscribe(shadow_writer.on_request_event, local_only=True)
+
+
+def enquiry_numbers(rows):
+    return {row['enquiry_no'] for row in rows}
+
+
+def course_pricing(fees):
+    return (round(float(fees['mrp']), 2), round(float(fees['installment']), 2)) if fees else None
+
+
 def validate_pw_email(email):
     """Validate if email is from pw.live domain"""
     return email.endswith('@pw.live')
@@ -100,6 +266,9 @@ def require_permission(permission):
             elif permission == 'approve' and session.get('approver_level') not in ['L1', 'L2']:
                 flash('You are not authorized to approve requests.', 'error')
                 return redirect(url_for('dashboard'))
+            elif permission == 'manage_pricing' and session.get('approver_level') != 'L2':
+                flash('You are not authorized to change course pricing.', 'error')
+                return redirect(url_for('dashboard'))
             
             return f(*args, **kwargs)
         return decorated_function
@@ -169,88 +338,22 @@ def authenticate_user(email, password):
 
 def get_branches():
     """Get unique branches from branch_cards_fees table"""
-    client = get_bigquery_client()
-    if not client:
-        logger.error("BigQuery client not available for get_branches")
-        return []
-    
-    try:
-        query = f"""
-            SELECT DISTINCT branch_name
-            FROM `{project_id}.{dataset_id}.branch_cards_fees`
-            ORDER BY branch_name
-        """
-        logger.info(f"Executing query: {query}")
-        result = client.query(query).result()
-        branches = [row.branch_name for row in result]
-        logger.info(f"Found {len(branches)} branches: {branches}")
-        return branches
-    except Exception as e:
-        logger.error(f"Error fetching branches: {e}")
-        return []
+    return catalog.branches()
 
 
 def get_cards_for_branch(branch_name):
     """Get cards for a specific branch"""
-    client = get_bigquery_client()
-    if not client:
-        logger.error("BigQuery client not available for get_cards_for_branch")
-        return []
-    
-    try:
-        query = f"""
-            SELECT DISTINCT card_name
-            FROM `{project_id}.{dataset_id}.branch_cards_fees`
-            WHERE branch_name = @branch_name
-            ORDER BY card_name
-        """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter('branch_name', 'STRING', branch_name)
-            ]
-        )
-        logger.info(f"Executing query for branch {branch_name}: {query}")
-        result = client.query(query, job_config=job_config).result()
-        cards = [row.card_name for row in result]
-        logger.info(f"Found {len(cards)} cards for branch {branch_name}: {cards}")
-        return cards
-    except Exception as e:
-        logger.error(f"Error fetching cards for branch {branch_name}: {e}")
-        return []
+    return catalog.cards(branch_name)
 
 
 def get_mrp_installment_for_branch_card(branch_name, card_name):
     """Get MRP and installment for specific branch and card combination"""
-    client = get_bigquery_client()
-    if not client:
-        logger.error("BigQuery client not available for get_mrp_installment_for_branch_card")
-        return None
-    
-    try:
-        query = f"""
-            SELECT mrp, installment
-            FROM `{project_id}.{dataset_id}.branch_cards_fees`
-            WHERE branch_name = @branch_name AND card_name = @card_name
-        """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter('branch_name', 'STRING', branch_name),
-                bigquery.ScalarQueryParameter('card_name', 'STRING', card_name)
-            ]
-        )
-        logger.info(f"Executing MRP and installment query for branch {branch_name}, card {card_name}: {query}")
-        result = list(client.query(query, job_config=job_config).result())
-        if result:
-            mrp = float(result[0].mrp)
-            installment = float(result[0].installment)
-            logger.info(f"Found MRP: {mrp}, Installment: {installment}")
-            return {'mrp': mrp, 'installment': installment}
-        else:
-            logger.warning(f"No MRP/installment found for branch {branch_name}, card {card_name}")
-            return None
-    except Exception as e:
-        logger.error(f"Error fetching MRP/installment for branch {branch_name}, card {card_name}: {e}")
-        return None
+    fees = shadow_reads.read('course_pricing', lambda: catalog.fees(branch_name, card_name),
+                             lambda: get_data_access().get_course_details(branch_name, card_name),
+                             key=course_pricing)
+    if not fees:
+        logger.warning(f"No MRP/installment found for branch {branch_name}, card {card_name}")
+    return fees
 
 def get_mrp_for_branch_card(branch_name, card_name):
     """Get MRP for specific branch and card combination - backward compatibility"""
@@ -258,6 +361,15 @@ def get_mrp_for_branch_card(branch_name, card_name):
     return data['mrp'] if data else None
 
 
+def appended_event_id(appended, row):
+    """Id of the event a record_submission/record_transition call appended, None if it appended none.
+
+    Rendered notifications are cached under it, so the cache never serves one
+    request's body for another event on the same enquiry.
+    """
+    return (row or {}).get('last_event_id') if appended else None
+
+
 def get_approvers_for_branch(branch_name, level):
     client = get_bigquery_client()
     if not client:
@@ -265,12 +377,11 @@ def get_approvers_for_branch(branch_name, level):
         return []
     
     try:
+        params = []
         if level == 'L1':
-            # L1 logic: Raja Ray for Kolkata/Siliguri/Bhubaneshwar, Praduman for others
-            if branch_name in ['Kolkata', 'Siliguri', 'Bhubaneshwar']:
-                approver_filter = "AND email = 'raja.ray@pw.live'"
-            else:
-                approver_filter = "AND email = 'praduman.shukla@pw.live'"
+            # The branch's approver pool
+            approver_filter = "AND email IN UNNEST(@pool)"
+            params.append(bigquery.ArrayQueryParameter('pool', 'STRING', sorted(approver_pools.pool_for(branch_name))))
         else:
             approver_filter = ""  # L2 handles all branches
             
@@ -286,7 +397,7 @@ def get_approvers_for_branch(branch_name, level):
             query_parameters=[
                 bigquery.ScalarQueryParameter('branch_name', 'STRING', branch_name),
                 bigquery.ScalarQueryParameter('level', 'STRING', level)
-            ]
+            ] + params
         )
         logger.info(f"Executing approvers query for branch {branch_name}, level {level}: {query}")
         result = client.query(query, job_config=job_config).result()
@@ -298,15 +409,18 @@ def get_approvers_for_branch(branch_name, level):
         return []
 
 
-def send_notification_email(to_emails, subject, body):
+# Required CC recipients as per problem statement
+NOTIFICATION_CC_EMAILS = [
+    'prince.tiwari@pw.live',
+    'rohan.kumar1@pw.live', 
+    'sanover.naquvi@pw.live',
+    'prashant.soni@pw.live'
+]
+
+def send_notification_email(to_emails, subject, body, text_body=None, cc_emails=None):
     """Send notification email with CC recipients and detailed debugging"""
-    # Required CC recipients as per problem statement
-    cc_emails = [
-        'prince.tiwari@pw.live',
-        'rohan.kumar1@pw.live', 
-        'sanover.naquvi@pw.live',
-        'prashant.soni@pw.live'
-    ]
+    if cc_emails is None:
+        cc_emails = NOTIFICATION_CC_EMAILS
     
     logger.info(f"Email Debug: Sender={EMAIL_SENDER}, Recipients={to_emails}, CC={cc_emails}")
     logger.info(f"Email Debug: SMTP_SERVER={SMTP_SERVER}, SMTP_PORT={SMTP_PORT}")
@@ -314,12 +428,7 @@ def send_notification_email(to_emails, subject, body):
     try:
         for email in to_emails:
             logger.info(f"Sending email to: {email}")
-            msg = MIMEText(body, 'html')
-            msg['Subject'] = subject
-            msg['From'] = EMAIL_SENDER
-            msg['To'] = email
-            # Add CC recipients
-            msg['Cc'] = ', '.join(cc_emails)
+            msg = build_message(subject, body, EMAIL_SENDER, email, cc_emails, text_body)
             
             # Combine TO and CC for actual sending
             all_recipients = [email] + cc_emails
@@ -345,6 +454,13 @@ def send_notification_email(to_emails, subject, body):
         logger.error(f"General Email Error: {e}")
         return False
 
+# Approver notifications go through the digest scheduler (NOTIFICATION_DIGEST_MINUTES,
+# see notification_digest.py); send_notification_email is looked up at send time
+notification_digest = DigestScheduler(
+    lambda *args, **kwargs: send_notification_email(*args, **kwargs), NOTIFICATION_CC_EMAILS
+)
+notification_digest.register_shutdown_flush()
+
 @app.route('/debug/config')
 def debug_config():
     """Debug route to check configuration - remove in production"""
@@ -420,6 +536,27 @@ def send_email(to_email, subject, body):
     """Send email using the updated notification system with CC"""
     return send_notification_email([to_email], subject, body)
 
+@app.before_request
+def enforce_rate_limits():
+    # Logins count against the email being tried, everything else against the logged-in user
+    if request.endpoint == 'login' and request.method == 'POST':
+        user = (request.form.get('email') or '').strip().lower()
+    else:
+        user = session.get('logged_in_email')
+    retry_after = rate_limiter.check(request.endpoint, request.method,
+                                     client_ip(request.headers.get('X-Forwarded-For'), request.remote_addr), user)
+    if not retry_after:
+        return None
+    headers = {'Retry-After': retry_after_header(retry_after)}
+    logger.warning(f"Rate limited {request.endpoint} for {user or request.remote_addr}")
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Too many requests', 'retry_after': int(headers['Retry-After'])}), 429, headers
+    if request.endpoint == 'login':
+        flash(f"Too many login attempts. Please try again in {headers['Retry-After']} seconds.", 'error')
+        return render_template('login.html'), 429, headers
+    return Response('Too many requests\n', status=429, mimetype='text/plain', headers=headers)
+
+
 @app.before_request
 def track_logged_in_user():
     # Only log if the key exists, don't try to access it
@@ -428,6 +565,23 @@ def track_logged_in_user():
     else:
         logger.info("No logged-in user found in session")
 
+@app.before_request
+def flush_notification_digest():
+    # Cloud Run may throttle CPU between requests, so a due digest is also
+    # kicked off from request handling rather than relying only on the timer
+    notification_digest.maybe_flush()
+
+
+@app.before_request
+def check_sla_escalations():
+    sla_tracker.maybe_check()
+
+
+@app.before_request
+def seed_risk_scorer():
+    # Loads the request projection off the request thread on a worker's first request
+    risk_scorer.seed_in_background()
+
 
 @app.route('/')
 def index():
@@ -468,26 +622,15 @@ def request_discount():
             
             form_mrp = float(request.form['mrp'])
             form_installment = float(request.form['installment'])
-            
-            if abs(form_mrp - db_mrp) > 0.01:  # Allow small floating point differences
-                flash(f'MRP mismatch. Expected: ₹{db_mrp}, Provided: ₹{form_mrp}', 'error')
-                return redirect(url_for('request_discount'))
-                
-            if abs(form_installment - db_installment) > 0.01:  # Allow small floating point differences  
-                flash(f'Installment mismatch. Expected: ₹{db_installment}, Provided: ₹{form_installment}', 'error')
-                return redirect(url_for('request_discount'))
-
-            # Get discount amount and calculate percentage
             discount_amount = float(request.form['discount_amount'])
-            discount_percentage = (discount_amount / db_installment) * 100
             
-            # Validate discount percentage - must be greater than 30%
-            if discount_percentage <= 30:
-                flash('Use ERP for the discounts upto 30%, this portal can receive discounts requests which are greater than 30%.', 'error')
+            # Price tolerance, ERP threshold and caps come from the discount policy
+            evaluation = discount_policy.evaluate(branch_name, card_name, db_mrp, db_installment, discount_amount,
+                                                  form_mrp, form_installment)
+            if not evaluation.ok:
+                flash(evaluation.errors[0], 'error')
                 return redirect(url_for('request_discount'))
             
-            # Calculate discounted fees
-            discounted_fees = db_mrp - discount_amount
             data = {
                 'enquiry_no': enquiry_no,
                 'student_name': request.form['student_name'],
@@ -495,10 +638,7 @@ def request_discount():
                 'card_name': card_name,
                 'mrp': db_mrp,
                 'installment': db_installment,
-                'discounted_fees': discounted_fees,
-                'discount_amount': discount_amount,
-                'discount_percentage': discount_percentage,
-                'net_discount': discount_amount,
+                **evaluation.fields(),
                 'reason': request.form['reason'],
                 'remarks': request.form.get('remarks', ''),
                 'requester_email': session['logged_in_email'],
@@ -510,9 +650,28 @@ def request_discount():
                 'l2_approver': None
             }
 
+            # Scored in memory against requests already seen, so approvers can spot outliers
+            # (against empty statistics while the scorer is still seeding)
+            risk_score, risk_reasons = risk_scorer.score(data, time.time())
+            data['risk_score'] = risk_score
+            data['risk_reasons'] = '\n'.join(risk_reasons)
+            data['assigned_to'] = assign_approvers([branch_name])[0]
+
             # Insert into database
             client = get_bigquery_client()
-            if client:
+            # Id of the submission event, which the rendered notification is cached under
+            event_id = None
+            if EVENT_SOURCED_REQUESTS:
+                if event_log.get_request(enquiry_no):
+                    flash('Duplicate request. This enquiry number has already been submitted.', 'error')
+                    return redirect(url_for('request_discount'))
+                
+                applied, submitted = event_log.record_submission(data, session.get('approver_level'))
+                event_id = appended_event_id(applied, submitted)
+                if not applied:
+                    flash('Duplicate request. This enquiry number has already been submitted.', 'error')
+                    return redirect(url_for('request_discount'))
+            elif client:
                 # Check for duplicates
                 dup_query = f"""
                     SELECT COUNT(*) as count FROM `{project_id}.{dataset_id}.discount_requests`
@@ -535,11 +694,13 @@ def request_discount():
                     INSERT INTO `{project_id}.{dataset_id}.discount_requests`
                     (enquiry_no, student_name, mobile_no, card_name, mrp, installment, discounted_fees, 
                      discount_amount, discount_percentage, net_discount, reason, remarks, requester_email, 
-                     requester_name, branch_name, status, created_at, l1_approver, l2_approver)
+                     requester_name, branch_name, status, created_at, l1_approver, l2_approver,
+                     risk_score, risk_reasons, assigned_to)
                     VALUES (@enquiry_no, @student_name, @mobile_no, @card_name, @mrp, @installment, 
                             @discounted_fees, @discount_amount, @discount_percentage, @net_discount, 
                             @reason, @remarks, @requester_email, @requester_name, @branch_name, 
-                            @status, @created_at, @l1_approver, @l2_approver)
+                            @status, @created_at, @l1_approver, @l2_approver,
+                            @risk_score, @risk_reasons, @assigned_to)
                 """
                 
                 insert_params = [
@@ -561,43 +722,28 @@ def request_discount():
                     bigquery.ScalarQueryParameter('status', 'STRING', data['status']),
                     bigquery.ScalarQueryParameter('created_at', 'STRING', data['created_at']),
                     bigquery.ScalarQueryParameter('l1_approver', 'STRING', data['l1_approver']),
-                    bigquery.ScalarQueryParameter('l2_approver', 'STRING', data['l2_approver'])
+                    bigquery.ScalarQueryParameter('l2_approver', 'STRING', data['l2_approver']),
+                    bigquery.ScalarQueryParameter('risk_score', 'FLOAT', data['risk_score']),
+                    bigquery.ScalarQueryParameter('risk_reasons', 'STRING', data['risk_reasons']),
+                    bigquery.ScalarQueryParameter('assigned_to', 'STRING', data['assigned_to'])
                 ]
                 
                 insert_config = bigquery.QueryJobConfig(query_parameters=insert_params)
                 client.query(insert_query, insert_config).result()
+                logged, submitted = event_log.record_submission(data, session.get('approver_level'))
+                event_id = appended_event_id(logged, submitted)
                 
-            # Notify L1 approvers
-            l1_approvers = get_approvers_for_branch(branch_name, 'L1')
-            if l1_approvers:
-                approver_emails = [email for email, name in l1_approvers]
-                subject = f"New Discount Request - {enquiry_no}"
-                body = f"""
-                    <html><body style='font-family: Arial, sans-serif;'>
-                    <h2 style='color:#4CAF50;'>New Discount Request - L1 Approval Required</h2>
-                    <p>A new discount request has been submitted and requires your approval.</p>
-                    <table style='border-collapse:collapse;'>
-                    <tr><td><b>Enquiry No:</b></td><td>{enquiry_no}</td></tr>
-                    <tr><td><b>Student Name:</b></td><td>{data['student_name']}</td></tr>
-                    <tr><td><b>Mobile No:</b></td><td>{data['mobile_no']}</td></tr>
-                    <tr><td><b>Branch:</b></td><td>{branch_name}</td></tr>
-                    <tr><td><b>Card:</b></td><td>{card_name}</td></tr>
-                    <tr><td><b>MRP:</b></td><td>₹{data['mrp']:,.2f}</td></tr>
-                    <tr><td><b>Installment:</b></td><td>₹{data['installment']:,.2f}</td></tr>
-                    <tr><td><b>Requested Discount Amount:</b></td><td>₹{discount_amount:,.2f}</td></tr>
-                    <tr><td><b>Discount Percentage:</b></td><td>{discount_percentage:.2f}%</td></tr>
-                    <tr><td><b>Discounted Fees:</b></td><td>₹{discounted_fees:,.2f}</td></tr>
-                    <tr><td><b>Reason:</b></td><td>{data['reason']}</td></tr>
-                    <tr><td><b>Requested by:</b></td><td>{data['requester_name']} ({data['requester_email']})</td></tr>
-                    </table>
-                    <p style='margin-top:20px;'>
-                    <a href='https://discount-app-644139762582.asia-south2.run.app/login' style='background:#007bff;color:#fff;padding:10px 20px;text-decoration:none;border-radius:5px;'>Login to Approve</a>
-                    <a href='https://discount-app-644139762582.asia-south2.run.app/approve_request' style='background:#28a745;color:#fff;padding:10px 20px;text-decoration:none;border-radius:5px;margin-left:10px;'>Go to Approval Page</a>
-                    </p>
-                    <p style='color:#888;font-size:12px;margin-top:30px;'>This is an automated notification from the Discount Management System.<br>Physics Wallah</p>
-                    </body></html>
-                """
-                send_notification_email(approver_emails, subject, body)
+            # Notify the assigned L1 approver (the branch's pool if it has none)
+            if data['assigned_to']:
+                approver_emails = [data['assigned_to']]
+            else:
+                approver_emails = [email for email, name in get_approvers_for_branch(branch_name, 'L1')]
+            if approver_emails:
+                context = build_request_context(data)
+                subject, body, text_body = render_notification(
+                    L1_APPROVAL_REQUIRED, context, cache_key=event_id
+                )
+                notification_digest.notify(approver_emails, L1_APPROVAL_REQUIRED, context, subject, body, text_body)
                             
             flash('Discount request submitted successfully! L1 approvers have been notified.', 'success')
             return redirect(url_for('request_discount'))
@@ -614,6 +760,107 @@ def request_discount():
                          approver_level=session.get('approver_level', 'Unknown'))
 
 
+def get_bulk_importer():
+    """Bulk importer wired to this app's catalog, event log and notifications."""
+    return BulkImporter(
+        get_bigquery_client, project_id, dataset_id, catalog, event_log, validate_enquiry_no,
+        get_approvers_for_branch=get_approvers_for_branch,
+        notify=lambda *args, **kwargs: send_notification_email(*args, **kwargs),
+        event_sourced=EVENT_SOURCED_REQUESTS,
+        policy=discount_policy,
+        assign=assign_approvers
+    )
+
+
+@app.route('/request_discount/bulk', methods=['GET', 'POST'])
+@require_auth
+@require_permission('request_discount')
+def bulk_request_discount():
+    """Upload a CSV/Excel file of discount requests."""
+    if request.method == 'GET':
+        return render_template('bulk_import.html', result=None)
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Please choose a CSV or Excel file to upload.', 'error')
+        return redirect(url_for('bulk_request_discount'))
+    
+    try:
+        rows = iter_upload_rows(upload.stream, upload.filename)
+        result = get_bulk_importer().run(rows, session['logged_in_email'], session['user_name'],
+                                         session.get('approver_level'))
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('bulk_request_discount'))
+    except Exception as e:
+        logger.error(f"Error processing bulk import: {e}")
+        flash('An error occurred while importing the file. No requests were submitted.', 'error')
+        return redirect(url_for('bulk_request_discount'))
+    
+    error_report = None
+    if result.errors:
+        # Inline the report so the download works whichever worker serves it
+        error_report = base64.b64encode(error_report_csv(result.errors).encode('utf-8')).decode('ascii')
+    if result.imported:
+        flash(f'{len(result.imported)} discount requests submitted successfully! '
+              f'L1 approvers have been notified.', 'success')
+    if result.errors:
+        flash(f'{len(result.errors)} rows were rejected. Download the error report for details.', 'error')
+    return render_template('bulk_import.html', result=result, error_report=error_report)
+
+
+@app.route('/request_discount/bulk/template.csv')
+@require_auth
+def bulk_import_template():
+    """Empty CSV with the columns the bulk import expects."""
+    return Response(','.join(REQUIRED_COLUMNS + OPTIONAL_COLUMNS) + '\n', mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=discount_requests_template.csv'})
+
+
+def get_request_row(enquiry_no):
+    """A request from the event log projection, or discount_requests if the projection lacks it."""
+    req = event_log.get_request(enquiry_no)
+    if req is None and not EVENT_SOURCED_REQUESTS:
+        client = get_bigquery_client()
+        if client:
+            query = f"""
+                SELECT * FROM `{project_id}.{dataset_id}.discount_requests`
+                WHERE enquiry_no = @enquiry_no
+            """
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ScalarQueryParameter('enquiry_no', 'STRING', enquiry_no)
+            ])
+            rows = list(client.query(query, job_config=job_config).result())
+            req = rows[0] if rows else None
+    return req
+
+
+def branch_filter_for(scope):
+    """SQL predicate on branch_name for a QueueScope's branches."""
+    def literals(branches):
+        return ', '.join("'" + branch.replace("\\", "\\\\").replace("'", "\\'") + "'" for branch in sorted(branches))
+    if scope.branch_in is not None:
+        return f"AND branch_name IN ({literals(scope.branch_in)})" if scope.branch_in else "AND FALSE"
+    if scope.branch_not_in:
+        return f"AND branch_name NOT IN ({literals(scope.branch_not_in)})"
+    return ""
+
+
+def get_approver_queue(approver_level, logged_in_email):
+    """
+    Return (QueueScope, SQL branch filter) for the requests an approver works on.
+
+    L1 approvers in a pool work the requests assigned to them (or delegated to
+    them) and see their pools' branches; L1 approvers in no pool see them all.
+    """
+    if approver_level == 'L1':
+        scope = approver_assigner.queue_scope(logged_in_email)
+        return scope, branch_filter_for(scope)
+    elif approver_level == 'L2':
+        return QueueScope('PENDING_L2'), ""  # L2 approvers can handle all branches
+    return QueueScope(), ""
+
+
 @app.route('/approve_request', methods=['GET', 'POST'])
 @require_auth
 @require_permission('approve')
@@ -633,27 +880,11 @@ def approve_request():
 
             logger.info(f"Processing {action} for request {request_id} by {logged_in_email} (Level: {approver_level})")
 
-            if not request_id or not action:
+            if not request_id or not get_transition(approver_level, action):
                 flash('Invalid request data.', 'error')
                 return redirect(url_for('approve_request'))
 
-            # Get current request details - remove branch restriction for approvers
-            get_query = f"""
-                SELECT * FROM `{project_id}.{dataset_id}.discount_requests`
-                WHERE enquiry_no = @enquiry_no
-            """
-            get_params = [
-                bigquery.ScalarQueryParameter('enquiry_no', 'STRING', request_id)
-            ]
-            get_config = bigquery.QueryJobConfig(query_parameters=get_params)
-            result = list(client.query(get_query, get_config).result())
-            
-            if not result:
-                flash('Request not found or you are not authorized to approve this request.', 'error')
-                return redirect(url_for('approve_request'))
-            
-            current_request = result[0]
-            
+            approved_amount = None
             if action == 'APPROVE':
                 if not approved_discount_value:
                     flash("Approved amount is required for approval.", "error")
@@ -661,114 +892,71 @@ def approve_request():
                 
                 try:
                     approved_amount = float(approved_discount_value)
-                    if approved_amount <= 0:
-                        flash("Approved amount must be greater than 0.", "error")
-                        return redirect(url_for('approve_request'))
                 except ValueError:
                     flash("Invalid approved amount.", "error")
                     return redirect(url_for('approve_request'))
                 
-                # Determine new status and update fields based on approver level
-                if approver_level == 'L1':
-                    if current_request['status'] != 'PENDING_L1':
-                        flash('This request is not pending L1 approval.', 'error')
-                        return redirect(url_for('approve_request'))
-                    
-                    new_status = 'PENDING_L2'
-                    update_query = f"""
-                        UPDATE `{project_id}.{dataset_id}.discount_requests`
-                        SET status = @status, 
-                            discounted_fees = @approved_amount,
-                            net_discount = @net_discount,
-                            l1_approver = @approver_email,
-                            l1_approved_at = @approved_at,
-                            l1_comments = @comments
-                        WHERE enquiry_no = @enquiry_no
-                    """
-                    net_discount = current_request['mrp'] - approved_amount
-                    
-                elif approver_level == 'L2':
-                    if current_request['status'] != 'PENDING_L2':
-                        flash('This request is not pending L2 approval.', 'error')
-                        return redirect(url_for('approve_request'))
-                    
-                    new_status = 'APPROVED'
-                    update_query = f"""
-                        UPDATE `{project_id}.{dataset_id}.discount_requests`
-                        SET status = @status, 
-                            discounted_fees = @approved_amount,
-                            net_discount = @net_discount,
-                            l2_approver = @approver_email,
-                            l2_approved_at = @approved_at,
-                            l2_comments = @comments
-                        WHERE enquiry_no = @enquiry_no
-                    """
-                    net_discount = current_request['mrp'] - approved_amount
-                
-                params = [
-                    bigquery.ScalarQueryParameter('status', 'STRING', new_status),
-                    bigquery.ScalarQueryParameter('approved_amount', 'FLOAT', approved_amount),
-                    bigquery.ScalarQueryParameter('net_discount', 'FLOAT', net_discount),
-                    bigquery.ScalarQueryParameter('approver_email', 'STRING', logged_in_email),
-                    bigquery.ScalarQueryParameter('approved_at', 'STRING', datetime.now(timezone.utc).isoformat()),
-                    bigquery.ScalarQueryParameter('comments', 'STRING', approver_comments),
-                    bigquery.ScalarQueryParameter('enquiry_no', 'STRING', request_id)
-                ]
-                
-            elif action == 'REJECT':
-                # Rejection can happen at any level
-                update_query = f"""
-                    UPDATE `{project_id}.{dataset_id}.discount_requests`
-                    SET status = 'REJECTED',
-                        {approver_level.lower()}_approver = @approver_email,
-                        {approver_level.lower()}_approved_at = @approved_at,
-                        {approver_level.lower()}_comments = @comments
-                    WHERE enquiry_no = @enquiry_no
-                """
-                params = [
-                    bigquery.ScalarQueryParameter('approver_email', 'STRING', logged_in_email),
-                    bigquery.ScalarQueryParameter('approved_at', 'STRING', datetime.now(timezone.utc).isoformat()),
-                    bigquery.ScalarQueryParameter('comments', 'STRING', approver_comments),
-                    bigquery.ScalarQueryParameter('enquiry_no', 'STRING', request_id)
-                ]
-            
-            # Execute the update
-            job_config = bigquery.QueryJobConfig(query_parameters=params)
-            client.query(update_query, job_config=job_config).result()
+                # Approved fees must be positive and within this level's discount cap
+                current = get_request_row(request_id) or {}
+                evaluation = discount_policy.evaluate_approval(
+                    current.get('branch_name'), current.get('card_name'), approver_level,
+                    current.get('mrp') or 0, current.get('installment') or 0, approved_amount
+                )
+                if not evaluation.ok:
+                    flash(evaluation.errors[0], "error")
+                    return redirect(url_for('approve_request'))
+
+            if EVENT_SOURCED_REQUESTS:
+                # Append-only: a conditional append of the event replaces the
+                # conditional UPDATE
+                applied, current_request = event_log.record_transition(
+                    request_id, approver_level, action, logged_in_email,
+                    approver_comments, approved_amount
+                )
+                event_id = appended_event_id(applied, current_request)
+            else:
+                # Single conditional UPDATE: only succeeds if the request is still
+                # pending at this approver's level (no read-then-write race)
+                applied = apply_legacy_transition(
+                    client, project_id, dataset_id, request_id, approver_level, action,
+                    logged_in_email, approver_comments, approved_amount
+                )
+                event_id = None
+                if applied:
+                    logged, transitioned = event_log.record_transition(
+                        request_id, approver_level, action, logged_in_email,
+                        approver_comments, approved_amount, check_state=False
+                    )
+                    event_id = appended_event_id(logged, transitioned)
+            if not applied:
+                flash(f'Request #{request_id} is not pending {approver_level} approval. '
+                      'It may have already been processed by another approver.', 'error')
+                return redirect(url_for('approve_request'))
             
             # Send notifications
             if action == 'APPROVE':
                 if approver_level == 'L1':
+                    if not EVENT_SOURCED_REQUESTS:
+                        # Read back the approved row for the L2 notification
+                        get_query = f"""
+                            SELECT * FROM `{project_id}.{dataset_id}.discount_requests`
+                            WHERE enquiry_no = @enquiry_no
+                        """
+                        get_config = bigquery.QueryJobConfig(query_parameters=[
+                            bigquery.ScalarQueryParameter('enquiry_no', 'STRING', request_id)
+                        ])
+                        current_request = list(client.query(get_query, get_config).result())[0]
+
                     # Notify L2 approvers
                     l2_approvers = get_approvers_for_branch(user_branch, 'L2')
                     if l2_approvers:
                         approver_emails = [email for email, name in l2_approvers]
-                        subject = f"L2 Approval Required - {request_id}"
-                        body = f"""
-<html><body style='font-family: Arial, sans-serif;'>
-<h2 style='color:#ff9800;'>L2 Approval Required - Request Approved at L1</h2>
-<p>A discount request has been <b>approved at L1 level</b> and now requires your L2 approval.</p>
-<table style='border-collapse:collapse;'>
-<tr><td><b>Enquiry No:</b></td><td>{request_id}</td></tr>
-<tr><td><b>Student Name:</b></td><td>{current_request['student_name']}</td></tr>
-<tr><td><b>Branch:</b></td><td>{current_request['branch_name']}</td></tr>
-<tr><td><b>Card:</b></td><td>{current_request['card_name']}</td></tr>
-<tr><td><b>Original MRP:</b></td><td>₹{current_request['mrp']:,.2f}</td></tr>
-<tr><td><b>Installment:</b></td><td>₹{current_request.get('installment', 0):,.2f}</td></tr>
-<tr><td><b>Discount Amount:</b></td><td>₹{net_discount:,.2f}</td></tr>
-<tr><td><b>Discount Percentage:</b></td><td>{(net_discount / current_request.get('installment', 1) * 100):,.2f}%</td></tr>
-<tr><td><b>L1 Approved Discounted Fees:</b></td><td>₹{approved_amount:,.2f}</td></tr>
-<tr><td><b>L1 Approver:</b></td><td>{logged_in_email}</td></tr>
-<tr><td><b>Original Requester:</b></td><td>{current_request['requester_name']} ({current_request['requester_email']})</td></tr>
-</table>
-<p style='margin-top:20px;'>
-<a href='https://discount-app-644139762582.asia-south2.run.app/login' style='background:#007bff;color:#fff;padding:10px 20px;text-decoration:none;border-radius:5px;'>Login to Approve</a>
-<a href='https://discount-app-644139762582.asia-south2.run.app/approve_request' style='background:#28a745;color:#fff;padding:10px 20px;text-decoration:none;border-radius:5px;margin-left:10px;'>Go to Approval Page</a>
-</p>
-<p style='color:#888;font-size:12px;margin-top:30px;'>This is an automated notification from the Discount Management System.<br>Physics Wallah</p>
-</body></html>
-                        """
-                        send_notification_email(approver_emails, subject, body)
+                        context = build_request_context(current_request, l1_approver=logged_in_email)
+                        subject, body, text_body = render_notification(
+                            L2_APPROVAL_REQUIRED, context, cache_key=event_id
+                        )
+                        notification_digest.notify(approver_emails, L2_APPROVAL_REQUIRED, context,
+                                                   subject, body, text_body)
                     
                     flash(f'Request #{request_id} approved at L1 level! L2 approvers have been notified.', 'success')
                 else:  # L2
@@ -784,45 +972,356 @@ def approve_request():
 
     try:
         # Get pending requests for the user's branch and level
-        if approver_level == 'L1':
-            status_filter = 'PENDING_L1'
-            # For L1, filter by specific approver logic
-            if logged_in_email == 'raja.ray@pw.live':
-                branch_filter = "AND branch_name IN ('Kolkata', 'Siliguri', 'Bhubaneshwar')"
-            elif logged_in_email == 'praduman.shukla@pw.live':
-                branch_filter = "AND branch_name NOT IN ('Kolkata', 'Siliguri', 'Bhubaneshwar')"
-            else:
-                # For others like Girish who can handle all
-                branch_filter = ""
-        else:  # L2
-            status_filter = 'PENDING_L2'
-            branch_filter = ""  # L2 approvers can handle all branches
+        scope, branch_filter = get_approver_queue(approver_level, logged_in_email)
+        status_filter = scope.status
+        # Starting point for the page's change polling (see /api/requests/changes)
+        changes_watermark = encode_watermark(settled_until())
         
-        query = f"""
-            SELECT * FROM `{project_id}.{dataset_id}.discount_requests`
-            WHERE status = @status 
-            {branch_filter}
-            ORDER BY created_at DESC
-        """
-        params = [
-            bigquery.ScalarQueryParameter('status', 'STRING', status_filter)
-        ]
-        job_config = bigquery.QueryJobConfig(query_parameters=params)
-        result = client.query(query, job_config=job_config).result()
-        requests = list(result)
+        def load_queue():
+            if EVENT_SOURCED_REQUESTS:
+                if scope.assigned_to is not None:
+                    return event_log.pending_requests(status_filter, assigned_to=scope.assigned_to)
+                return event_log.pending_requests(status_filter, scope.branch_in, scope.branch_not_in)
+            
+            params = [
+                bigquery.ScalarQueryParameter('status', 'STRING', status_filter)
+            ]
+            queue_filter = branch_filter
+            if scope.assigned_to is not None:
+                queue_filter = "AND assigned_to IN UNNEST(@assignees)"
+                params.append(bigquery.ArrayQueryParameter('assignees', 'STRING', sorted(scope.assigned_to)))
+            query = f"""
+                SELECT * FROM `{project_id}.{dataset_id}.discount_requests`
+                WHERE status = @status 
+                {queue_filter}
+                ORDER BY created_at DESC
+            """
+            job_config = bigquery.QueryJobConfig(query_parameters=params)
+            result = client.query(query, job_config=job_config).result()
+            return list(result)
+        
+        requests = shadow_reads.read(
+            'approver_queue', load_queue,
+            lambda: get_data_access().get_pending_requests_for_approver(approver_level, logged_in_email, scope),
+            key=enquiry_numbers)
         
         return render_template('approve_request.html', 
                              requests=requests, 
                              approver_level=approver_level,
-                             user_branch=user_branch)
+                             user_branch=user_branch,
+                             queue_status=status_filter,
+                             changes_watermark=changes_watermark,
+                             risk_review_score=RISK_REVIEW_SCORE)
     except Exception as e:
         logger.error(f"Error fetching pending requests: {e}")
         flash('An error occurred while fetching pending requests. Please try again later.', 'error')
         return redirect(url_for('dashboard'))
 
 
+@app.route('/approve_request/card/<enquiry_no>')
+@require_auth
+@require_permission('approve')
+def approve_request_card(enquiry_no):
+    """Rendered queue card for one request, used by live updates to insert new work."""
+    scope, _ = get_approver_queue(session.get('approver_level'), session.get('logged_in_email'))
+    req = get_request_row(enquiry_no)
+    if req is None or not scope.matches(req['status'], req['branch_name'], req.get('assigned_to')):
+        return '', 204
+    return render_template('_request_card.html', req=req, risk_review_score=RISK_REVIEW_SCORE)
+
+
+@app.route('/events')
+@require_auth
+@require_permission('approve')
+def live_events():
+    """Server-Sent Events stream of queue changes and dashboard counter deltas."""
+    scope, _ = get_approver_queue(session.get('approver_level'), session.get('logged_in_email'))
+    subscription = live_updates.subscribe(scope)
+    if subscription is None:
+        # Stream cap reached; the browser stops retrying and the page works as before
+        return '', 204
+    return Response(
+        live_updates.stream(subscription, tick=event_log.sync),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/requests/changes')
+@require_auth
+def get_request_changes_api():
+    """Requests inserted or updated since the caller's watermark, as compact JSON."""
+    try:
+        since = decode_watermark(request.args.get('since', ''))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    until = settled_until()
+    rows = event_log.changes_since(since, until, CHANGES_PAGE_SIZE + 1)
+    # Approvers see their branches, requesters only their own requests
+    return jsonify(build_changes_response(rows, since, until, visible=search_visibility()))
+
+
+@app.route('/export')
+@require_auth
+@require_permission('approve')
+def export_page():
+    """Export form for requests and analytics."""
+    return render_template('export.html', branches=get_branches(), sources=sorted(EXPORT_SOURCES),
+                           formats=sorted(EXPORT_FORMATS))
+
+
+@app.route('/admin/pricing', methods=['GET', 'POST'])
+@require_auth
+@require_permission('manage_pricing')
+def pricing_admin():
+    """Price history of a branch/card, and repricing it from a date."""
+    branch_name = request.values.get('branch_name', '')
+    card_name = request.values.get('card_name', '')
+    if request.method == 'POST':
+        back = redirect(url_for('pricing_admin', branch_name=branch_name, card_name=card_name))
+        try:
+            mrp = float(request.form['mrp'])
+            installment = float(request.form['installment'])
+            effective_day = parse_date(request.form.get('effective_date'))
+        except (KeyError, ValueError):
+            flash('Enter a valid MRP, installment and effective date.', 'error')
+            return back
+        # A date takes effect from the start of that day, local time; no date means now
+        effective_date = (datetime.combine(effective_day, datetime.min.time(), ZoneInfo(ROLLUP_TIMEZONE))
+                          if effective_day else datetime.now(timezone.utc))
+        course_id = pricing.course_id(branch_name, card_name)
+        client = get_bigquery_client()
+        if course_id is None or client is None:
+            flash('Unknown branch and card combination.', 'error')
+            return back
+        try:
+            reprice_course(client, project_id, dataset_id, course_id, mrp, installment, effective_date,
+                           session['logged_in_email'])
+        except ValueError as e:
+            flash(str(e), 'error')
+            return back
+        except Exception as e:
+            logger.error(f"Error repricing {branch_name}/{card_name}: {e}")
+            flash('Repricing failed. The previous price is still in force.', 'error')
+            return back
+        # Other workers pick the new price up within CATALOG_CACHE_SECONDS
+        catalog.invalidate()
+        pricing.invalidate()
+        flash(f'{branch_name} {card_name} repriced from {effective_date:%d %b %Y}.', 'success')
+        return back
+
+    return render_template('pricing.html',
+                           branches=get_branches(),
+                           cards=get_cards_for_branch(branch_name) if branch_name else [],
+                           branch_name=branch_name,
+                           card_name=card_name,
+                           current=catalog.fees(branch_name, card_name) if card_name else None,
+                           history=list(reversed(pricing.history(branch_name, card_name))) if card_name else [])
+
+
+@app.route('/export/<source>.<export_format>')
+@require_auth
+@require_permission('approve')
+def export_download(source, export_format):
+    """Stream an export as CSV or Parquet, filtered by date range, branch and status."""
+    client = get_bigquery_client()
+    if client is None:
+        return jsonify({'error': 'BigQuery client not available'}), 503
+    
+    _, branch_filter = get_approver_queue(session.get('approver_level'), session.get('logged_in_email'))
+    try:
+        date_from = parse_date(request.args.get('from'))
+        date_to = parse_date(request.args.get('to'))
+        chunks = export_stream(client, project_id, dataset_id, source, export_format,
+                               date_from=date_from, date_to=date_to,
+                               branch=request.args.get('branch') or None,
+                               status=request.args.get('status') or None,
+                               branch_filter=branch_filter,
+                               event_sourced=EVENT_SOURCED_REQUESTS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    logger.info(f"Export of {source} as {export_format} started by {session.get('logged_in_email')}")
+    filename = export_filename(source, export_format, date_from, date_to)
+    return Response(chunks, mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/analytics/summary')
+@require_auth
+@require_permission('approve')
+def analytics_summary_api():
+    """Aggregates over the analytics snapshot, e.g. ?group_by=branch,month&from=2025-01-01."""
+    started = time.monotonic()
+    group_by = [name.strip() for name in request.args.get('group_by', '').split(',') if name.strip()]
+    scope, _ = get_approver_queue(session.get('approver_level'), session.get('logged_in_email'))
+    try:
+        groups = analytics.summarize(
+            group_by,
+            branch=request.args.get('branch') or None,
+            status=request.args.get('status') or None,
+            date_from=parse_date(request.args.get('from')),
+            date_to=parse_date(request.args.get('to')),
+            scope=scope
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    snapshot_at = analytics.snapshot_at()
+    return jsonify({
+        'group_by': group_by,
+        'groups': groups,
+        'snapshot_at': datetime.fromtimestamp(snapshot_at, timezone.utc).isoformat() if snapshot_at else None,
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1)
+    })
+
+
+@app.route('/analytics')
+@require_auth
+@require_permission('approve')
+def analytics_page():
+    """Trend charts over the pre-aggregated rollups."""
+    return render_template('analytics.html', branches=get_branches())
+
+
+@app.route('/simulate')
+@require_auth
+@require_permission('approve')
+def simulate_page():
+    """Revenue impact of a candidate discount policy, over the approved and pending requests."""
+    group_by = [name for name in request.args.getlist('group_by') if name in SIMULATION_GROUPS] or ['branch']
+    rules_text = request.args.get('rules', discount_policy.to_json())
+    context = {'rules_text': rules_text, 'group_by': group_by, 'groups': None, 'totals': None,
+               'min_discount_percentage': request.args.get('min', ''),
+               'max_discount_percentage': request.args.get('max', ''),
+               'group_names': list(SIMULATION_GROUPS)}
+    if not request.args:
+        return render_template('simulate.html', **context)
+    
+    started = time.monotonic()
+    try:
+        overrides = [float(context[name]) if context[name] else None
+                     for name in ('min_discount_percentage', 'max_discount_percentage')]
+        policy = candidate_policy(json.loads(rules_text or '[]'), *overrides)
+    except (ValueError, TypeError) as e:
+        flash(f'Invalid policy: {e}', 'error')
+        return render_template('simulate.html', **context)
+    
+    scope, _ = get_approver_queue(session.get('approver_level'), session.get('logged_in_email'))
+    groups, totals = simulator.run(policy, group_by, scope)
+    if totals is None:
+        flash('Request data is not available right now. Please try again shortly.', 'error')
+    snapshot_at = analytics.snapshot_at()
+    context.update(groups=groups, totals=totals,
+                   snapshot_at=datetime.fromtimestamp(snapshot_at, timezone.utc) if snapshot_at else None,
+                   elapsed_ms=round((time.monotonic() - started) * 1000, 1))
+    return render_template('simulate.html', **context)
+
+
+@app.route('/api/analytics/trends')
+@require_auth
+@require_permission('approve')
+def analytics_trends_api():
+    """Chart data from the rollup tables; defaults to the last 30 days by day."""
+    client = get_bigquery_client()
+    if client is None:
+        return jsonify({'error': 'BigQuery client not available'}), 503
+    
+    _, branch_filter = get_approver_queue(session.get('approver_level'), session.get('logged_in_email'))
+    try:
+        date_to = parse_date(request.args.get('to')) or local_today()
+        date_from = parse_date(request.args.get('from')) or date_to - timedelta(days=29)
+        trends = load_trends(client, project_id, dataset_id, date_from, date_to,
+                             granularity=request.args.get('granularity', 'day'),
+                             branch=request.args.get('branch') or None,
+                             branch_filter=branch_filter)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error loading analytics trends: {e}")
+        return jsonify({'error': 'Could not load analytics'}), 500
+    return jsonify(trends)
+
+
+@app.route('/students/<enquiry_no>')
+@require_auth
+@require_permission('approve')
+def student_profile(enquiry_no):
+    """A student's requests and approvals across branches and cards (?inline=1 for the approval page)."""
+    history = student_histories.get(enquiry_no)
+    template = '_student_history.html' if request.args.get('inline') else 'student_profile.html'
+    return render_template(template, enquiry_no=enquiry_no, history=history,
+                           summary=summarize_history(history) if history else None)
+
+
+@app.route('/api/students/<enquiry_no>')
+@require_auth
+@require_permission('approve')
+def student_profile_api(enquiry_no):
+    """A student's request/approval history as JSON."""
+    history = student_histories.get(enquiry_no)
+    if history is None:
+        return jsonify({'error': 'Could not load student history'}), 503
+    if history['student'] is None:
+        return jsonify({'error': 'Student not found'}), 404
+    return jsonify(dict(history, summary=summarize_history(history)))
+
+
+def search_visibility():
+    """Approvers see the branches they approve for, requesters their own requests."""
+    if session.get('approver_level') in ['L1', 'L2']:
+        scope, _ = get_approver_queue(session.get('approver_level'), session.get('logged_in_email'))
+        return lambda row: scope.covers_branch(row['branch_name'])
+    logged_in_email = session.get('logged_in_email')
+    return lambda row: row['requester_email'] == logged_in_email
+
+
+def run_search(query):
+    """(results, elapsed_ms, available) for the search page and API."""
+    if not query:
+        return [], 0.0, True
+    started = time.monotonic()
+    if not search_index.ensure_seeded():
+        return [], 0.0, False
+    results = search_index.search(query, visible=search_visibility())
+    return results, round((time.monotonic() - started) * 1000, 1), True
+
+
+@app.route('/search')
+@require_auth
+def search_page():
+    """Find requests by student name, mobile number, enquiry number, requester or branch."""
+    query = request.args.get('q', '').strip()
+    results, elapsed_ms, available = run_search(query)
+    if not available:
+        flash('Search is not available right now. Please try again shortly.', 'error')
+    return render_template('search.html', query=query, results=results, elapsed_ms=elapsed_ms)
+
+
+@app.route('/api/search')
+@require_auth
+def search_api():
+    """Ranked search results as JSON, e.g. ?q=ravi%20kol."""
+    query = request.args.get('q', '').strip()
+    results, elapsed_ms, available = run_search(query)
+    if not available:
+        return jsonify({'error': 'Search index not available'}), 503
+    return jsonify({'query': query, 'results': results, 'elapsed_ms': elapsed_ms})
+
+
 # Add new routes for redesigned UI
 def get_dashboard_stats():
+    return shadow_reads.read('dashboard_stats', load_dashboard_stats,
+                             lambda: get_data_access().get_dashboard_stats(),
+                             key=lambda stats: tuple(stats[:4]))
+
+
+def load_dashboard_stats():
+    if EVENT_SOURCED_REQUESTS:
+        return event_log.dashboard_stats()
+    
     client = get_bigquery_client()
     if client is None:
         logger.warning("BigQuery client not available, returning default stats")
@@ -866,16 +1365,43 @@ def get_dashboard_stats():
 @require_auth
 def dashboard():
     total_requests, pending_requests, approved_requests, rejected_requests, recent_requests = get_dashboard_stats()
+    sla_queues = []
+    if session.get('approver_level') in ['L1', 'L2'] and sla_tracker.ensure_seeded():
+        sla_queues = sla_tracker.summary()
     return render_template(
         'dashboard.html',
         total_requests=total_requests,
         pending_requests=pending_requests,
         approved_requests=approved_requests,
         rejected_requests=rejected_requests,
-        recent_requests=recent_requests
+        recent_requests=recent_requests,
+        sla_queues=sla_queues
     )
 
 
+# Bearer token for Prometheus scrapes; without it /metrics needs a login
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+@app.route('/metrics')
+def metrics():
+    """SLA, query cost, cutover and rate limit metrics in the Prometheus text format."""
+    if METRICS_TOKEN:
+        if request.headers.get('Authorization', '') != f'Bearer {METRICS_TOKEN}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    elif 'logged_in_email' not in session:
+        return redirect(url_for('login'))
+    sla_tracker.ensure_seeded()
+    body = sla_tracker.render_metrics()
+    if isinstance(client, GuardedClient):
+        body += client.render_metrics()
+    if CUTOVER_MODE != 'off':
+        body += shadow_writer.render_metrics() + shadow_reads.render_metrics()
+    body += rate_limiter.render_metrics()
+    # Every worker counts on its own; the label keeps their series apart
+    return Response(add_labels(body, worker=os.getpid()), mimetype='text/plain; version=0.0.4')
+
+
 
 # Add to app.py
 def parse_datetime(value):
@@ -948,9 +1474,15 @@ def setup_bigquery_credentials():
 # Setup credentials on startup
 setup_bigquery_credentials()
 
+# Partials fetched by live updates render without the page chrome or its stats
+PARTIAL_ENDPOINTS = {'approve_request_card'}
+
+
 # Make stats available in all templates
 @app.context_processor
 def inject_dashboard_stats():
+    if request.endpoint in PARTIAL_ENDPOINTS:
+        return {}
     try:
         total_requests, pending_requests, approved_requests, rejected_requests, recent_requests = get_dashboard_stats()
     except Exception as e:
@@ -982,13 +1514,26 @@ def get_cards_api(branch_name):
 
 @app.route('/api/mrp/<branch_name>/<card_name>')
 def get_mrp_api(branch_name, card_name):
-    """API endpoint to get MRP and installment for branch and card"""
+    """API endpoint to get MRP and installment for branch and card (?as_of=YYYY-MM-DD for a past date)"""
+    try:
+        as_of = parse_date(request.args.get('as_of'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         logger.info(f"Getting MRP and installment for branch: {branch_name}, card: {card_name}")
-        data = get_mrp_installment_for_branch_card(branch_name, card_name)
+        if as_of:
+            # Prices in force at the end of that day, local time
+            end_of_day = datetime.combine(as_of, datetime.max.time(), ZoneInfo(ROLLUP_TIMEZONE))
+            price = pricing.price_as_of(branch_name, card_name, end_of_day)
+            data = {'mrp': price['mrp'], 'installment': price['installment']} if price else None
+        else:
+            data = get_mrp_installment_for_branch_card(branch_name, card_name)
         if data:
             logger.info(f"Found MRP: {data['mrp']}, Installment: {data['installment']}")
-            return jsonify(data)
+            # The form checks the discount against the same thresholds as the server
+            settings = discount_policy.settings_for(branch_name, card_name)
+            return jsonify(dict(data, min_discount_percentage=settings['min_discount_percentage'],
+                                max_discount_percentage=settings['max_discount_percentage']))
         else:
             logger.warning(f"No data found for branch: {branch_name}, card: {card_name}")
             return jsonify({'mrp': None, 'installment': None})
@@ -6,7 +6,10 @@ the old structure or the new normalized structure based on configuration.
 """
 
 import os
+from datetime import datetime, timezone
 from enhanced_data_access import DiscountDataAccess
+from shadow_cutover import CUTOVER_MODE
+from request_changes import decode_watermark, settled_until, build_changes_response, CHANGES_PAGE_SIZE
 
 # Feature flag to enable new database structure
 USE_ENHANCED_DATA_ACCESS = os.getenv('USE_ENHANCED_DATA_ACCESS', 'false').lower() == 'true'
@@ -60,7 +63,12 @@ def get_mrp_installment_for_branch_card_enhanced(branch_name, card_name):
     return get_mrp_installment_for_branch_card(branch_name, card_name)
 
 def create_discount_request_enhanced(request_data):
-    """Enhanced version of discount request creation."""
+    """
+    Enhanced version of discount request creation.
+
+    The submission is also appended to the request event log, with the new
+    request_id, so the projection, SLA tracking and queues see it.
+    """
     if USE_ENHANCED_DATA_ACCESS:
         data_access = get_enhanced_data_access()
         if data_access:
@@ -89,6 +97,7 @@ def create_discount_request_enhanced(request_data):
                 return {'success': False, 'error': 'Failed to create student record'}
             
             # Create discount request
+            assigned_to = assign_approvers([request_data['branch_name']])[0]
             request_id = data_access.create_discount_request(
                 student_id=student_id,
                 course_id=course_details['course_id'],
@@ -97,10 +106,15 @@ def create_discount_request_enhanced(request_data):
                 discount_reason=request_data['reason'],
                 remarks=request_data.get('remarks', ''),
                 requester_email=request_data['requester_email'],
-                requester_name=request_data['requester_name']
+                requester_name=request_data['requester_name'],
+                assigned_to=assigned_to
             )
             
             if request_id:
+                submission = dict(request_data, mrp=course_details['mrp'], installment=course_details['installment'],
+                                  status='PENDING_L1', created_at=datetime.now(timezone.utc).isoformat(),
+                                  assigned_to=assigned_to)
+                event_log.record_submission(submission, session.get('approver_level'), request_id=request_id)
                 return {'success': True, 'request_id': request_id}
             else:
                 return {'success': False, 'error': 'Failed to create request'}
@@ -113,15 +127,22 @@ def get_pending_requests_enhanced(approver_level, approver_email):
     if USE_ENHANCED_DATA_ACCESS:
         data_access = get_enhanced_data_access()
         if data_access:
+            scope, _ = get_approver_queue(approver_level, approver_email)
             return data_access.get_pending_requests_for_approver(
-                approver_level, approver_email
+                approver_level, approver_email, scope
             )
     
     # Fallback to original implementation
     return get_pending_requests_original(approver_level, approver_email)
 
 def approve_request_enhanced(request_data):
-    """Enhanced version of request approval."""
+    """
+    Enhanced version of request approval.
+
+    request_data['enquiry_no'] names the request in the event log, where an
+    applied approval is also appended (the conditional UPDATE of
+    discount_requests_new has already checked the status).
+    """
     if USE_ENHANCED_DATA_ACCESS:
         data_access = get_enhanced_data_access()
         if data_access:
@@ -134,6 +155,11 @@ def approve_request_enhanced(request_data):
                 approved_amount=request_data.get('approved_amount'),
                 comments=request_data.get('comments', '')
             )
+            if success and request_data.get('enquiry_no'):
+                event_log.record_transition(request_data['enquiry_no'], request_data['approver_level'],
+                                            request_data['action'], request_data['approver_email'],
+                                            request_data.get('comments', ''), request_data.get('approved_amount'),
+                                            check_state=False, request_id=request_data['request_id'])
             return {'success': success}
     
     # Fallback to original implementation
@@ -149,6 +175,16 @@ def get_dashboard_stats_enhanced():
     # Fallback to original implementation
     return get_dashboard_stats()
 
+def get_request_changes_enhanced(since, until, limit):
+    """Enhanced version of the change feed, backed by discount_requests_new.updated_at."""
+    if USE_ENHANCED_DATA_ACCESS:
+        data_access = get_enhanced_data_access()
+        if data_access:
+            return data_access.get_request_changes(since, until, limit)
+    
+    # Fallback to original implementation (request event projection)
+    return event_log.changes_since(since, until, limit)
+
 # Example of how to update the routes to use enhanced functions
 
 # Update the request_discount route
@@ -185,13 +221,16 @@ def request_discount_route_enhanced():
                 flash('Invalid branch and card combination.', 'error')
                 return redirect(url_for('request_discount'))
             
-            # Validate discount percentage
-            discount_percentage = (request_data['discount_amount'] / pricing['installment']) * 100
-            if discount_percentage <= 30:
-                flash('Use ERP for discounts up to 30%. This portal handles discounts greater than 30%.', 'error')
+            # Validate the discount against the same policy as the legacy route
+            evaluation = discount_policy.evaluate(request_data['branch_name'], request_data['card_name'],
+                                                  pricing['mrp'], pricing['installment'],
+                                                  request_data['discount_amount'])
+            if not evaluation.ok:
+                flash(evaluation.errors[0], 'error')
                 return redirect(url_for('request_discount'))
             
             # Create request using enhanced function
+            request_data.update(evaluation.fields())
             result = create_discount_request_enhanced(request_data)
             
             if result['success']:
@@ -223,6 +262,7 @@ def debug_db_structure():
     
     info = {
         'USE_ENHANCED_DATA_ACCESS': USE_ENHANCED_DATA_ACCESS,
+        'CUTOVER_MODE': CUTOVER_MODE,
         'Enhanced Data Access Available': bool(get_enhanced_data_access()),
         'BigQuery Client Available': bool(get_bigquery_client()),
     }
@@ -247,6 +287,7 @@ def debug_db_structure():
     html += '<p>To enable enhanced data access:</p>'
     html += '<ol>'
     html += '<li>Run: <code>python migrate_database.py migrate</code></li>'
+    html += '<li>Set <code>CUTOVER_MODE=shadow</code> and watch the cutover_* metrics</li>'
     html += '<li>Set environment variable: <code>USE_ENHANCED_DATA_ACCESS=true</code></li>'
     html += '<li>Restart application</li>'
     html += '</ol>'
@@ -289,6 +330,20 @@ def get_mrp_api_enhanced(branch_name, card_name):
         logger.error(f"Error in enhanced MRP API: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/requests/changes/enhanced')
+def get_request_changes_api_enhanced():
+    """Enhanced API endpoint for incremental request changes."""
+    try:
+        since = decode_watermark(request.args.get('since', ''))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    until = settled_until()
+    rows = get_request_changes_enhanced(since, until, CHANGES_PAGE_SIZE + 1)
+    if USE_ENHANCED_DATA_ACCESS:
+        return jsonify(build_changes_response(rows, since, until,
+                                              changed_at_column='updated_at', key_column='request_id'))
+    return jsonify(build_changes_response(rows, since, until))
+
 # Migration helper functions for backward compatibility
 def create_discount_request_original(request_data):
     """Original implementation placeholder."""
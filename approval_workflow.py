@@ -0,0 +1,86 @@
+"""
+Approval state machine for discount requests.
+
+Every approval action is a transition between two statuses. Transitions are
+applied with a single conditional UPDATE (... AND status = @expected_status),
+so the affected-row count tells us whether this approver won: a request that
+another approver has already moved on is left untouched and reported back.
+"""
+
+import logging
+from datetime import datetime, timezone
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING_L1 = 'PENDING_L1'
+STATUS_PENDING_L2 = 'PENDING_L2'
+STATUS_APPROVED = 'APPROVED'
+STATUS_REJECTED = 'REJECTED'
+
+# (approver_level, action) -> (expected current status, new status)
+TRANSITIONS = {
+    ('L1', 'APPROVE'): (STATUS_PENDING_L1, STATUS_PENDING_L2),
+    ('L1', 'REJECT'): (STATUS_PENDING_L1, STATUS_REJECTED),
+    ('L2', 'APPROVE'): (STATUS_PENDING_L2, STATUS_APPROVED),
+    ('L2', 'REJECT'): (STATUS_PENDING_L2, STATUS_REJECTED),
+}
+
+
+def get_transition(approver_level, action):
+    """Return (expected_status, new_status) for an allowed transition, or None."""
+    return TRANSITIONS.get((approver_level, action))
+
+
+def build_legacy_transition(project_id, dataset_id, enquiry_no, approver_level, action,
+                            approver_email, comments='', approved_amount=None, acted_at=None):
+    """Build the conditional UPDATE for a transition on the discount_requests table."""
+    transition = get_transition(approver_level, action)
+    if transition is None:
+        raise ValueError(f"Transition not allowed: {approver_level} {action}")
+    expected_status, new_status = transition
+    level = approver_level.lower()
+
+    assignments = [
+        'status = @new_status',
+        f'{level}_approver = @approver_email',
+        f'{level}_approved_at = @approved_at',
+        f'{level}_comments = @comments',
+    ]
+    params = [
+        bigquery.ScalarQueryParameter('new_status', 'STRING', new_status),
+        bigquery.ScalarQueryParameter('approver_email', 'STRING', approver_email),
+        bigquery.ScalarQueryParameter('approved_at', 'STRING', acted_at or datetime.now(timezone.utc).isoformat()),
+        bigquery.ScalarQueryParameter('comments', 'STRING', comments),
+        bigquery.ScalarQueryParameter('enquiry_no', 'STRING', enquiry_no),
+        bigquery.ScalarQueryParameter('expected_status', 'STRING', expected_status),
+    ]
+    if action == 'APPROVE':
+        assignments += ['discounted_fees = @approved_amount', 'net_discount = mrp - @approved_amount']
+        params.append(bigquery.ScalarQueryParameter('approved_amount', 'FLOAT', approved_amount))
+
+    query = f"""
+        UPDATE `{project_id}.{dataset_id}.discount_requests`
+        SET {', '.join(assignments)}
+        WHERE enquiry_no = @enquiry_no AND status = @expected_status
+    """
+    return query, params
+
+
+def apply_legacy_transition(client, project_id, dataset_id, enquiry_no, approver_level, action,
+                            approver_email, comments='', approved_amount=None):
+    """
+    Apply an approval transition to discount_requests in one DML job.
+
+    Returns True if this call moved the request, False if the request does not
+    exist or is no longer in the expected status.
+    """
+    query, params = build_legacy_transition(project_id, dataset_id, enquiry_no, approver_level,
+                                            action, approver_email, comments, approved_amount)
+    job = client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
+    job.result()
+    affected = job.num_dml_affected_rows or 0
+    if not affected:
+        logger.warning(f"Transition {approver_level} {action} on {enquiry_no} by {approver_email} "
+                       f"lost: request not in status {get_transition(approver_level, action)[0]}")
+    return affected > 0
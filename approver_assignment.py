@@ -0,0 +1,269 @@
+"""
+Assignment of new discount requests to individual L1 approvers.
+
+Approver pools are read from APPROVER_POOLS_PATH, a JSON object:
+
+    {"pools": [
+        {"branches": ["Kolkata", "Siliguri", "Bhubaneshwar"],
+         "approvers": [{"email": "raja.ray@pw.live", "weight": 2}, {"email": "..."}]},
+        {"approvers": [{"email": "praduman.shukla@pw.live"}]}
+     ],
+     "delegations": [
+        {"from": "raja.ray@pw.live", "to": "...", "start": "2026-11-01", "until": "2026-11-08"}
+     ]}
+
+A branch belongs to the first pool listing it, otherwise to the pool without
+branches. Without a file the pools are the previous fixed routing: Raja Ray
+for Kolkata/Siliguri/Bhubaneshwar, Praduman for every other branch.
+
+Each new request is assigned (assigned_to) to one member of its branch's pool,
+by APPROVER_ASSIGNMENT_STRATEGY:
+
+- ``least_pending`` (default): the fewest pending L1 requests per unit of
+  weight, from live queue depth; ties go to whoever was assigned least recently;
+- ``round_robin``: smooth weighted round-robin.
+
+A member with a delegation in effect (start inclusive, until exclusive, dates
+in ROLLUP_TIMEZONE) is away. Their share of new requests goes to the delegate,
+or to the rest of the pool when there is none. The delegate also works the
+queue already assigned to them. Queue depth is kept from the request event log,
+like the SLA tracker's queues.
+
+L1 approvers in no pool see every pending L1 request, as before.
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from live_updates import QueueScope
+from rollups import ROLLUP_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+APPROVER_POOLS_PATH = os.getenv('APPROVER_POOLS_PATH', str(Path(__file__).parent / 'approver_pools.json'))
+APPROVER_ASSIGNMENT_STRATEGY = os.getenv('APPROVER_ASSIGNMENT_STRATEGY', 'least_pending')
+STRATEGIES = ('least_pending', 'round_robin')
+
+STATUS_PENDING_L1 = 'PENDING_L1'
+
+DEFAULT_POOLS = {
+    'pools': [
+        {'branches': ['Kolkata', 'Siliguri', 'Bhubaneshwar'], 'approvers': [{'email': 'raja.ray@pw.live'}]},
+        {'approvers': [{'email': 'praduman.shukla@pw.live'}]},
+    ],
+}
+
+
+def _parse_date(value):
+    """Aware datetime for an ISO date or datetime (naive values are local time)."""
+    parsed = datetime.fromisoformat(str(value))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=ZoneInfo(ROLLUP_TIMEZONE))
+    return parsed
+
+
+class ApproverPools:
+    """Branch pools of L1 approvers with weights, and delegations while someone is away."""
+
+    def __init__(self, config=None):
+        config = DEFAULT_POOLS if config is None else config
+        if not isinstance(config, dict):
+            raise ValueError("Approver pools must be an object")
+        self.pools = []
+        self.default_pool = None
+        self._by_branch = {}
+        for pool in config.get('pools', []):
+            approvers = {}
+            for approver in pool.get('approvers', []):
+                if not isinstance(approver, dict) or not approver.get('email'):
+                    raise ValueError("Each approver needs an email")
+                weight = approver.get('weight', 1)
+                if not isinstance(weight, (int, float)) or weight <= 0:
+                    raise ValueError(f"Weight of {approver['email']} must be a positive number")
+                approvers[approver['email']] = float(weight)
+            branches = pool.get('branches') or []
+            entry = {'branches': set(branches), 'approvers': approvers}
+            self.pools.append(entry)
+            if not branches and self.default_pool is None:
+                self.default_pool = entry
+            for branch in branches:
+                self._by_branch.setdefault(branch, entry)
+        self.delegations = []
+        for delegation in config.get('delegations', []):
+            if not delegation.get('from'):
+                raise ValueError("Each delegation needs a from email")
+            self.delegations.append({
+                'from': delegation['from'],
+                'to': delegation.get('to'),
+                'start': _parse_date(delegation['start']) if delegation.get('start') else None,
+                'until': _parse_date(delegation['until']) if delegation.get('until') else None,
+            })
+        self.members = {email for pool in self.pools for email in pool['approvers']}
+        self.listed_branches = set(self._by_branch)
+
+    @classmethod
+    def load(cls, path=APPROVER_POOLS_PATH):
+        """Pools from a JSON file; the previous fixed routing if there is no file."""
+        try:
+            with open(path) as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except Exception as e:
+            logger.error(f"Could not read approver pools {path}: {e}; using the defaults")
+            return cls()
+
+    def pool_for(self, branch_name):
+        """{email: weight} of the pool a branch's requests go to (empty if none)."""
+        pool = self._by_branch.get(branch_name, self.default_pool)
+        return dict(pool['approvers']) if pool else {}
+
+    def away(self, now):
+        """{email: delegate or None} for delegations in effect at now."""
+        away = {}
+        for delegation in self.delegations:
+            if delegation['start'] is not None and now < delegation['start']:
+                continue
+            if delegation['until'] is not None and now >= delegation['until']:
+                continue
+            away[delegation['from']] = delegation['to']
+        return away
+
+    def branch_scope(self, emails):
+        """(branch_in, branch_not_in) covering every pool the emails belong to."""
+        pools = [pool for pool in self.pools if set(pool['approvers']) & set(emails)]
+        if any(not pool['branches'] for pool in pools):
+            own = set().union(*(pool['branches'] for pool in pools))
+            others = self.listed_branches - own
+            return None, (others or None)
+        return set().union(*(pool['branches'] for pool in pools)), None
+
+
+class ApproverAssigner:
+    """Assigns new requests within ApproverPools, from live per-approver queue depth."""
+
+    def __init__(self, pools, event_log=None, strategy=APPROVER_ASSIGNMENT_STRATEGY):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown assignment strategy {strategy}; use one of {', '.join(STRATEGIES)}")
+        self.pools = pools
+        self.event_log = event_log
+        self.strategy = strategy
+        self.seeded = False
+        self._assigned = {}
+        self._pending = {}
+        self._last_assigned = {}
+        self._round_robin = {}
+        self._sequence = 0
+        self._lock = threading.RLock()
+
+    def _now(self):
+        return datetime.now(ZoneInfo(ROLLUP_TIMEZONE))
+
+    def _set(self, enquiry_no, assigned_to):
+        previous = self._assigned.pop(enquiry_no, None)
+        if previous is not None:
+            self._pending[previous] -= 1
+        if assigned_to:
+            self._assigned[enquiry_no] = assigned_to
+            self._pending[assigned_to] = self._pending.get(assigned_to, 0) + 1
+
+    def _seed(self, rows):
+        with self._lock:
+            for row in rows:
+                if row['status'] == STATUS_PENDING_L1:
+                    self._set(row['enquiry_no'], row.get('assigned_to'))
+            self.seeded = True
+        logger.info(f"Approver assigner seeded with {len(self._assigned)} assigned pending requests")
+
+    def ensure_seeded(self):
+        """Seed from the event log's projection once it is loaded."""
+        if self.event_log is None or self.seeded:
+            return True
+        if not self.event_log.ensure_loaded():
+            return False
+        with self._lock:
+            if not self.seeded:
+                self.event_log.with_rows(self._seed)
+        return True
+
+    def on_request_event(self, event, row, previous_status):
+        """RequestEventLog listener: keep each approver's pending L1 count current."""
+        if not self.seeded:
+            return
+        with self._lock:
+            self._set(row['enquiry_no'], row.get('assigned_to') if row['status'] == STATUS_PENDING_L1 else None)
+
+    def pending(self, email):
+        with self._lock:
+            return self._pending.get(email, 0)
+
+    def candidates(self, branch_name, now=None):
+        """{email: weight} available for a branch's new requests, with delegates standing in."""
+        pool = self.pools.pool_for(branch_name)
+        away = self.pools.away(now or self._now())
+        candidates = {}
+        for email, weight in pool.items():
+            if email in away:
+                email = away[email]
+                if email is None or email in away:
+                    continue
+            candidates[email] = candidates.get(email, 0) + weight
+        # Everyone away and nobody delegated: the pool still has to take the work
+        return candidates or pool
+
+    def _choose(self, candidates, extra):
+        if self.strategy == 'round_robin':
+            key = tuple(sorted(candidates))
+            current = self._round_robin.setdefault(key, {})
+            for email, weight in candidates.items():
+                current[email] = current.get(email, 0) + weight
+            choice = max(sorted(candidates), key=lambda email: current[email])
+            current[choice] -= sum(candidates.values())
+        else:
+            choice = min(sorted(candidates), key=lambda email: (
+                (self._pending.get(email, 0) + extra.get(email, 0)) / candidates[email],
+                self._last_assigned.get(email, 0)))
+        self._sequence += 1
+        self._last_assigned[choice] = self._sequence
+        return choice
+
+    def assign_many(self, branch_names, now=None):
+        """Approver emails for new requests in these branches (None where a branch has no pool)."""
+        now = now or self._now()
+        extra = {}
+        assigned = []
+        with self._lock:
+            for branch_name in branch_names:
+                candidates = self.candidates(branch_name, now)
+                if not candidates:
+                    assigned.append(None)
+                    continue
+                choice = self._choose(candidates, extra)
+                # Counted here until the submission events arrive
+                extra[choice] = extra.get(choice, 0) + 1
+                assigned.append(choice)
+        return assigned
+
+    def assign(self, branch_name, now=None):
+        return self.assign_many([branch_name], now)[0]
+
+    def assignees_for(self, email, now=None):
+        """Whose assigned requests an approver works: theirs and those delegated to them (None: all)."""
+        if email not in self.pools.members:
+            return None
+        away = self.pools.away(now or self._now())
+        return {email} | {delegator for delegator, delegate in away.items() if delegate == email}
+
+    def queue_scope(self, email, now=None):
+        """QueueScope of an L1 approver's pending queue."""
+        assignees = self.assignees_for(email, now)
+        if assignees is None:
+            return QueueScope(STATUS_PENDING_L1)
+        branch_in, branch_not_in = self.pools.branch_scope(assignees)
+        return QueueScope(STATUS_PENDING_L1, branch_in=branch_in, branch_not_in=branch_not_in,
+                          assigned_to=assignees)
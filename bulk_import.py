@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Bulk import of discount requests from CSV or Excel.
+
+Rows are streamed from the upload, parsed against the cached catalog and then
+checked in one vectorized pass with the same discount policy as the request
+form (enquiry number format, MRP/installment match, ERP threshold). Duplicates are dropped within the
+file and against existing requests with one lookup query. All valid rows are
+written in a single batch load job plus one event append. Each request is
+assigned to an L1 approver (see approver_assignment.py), and each approver
+gets one consolidated email for the whole import. Rejected rows are
+returned as a CSV error report.
+
+Usage:
+    python bulk_import.py requests.csv --requester counselor@pw.live [--dry-run]
+"""
+
+import io
+import os
+import csv
+import sys
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from google.cloud import bigquery
+
+from discount_policy import DiscountPolicy
+
+logger = logging.getLogger(__name__)
+
+BULK_IMPORT_MAX_ROWS = int(os.getenv('BULK_IMPORT_MAX_ROWS', 1000))
+
+REQUIRED_COLUMNS = [
+    'enquiry_no', 'student_name', 'mobile_no', 'branch_name', 'card_name',
+    'mrp', 'installment', 'discount_amount', 'reason',
+]
+OPTIONAL_COLUMNS = ['remarks']
+ERROR_REPORT_COLUMNS = ['row', 'enquiry_no', 'error'] + REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+
+
+def _normalize_header(name):
+    return str(name or '').strip().lower().replace(' ', '_')
+
+
+def iter_csv_rows(stream):
+    """Yield dicts from a CSV byte stream without reading it all into memory."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    header = [_normalize_header(h) for h in next(reader, [])]
+    for values in reader:
+        if any(v.strip() for v in values):
+            yield dict(zip(header, (v.strip() for v in values)))
+
+
+def iter_xlsx_rows(stream):
+    """Yield dicts from an .xlsx stream (needs the optional openpyxl package)."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Excel uploads need the openpyxl package; upload a CSV instead")
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = [_normalize_header(h) for h in next(rows, [])]
+    for values in rows:
+        if any(v not in (None, '') for v in values):
+            yield dict(zip(header, ('' if v is None else str(v).strip() for v in values)))
+
+
+def iter_upload_rows(stream, filename):
+    """Pick the row reader from the file extension."""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return iter_xlsx_rows(stream)
+    if filename.lower().endswith('.csv'):
+        return iter_csv_rows(stream)
+    raise ValueError("Unsupported file type; upload a .csv or .xlsx file")
+
+
+def parse_row(raw, catalog, validate_enquiry_no):
+    """
+    Return (errors, values) for one uploaded row. values holds the submitted
+    amounts and catalog fees for the policy check, or is None if the row
+    cannot be checked at all.
+    """
+    missing = [c for c in REQUIRED_COLUMNS if not raw.get(c)]
+    if missing:
+        return [f"Missing {', '.join(missing)}"], None
+
+    errors = []
+    enquiry_no = raw['enquiry_no']
+    if not validate_enquiry_no(enquiry_no):
+        errors.append('Invalid enquiry number format (EN followed by 9 digits)')
+
+    try:
+        mrp = float(raw['mrp'])
+        installment = float(raw['installment'])
+        discount_amount = float(raw['discount_amount'])
+    except ValueError:
+        return errors + ['MRP, installment and discount amount must be numbers'], None
+
+    fees = catalog.fees(raw['branch_name'], raw['card_name'])
+    if not fees:
+        return errors + ['Invalid branch and card combination'], None
+    return errors, {'branch_name': raw['branch_name'], 'card_name': raw['card_name'], 'fees': fees,
+                    'catalog_mrp': fees['mrp'], 'catalog_installment': fees['installment'],
+                    'mrp': mrp, 'installment': installment, 'discount_amount': discount_amount}
+
+
+def request_row(raw, fees, fields):
+    """The discount_requests row for a valid upload row (fields from the policy evaluation)."""
+    return {
+        'enquiry_no': raw['enquiry_no'],
+        'student_name': raw['student_name'],
+        'mobile_no': raw['mobile_no'],
+        'card_name': raw['card_name'],
+        'mrp': fees['mrp'],
+        'installment': fees['installment'],
+        **fields,
+        'reason': raw['reason'],
+        'remarks': raw.get('remarks', ''),
+        'branch_name': raw['branch_name'],
+        'status': 'PENDING_L1',
+        'l1_approver': None,
+        'l2_approver': None,
+    }
+
+
+def existing_enquiries(client, project_id, dataset_id, enquiry_nos, requester_email):
+    """Enquiry numbers this requester has already submitted, in one query."""
+    if not enquiry_nos:
+        return set()
+    query = f"""
+        SELECT DISTINCT enquiry_no FROM `{project_id}.{dataset_id}.discount_requests`
+        WHERE requester_email = @requester_email AND enquiry_no IN UNNEST(@enquiry_nos)
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter('requester_email', 'STRING', requester_email),
+        bigquery.ArrayQueryParameter('enquiry_nos', 'STRING', list(enquiry_nos)),
+    ])
+    return {row['enquiry_no'] for row in client.query(query, job_config=job_config).result()}
+
+
+def load_requests(client, project_id, dataset_id, rows):
+    """Append rows to discount_requests with one batch load job (no DML quota used)."""
+    job_config = bigquery.LoadJobConfig(
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+    )
+    client.load_table_from_json(rows, f"{project_id}.{dataset_id}.discount_requests",
+                                job_config=job_config).result()
+
+
+def error_report_csv(errors):
+    """CSV text of rejected rows, one line per row with all its errors."""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=ERROR_REPORT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for error in errors:
+        writer.writerow(dict(error['values'], row=error['row'], error='; '.join(error['errors'])))
+    return output.getvalue()
+
+
+class BulkImportResult:
+    def __init__(self):
+        self.imported = []
+        self.errors = []
+        self.total_rows = 0
+        self.notified = 0
+
+    def reject(self, row_number, raw, errors):
+        self.errors.append({'row': row_number, 'enquiry_no': raw.get('enquiry_no', ''),
+                            'errors': errors, 'values': raw})
+
+
+class BulkImporter:
+    """Runs the validate -> dedup -> batch write -> notify pipeline for one upload."""
+
+    def __init__(self, client_getter, project_id, dataset_id, catalog, event_log, validate_enquiry_no,
+                 get_approvers_for_branch=None, notify=None, event_sourced=False, policy=None, assign=None):
+        self.client_getter = client_getter
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.catalog = catalog
+        self.event_log = event_log
+        self.validate_enquiry_no = validate_enquiry_no
+        self.get_approvers_for_branch = get_approvers_for_branch
+        self.notify = notify
+        self.event_sourced = event_sourced
+        self.policy = policy or DiscountPolicy()
+        # assign(branch_names) -> L1 approver for each new request
+        self.assign = assign
+
+    def validate(self, rows, result, requester_email, requester_name):
+        """Validate streamed rows; returns the valid request rows in file order."""
+        parsed = []
+        for row_number, raw in enumerate(rows, start=2):
+            result.total_rows += 1
+            if result.total_rows > BULK_IMPORT_MAX_ROWS:
+                raise ValueError(f"Too many rows; the limit is {BULK_IMPORT_MAX_ROWS} per import")
+            errors, values = parse_row(raw, self.catalog, self.validate_enquiry_no)
+            if values is None:
+                result.reject(row_number, raw, errors)
+            else:
+                parsed.append((row_number, raw, errors, values))
+
+        # One policy evaluation for the whole file
+        column = lambda key: [values[key] for *_, values in parsed]
+        evaluation = self.policy.evaluate_batch(
+            column('branch_name'), column('card_name'), column('catalog_mrp'), column('catalog_installment'),
+            column('discount_amount'), submitted_mrp=column('mrp'), submitted_installment=column('installment'),
+        )
+        valid = {}
+        for index, (row_number, raw, errors, values) in enumerate(parsed):
+            errors = errors + [message for _, message in evaluation.messages(index, values['mrp'], values['installment'])]
+            data = None if errors else request_row(raw, values['fees'], evaluation.fields(index))
+            if not errors and data['enquiry_no'] in valid:
+                errors = [f"Duplicate of row {valid[data['enquiry_no']][0]} in this file"]
+            if errors:
+                result.reject(row_number, raw, errors)
+                continue
+            data['requester_email'] = requester_email
+            data['requester_name'] = requester_name
+            valid[data['enquiry_no']] = (row_number, raw, data)
+        return valid
+
+    def drop_existing(self, valid, result, requester_email):
+        if self.event_sourced:
+            existing = {e for e in valid if self.event_log.get_request(e)}
+        else:
+            existing = existing_enquiries(self.client_getter(), self.project_id, self.dataset_id,
+                                          valid, requester_email)
+        for enquiry_no in existing:
+            row_number, raw, _ = valid.pop(enquiry_no)
+            result.reject(row_number, raw, ['Duplicate request. This enquiry number has already been submitted.'])
+
+    def run(self, rows, requester_email, requester_name, actor_level=None, dry_run=False):
+        result = BulkImportResult()
+        valid = self.validate(rows, result, requester_email, requester_name)
+        self.drop_existing(valid, result, requester_email)
+        result.errors.sort(key=lambda e: e['row'])
+
+        datas = [data for _, _, data in valid.values()]
+        if not datas or dry_run:
+            result.imported = datas
+            return result
+
+        created_at = datetime.now(timezone.utc).isoformat()
+        for data in datas:
+            data['created_at'] = created_at
+        if self.assign:
+            for data, assigned_to in zip(datas, self.assign([data['branch_name'] for data in datas])):
+                data['assigned_to'] = assigned_to
+        if not self.event_sourced:
+            load_requests(self.client_getter(), self.project_id, self.dataset_id, datas)
+            # discount_requests is the record; the event log only mirrors it
+            self.event_log.record_submissions(datas, actor_level)
+        else:
+            recorded = {row['enquiry_no'] for row in self.event_log.record_submissions(datas, actor_level)}
+            for data in [data for data in datas if data['enquiry_no'] not in recorded]:
+                row_number, raw, _ = valid[data['enquiry_no']]
+                if self.event_log.get_request(data['enquiry_no']):
+                    error = 'Duplicate request. This enquiry number has already been submitted.'
+                else:
+                    error = 'Could not be saved. Please try again.'
+                result.reject(row_number, raw, [error])
+            result.errors.sort(key=lambda e: e['row'])
+            datas = [data for data in datas if data['enquiry_no'] in recorded]
+        result.imported = datas
+        logger.info(f"Bulk import by {requester_email}: {len(datas)} imported, {len(result.errors)} rejected")
+
+        if datas and self.notify and self.get_approvers_for_branch:
+            result.notified = self.notify_approvers(datas)
+        return result
+
+    def notify_approvers(self, datas):
+        """One consolidated email per L1 approver covering all their imported requests."""
+        from notifications import build_request_context, render_digest, L1_APPROVAL_REQUIRED
+
+        approvers_by_branch = {}
+        items_by_approver = {}
+        for data in datas:
+            branch = data['branch_name']
+            if data.get('assigned_to'):
+                emails = [data['assigned_to']]
+            else:
+                if branch not in approvers_by_branch:
+                    approvers_by_branch[branch] = [email for email, _ in self.get_approvers_for_branch(branch, 'L1')]
+                emails = approvers_by_branch[branch]
+            for email in emails:
+                items_by_approver.setdefault(email, []).append(
+                    {'kind': L1_APPROVAL_REQUIRED, 'context': build_request_context(data)})
+
+        sent = 0
+        for email, items in items_by_approver.items():
+            subject, html_body, text_body = render_digest(
+                items, subject=f"Bulk Discount Requests - {len(items)} awaiting L1 approval")
+            if self.notify([email], subject, html_body, text_body):
+                sent += 1
+        return sent
+
+
+def main():
+    """Import a CSV/Excel file from the command line through the app's backends."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Bulk import discount requests')
+    parser.add_argument('path', help='CSV or .xlsx file')
+    parser.add_argument('--requester', required=True, help='Requester email (must be authorized to request)')
+    parser.add_argument('--dry-run', action='store_true', help='Validate only; write nothing')
+    parser.add_argument('--errors', help='Write the error report CSV to this path')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, str(Path(__file__).parent))
+    import app as discount_app
+
+    person = discount_app.get_authorized_person(args.requester)
+    if not person or not person.get('can_request_discount'):
+        logger.error(f"{args.requester} is not authorized to request discounts")
+        sys.exit(1)
+
+    importer = discount_app.get_bulk_importer()
+    with open(args.path, 'rb') as stream:
+        result = importer.run(iter_upload_rows(stream, args.path), args.requester, person['name'],
+                              person['approver_level'], dry_run=args.dry_run)
+
+    verb = 'Validated' if args.dry_run else 'Imported'
+    logger.info(f"{verb} {len(result.imported)} of {result.total_rows} rows; "
+                f"{len(result.errors)} rejected; {result.notified} approvers notified")
+    if result.errors:
+        report = error_report_csv(result.errors)
+        if args.errors:
+            Path(args.errors).write_text(report, encoding='utf-8')
+            logger.info(f"Error report written to {args.errors}")
+        else:
+            sys.stdout.write(report)
+
+
+if __name__ == '__main__':
+    main()
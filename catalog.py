@@ -0,0 +1,81 @@
+"""
+In-process cache of the branch/card fee catalog (branch_cards_fees).
+
+The catalog is small and changes rarely, so the whole table is read in one
+query and served from memory until CATALOG_CACHE_SECONDS have passed. The
+dropdown APIs, the request form validation and bulk imports all read from it
+instead of issuing a BigQuery job per lookup.
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_SECONDS = int(os.getenv('CATALOG_CACHE_SECONDS', 300))
+
+
+class CatalogCache:
+    """Branch -> card -> {'mrp', 'installment'} loaded from branch_cards_fees."""
+
+    def __init__(self, client_getter, project_id, dataset_id, ttl=CATALOG_CACHE_SECONDS):
+        self.client_getter = client_getter
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.ttl = ttl
+        self._fees = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        client = self.client_getter()
+        if not client:
+            logger.error("BigQuery client not available for catalog")
+            return None
+        query = f"""
+            SELECT branch_name, card_name, mrp, installment
+            FROM `{self.project_id}.{self.dataset_id}.branch_cards_fees`
+        """
+        fees = {}
+        for row in client.query(query).result():
+            fees.setdefault(row['branch_name'], {})[row['card_name']] = {
+                'mrp': float(row['mrp']),
+                'installment': float(row['installment']),
+            }
+        logger.info(f"Loaded catalog: {sum(len(cards) for cards in fees.values())} cards "
+                    f"across {len(fees)} branches")
+        return fees
+
+    def _catalog(self):
+        if self._fees is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return self._fees
+        with self._lock:
+            if self._fees is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._fees
+            try:
+                fees = self._load()
+            except Exception as e:
+                logger.error(f"Error loading catalog: {e}")
+                fees = None
+            if fees is not None:
+                self._fees = fees
+                self._loaded_at = time.monotonic()
+            # On failure keep serving the previous catalog, if any
+            return self._fees or {}
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def branches(self):
+        return sorted(self._catalog())
+
+    def cards(self, branch_name):
+        return sorted(self._catalog().get(branch_name, {}))
+
+    def fees(self, branch_name, card_name):
+        """{'mrp', 'installment'} for a branch/card, or None if not in the catalog."""
+        fees = self._catalog().get(branch_name, {}).get(card_name)
+        return dict(fees) if fees else None
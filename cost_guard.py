@@ -0,0 +1,302 @@
+"""
+BigQuery cost guard: dry-run cost plans and a per-query bytes-billed cap.
+
+Plan mode finds every SQL string literal in the data access modules (with
+their query parameter types, read from the same function) and every statement
+in migrations/, dry-runs each distinct one and reports bytes processed. Run it
+with ``migrate_database.py cost``; ``--save-baseline`` writes the result to
+QUERY_COST_BASELINE_PATH, and later plans flag queries whose cost grew by more
+than QUERY_COST_REGRESSION_FACTOR.
+
+At runtime GuardedClient wraps the app's bigquery.Client: every query gets
+maximum_bytes_billed (QUERY_MAX_BYTES_BILLED), so a scan blowup fails instead
+of being billed, and finished jobs are compared with the baseline.
+"""
+
+import os
+import re
+import ast
+import json
+import hashlib
+import logging
+import threading
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+# Per-query cap on bytes billed (0 disables it); default 10 GiB
+QUERY_MAX_BYTES_BILLED = int(os.getenv('QUERY_MAX_BYTES_BILLED', 10 * 1024 ** 3))
+QUERY_COST_BASELINE_PATH = os.getenv('QUERY_COST_BASELINE_PATH',
+                                     str(Path(__file__).parent / 'query_costs.json'))
+QUERY_COST_REGRESSION_FACTOR = float(os.getenv('QUERY_COST_REGRESSION_FACTOR', 2.0))
+# Growth below this many bytes is never a regression (tiny tables fluctuate)
+QUERY_COST_MIN_BYTES = int(os.getenv('QUERY_COST_MIN_BYTES', 10 * 1024 ** 2))
+
+SQL_START = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|MERGE)\b')
+PARAMETER = re.compile(r'@(\w+)')
+
+DUMMY_VALUES = {
+    'STRING': lambda: '',
+    'INT64': lambda: 0,
+    'INTEGER': lambda: 0,
+    'FLOAT': lambda: 0.0,
+    'FLOAT64': lambda: 0.0,
+    'NUMERIC': lambda: 0,
+    'BOOL': lambda: False,
+    'TIMESTAMP': lambda: datetime.now(timezone.utc),
+    'DATE': lambda: date.today(),
+}
+
+
+def fingerprint(sql):
+    """Stable id for a query: hash of its text with whitespace collapsed."""
+    return hashlib.sha256(' '.join(sql.split()).encode()).hexdigest()[:12]
+
+
+def format_bytes(value):
+    if value is None:
+        return '-'
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
+
+
+class PlannedQuery:
+    """A query found in the source, with the parameter types it is run with."""
+
+    def __init__(self, origin, sql, param_types=None, partial=False):
+        self.origin = origin
+        self.sql = sql
+        self.param_types = param_types or {}
+        self.partial = partial  # optional clauses could not be resolved and were left out
+
+    @property
+    def fingerprint(self):
+        return fingerprint(self.sql)
+
+
+def _dotted(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted(node.value)
+        return f"{base}.{node.attr}" if base else None
+    return None
+
+
+def _render(node, substitutions):
+    """Text of a str/f-string node with known names substituted; (text, partial)."""
+    if isinstance(node, ast.Constant):
+        return node.value, False
+    text, partial = [], False
+    for value in node.values:
+        if isinstance(value, ast.Constant):
+            text.append(value.value)
+            continue
+        name = _dotted(value.value)
+        if name in substitutions:
+            text.append(substitutions[name])
+        else:
+            partial = True
+    return ''.join(text), partial
+
+
+def _parameter_types(function):
+    """{name: type} from the Scalar/ArrayQueryParameter calls in a function."""
+    types = {}
+    for node in ast.walk(function):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, (ast.Attribute, ast.Name))):
+            continue
+        name = node.func.attr if isinstance(node.func, ast.Attribute) else node.func.id
+        if name not in ('ScalarQueryParameter', 'ArrayQueryParameter') or len(node.args) < 2:
+            continue
+        param, param_type = node.args[0], node.args[1]
+        if isinstance(param, ast.Constant) and isinstance(param_type, ast.Constant):
+            types[param.value] = ('ARRAY', param_type.value) if name == 'ArrayQueryParameter' else param_type.value
+    return types
+
+
+def extract_queries(path, project_id, dataset_id):
+    """PlannedQuery for every SQL string literal in a Python module."""
+    path = Path(path)
+    substitutions = {name: project_id for name in ('project_id', 'PROJECT_ID', 'self.project_id')}
+    substitutions.update({name: dataset_id for name in ('dataset_id', 'DATASET_ID', 'self.dataset_id')})
+
+    queries = []
+    for function in ast.walk(ast.parse(path.read_text())):
+        if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        param_types = _parameter_types(function)
+        for node in _own_nodes(function):
+            if isinstance(node, ast.JoinedStr) or (isinstance(node, ast.Constant) and isinstance(node.value, str)):
+                sql, partial = _render(node, substitutions)
+                if not SQL_START.match(sql) or '`' not in sql:
+                    continue
+                queries.append((node.lineno, PlannedQuery(f"{path.name}:{node.lineno} {function.name}",
+                                                          sql.strip(), param_types, partial)))
+    return [planned for _, planned in sorted(queries, key=lambda item: item[0])]
+
+
+def _own_nodes(function):
+    """Nodes of a function body, not descending into nested functions or f-string parts."""
+    stack = list(ast.iter_child_nodes(function))
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.JoinedStr)):
+            stack.extend(ast.iter_child_nodes(node))
+
+
+def dummy_parameters(sql, param_types):
+    params = []
+    for name in sorted(set(PARAMETER.findall(sql))):
+        param_type = param_types.get(name, 'STRING')
+        if isinstance(param_type, tuple):
+            params.append(bigquery.ArrayQueryParameter(name, param_type[1], []))
+        else:
+            params.append(bigquery.ScalarQueryParameter(name, param_type, DUMMY_VALUES.get(param_type, str)()))
+    return params
+
+
+def dry_run(client, planned):
+    """Bytes the query would process, from a BigQuery dry run."""
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False,
+                                         query_parameters=dummy_parameters(planned.sql, planned.param_types))
+    return client.query(planned.sql, job_config=job_config).total_bytes_processed
+
+
+def load_baseline(path=QUERY_COST_BASELINE_PATH):
+    """{fingerprint: bytes} saved by a previous plan, or {}."""
+    try:
+        with open(path) as f:
+            return {fp: entry['bytes'] for fp, entry in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error(f"Could not read query cost baseline {path}: {e}")
+        return {}
+
+
+def save_baseline(results, path=QUERY_COST_BASELINE_PATH):
+    baseline = {r['fingerprint']: {'bytes': r['bytes'], 'origin': r['origins'][0]}
+                for r in results if r['bytes'] is not None}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    logger.info(f"Saved {len(baseline)} query costs to {path}")
+
+
+def is_regression(planned_bytes, actual_bytes, factor=QUERY_COST_REGRESSION_FACTOR):
+    if planned_bytes is None or actual_bytes is None:
+        return False
+    return actual_bytes > planned_bytes * factor and actual_bytes - planned_bytes > QUERY_COST_MIN_BYTES
+
+
+def plan_costs(client, queries, baseline=None, max_bytes=QUERY_MAX_BYTES_BILLED):
+    """
+    Dry-run each distinct query. Returns one dict per fingerprint with its
+    origins, bytes (None on error), error, and regression/over_limit flags.
+    """
+    baseline = baseline or {}
+    results = {}
+    for planned in queries:
+        result = results.get(planned.fingerprint)
+        if result is not None:
+            result['origins'].append(planned.origin)
+            continue
+        result = {'fingerprint': planned.fingerprint, 'origins': [planned.origin], 'partial': planned.partial,
+                  'bytes': None, 'error': None, 'baseline': baseline.get(planned.fingerprint)}
+        try:
+            result['bytes'] = dry_run(client, planned)
+        except Exception as e:
+            result['error'] = str(e).splitlines()[0][:200]
+        result['regression'] = is_regression(result['baseline'], result['bytes'])
+        result['over_limit'] = bool(max_bytes and result['bytes'] and result['bytes'] > max_bytes)
+        results[planned.fingerprint] = result
+    return sorted(results.values(), key=lambda r: -(r['bytes'] or 0))
+
+
+def format_cost_table(results):
+    lines = [f"{'bytes processed':>16}  {'baseline':>12}  {'flag':10}  {'query':12}  origin"]
+    for r in results:
+        flag = ('ERROR' if r['error'] else 'OVER LIMIT' if r['over_limit']
+                else 'REGRESSION' if r['regression'] else 'partial' if r['partial'] else '')
+        origins = r['origins'][0] + (f" (+{len(r['origins']) - 1} more)" if len(r['origins']) > 1 else '')
+        lines.append(f"{format_bytes(r['bytes']):>16}  {format_bytes(r['baseline']):>12}  {flag:10}  "
+                     f"{r['fingerprint']:12}  {origins}")
+        if r['error']:
+            lines.append(f"{'':>16}  {'':>12}  {'':10}  {'':12}  {r['error']}")
+    total = sum(r['bytes'] or 0 for r in results)
+    lines.append(f"{format_bytes(total):>16}  total over {len(results)} distinct queries")
+    return '\n'.join(lines)
+
+
+class GuardedClient:
+    """
+    bigquery.Client wrapper that caps bytes billed per query and flags
+    queries processing far more than their planned cost.
+    """
+
+    def __init__(self, client, max_bytes_billed=QUERY_MAX_BYTES_BILLED, baseline=None):
+        self._client = client
+        self.max_bytes_billed = max_bytes_billed
+        self.baseline = load_baseline() if baseline is None else baseline
+        self.bytes_processed = {}
+        self.regressions = 0
+        self.limit_exceeded = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def query(self, query, job_config=None, **kwargs):
+        job_config = job_config or bigquery.QueryJobConfig()
+        if self.max_bytes_billed and not job_config.dry_run and job_config.maximum_bytes_billed is None:
+            job_config.maximum_bytes_billed = self.max_bytes_billed
+        job = self._client.query(query, job_config=job_config, **kwargs)
+        if not job_config.dry_run:
+            query_fingerprint = fingerprint(query)
+            job.add_done_callback(lambda finished: self._check(query_fingerprint, finished))
+        return job
+
+    def _check(self, query_fingerprint, job):
+        try:
+            error = job.error_result or {}
+            if error.get('reason') == 'bytesBilledLimitExceeded':
+                with self._lock:
+                    self.limit_exceeded += 1
+                logger.error(f"Query {query_fingerprint} stopped by maximum_bytes_billed "
+                             f"({format_bytes(self.max_bytes_billed)}): {error.get('message')}")
+                return
+            processed = job.total_bytes_processed
+            if processed is None:
+                return
+            with self._lock:
+                self.bytes_processed[query_fingerprint] = self.bytes_processed.get(query_fingerprint, 0) + processed
+            planned = self.baseline.get(query_fingerprint)
+            if is_regression(planned, processed):
+                with self._lock:
+                    self.regressions += 1
+                logger.warning(f"Query cost regression: {query_fingerprint} processed {format_bytes(processed)}, "
+                               f"planned {format_bytes(planned)}")
+        except Exception as e:
+            logger.error(f"Query cost check failed for {query_fingerprint}: {e}")
+
+    def render_metrics(self):
+        """Prometheus text exposition of bytes processed per query fingerprint."""
+        lines = ['# HELP bigquery_bytes_processed_total Bytes processed by BigQuery jobs, per query',
+                 '# TYPE bigquery_bytes_processed_total counter']
+        with self._lock:
+            for query_fingerprint, processed in sorted(self.bytes_processed.items()):
+                lines.append(f'bigquery_bytes_processed_total{{query="{query_fingerprint}"}} {processed}')
+            lines += ['# HELP bigquery_query_cost_regressions_total Jobs processing far more than their planned bytes',
+                      '# TYPE bigquery_query_cost_regressions_total counter',
+                      f'bigquery_query_cost_regressions_total {self.regressions}',
+                      '# HELP bigquery_bytes_billed_limit_exceeded_total Jobs stopped by maximum_bytes_billed',
+                      '# TYPE bigquery_bytes_billed_limit_exceeded_total counter',
+                      f'bigquery_bytes_billed_limit_exceeded_total {self.limit_exceeded}']
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,277 @@
+"""
+Discount policy: the rules a discount request is checked against, and the fee
+math that goes with them.
+
+A policy is a list of declarative rules. A rule may be scoped to a branch, a
+card and/or an approver level, and sets any of:
+
+- ``min_discount_percentage``: requests at or below it belong in the ERP (30);
+- ``max_discount_percentage``: the most a request may ask for, or, in a rule
+  with a level, the most an approver at that level may approve (no limit:
+  only the discount <= MRP check applies unless a rule sets one);
+- ``price_tolerance``: how far a submitted MRP/installment may be from the
+  catalog (0.01).
+
+Each setting comes from the most specific matching rule (the one naming the
+most of branch, card and level; later rules win ties). Rules are read from
+DISCOUNT_POLICY_PATH, a JSON list, on top of the defaults.
+
+evaluate_batch() checks arrays of requests with NumPy, resolving the rules once
+per distinct branch/card/level, so the whole backlog can be re-checked against
+a draft policy in milliseconds. evaluate() and evaluate_approval() are batches
+of one, so the request form, bulk imports and approvals share the same math:
+
+    discount_percentage = discount_amount / installment * 100
+    discounted_fees     = mrp - discount_amount
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DISCOUNT_POLICY_PATH = os.getenv('DISCOUNT_POLICY_PATH', str(Path(__file__).parent / 'discount_policy.json'))
+
+SCOPE_KEYS = ('branch', 'card', 'level')
+DEFAULT_SETTINGS = {
+    'min_discount_percentage': 30.0,
+    'max_discount_percentage': None,
+    'price_tolerance': 0.01,
+}
+
+# Violation codes, in the order they are reported
+MRP_MISMATCH = 'mrp_mismatch'
+INSTALLMENT_MISMATCH = 'installment_mismatch'
+INVALID_AMOUNT = 'invalid_amount'
+EXCEEDS_MRP = 'exceeds_mrp'
+BELOW_MINIMUM = 'below_minimum'
+ABOVE_MAXIMUM = 'above_maximum'
+VIOLATIONS = (MRP_MISMATCH, INSTALLMENT_MISMATCH, INVALID_AMOUNT, EXCEEDS_MRP, BELOW_MINIMUM, ABOVE_MAXIMUM)
+
+
+def _percent(value):
+    return f"{value:g}%"
+
+
+def _encode(values):
+    """(distinct values, codes) of a sequence of strings, None as ''."""
+    values = np.asarray(values)
+    if values.dtype.kind != 'U':
+        values = np.array(['' if value is None else str(value) for value in values], dtype=str)
+    return np.unique(values, return_inverse=True)
+
+
+def request_fields(discount_amount, discount_percentage, discounted_fees):
+    """The computed discount_requests columns of a new request."""
+    return {
+        'discounted_fees': float(discounted_fees),
+        'discount_amount': float(discount_amount),
+        'discount_percentage': float(discount_percentage),
+        'net_discount': float(discount_amount),
+    }
+
+
+class PolicyEvaluation:
+    """Result of evaluating one request: derived fees and violation messages."""
+
+    def __init__(self, discount_amount, discount_percentage, discounted_fees, violations):
+        self.discount_amount = discount_amount
+        self.discount_percentage = discount_percentage
+        self.discounted_fees = discounted_fees
+        self.violations = violations
+
+    @property
+    def ok(self):
+        return not self.violations
+
+    @property
+    def errors(self):
+        return [message for _, message in self.violations]
+
+    def fields(self):
+        return request_fields(self.discount_amount, self.discount_percentage, self.discounted_fees)
+
+
+class BatchEvaluation:
+    """Arrays from evaluate_batch(); ``violations[code]`` is a boolean mask per code."""
+
+    def __init__(self, mrp, installment, discount_amount, discount_percentage, discounted_fees, violations,
+                 settings):
+        self.mrp = mrp
+        self.installment = installment
+        self.discount_amount = discount_amount
+        self.discount_percentage = discount_percentage
+        self.discounted_fees = discounted_fees
+        self.violations = violations
+        self.settings = settings
+
+    def __len__(self):
+        return len(self.discount_amount)
+
+    @property
+    def ok(self):
+        """Mask of requests with no violation."""
+        failed = np.zeros(len(self), dtype=bool)
+        for mask in self.violations.values():
+            failed |= mask
+        return ~failed
+
+    def fields(self, index):
+        return request_fields(self.discount_amount[index], self.discount_percentage[index],
+                              self.discounted_fees[index])
+
+    def counts(self):
+        return {code: int(mask.sum()) for code, mask in self.violations.items()}
+
+    def messages(self, index, mrp=None, installment=None):
+        """Violation messages of one request (mrp/installment are what was submitted)."""
+        settings = {name: values[index] for name, values in self.settings.items()}
+        messages = {
+            MRP_MISMATCH: f"MRP mismatch. Expected: ₹{float(self.mrp[index])}, Provided: ₹{mrp}",
+            INSTALLMENT_MISMATCH: f"Installment mismatch. Expected: ₹{float(self.installment[index])}, "
+                                  f"Provided: ₹{installment}",
+            INVALID_AMOUNT: 'Discount amount must be greater than 0',
+            EXCEEDS_MRP: 'Discount amount cannot be greater than MRP',
+            BELOW_MINIMUM: (f"Use ERP for the discounts upto {_percent(settings['min_discount_percentage'])}, "
+                            f"this portal can receive discounts requests which are greater than "
+                            f"{_percent(settings['min_discount_percentage'])}."),
+            ABOVE_MAXIMUM: f"Discount cannot be more than {_percent(settings['max_discount_percentage'])} "
+                           f"of the installment",
+        }
+        return [(code, messages[code]) for code in VIOLATIONS
+                if code in self.violations and self.violations[code][index]]
+
+
+class DiscountPolicy:
+    """Scoped rules over DEFAULT_SETTINGS, evaluated one request or many at a time."""
+
+    def __init__(self, rules=()):
+        self.rules = []
+        for rule in rules:
+            if not isinstance(rule, dict):
+                raise ValueError("Each policy rule must be an object")
+            unknown = set(rule) - set(SCOPE_KEYS) - set(DEFAULT_SETTINGS)
+            if unknown:
+                raise ValueError(f"Unknown policy rule keys: {', '.join(sorted(unknown))}")
+            for name in DEFAULT_SETTINGS:
+                if name in rule and not isinstance(rule[name], (int, float)):
+                    raise ValueError(f"{name} must be a number")
+            self.rules.append(dict(rule))
+        # Least specific first, so more specific rules are applied over them
+        self._ordered = sorted(self.rules, key=lambda rule: sum(key in rule for key in SCOPE_KEYS))
+
+    @classmethod
+    def load(cls, path=DISCOUNT_POLICY_PATH):
+        """Policy from a JSON list of rules; the defaults alone if there is no file."""
+        try:
+            with open(path) as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except Exception as e:
+            logger.error(f"Could not read discount policy {path}: {e}; using the defaults")
+            return cls()
+
+    def to_json(self):
+        return json.dumps(self.rules, indent=2)
+
+    def settings_for(self, branch=None, card=None, level=None):
+        """
+        The effective settings for a branch/card (and approver level, at
+        approval). At approval the maximum only comes from rules with a level.
+        """
+        settings = dict(DEFAULT_SETTINGS)
+        scope = {'branch': branch, 'card': card, 'level': level}
+        for rule in self._ordered:
+            if all(rule[key] == scope[key] for key in SCOPE_KEYS if key in rule):
+                settings.update({name: float(rule[name]) for name in DEFAULT_SETTINGS if name in rule
+                                 and not (name == 'max_discount_percentage' and level and 'level' not in rule)})
+        return settings
+
+    def _resolve(self, branches, cards, levels):
+        """Per-request settings arrays, resolving each distinct scope once."""
+        if len(branches) == 0:
+            return {name: np.zeros(0) for name in DEFAULT_SETTINGS}
+        encoded = [_encode(values) for values in (branches, cards, levels)]
+        dims = [len(distinct) for distinct, _ in encoded]
+        scopes, positions = np.unique(np.ravel_multi_index([codes for _, codes in encoded], dims),
+                                      return_inverse=True)
+        resolved = []
+        for scope in zip(*np.unravel_index(scopes, dims)):
+            branch, card, level = (str(distinct[index]) or None for (distinct, _), index in zip(encoded, scope))
+            resolved.append(self.settings_for(branch, card, level))
+        # No maximum is an infinite one
+        return {name: np.array([np.inf if settings[name] is None else settings[name] for settings in resolved],
+                               dtype=float)[positions.reshape(-1)]
+                for name in DEFAULT_SETTINGS}
+
+    def evaluate_batch(self, branches, cards, mrp, installment, discount_amount,
+                       submitted_mrp=None, submitted_installment=None, levels=None):
+        """
+        Check arrays of requests. mrp and installment are the catalog prices;
+        submitted_* (optional) are compared with them. levels (optional) are
+        approver levels, to apply level-scoped rules. Returns a BatchEvaluation.
+        """
+        mrp = np.asarray(mrp, dtype=float)
+        installment = np.asarray(installment, dtype=float)
+        discount_amount = np.asarray(discount_amount, dtype=float)
+        if levels is None:
+            levels = np.full(len(mrp), '')
+        settings = self._resolve(branches, cards, levels)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            discount_percentage = np.where(installment > 0, discount_amount / installment * 100, 0.0)
+        discounted_fees = mrp - discount_amount
+
+        violations = {}
+        if submitted_mrp is not None:
+            violations[MRP_MISMATCH] = np.abs(np.asarray(submitted_mrp, dtype=float) - mrp) > settings['price_tolerance']
+        if submitted_installment is not None:
+            violations[INSTALLMENT_MISMATCH] = (np.abs(np.asarray(submitted_installment, dtype=float) - installment)
+                                                > settings['price_tolerance'])
+        violations[INVALID_AMOUNT] = discount_amount <= 0
+        violations[EXCEEDS_MRP] = discount_amount > mrp
+        violations[BELOW_MINIMUM] = discount_percentage <= settings['min_discount_percentage']
+        violations[ABOVE_MAXIMUM] = discount_percentage > settings['max_discount_percentage']
+
+        return BatchEvaluation(mrp, installment, discount_amount, discount_percentage, discounted_fees,
+                               violations, settings)
+
+    def evaluate_rows(self, rows, level=None):
+        """evaluate_batch() over request dicts (branch_name, card_name, mrp, installment, discount_amount)."""
+        return self.evaluate_batch(
+            [row['branch_name'] for row in rows], [row['card_name'] for row in rows],
+            [row['mrp'] or 0 for row in rows], [row['installment'] or 0 for row in rows],
+            [row['discount_amount'] or 0 for row in rows],
+            levels=[level] * len(rows) if level else None,
+        )
+
+    def evaluate(self, branch, card, mrp, installment, discount_amount,
+                 submitted_mrp=None, submitted_installment=None):
+        """Check one new request against the catalog prices. Returns a PolicyEvaluation."""
+        batch = self.evaluate_batch(
+            [branch], [card], [mrp], [installment], [discount_amount],
+            None if submitted_mrp is None else [submitted_mrp],
+            None if submitted_installment is None else [submitted_installment],
+        )
+        return PolicyEvaluation(float(batch.discount_amount[0]), float(batch.discount_percentage[0]),
+                                float(batch.discounted_fees[0]),
+                                batch.messages(0, submitted_mrp, submitted_installment))
+
+    def evaluate_approval(self, branch, card, level, mrp, installment, approved_fees):
+        """
+        Check the discounted fees an approver at level is approving. Only a
+        maximum from the level's rules applies: approvers may settle below the
+        ERP threshold, and without a level rule any fees above 0 are approvable.
+        """
+        if approved_fees <= 0:
+            return PolicyEvaluation(mrp - approved_fees, 0.0, approved_fees,
+                                    [(INVALID_AMOUNT, 'Approved amount must be greater than 0.')])
+        batch = self.evaluate_batch([branch], [card], [mrp], [installment], [mrp - approved_fees], levels=[level])
+        violations = [(code, message) for code, message in batch.messages(0) if code == ABOVE_MAXIMUM]
+        return PolicyEvaluation(float(batch.discount_amount[0]), float(batch.discount_percentage[0]),
+                                float(batch.discounted_fees[0]), violations)
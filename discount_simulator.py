@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+What-if revenue impact of a candidate discount policy.
+
+Approved and pending requests are taken from the analytics snapshot (see
+analytics_snapshot.py) into NumPy arrays once per snapshot, with branch, card
+and month dictionary-encoded. A candidate DiscountPolicy is then applied to
+the whole history with evaluate_batch() and the revenue delta is summed per
+group with bincount, so each what-if answer takes milliseconds and no
+BigQuery job.
+
+A request's discount is its net_discount: what was approved, or what was
+asked for while pending. Under the candidate policy:
+
+- a discount above max_discount_percentage of the installment is capped at
+  it, and the difference is revenue gained;
+- a request at or below min_discount_percentage would have gone through the
+  ERP instead. It is counted as routed to the ERP, at the same discount.
+
+Usage:
+    python discount_simulator.py candidate_policy.json [--group-by branch,card,month]
+    python discount_simulator.py --min 35 --max 60 --group-by card
+"""
+
+import sys
+import json
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+import pyarrow.compute as pc
+
+from discount_policy import DiscountPolicy, BELOW_MINIMUM, ABOVE_MAXIMUM
+
+logger = logging.getLogger(__name__)
+
+# API names for the columns a simulation can be grouped by
+SIMULATION_GROUPS = {'branch': 'branch_name', 'card': 'card_name', 'month': 'month'}
+
+
+def _encode(column):
+    """(distinct values, codes) of a string column, with Arrow's dictionary encoding."""
+    encoded = pc.fill_null(column, '').combine_chunks().dictionary_encode()
+    return np.array(encoded.dictionary.to_pylist(), dtype=str), encoded.indices.to_numpy().astype(np.int64)
+
+
+class SimulationData:
+    """Columnar approved and pending requests, ready for vectorized what-ifs."""
+
+    def __init__(self, table):
+        table = table.filter(pc.or_(pc.equal(table['is_approved'], 1), pc.equal(table['is_pending'], 1)))
+        self.columns = {name: _encode(table[column]) for name, column in SIMULATION_GROUPS.items()}
+        self.branches = self.columns['branch'][0][self.columns['branch'][1]]
+        self.cards = self.columns['card'][0][self.columns['card'][1]]
+        self.approved = table['is_approved'].to_numpy().astype(bool)
+        self.mrp = pc.fill_null(table['mrp'], 0.0).to_numpy()
+        self.installment = pc.fill_null(table['installment'], 0.0).to_numpy()
+        self.discount = pc.fill_null(table['net_discount'], 0.0).to_numpy()
+
+    def __len__(self):
+        return len(self.mrp)
+
+    def branch_mask(self, scope):
+        """Requests in a QueueScope's branches (all of them without a scope)."""
+        mask = np.ones(len(self), dtype=bool)
+        if scope is not None and scope.branch_in is not None:
+            mask &= np.isin(self.branches, list(scope.branch_in))
+        if scope is not None and scope.branch_not_in is not None:
+            mask &= ~np.isin(self.branches, list(scope.branch_not_in))
+        return mask
+
+
+def _group_codes(data, group_by, mask):
+    """One code per request for its group, and each group's values."""
+    if not group_by:
+        return np.zeros(mask.sum(), dtype=np.int64), [()]
+    dims = [len(data.columns[name][0]) for name in group_by]
+    combined = np.ravel_multi_index([data.columns[name][1][mask] for name in group_by], dims)
+    present, codes = np.unique(combined, return_inverse=True)
+    keys = list(zip(*[data.columns[name][0][index].tolist() for name, index
+                      in zip(group_by, np.unravel_index(present, dims))]))
+    return codes, keys
+
+
+def simulate(data, policy, group_by=(), scope=None):
+    """
+    Apply policy to data. Returns (groups, totals): per-group dicts with the
+    group values plus requests, approved, baseline_revenue, simulated_revenue,
+    revenue_delta, capped and routed_to_erp, and the same figures overall.
+    """
+    unknown = [name for name in group_by if name not in SIMULATION_GROUPS]
+    if unknown:
+        raise ValueError(f"Cannot group by: {', '.join(unknown)}")
+
+    mask = data.branch_mask(scope)
+    evaluation = policy.evaluate_batch(data.branches[mask], data.cards[mask], data.mrp[mask],
+                                       data.installment[mask], data.discount[mask])
+    installment = data.installment[mask]
+    capped = evaluation.violations[ABOVE_MAXIMUM]
+    routed = evaluation.violations[BELOW_MINIMUM]
+    with np.errstate(invalid='ignore'):
+        # Infinite (no maximum) where nothing is capped
+        cap = evaluation.settings['max_discount_percentage'] * installment / 100
+    discount = data.discount[mask]
+    baseline = data.mrp[mask] - discount
+    simulated = data.mrp[mask] - np.where(capped, cap, discount)
+
+    codes, keys = _group_codes(data, group_by, mask)
+    sums = {
+        'requests': np.bincount(codes, minlength=len(keys)),
+        'approved': np.bincount(codes, weights=data.approved[mask], minlength=len(keys)),
+        'baseline_revenue': np.bincount(codes, weights=baseline, minlength=len(keys)),
+        'simulated_revenue': np.bincount(codes, weights=simulated, minlength=len(keys)),
+        'capped': np.bincount(codes, weights=capped, minlength=len(keys)),
+        'routed_to_erp': np.bincount(codes, weights=routed, minlength=len(keys)),
+    }
+
+    def figures(values):
+        result = {
+            'requests': int(values['requests']),
+            'approved': int(values['approved']),
+            'baseline_revenue': round(float(values['baseline_revenue']), 2),
+            'simulated_revenue': round(float(values['simulated_revenue']), 2),
+            'capped': int(values['capped']),
+            'routed_to_erp': int(values['routed_to_erp']),
+        }
+        result['revenue_delta'] = round(result['simulated_revenue'] - result['baseline_revenue'], 2)
+        return result
+
+    groups = [dict(zip(group_by, key), **figures({name: column[index] for name, column in sums.items()}))
+              for index, key in enumerate(keys) if sums['requests'][index]]
+    groups.sort(key=lambda group: tuple(group[name] for name in group_by))
+    totals = figures({name: column.sum() for name, column in sums.items()})
+    return groups, totals
+
+
+class DiscountSimulator:
+    """What-ifs over the analytics snapshot, re-encoding it only when it is refreshed."""
+
+    def __init__(self, analytics):
+        self.analytics = analytics
+        self._table = None
+        self._data = None
+        self._lock = threading.Lock()
+
+    def data(self):
+        table = self.analytics.table()
+        if table is None:
+            return None
+        with self._lock:
+            if table is not self._table:
+                self._data = SimulationData(table)
+                self._table = table
+            return self._data
+
+    def run(self, policy, group_by=(), scope=None):
+        data = self.data()
+        if data is None:
+            return [], None
+        return simulate(data, policy, group_by, scope)
+
+
+def candidate_policy(base_rules=(), min_discount_percentage=None, max_discount_percentage=None):
+    """A DiscountPolicy from rules, with optional overall min/max overrides on top."""
+    rules = list(base_rules)
+    overrides = {name: value for name, value in (('min_discount_percentage', min_discount_percentage),
+                                                 ('max_discount_percentage', max_discount_percentage))
+                 if value is not None}
+    if overrides:
+        # Last among the unscoped rules; branch/card rules still take precedence
+        rules.append(overrides)
+    return DiscountPolicy(rules)
+
+
+def main():
+    """Print the revenue impact of a candidate policy, computed through the app's snapshot."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='What-if revenue impact of a discount policy')
+    parser.add_argument('policy', nargs='?', help='JSON list of policy rules (default: the current policy)')
+    parser.add_argument('--min', type=float, help='ERP threshold (min_discount_percentage) for all requests')
+    parser.add_argument('--max', type=float, help='Discount cap (max_discount_percentage) for all requests')
+    parser.add_argument('--group-by', default='branch', help='Comma-separated: branch, card, month')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, str(Path(__file__).parent))
+    import app as discount_app
+
+    if args.policy:
+        with open(args.policy) as f:
+            rules = json.load(f)
+    else:
+        rules = discount_app.discount_policy.rules
+    group_by = [name.strip() for name in args.group_by.split(',') if name.strip()]
+    try:
+        groups, totals = DiscountSimulator(discount_app.analytics).run(
+            candidate_policy(rules, args.min, args.max), group_by)
+    except ValueError as e:
+        parser.error(str(e))
+    if totals is None:
+        logger.error("No analytics snapshot available")
+        sys.exit(1)
+
+    width = max([len(' / '.join(str(g[name]) for name in group_by)) for g in groups] + [5])
+    print(f"{'Group':{width}} {'Requests':>9} {'Capped':>7} {'To ERP':>7} {'Baseline':>15} {'Simulated':>15} {'Delta':>13}")
+    for group in groups + [dict(totals, total=True)]:
+        label = 'Total' if group.get('total') else ' / '.join(str(group[name]) for name in group_by)
+        print(f"{label:{width}} {group['requests']:9} {group['capped']:7} {group['routed_to_erp']:7} "
+              f"{group['baseline_revenue']:15,.2f} {group['simulated_revenue']:15,.2f} {group['revenue_delta']:13,.2f}")
+
+
+if __name__ == '__main__':
+    main()
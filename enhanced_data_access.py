@@ -9,6 +9,7 @@ import uuid
 import logging
 from datetime import datetime, timezone
 from google.cloud import bigquery
+from approval_workflow import get_transition
 
 logger = logging.getLogger(__name__)
 
@@ -144,14 +145,15 @@ class DiscountDataAccess:
     
     def create_discount_request(self, student_id, course_id, course_details, 
                               requested_discount_amount, discount_reason, remarks,
-                              requester_email, requester_name):
+                              requester_email, requester_name, request_id=None, created_at=None,
+                              assigned_to=None):
         """Create a new discount request with pricing snapshot."""
         if not self.client:
             logger.error("BigQuery client not available")
             return None
         
         try:
-            request_id = str(uuid.uuid4())
+            request_id = request_id or str(uuid.uuid4())
             snapshot_id = str(uuid.uuid4())
             now = datetime.now(timezone.utc).isoformat()
             
@@ -159,9 +161,9 @@ class DiscountDataAccess:
             request_query = f"""
                 INSERT INTO `{self.project_id}.{self.dataset_id}.discount_requests_new`
                 (request_id, student_id, course_id, requested_discount_amount, discount_reason,
-                 remarks, requester_email, requester_name, status, created_at, updated_at)
+                 remarks, requester_email, requester_name, status, assigned_to, created_at, updated_at)
                 VALUES (@request_id, @student_id, @course_id, @requested_discount_amount, @discount_reason,
-                        @remarks, @requester_email, @requester_name, @status, @created_at, @updated_at)
+                        @remarks, @requester_email, @requester_name, @status, @assigned_to, @created_at, @updated_at)
             """
             request_params = [
                 bigquery.ScalarQueryParameter('request_id', 'STRING', request_id),
@@ -173,7 +175,8 @@ class DiscountDataAccess:
                 bigquery.ScalarQueryParameter('requester_email', 'STRING', requester_email),
                 bigquery.ScalarQueryParameter('requester_name', 'STRING', requester_name),
                 bigquery.ScalarQueryParameter('status', 'STRING', 'PENDING_L1'),
-                bigquery.ScalarQueryParameter('created_at', 'STRING', now),
+                bigquery.ScalarQueryParameter('assigned_to', 'STRING', assigned_to),
+                bigquery.ScalarQueryParameter('created_at', 'STRING', created_at or now),
                 bigquery.ScalarQueryParameter('updated_at', 'STRING', now)
             ]
             request_config = bigquery.QueryJobConfig(query_parameters=request_params)
@@ -202,6 +205,31 @@ class DiscountDataAccess:
             logger.error(f"Error creating discount request: {e}")
             return None
     
+    def get_request_id(self, enquiry_no):
+        """request_id of the latest request for an enquiry number, or None."""
+        if not self.client:
+            return None
+        
+        try:
+            query = f"""
+                SELECT dr.request_id
+                FROM `{self.project_id}.{self.dataset_id}.discount_requests_new` dr
+                JOIN `{self.project_id}.{self.dataset_id}.students` s ON dr.student_id = s.student_id
+                WHERE s.enquiry_no = @enquiry_no
+                ORDER BY dr.created_at DESC
+                LIMIT 1
+            """
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ScalarQueryParameter('enquiry_no', 'STRING', enquiry_no)
+                ]
+            )
+            result = list(self.client.query(query, job_config=job_config).result())
+            return result[0].request_id if result else None
+        except Exception as e:
+            logger.error(f"Error fetching request id for {enquiry_no}: {e}")
+            return None
+    
     def check_duplicate_request(self, enquiry_no, requester_email):
         """Check if a duplicate request exists for the same enquiry number and requester."""
         if not self.client:
@@ -226,21 +254,117 @@ class DiscountDataAccess:
             logger.error(f"Error checking duplicate request: {e}")
             return False
     
-    def get_pending_requests_for_approver(self, approver_level, approver_email):
-        """Get pending requests for a specific approver level and email."""
+    def get_student_history(self, enquiry_no):
+        """
+        Every request by the student with this enquiry number, with its approvals.
+
+        Students are matched on enquiry_no or mobile_no, so requests filed under
+        another enquiry number for the same mobile show up too. Returns
+        {'student': {...} or None, 'requests': [...]}, newest request first, or
+        None if the query failed.
+        """
+        if not self.client:
+            return None
+
+        try:
+            query = f"""
+                WITH student AS (
+                    SELECT enquiry_no, student_name, mobile_no
+                    FROM `{self.project_id}.{self.dataset_id}.students`
+                    WHERE enquiry_no = @enquiry_no
+                    LIMIT 1
+                )
+                SELECT
+                    t.enquiry_no AS profile_enquiry_no,
+                    t.student_name AS profile_student_name,
+                    t.mobile_no AS profile_mobile_no,
+                    dr.request_id,
+                    s.enquiry_no,
+                    s.student_name,
+                    s.mobile_no,
+                    c.branch_name,
+                    c.card_name,
+                    ps.mrp_at_request as mrp,
+                    ps.installment_at_request as installment,
+                    dr.requested_discount_amount as discount_amount,
+                    dr.discount_reason as reason,
+                    dr.requester_email,
+                    dr.requester_name,
+                    dr.status,
+                    dr.created_at,
+                    ARRAY_AGG(
+                        IF(ra.approval_id IS NULL, NULL, STRUCT(
+                            ra.approver_level, ra.approver_email, ra.action,
+                            ra.approved_discount_amount, ra.comments, ra.approved_at
+                        )) IGNORE NULLS ORDER BY ra.approved_at
+                    ) as approvals
+                FROM student t
+                LEFT JOIN `{self.project_id}.{self.dataset_id}.students` s
+                    ON s.enquiry_no = t.enquiry_no OR s.mobile_no = t.mobile_no
+                LEFT JOIN `{self.project_id}.{self.dataset_id}.discount_requests_new` dr ON dr.student_id = s.student_id
+                LEFT JOIN `{self.project_id}.{self.dataset_id}.courses` c ON dr.course_id = c.course_id
+                LEFT JOIN `{self.project_id}.{self.dataset_id}.pricing_snapshots` ps ON dr.request_id = ps.request_id
+                LEFT JOIN `{self.project_id}.{self.dataset_id}.request_approvals` ra ON ra.request_id = dr.request_id
+                GROUP BY profile_enquiry_no, profile_student_name, profile_mobile_no, dr.request_id,
+                         s.enquiry_no, s.student_name, s.mobile_no, c.branch_name, c.card_name, mrp,
+                         installment, discount_amount, reason, dr.requester_email, dr.requester_name,
+                         dr.status, dr.created_at
+                ORDER BY dr.created_at DESC
+            """
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ScalarQueryParameter('enquiry_no', 'STRING', enquiry_no)
+                ]
+            )
+            rows = [dict(row.items()) for row in self.client.query(query, job_config=job_config).result()]
+            if not rows:
+                return {'student': None, 'requests': []}
+
+            student = {
+                'enquiry_no': rows[0]['profile_enquiry_no'],
+                'student_name': rows[0]['profile_student_name'],
+                'mobile_no': rows[0]['profile_mobile_no'],
+            }
+            requests = []
+            for row in rows:
+                if row['request_id'] is None:
+                    continue
+                for key in ('profile_enquiry_no', 'profile_student_name', 'profile_mobile_no'):
+                    row.pop(key)
+                row['approvals'] = [dict(approval) for approval in row['approvals'] or []]
+                requests.append(row)
+            return {'student': student, 'requests': requests}
+        except Exception as e:
+            logger.error(f"Error fetching history for student {enquiry_no}: {e}")
+            return None
+
+    def get_pending_requests_for_approver(self, approver_level, approver_email, scope=None):
+        """
+        Get pending requests for a specific approver level and email.
+
+        scope is the approver's QueueScope (approver_assignment.py), the same
+        filter the legacy queue uses; without one every pending request at the
+        level is returned.
+        """
         if not self.client:
             return []
         
         try:
             status_filter = f'PENDING_{approver_level}'
+            query_params = [bigquery.ScalarQueryParameter('status', 'STRING', status_filter)]
             
-            # Apply branch-specific filtering for L1 approvers
+            # Restrict to the approver's assigned requests, or their pool's branches
             branch_filter = ""
-            if approver_level == 'L1':
-                if approver_email == 'raja.ray@pw.live':
-                    branch_filter = "AND c.branch_name IN ('Kolkata', 'Siliguri', 'Bhubaneshwar')"
-                elif approver_email == 'praduman.shukla@pw.live':
-                    branch_filter = "AND c.branch_name NOT IN ('Kolkata', 'Siliguri', 'Bhubaneshwar')"
+            if scope is not None and scope.assigned_to is not None:
+                branch_filter = "AND dr.assigned_to IN UNNEST(@assignees)"
+                query_params.append(bigquery.ArrayQueryParameter('assignees', 'STRING', sorted(scope.assigned_to)))
+            elif scope is not None and scope.branch_in is not None:
+                branch_filter = "AND c.branch_name IN UNNEST(@branch_in)"
+                query_params.append(bigquery.ArrayQueryParameter('branch_in', 'STRING', sorted(scope.branch_in)))
+            elif scope is not None and scope.branch_not_in:
+                branch_filter = "AND c.branch_name NOT IN UNNEST(@branch_not_in)"
+                query_params.append(bigquery.ArrayQueryParameter('branch_not_in', 'STRING',
+                                                                 sorted(scope.branch_not_in)))
             
             query = f"""
                 SELECT 
@@ -267,15 +391,60 @@ class DiscountDataAccess:
                 {branch_filter}
                 ORDER BY dr.created_at DESC
             """
+            job_config = bigquery.QueryJobConfig(query_parameters=query_params)
+            result = self.client.query(query, job_config=job_config).result()
+            return list(result)
+        except Exception as e:
+            logger.error(f"Error fetching pending requests: {e}")
+            return []
+    
+    def get_request_changes(self, since, until, limit=500):
+        """
+        Requests inserted or updated in (since, until], oldest change first.
+
+        since and until are (updated_at, request_id) keys; the range predicate
+        on updated_at lets BigQuery prune to the polled time window.
+        """
+        if not self.client:
+            return []
+        
+        try:
+            query = f"""
+                SELECT 
+                    dr.request_id,
+                    s.enquiry_no,
+                    s.student_name,
+                    c.branch_name,
+                    c.card_name,
+                    ps.mrp_at_request as mrp,
+                    ps.mrp_at_request - dr.requested_discount_amount as discounted_fees,
+                    dr.requested_discount_amount as net_discount,
+                    dr.requester_email,
+                    dr.status,
+                    dr.updated_at
+                FROM `{self.project_id}.{self.dataset_id}.discount_requests_new` dr
+                JOIN `{self.project_id}.{self.dataset_id}.students` s ON dr.student_id = s.student_id
+                JOIN `{self.project_id}.{self.dataset_id}.courses` c ON dr.course_id = c.course_id
+                JOIN `{self.project_id}.{self.dataset_id}.pricing_snapshots` ps ON dr.request_id = ps.request_id
+                WHERE dr.updated_at >= @since_at AND dr.updated_at <= @until_at
+                  AND (dr.updated_at > @since_at OR dr.request_id > @since_id)
+                  AND (dr.updated_at < @until_at OR dr.request_id <= @until_id)
+                ORDER BY dr.updated_at, dr.request_id
+                LIMIT @limit
+            """
             job_config = bigquery.QueryJobConfig(
                 query_parameters=[
-                    bigquery.ScalarQueryParameter('status', 'STRING', status_filter)
+                    bigquery.ScalarQueryParameter('since_at', 'TIMESTAMP', since[0] or '1970-01-01T00:00:00+00:00'),
+                    bigquery.ScalarQueryParameter('since_id', 'STRING', since[1]),
+                    bigquery.ScalarQueryParameter('until_at', 'TIMESTAMP', until[0]),
+                    bigquery.ScalarQueryParameter('until_id', 'STRING', until[1]),
+                    bigquery.ScalarQueryParameter('limit', 'INT64', limit),
                 ]
             )
             result = self.client.query(query, job_config=job_config).result()
-            return list(result)
+            return [dict(row.items()) for row in result]
         except Exception as e:
-            logger.error(f"Error fetching pending requests: {e}")
+            logger.error(f"Error fetching request changes: {e}")
             return []
     
     def approve_or_reject_request(self, request_id, action, approver_level, 
@@ -289,25 +458,32 @@ class DiscountDataAccess:
             now = datetime.now(timezone.utc).isoformat()
             approval_id = str(uuid.uuid4())
             
-            # Determine new status
-            if action == 'APPROVE':
-                new_status = 'PENDING_L2' if approver_level == 'L1' else 'APPROVED'
-            else:
-                new_status = 'REJECTED'
+            # Determine the allowed transition for this level/action
+            transition = get_transition(approver_level, action)
+            if transition is None:
+                logger.error(f"Transition not allowed: {approver_level} {action}")
+                return False
+            expected_status, new_status = transition
             
-            # Update request status
+            # Update request status only if it is still in the expected status
             update_query = f"""
                 UPDATE `{self.project_id}.{self.dataset_id}.discount_requests_new`
                 SET status = @status, updated_at = @updated_at
-                WHERE request_id = @request_id
+                WHERE request_id = @request_id AND status = @expected_status
             """
             update_params = [
                 bigquery.ScalarQueryParameter('status', 'STRING', new_status),
                 bigquery.ScalarQueryParameter('updated_at', 'STRING', now),
-                bigquery.ScalarQueryParameter('request_id', 'STRING', request_id)
+                bigquery.ScalarQueryParameter('request_id', 'STRING', request_id),
+                bigquery.ScalarQueryParameter('expected_status', 'STRING', expected_status)
             ]
             update_config = bigquery.QueryJobConfig(query_parameters=update_params)
-            self.client.query(update_query, update_config).result()
+            update_job = self.client.query(update_query, update_config)
+            update_job.result()
+            if not update_job.num_dml_affected_rows:
+                logger.warning(f"Request {request_id} is not in status {expected_status}; "
+                               f"{approver_level} {action} by {approver_email} not applied")
+                return False
             
             # Record approval/rejection
             approval_query = f"""
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Streaming CSV/Parquet export of discount requests and analytics.
+
+Query results are read as Arrow record batches (over the BigQuery Storage
+Read API when it is available, otherwise page by page over REST) and each
+batch is encoded and handed to the caller before the next one is fetched.
+Only a couple of batches are ever held in memory, so a million-row export
+runs in the same footprint as a small one.
+
+Usage:
+    python export.py requests --format parquet --from 2025-01-01 --to 2025-03-31 \
+        [--branch Delhi] [--status APPROVED] -o requests.parquet
+    python export.py analytics --format csv -o analytics.csv
+"""
+
+import sys
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Rows per page when the Storage Read API is not available
+EXPORT_PAGE_SIZE = 10000
+# Storage Read API pages held ahead of the encoder
+EXPORT_MAX_QUEUE_SIZE = 2
+
+REQUEST_COLUMNS = [
+    'enquiry_no', 'student_name', 'mobile_no', 'branch_name', 'card_name', 'mrp', 'installment',
+    'discounted_fees', 'discount_amount', 'discount_percentage', 'net_discount', 'reason', 'remarks',
+    'requester_email', 'requester_name', 'status', 'created_at', 'l1_approver', 'l2_approver',
+]
+
+ANALYTICS_COLUMNS = [
+    'branch_name', 'card_name', 'total_requests', 'approved_requests', 'rejected_requests',
+    'pending_requests', 'avg_requested_discount', 'avg_approved_discount', 'total_discount_approved',
+    'first_request_date', 'latest_request_date',
+]
+
+# table (and the table read with EVENT_SOURCED_REQUESTS=true), columns, and the filters each source supports
+EXPORT_SOURCES = {
+    'requests': {
+        'table': 'discount_requests',
+        'event_sourced_table': 'request_state',
+        'columns': REQUEST_COLUMNS,
+        'filters': ('date', 'branch', 'status'),
+        'order_by': 'created_at',
+    },
+    'analytics': {
+        'table': 'discount_analytics',
+        'columns': ANALYTICS_COLUMNS,
+        'filters': ('date', 'branch'),
+        'order_by': 'branch_name, card_name',
+    },
+}
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD filter value (None or '' means unbounded)."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value} (expected YYYY-MM-DD)")
+
+
+def build_export_query(project_id, dataset_id, source, date_from=None, date_to=None,
+                       branch=None, status=None, branch_filter='', event_sourced=False):
+    """
+    Build the SELECT for an export. Returns (query, query_parameters).
+
+    date_to is inclusive. branch_filter is an extra SQL predicate (e.g. an
+    approver's branch scope) appended as is. event_sourced reads the request
+    export from the request_state projection.
+    """
+    spec = EXPORT_SOURCES.get(source)
+    if spec is None:
+        raise ValueError(f"Unknown export source: {source}")
+    if status and 'status' not in spec['filters']:
+        raise ValueError(f"The {source} export cannot be filtered by status")
+    if date_from and date_to and date_from > date_to:
+        raise ValueError("The start date must not be after the end date")
+
+    conditions = []
+    params = []
+    start = datetime.combine(date_from, time.min, tzinfo=timezone.utc) if date_from else None
+    # Exclusive upper bound so the whole of date_to is included
+    end = datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=timezone.utc) if date_to else None
+    if source == 'requests':
+        # created_at is written as an ISO string by older code paths
+        if start:
+            conditions.append("CAST(created_at AS TIMESTAMP) >= @start_at")
+        if end:
+            conditions.append("CAST(created_at AS TIMESTAMP) < @end_at")
+    else:
+        # An analytics group is included when its requests overlap the range
+        if start:
+            conditions.append("latest_request_date >= @start_at")
+        if end:
+            conditions.append("first_request_date < @end_at")
+    if start:
+        params.append(bigquery.ScalarQueryParameter('start_at', 'TIMESTAMP', start))
+    if end:
+        params.append(bigquery.ScalarQueryParameter('end_at', 'TIMESTAMP', end))
+    if branch:
+        conditions.append("branch_name = @branch_name")
+        params.append(bigquery.ScalarQueryParameter('branch_name', 'STRING', branch))
+    if status:
+        conditions.append("status = @status")
+        params.append(bigquery.ScalarQueryParameter('status', 'STRING', status))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else "WHERE TRUE"
+    table = spec.get('event_sourced_table', spec['table']) if event_sourced else spec['table']
+    query = f"""
+        SELECT {', '.join(spec['columns'])}
+        FROM `{project_id}.{dataset_id}.{table}`
+        {where} {branch_filter}
+        ORDER BY {spec['order_by']}
+    """
+    return query, params
+
+
+def _storage_client():
+    """BigQuery Storage Read client on the application default credentials, if installed."""
+    try:
+        from google.cloud import bigquery_storage
+
+        return bigquery_storage.BigQueryReadClient()
+    except Exception as e:
+        logger.warning(f"BigQuery Storage API unavailable, exporting over REST: {e}")
+        return None
+
+
+def iter_record_batches(client, query, params):
+    """Run the export query and yield its result as Arrow record batches."""
+    job_config = bigquery.QueryJobConfig(query_parameters=params)
+    rows = client.query(query, job_config=job_config).result(page_size=EXPORT_PAGE_SIZE)
+    bqstorage_client = _storage_client()
+    try:
+        for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client,
+                                            max_queue_size=EXPORT_MAX_QUEUE_SIZE):
+            if batch.num_rows:
+                yield batch
+    finally:
+        if bqstorage_client is not None:
+            bqstorage_client.transport.close()
+
+
+class _DrainableSink:
+    """Write-only file object whose buffered bytes are taken by the caller after each write."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _empty_schema(columns):
+    import pyarrow as pa
+    return pa.schema([(name, pa.string()) for name in columns])
+
+
+def stream_export(batches, export_format, columns):
+    """
+    Encode record batches as CSV or Parquet, yielding bytes after every batch.
+
+    Parquet gets one row group per batch. An export with no rows still yields
+    a valid file (a CSV header, or an empty Parquet file).
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+    sink = _DrainableSink()
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                if export_format == 'csv':
+                    writer = pa_csv.CSVWriter(sink, batch.schema)
+                else:
+                    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), batch.schema)
+            if export_format == 'csv':
+                writer.write_batch(batch)
+            else:
+                writer.write_table(pa.Table.from_batches([batch]))
+            data = sink.drain()
+            if data:
+                yield data
+        if writer is None:
+            if export_format == 'csv':
+                yield (','.join(f'"{name}"' for name in columns) + '\n').encode('utf-8')
+                return
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), _empty_schema(columns))
+    finally:
+        if writer is not None:
+            writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def export_filename(source, export_format, date_from=None, date_to=None):
+    parts = [f"discount_{source}"]
+    if date_from:
+        parts.append(date_from.isoformat())
+    if date_to:
+        parts.append(date_to.isoformat())
+    return f"{'_'.join(parts)}.{export_format}"
+
+
+def export_stream(client, project_id, dataset_id, source, export_format, **filters):
+    """Validate an export and return its byte generator (nothing is queried until iterated)."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    query, params = build_export_query(project_id, dataset_id, source, **filters)
+    columns = EXPORT_SOURCES[source]['columns']
+
+    def counted(batches):
+        total = 0
+        for batch in batches:
+            total += batch.num_rows
+            yield batch
+        logger.info(f"Exported {total} {source} rows as {export_format}")
+
+    return stream_export(counted(iter_record_batches(client, query, params)), export_format, columns)
+
+
+def main():
+    """Write an export to a file (or stdout) from the command line."""
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description='Export discount requests or analytics')
+    parser.add_argument('source', choices=sorted(EXPORT_SOURCES))
+    parser.add_argument('--format', dest='export_format', choices=sorted(EXPORT_FORMATS), default='csv')
+    parser.add_argument('--from', dest='date_from', help='First day to include (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='date_to', help='Last day to include (YYYY-MM-DD)')
+    parser.add_argument('--branch', help='Only this branch')
+    parser.add_argument('--status', help='Only this status (requests export)')
+    parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, str(Path(__file__).parent))
+    import app as discount_app
+
+    client = discount_app.get_bigquery_client()
+    if client is None:
+        logger.error("BigQuery client not available")
+        sys.exit(1)
+    try:
+        chunks = export_stream(client, discount_app.project_id, discount_app.dataset_id, args.source,
+                               args.export_format, date_from=parse_date(args.date_from),
+                               date_to=parse_date(args.date_to), branch=args.branch, status=args.status,
+                               event_sourced=discount_app.EVENT_SOURCED_REQUESTS)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(2)
+
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
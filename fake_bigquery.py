@@ -0,0 +1,128 @@
+"""
+In-memory stand-ins for the BigQuery client, shared by the unit tests.
+
+FakeClient records every query and answers it from respond(), which tests
+override for the query shapes they exercise. Streamed rows are kept in
+`inserted`. ArrowRows stands in for a result read as Arrow record batches.
+"""
+
+import threading
+
+
+def query_params(job_config):
+    """{name: value} of a QueryJobConfig's parameters."""
+    if job_config is None:
+        return {}
+    return {p.name: p.values if hasattr(p, 'values') else p.value for p in job_config.query_parameters}
+
+
+class ArrowRows:
+    """RowIterator stand-in yielding fixed record batches, counting those pulled."""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.pulled = 0
+
+    def to_arrow_iterable(self, bqstorage_client=None, max_queue_size=None):
+        for batch in self.batches:
+            self.pulled += 1
+            yield batch
+
+
+class FakeJob:
+    """QueryJob stand-in returning fixed rows (a list, or ArrowRows)."""
+
+    def __init__(self, rows=(), num_dml_affected_rows=None):
+        self.rows = rows if isinstance(rows, ArrowRows) else list(rows)
+        self.num_dml_affected_rows = num_dml_affected_rows
+
+    def result(self, *args, **kwargs):
+        return self.rows
+
+
+class FakeClient:
+    """bigquery.Client stand-in answering every query with the same rows."""
+
+    def __init__(self, rows=()):
+        self.rows = rows if isinstance(rows, ArrowRows) else list(rows)
+        self.queries = []
+        self.inserted = []
+        self._lock = threading.Lock()
+
+    def respond(self, query, params):
+        """Rows (or a FakeJob) for one query."""
+        return self.rows
+
+    def query(self, query, job_config=None, **kwargs):
+        with self._lock:
+            self.queries.append((query, job_config))
+        response = self.respond(query, query_params(job_config))
+        return response if isinstance(response, FakeJob) else FakeJob(response)
+
+    def insert_rows_json(self, table, rows, row_ids=None, **kwargs):
+        with self._lock:
+            self.inserted.extend(rows)
+        return []
+
+
+class StateClient(FakeClient):
+    """Serves request_state rows for the projection bootstrap and no events."""
+
+    def respond(self, query, params):
+        return self.rows if 'request_state' in query else []
+
+
+class EventStoreClient(FakeClient):
+    """
+    Keeps request_heads and the appended request_events, and runs the event
+    log's append transactions under snapshot isolation: a transaction that
+    commits after another has committed since it started is aborted, as
+    BigQuery aborts conflicting mutations of request_heads.
+    """
+
+    def __init__(self, rows=()):
+        super().__init__(rows)
+        self.heads = {}
+        self.version = 0
+
+    def between_read_and_write(self):
+        """Called inside each transaction after its snapshot is taken."""
+
+    def respond(self, query, params):
+        if 'BEGIN TRANSACTION' in query:
+            return self._transaction(query, params)
+        if 'request_events' in query:
+            return [dict(e) for e in self.inserted]
+        return self.rows if 'request_state' in query else []
+
+    @staticmethod
+    def _submissions(params):
+        return [{'event_id': event_id, 'enquiry_no': params['enquiry_nos'][i],
+                 'request_id': params['request_ids'][i] or None, 'event_type': params['event_type'],
+                 'from_status': None, 'to_status': params['to_status'],
+                 'actor_email': params['actor_emails'][i] or None, 'actor_level': params['actor_level'],
+                 'payload': params['payloads'][i], 'occurred_at': params['occurred_ats'][i].isoformat()}
+                for i, event_id in enumerate(params['event_ids'])]
+
+    def _transaction(self, query, params):
+        with self._lock:
+            snapshot, heads = self.version, dict(self.heads)
+        if 'MERGE' in query:
+            events = [e for e in self._submissions(params) if e['enquiry_no'] not in heads]
+            result = [{'event_id': e['event_id']} for e in events]
+        else:
+            event = dict(params, occurred_at=params['occurred_at'].isoformat())
+            del event['check_state']
+            applied = not params['check_state'] or heads.get(event['enquiry_no']) == event['from_status']
+            events = [event] if applied else []
+            result = [{'applied': applied}]
+        self.between_read_and_write()
+        if events:
+            with self._lock:
+                if self.version != snapshot:
+                    raise Exception('Transaction is aborted due to concurrent update against table request_heads')
+                self.version += 1
+                for event in events:
+                    self.heads[event['enquiry_no']] = event['to_status']
+                self.inserted.extend(events)
+        return result
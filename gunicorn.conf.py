@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for the discount management app.
+
+SERVING_MODE selects how requests share a container:
+
+- sync (default): gthread workers, 2 workers x 4 threads. Every in-flight
+  request holds a thread while it waits on BigQuery or SMTP. An open live
+  updates stream (/events) holds one for up to a minute, so live_updates.py
+  allows GUNICORN_THREADS // 4 streams per worker (one by default): more
+  approvers get live pages only at the cost of threads for everything else.
+  Raise GUNICORN_THREADS, or use async mode, to serve more streams.
+- async: a single gevent worker. BigQuery (HTTP via requests) and smtplib
+  calls yield to other requests while they wait on the network, so hundreds
+  of requests can be in flight in one process.
+"""
+
+import os
+
+SERVING_MODE = os.getenv('SERVING_MODE', 'sync').lower()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+keepalive = 5
+max_requests = 1000
+max_requests_jitter = 100
+loglevel = 'info'
+
+if SERVING_MODE == 'async':
+    worker_class = 'gevent'
+    workers = int(os.getenv('GUNICORN_WORKERS', 1))
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 200))
+else:
+    worker_class = 'gthread'
+    workers = int(os.getenv('GUNICORN_WORKERS', 2))
+    threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+
+def post_worker_init(worker):
+    """Make gRPC-based Google clients cooperate with the gevent hub."""
+    if SERVING_MODE == 'async':
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
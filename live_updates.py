@@ -0,0 +1,189 @@
+"""
+Server-Sent Events broker for live approval queue and dashboard updates.
+
+The broker subscribes to the request event log (request_events.py), so every
+submission and approval applied in this process, including events tailed from
+other workers, is pushed to connected browsers:
+
+- ``request`` messages tell an approver that a request entered or left their
+  queue; the page fetches the rendered card for new entries.
+- ``stats`` messages carry counter deltas for the dashboard cards.
+- ``resync`` asks the page to reload when a slow client has missed messages.
+
+Each open stream holds a worker thread in sync serving mode, so streams are
+capped in count and duration there; browsers reconnect automatically.
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime, timezone
+from request_events import to_iso
+
+logger = logging.getLogger(__name__)
+
+SERVING_MODE = os.getenv('SERVING_MODE', 'sync').lower()
+# In sync mode a quarter of the worker's threads (one with the default 4), see gunicorn.conf.py
+LIVE_UPDATES_MAX_STREAMS = int(os.getenv(
+    'LIVE_UPDATES_MAX_STREAMS',
+    500 if SERVING_MODE == 'async' else max(1, int(os.getenv('GUNICORN_THREADS', 4)) // 4)
+))
+LIVE_UPDATES_MAX_STREAM_SECONDS = int(os.getenv('LIVE_UPDATES_MAX_STREAM_SECONDS',
+                                                900 if SERVING_MODE == 'async' else 55))
+LIVE_UPDATES_KEEPALIVE_SECONDS = 15
+# How often a waiting stream tails the event log for other workers' writes
+LIVE_UPDATES_POLL_SECONDS = 5
+LIVE_UPDATES_RETRY_MS = 5000
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def counter_for(status):
+    """Dashboard counter a status is counted under (None for unknown)."""
+    if not status:
+        return None
+    if status.startswith('PENDING'):
+        return 'pending'
+    return {'APPROVED': 'approved', 'REJECTED': 'rejected'}.get(status)
+
+
+def stats_delta(previous_status, status):
+    """Counter changes for a request moving from previous_status to status."""
+    delta = {}
+    if previous_status is None:
+        delta['total'] = 1
+    old_counter, new_counter = counter_for(previous_status), counter_for(status)
+    if old_counter != new_counter:
+        if old_counter:
+            delta[old_counter] = delta.get(old_counter, 0) - 1
+        if new_counter:
+            delta[new_counter] = delta.get(new_counter, 0) + 1
+    return delta
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class QueueScope:
+    """
+    Which requests an approver's queue shows: a status plus an optional branch
+    filter, or the approvers the requests are assigned to (see approver_assignment.py).
+    """
+
+    def __init__(self, status=None, branch_in=None, branch_not_in=None, assigned_to=None):
+        self.status = status
+        self.branch_in = branch_in
+        self.branch_not_in = branch_not_in
+        self.assigned_to = assigned_to
+
+    def matches(self, status, branch_name, assigned_to=None):
+        if self.status is None or status != self.status:
+            return False
+        if self.assigned_to is not None:
+            return assigned_to in self.assigned_to
+        return self.covers_branch(branch_name)
+
+    def covers_branch(self, branch_name):
+        if self.branch_in is not None and branch_name not in self.branch_in:
+            return False
+        if self.branch_not_in is not None and branch_name in self.branch_not_in:
+            return False
+        return True
+
+
+class Subscription:
+    def __init__(self, scope):
+        self.scope = scope
+        self.messages = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+
+class LiveUpdateBroker:
+    """Fans request events out to connected SSE clients."""
+
+    def __init__(self, max_streams=LIVE_UPDATES_MAX_STREAMS, max_stream_seconds=LIVE_UPDATES_MAX_STREAM_SECONDS,
+                 keepalive_seconds=LIVE_UPDATES_KEEPALIVE_SECONDS, poll_seconds=LIVE_UPDATES_POLL_SECONDS):
+        self.max_streams = max_streams
+        self.max_stream_seconds = max_stream_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.poll_seconds = poll_seconds
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        # Events replayed while a worker bootstraps its projection predate
+        # every connected page, so they are not pushed
+        self._started_at = to_iso(datetime.now(timezone.utc))
+
+    def subscribe(self, scope):
+        """Register a client. Returns None when the stream cap is reached."""
+        with self._lock:
+            if len(self._subscriptions) >= self.max_streams:
+                return None
+            subscription = Subscription(scope)
+            self._subscriptions.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def stream_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def on_request_event(self, event, row, previous_status):
+        """RequestEventLog listener: push queue changes and counter deltas."""
+        if (event.get('occurred_at') or '') < self._started_at:
+            return
+        status, branch_name, assigned_to = row.get('status'), row.get('branch_name'), row.get('assigned_to')
+        request_message = format_sse('request', {
+            'enquiry_no': row.get('enquiry_no'),
+            'status': status,
+            'previous_status': previous_status,
+        })
+        delta = stats_delta(previous_status, status)
+        stats_message = format_sse('stats', delta) if delta else None
+
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            scope = subscription.scope
+            if scope.matches(status, branch_name, assigned_to) or scope.matches(previous_status, branch_name, assigned_to):
+                subscription.put(request_message)
+            if stats_message:
+                subscription.put(stats_message)
+
+    def stream(self, subscription, tick=None):
+        """
+        Generate the SSE body for one client until the stream limit is hit.
+
+        tick is called between messages (e.g. to tail other workers' events).
+        """
+        deadline = time.monotonic() + self.max_stream_seconds
+        last_write = time.monotonic()
+        try:
+            yield f"retry: {LIVE_UPDATES_RETRY_MS}\n\n"
+            while time.monotonic() < deadline:
+                if tick is not None:
+                    tick()
+                if subscription.overflowed:
+                    yield format_sse('resync', {})
+                    return
+                timeout = min(self.poll_seconds, max(deadline - time.monotonic(), 0))
+                try:
+                    yield subscription.messages.get(timeout=timeout)
+                    last_write = time.monotonic()
+                except queue.Empty:
+                    if time.monotonic() - last_write >= self.keepalive_seconds:
+                        yield ": keepalive\n\n"
+                        last_write = time.monotonic()
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,734 @@
+#!/usr/bin/env python3
+"""
+Load-test scenario runner for the discount management app.
+
+Drives synthetic counselors and approvers through the real HTTP routes
+(/login, the request form dropdown APIs, /request_discount and the L1 -> L2
+/approve_request chain) at configurable arrival rates, and reports
+throughput/latency/error curves per rate step.
+
+The app under test can be started locally with stand-in backends: an
+in-process BigQuery replacement with a configurable job latency model and an
+SMTP replacement that only sleeps. Both are selected with
+
+    gunicorn --workers 2 --threads 4 --timeout 120 'load_test:standin_app()'
+
+or automatically with `python load_test.py run --spawn`.
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import random
+import functools
+import sqlite3
+import logging
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from approver_assignment import ApproverPools
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Stand-in backend configuration (read by standin_app() inside each worker)
+STANDIN_DB_PATH = os.getenv('LOADTEST_DB_PATH', '/tmp/discount_loadtest.sqlite3')
+STANDIN_BQ_LATENCY_MS = float(os.getenv('LOADTEST_BQ_LATENCY_MS', 800))
+STANDIN_BQ_DML_LATENCY_MS = float(os.getenv('LOADTEST_BQ_DML_LATENCY_MS', 2000))
+STANDIN_SMTP_LATENCY_MS = float(os.getenv('LOADTEST_SMTP_LATENCY_MS', 1500))
+STANDIN_COUNSELORS = int(os.getenv('LOADTEST_COUNSELORS', 50))
+STANDIN_PASSWORD = 'loadtest'
+
+# Seed data mirroring production routing rules
+STANDIN_BRANCHES = ['Kolkata', 'Siliguri', 'Bhubaneshwar', 'Patna', 'Delhi', 'Lucknow', 'Jaipur', 'Pune']
+STANDIN_CARDS = {
+    'Foundation': (60000.0, 30000.0),
+    'Prelims Plus': (45000.0, 22500.0),
+    'Mains Mentorship': (30000.0, 15000.0),
+}
+L2_APPROVER = 'l2.loadtest@pw.live'
+
+
+def _sleep_ms(mean_ms):
+    """Sleep for a log-normally jittered duration around mean_ms."""
+    if mean_ms <= 0:
+        return
+    time.sleep(random.lognormvariate(0, 0.35) * mean_ms / 1000.0)
+
+
+def standin_authorized_persons():
+    """Build the synthetic authorized_persons rows."""
+    # L1 approvers are the members of the app's approver pools
+    persons = []
+    for pool in ApproverPools.load().pools:
+        for email in pool['approvers']:
+            if email not in {person['email'] for person in persons}:
+                persons.append({'email': email, 'name': email.split('@')[0],
+                                'branch_names': sorted(pool['branches']) or ['All'],
+                                'approver_level': 'L1', 'can_request_discount': False})
+    persons.append({'email': L2_APPROVER, 'name': 'L2 Approver', 'branch_names': ['All'],
+                    'approver_level': 'L2', 'can_request_discount': False})
+    for i in range(STANDIN_COUNSELORS):
+        branch = STANDIN_BRANCHES[i % len(STANDIN_BRANCHES)]
+        persons.append({'email': f'counselor{i}@pw.live', 'name': f'Counselor {i}',
+                        'branch_names': [branch], 'approver_level': 'Requester',
+                        'can_request_discount': True})
+    for person in persons:
+        person['password'] = STANDIN_PASSWORD
+        person['is_active'] = True
+    return persons
+
+
+class StandInJob:
+    """Minimal stand-in for a BigQuery QueryJob."""
+
+    def __init__(self, rows, latency_ms, num_dml_affected_rows=None):
+        self._rows = rows
+        self._latency_ms = latency_ms
+        self.num_dml_affected_rows = num_dml_affected_rows
+
+    def result(self, *args, **kwargs):
+        _sleep_ms(self._latency_ms)
+        return list(self._rows)
+
+
+class StandInBigQueryClient:
+    """
+    In-process replacement for bigquery.Client used for load testing.
+
+    Reference tables are served from memory. discount_requests rows,
+    request_events and request_heads live in a SQLite file so every gunicorn
+    worker sees the same data, and the event log's append transactions run
+    as SQLite transactions. Only the query shapes issued by app.py are
+    understood.
+    """
+
+    def __init__(self, db_path=STANDIN_DB_PATH, latency_ms=STANDIN_BQ_LATENCY_MS,
+                 dml_latency_ms=STANDIN_BQ_DML_LATENCY_MS):
+        self.db_path = db_path
+        self.latency_ms = latency_ms
+        self.dml_latency_ms = dml_latency_ms
+        self.persons = {p['email']: p for p in standin_authorized_persons()}
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS discount_requests "
+            "(enquiry_no TEXT, status TEXT, created_at TEXT, data TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_enquiry ON discount_requests (enquiry_no)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_status ON discount_requests (status)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS request_events "
+            "(event_id TEXT PRIMARY KEY, occurred_at TEXT, data TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_occurred ON request_events (occurred_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS request_heads (enquiry_no TEXT PRIMARY KEY, status TEXT)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _params(job_config):
+        if job_config is None:
+            return {}
+        return {p.name: p.values if hasattr(p, 'values') else p.value for p in job_config.query_parameters}
+
+    @staticmethod
+    def _rows(dicts):
+        from google.cloud.bigquery.table import Row
+        rows = []
+        for d in dicts:
+            keys = list(d.keys())
+            rows.append(Row(tuple(d[k] for k in keys), {k: i for i, k in enumerate(keys)}))
+        return rows
+
+    def query(self, query, job_config=None, **kwargs):
+        sql = ' '.join(query.split())
+        params = self._params(job_config)
+        if sql.upper().startswith('SELECT 1'):
+            return StandInJob(self._rows([{'test': 1}]), 0)
+        if '.authorized_persons`' in sql:
+            return StandInJob(self._rows(self._query_persons(sql, params)), self.latency_ms)
+        if '.branch_cards_fees`' in sql:
+            return StandInJob(self._rows(self._query_catalog(sql, params)), self.latency_ms)
+        if '.discount_requests`' in sql:
+            if sql.upper().startswith(('INSERT', 'UPDATE')):
+                affected = self._dml_requests(sql, params)
+                return StandInJob([], self.dml_latency_ms, num_dml_affected_rows=affected)
+            return StandInJob(self._rows(self._select_requests(sql, params)), self.latency_ms)
+        if 'BEGIN TRANSACTION' in sql and '.request_heads`' in sql:
+            return StandInJob(self._rows(self._append_events(sql, params)), self.dml_latency_ms)
+        if '.request_events`' in sql:
+            return StandInJob(self._rows(self._select_events(params)), self.latency_ms)
+        if '.request_state`' in sql:
+            # Projection bootstraps from an empty table; events carry the history
+            return StandInJob([], self.latency_ms)
+        logger.warning(f"Stand-in BigQuery does not understand query: {sql[:120]}")
+        return StandInJob([], self.latency_ms)
+
+    def insert_rows_json(self, table, json_rows, **kwargs):
+        _sleep_ms(self.latency_ms / 4)
+        return []
+
+    def load_table_from_json(self, json_rows, destination, **kwargs):
+        if str(destination).endswith('.discount_requests'):
+            conn = self._conn()
+            conn.executemany(
+                "INSERT INTO discount_requests VALUES (?, ?, ?, ?)",
+                [(r['enquiry_no'], r['status'], r['created_at'], json.dumps(r)) for r in json_rows]
+            )
+            conn.commit()
+        return StandInJob([], self.dml_latency_ms)
+
+    def _select_events(self, params):
+        since = params.get('since')
+        since = since.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00') if since else ''
+        cursor = self._conn().execute(
+            "SELECT data FROM request_events WHERE occurred_at > ? ORDER BY occurred_at, event_id", (since,)
+        )
+        return [json.loads(data) for (data,) in cursor]
+
+    @staticmethod
+    def _iso(value):
+        return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+    def _append_events(self, sql, params):
+        """The event log's append transactions: submissions (MERGE) or one transition (UPDATE)."""
+        if 'MERGE' in sql:
+            events = [{'event_id': event_id, 'enquiry_no': params['enquiry_nos'][i],
+                       'request_id': params['request_ids'][i] or None, 'event_type': params['event_type'],
+                       'from_status': None, 'to_status': params['to_status'],
+                       'actor_email': params['actor_emails'][i] or None, 'actor_level': params['actor_level'],
+                       'payload': params['payloads'][i], 'occurred_at': self._iso(params['occurred_ats'][i])}
+                      for i, event_id in enumerate(params['event_ids'])]
+        else:
+            events = [dict({name: value for name, value in params.items() if name != 'check_state'},
+                           occurred_at=self._iso(params['occurred_at']))]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            appended = []
+            for event in events:
+                if event['from_status'] is None:
+                    moved = conn.execute("INSERT OR IGNORE INTO request_heads VALUES (?, ?)",
+                                         (event['enquiry_no'], event['to_status'])).rowcount
+                elif params['check_state']:
+                    moved = conn.execute("UPDATE request_heads SET status = ? WHERE enquiry_no = ? AND status = ?",
+                                         (event['to_status'], event['enquiry_no'], event['from_status'])).rowcount
+                else:
+                    moved = conn.execute("INSERT OR REPLACE INTO request_heads VALUES (?, ?)",
+                                         (event['enquiry_no'], event['to_status'])).rowcount
+                if moved:
+                    conn.execute("INSERT INTO request_events (event_id, occurred_at, data) VALUES (?, ?, ?)",
+                                 (event['event_id'], event['occurred_at'], json.dumps(event)))
+                    appended.append(event)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if 'MERGE' in sql:
+            return [{'event_id': event['event_id']} for event in appended]
+        return [{'applied': bool(appended)}]
+
+    def _query_persons(self, sql, params):
+        if 'approver_level = @level' in sql:
+            # L1 lookups are narrowed to the branch's approver pool
+            pool = params.get('pool') if 'IN UNNEST(@pool)' in sql else None
+            branch = params.get('branch_name')
+            matches = []
+            for person in self.persons.values():
+                if person['approver_level'] != params.get('level'):
+                    continue
+                if pool is not None and person['email'] not in pool:
+                    continue
+                names = person['branch_names']
+                if branch in names or 'All' in names or not names:
+                    matches.append({'email': person['email'], 'name': person['name']})
+            return matches
+        person = self.persons.get(params.get('email'))
+        return [dict(person)] if person else []
+
+    def _query_catalog(self, sql, params):
+        if 'WHERE' not in sql.upper():
+            return [{'branch_name': b, 'card_name': c, 'mrp': fees[0], 'installment': fees[1]}
+                    for b in STANDIN_BRANCHES for c, fees in STANDIN_CARDS.items()]
+        if 'DISTINCT branch_name' in sql:
+            return [{'branch_name': b} for b in sorted(STANDIN_BRANCHES)]
+        if 'DISTINCT card_name' in sql:
+            if params.get('branch_name') not in STANDIN_BRANCHES:
+                return []
+            return [{'card_name': c} for c in sorted(STANDIN_CARDS)]
+        fees = STANDIN_CARDS.get(params.get('card_name'))
+        if params.get('branch_name') in STANDIN_BRANCHES and fees:
+            return [{'mrp': fees[0], 'installment': fees[1]}]
+        return []
+
+    def _load(self, where='', args=()):
+        cur = self._conn().execute(
+            f"SELECT data FROM discount_requests {where} ORDER BY created_at DESC", args
+        )
+        return [json.loads(r[0]) for r in cur.fetchall()]
+
+    @staticmethod
+    def _value(expr, params, row):
+        expr = expr.strip()
+        if expr.startswith('@'):
+            return params.get(expr[1:])
+        if expr.startswith("'"):
+            return expr.strip("'")
+        if ' - ' in expr:
+            left, right = expr.split(' - ', 1)
+            return (StandInBigQueryClient._value(left, params, row) or 0) - \
+                (StandInBigQueryClient._value(right, params, row) or 0)
+        if re.match(r'^-?\d+(\.\d+)?$', expr):
+            return float(expr)
+        return row.get(expr)
+
+    @classmethod
+    def _matches(cls, where, params, row):
+        """Evaluate a conjunction of simple predicates against a row."""
+        for cond in re.split(r'\s+AND\s+', where, flags=re.IGNORECASE):
+            cond = cond.strip()
+            m = re.match(r'^(\w+) (NOT )?IN \((.*)\)$', cond)
+            if m:
+                values = [v.strip().strip("'") for v in m.group(3).split(',')]
+                if (row.get(m.group(1)) in values) == bool(m.group(2)):
+                    return False
+                continue
+            m = re.match(r'^(\w+) IN UNNEST\(@(\w+)\)$', cond)
+            if m:
+                if row.get(m.group(1)) not in (params.get(m.group(2)) or []):
+                    return False
+                continue
+            m = re.match(r"^(\w+) LIKE '([^']*)%'$", cond)
+            if m:
+                if not str(row.get(m.group(1)) or '').startswith(m.group(2)):
+                    return False
+                continue
+            m = re.match(r'^(\w+) = (.+)$', cond)
+            if m:
+                if row.get(m.group(1)) != cls._value(m.group(2), params, row):
+                    return False
+                continue
+            logger.warning(f"Stand-in BigQuery ignoring predicate: {cond}")
+        return True
+
+    def _select_requests(self, sql, params):
+        if 'COUNT(*) as total' in sql:
+            rows = self._load()
+            return [{
+                'total': len(rows),
+                'pending': sum(1 for r in rows if r['status'].startswith('PENDING')),
+                'approved': sum(1 for r in rows if r['status'] == 'APPROVED'),
+                'rejected': sum(1 for r in rows if r['status'] == 'REJECTED'),
+            }]
+        where = re.search(r'WHERE (.+?)( ORDER BY| LIMIT|$)', sql)
+        rows = self._load()
+        if where:
+            rows = [r for r in rows if self._matches(where.group(1), params, r)]
+        if 'COUNT(*) as count' in sql:
+            return [{'count': len(rows)}]
+        limit = re.search(r'LIMIT (\d+)', sql)
+        if limit:
+            rows = rows[:int(limit.group(1))]
+        return rows
+
+    def _dml_requests(self, sql, params):
+        conn = self._conn()
+        if sql.upper().startswith('INSERT'):
+            row = dict(params)
+            conn.execute(
+                "INSERT INTO discount_requests VALUES (?, ?, ?, ?)",
+                (row['enquiry_no'], row['status'], row['created_at'], json.dumps(row))
+            )
+            conn.commit()
+            return 1
+        m = re.search(r'SET (.+) WHERE (.+)$', sql)
+        if not m:
+            return 0
+        assignments = [a.split(' = ', 1) for a in re.split(r',\s*', m.group(1))]
+        affected = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "SELECT rowid, data FROM discount_requests WHERE enquiry_no = ?",
+                (params.get('enquiry_no'),)
+            )
+            for rowid, data in cur.fetchall():
+                row = json.loads(data)
+                if not self._matches(m.group(2), params, row):
+                    continue
+                for column, expr in assignments:
+                    row[column.strip()] = self._value(expr, params, row)
+                conn.execute(
+                    "UPDATE discount_requests SET status = ?, data = ? WHERE rowid = ?",
+                    (row['status'], json.dumps(row), rowid)
+                )
+                affected += 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return affected
+
+
+def standin_send_notification_email(to_emails, subject, body, *args, latency_ms=STANDIN_SMTP_LATENCY_MS, **kwargs):
+    """Stand-in for app.send_notification_email: one SMTP session per recipient."""
+    for _ in to_emails:
+        _sleep_ms(latency_ms)
+    return True
+
+
+def standin_app(db_path=STANDIN_DB_PATH, latency_ms=STANDIN_BQ_LATENCY_MS,
+                dml_latency_ms=STANDIN_BQ_DML_LATENCY_MS, smtp_latency_ms=STANDIN_SMTP_LATENCY_MS):
+    """
+    gunicorn app factory: the real Flask app wired to stand-in backends.
+
+    The defaults come from the LOADTEST_* environment variables; callers in
+    the same process (the smoke test) pass the latencies explicitly.
+    """
+    os.environ.setdefault('K_SERVICE', 'discount-app-loadtest')
+    os.environ.setdefault('FLASK_SECRET_KEY', 'loadtest-secret')
+    os.environ.setdefault('EMAIL_SENDER', 'loadtest@pw.live')
+    os.environ.setdefault('EMAIL_PASSWORD', 'loadtest')
+    # Every simulated user comes from the same address
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    import app as app_module
+
+    # app reads these on import, which may have happened first (in the test suite)
+    app_module.app.secret_key = app_module.app.secret_key or os.environ['FLASK_SECRET_KEY']
+    app_module.rate_limiter.enabled = os.environ['RATE_LIMIT_ENABLED'].lower() in ('1', 'true', 'yes')
+    app_module.client = StandInBigQueryClient(db_path, latency_ms, dml_latency_ms)
+    app_module.send_notification_email = functools.partial(standin_send_notification_email,
+                                                           latency_ms=smtp_latency_ms)
+    logging.getLogger('app').setLevel(logging.WARNING)
+    return app_module.app
+
+
+def reset_standin_db(db_path=STANDIN_DB_PATH):
+    """Remove the stand-in discount_requests store."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+class MetricsCollector:
+    """Thread-safe collection of per-step latencies and outcomes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+        self.journeys = []
+
+    def record(self, step, latency, ok, error=None):
+        with self._lock:
+            self.samples.append((step, latency, ok, error))
+
+    def record_journey(self, name, ok):
+        with self._lock:
+            self.journeys.append((name, ok))
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+class LoadTestRunner:
+    """Open-loop arrival generator running counselor and approver journeys."""
+
+    def __init__(self, target, counselors=STANDIN_COUNSELORS, approval_ratio=1.0,
+                 timeout=130, max_in_flight=500):
+        self.target = target.rstrip('/')
+        self.counselors = counselors
+        self.approval_ratio = approval_ratio
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.approver_pools = ApproverPools.load()
+        self._enquiry_counter = itertools.count(random.randint(100000000, 400000000))
+        self._counter_lock = threading.Lock()
+        self._in_flight = 0
+
+    def _submit(self, fn, *args):
+        """Schedule a journey and track it until it finishes."""
+        with self._counter_lock:
+            self._in_flight += 1
+
+        def run():
+            try:
+                fn(*args)
+            finally:
+                with self._counter_lock:
+                    self._in_flight -= 1
+        self.pool.submit(run)
+
+    def _next_enquiry(self):
+        with self._counter_lock:
+            return f"EN{next(self._enquiry_counter):09d}"
+
+    def _step(self, metrics, session, step, method, path, expect=None, **kwargs):
+        """Issue one HTTP request and record its latency and outcome."""
+        start = time.perf_counter()
+        try:
+            response = session.request(method, self.target + path, timeout=self.timeout, **kwargs)
+            latency = time.perf_counter() - start
+            ok = response.status_code < 400 and (expect is None or expect in response.text)
+            metrics.record(step, latency, ok, None if ok else f"HTTP {response.status_code}")
+            return response if ok else None
+        except Exception as e:
+            metrics.record(step, time.perf_counter() - start, False, type(e).__name__)
+            return None
+
+    def _login(self, metrics, session, email, step):
+        return self._step(metrics, session, step, 'POST', '/login',
+                          expect='Welcome', data={'email': email, 'password': STANDIN_PASSWORD})
+
+    def counselor_journey(self, metrics):
+        """Login, walk the dropdown flow and submit one discount request."""
+        import requests
+        index = random.randrange(self.counselors)
+        branch = STANDIN_BRANCHES[index % len(STANDIN_BRANCHES)]
+        card = random.choice(list(STANDIN_CARDS))
+        enquiry_no = self._next_enquiry()
+        with requests.Session() as session:
+            ok = (
+                self._login(metrics, session, f'counselor{index}@pw.live', 'counselor_login') is not None
+                and self._step(metrics, session, 'request_form', 'GET', '/request_discount') is not None
+                and self._step(metrics, session, 'api_cards', 'GET', f'/api/cards/{branch}') is not None
+            )
+            mrp_response = ok and self._step(metrics, session, 'api_mrp', 'GET', f'/api/mrp/{branch}/{card}')
+            if not mrp_response:
+                metrics.record_journey('counselor', False)
+                return
+            fees = mrp_response.json()
+            discount = round(fees['installment'] * random.uniform(0.31, 0.6), 2)
+            submitted = self._step(
+                metrics, session, 'submit_request', 'POST', '/request_discount',
+                expect='submitted successfully',
+                data={
+                    'enquiry_no': enquiry_no, 'student_name': f'Student {enquiry_no}',
+                    'mobile_no': f'9{random.randint(100000000, 999999999)}',
+                    'branch_name': branch, 'card_name': card,
+                    'mrp': fees['mrp'], 'installment': fees['installment'],
+                    'discount_amount': discount, 'reason': 'Financial Hardship', 'remarks': 'load test',
+                })
+        metrics.record_journey('counselor', submitted is not None)
+        if submitted is not None and random.random() < self.approval_ratio:
+            self._submit(self.approval_journey, metrics, enquiry_no, branch, fees['mrp'] - discount)
+
+    def approval_journey(self, metrics, enquiry_no, branch, discounted_fees):
+        """Run the L1 -> L2 approval chain for one submitted request."""
+        import requests
+        # The request is assigned to one member of its branch's pool; find whose queue has it
+        members = sorted(self.approver_pools.pool_for(branch))
+        l1_email = members[0] if len(members) == 1 else None
+        for email in members if l1_email is None else []:
+            with requests.Session() as session:
+                queue = (self._login(metrics, session, email, 'l1_login') is not None
+                         and self._step(metrics, session, 'l1_queue', 'GET', '/approve_request'))
+            if not queue:
+                metrics.record_journey('approval', False)
+                return
+            if enquiry_no in queue.text:
+                l1_email = email
+                break
+        if l1_email is None:
+            metrics.record_journey('approval', False)
+            return
+        for level, email, expect in (('l1', l1_email, 'approved at L1 level'),
+                                     ('l2', L2_APPROVER, 'fully approved')):
+            with requests.Session() as session:
+                ok = (
+                    self._login(metrics, session, email, f'{level}_login') is not None
+                    and self._step(metrics, session, f'{level}_queue', 'GET', '/approve_request') is not None
+                    and self._step(metrics, session, f'{level}_approve', 'POST', '/approve_request',
+                                   expect=expect,
+                                   data={'request_id': enquiry_no, 'action': 'APPROVE',
+                                         'approved_discount_value': f'{discounted_fees:.2f}',
+                                         'approver_comments': 'load test'}) is not None
+                )
+            if not ok:
+                metrics.record_journey('approval', False)
+                return
+        metrics.record_journey('approval', True)
+
+    def run_step(self, rate, duration, drain=30):
+        """Generate Poisson arrivals at `rate` journeys/s for `duration` seconds."""
+        metrics = MetricsCollector()
+        started = time.perf_counter()
+        next_arrival = started
+        while next_arrival - started < duration:
+            now = time.perf_counter()
+            if next_arrival > now:
+                time.sleep(next_arrival - now)
+            self._submit(self.counselor_journey, metrics)
+            next_arrival += random.expovariate(rate)
+        elapsed = time.perf_counter() - started
+        # Give in-flight journeys (including approval chains) time to finish
+        deadline = time.perf_counter() + drain
+        while self._in_flight and time.perf_counter() < deadline:
+            time.sleep(0.5)
+        return summarize(rate, elapsed, metrics)
+
+
+def summarize(rate, elapsed, metrics):
+    """Reduce raw samples into one row of the throughput/latency/error curve."""
+    steps = {}
+    for step, latency, ok, error in metrics.samples:
+        entry = steps.setdefault(step, {'latencies': [], 'errors': 0, 'timeouts': 0})
+        entry['latencies'].append(latency)
+        if not ok:
+            entry['errors'] += 1
+            if error in ('ReadTimeout', 'ConnectionError') or latency >= 120:
+                entry['timeouts'] += 1
+    completed = sum(1 for name, ok in metrics.journeys if name == 'counselor' and ok)
+    attempted = sum(1 for name, _ in metrics.journeys if name == 'counselor')
+    approvals = sum(1 for name, ok in metrics.journeys if name == 'approval' and ok)
+    summary = {
+        'offered_rate': rate,
+        'submitted_per_s': completed / elapsed if elapsed else 0.0,
+        'approval_chains_per_s': approvals / elapsed if elapsed else 0.0,
+        'journey_error_pct': 100.0 * (attempted - completed) / attempted if attempted else 0.0,
+        'steps': {},
+    }
+    for step, entry in sorted(steps.items()):
+        latencies = entry['latencies']
+        summary['steps'][step] = {
+            'count': len(latencies),
+            'p50': _percentile(latencies, 50),
+            'p95': _percentile(latencies, 95),
+            'p99': _percentile(latencies, 99),
+            'max': max(latencies),
+            'error_pct': 100.0 * entry['errors'] / len(latencies),
+            'timeouts': entry['timeouts'],
+        }
+    return summary
+
+
+def print_summary(summaries):
+    """Print the per-rate curves as plain-text tables."""
+    print("\n" + "=" * 78)
+    print(f"{'rate/s':>8} {'submit/s':>9} {'chains/s':>9} {'err%':>7}")
+    for s in summaries:
+        print(f"{s['offered_rate']:>8.2f} {s['submitted_per_s']:>9.2f} "
+              f"{s['approval_chains_per_s']:>9.2f} {s['journey_error_pct']:>7.1f}")
+    for s in summaries:
+        print(f"\nOffered rate {s['offered_rate']:.2f}/s")
+        print(f"  {'step':<16} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'err%':>6} {'t/o':>5}")
+        for step, m in s['steps'].items():
+            print(f"  {step:<16} {m['count']:>6} {m['p50']:>8.2f} {m['p95']:>8.2f} {m['p99']:>8.2f} "
+                  f"{m['max']:>8.2f} {m['error_pct']:>6.1f} {m['timeouts']:>5}")
+
+
+def write_csv(summaries, path):
+    """Write one CSV row per (rate, step) for plotting."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['offered_rate', 'submitted_per_s', 'approval_chains_per_s', 'journey_error_pct',
+                         'step', 'count', 'p50', 'p95', 'p99', 'max', 'error_pct', 'timeouts'])
+        for s in summaries:
+            for step, m in s['steps'].items():
+                writer.writerow([s['offered_rate'], f"{s['submitted_per_s']:.3f}",
+                                 f"{s['approval_chains_per_s']:.3f}", f"{s['journey_error_pct']:.2f}",
+                                 step, m['count'], f"{m['p50']:.3f}", f"{m['p95']:.3f}",
+                                 f"{m['p99']:.3f}", f"{m['max']:.3f}", f"{m['error_pct']:.2f}", m['timeouts']])
+
+
+def spawn_server(port, workers, threads, serving_mode='sync', worker_connections=200):
+    """Start gunicorn (via gunicorn.conf.py) with the stand-in app and wait for /_health."""
+    import requests
+    reset_standin_db()
+    cmd = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+           '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning']
+    if serving_mode == 'async':
+        cmd += ['--worker-connections', str(worker_connections)]
+    else:
+        cmd += ['--threads', str(threads)]
+    cmd.append('load_test:standin_app()')
+    env = dict(os.environ, SERVING_MODE=serving_mode)
+    logger.info(f"Starting stand-in server ({serving_mode}): {' '.join(cmd)}")
+    process = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    for _ in range(60):
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/_health', timeout=2).ok:
+                return process
+        except Exception:
+            pass
+        time.sleep(1)
+    process.terminate()
+    raise RuntimeError("Stand-in server did not become healthy")
+
+
+def main():
+    """Load-test command line entry point."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Discount app load-test scenario runner')
+    parser.add_argument('action', choices=['run', 'reset'], help='Action to perform')
+    parser.add_argument('--target', default='http://127.0.0.1:8080', help='Base URL of the app under test')
+    parser.add_argument('--spawn', action='store_true', help='Start a local stand-in server first')
+    parser.add_argument('--port', type=int, default=8080, help='Port for --spawn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers for --spawn')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads for --spawn (sync mode)')
+    parser.add_argument('--serving-mode', choices=['sync', 'async'], default='sync',
+                        help='SERVING_MODE for --spawn (see gunicorn.conf.py)')
+    parser.add_argument('--worker-connections', type=int, default=200,
+                        help='gevent connections per worker for --spawn (async mode)')
+    parser.add_argument('--rates', default='0.25,0.5,1,2,4', help='Comma-separated arrival rates (journeys/s)')
+    parser.add_argument('--step-duration', type=float, default=60, help='Seconds per rate step')
+    parser.add_argument('--drain', type=float, default=30, help='Seconds to let in-flight journeys finish')
+    parser.add_argument('--approval-ratio', type=float, default=1.0,
+                        help='Fraction of submitted requests that run the L1 -> L2 chain')
+    parser.add_argument('--counselors', type=int, default=STANDIN_COUNSELORS, help='Synthetic counselor pool size')
+    parser.add_argument('--csv', help='Write per-step curves to this CSV file')
+    parser.add_argument('--json', help='Write raw summaries to this JSON file')
+
+    args = parser.parse_args()
+
+    if args.action == 'reset':
+        reset_standin_db()
+        logger.info("Stand-in store removed")
+        return
+
+    process = None
+    if args.spawn:
+        os.environ['LOADTEST_COUNSELORS'] = str(args.counselors)
+        process = spawn_server(args.port, args.workers, args.threads,
+                               args.serving_mode, args.worker_connections)
+        args.target = f'http://127.0.0.1:{args.port}'
+
+    try:
+        runner = LoadTestRunner(args.target, counselors=args.counselors, approval_ratio=args.approval_ratio)
+        summaries = []
+        for rate in [float(r) for r in args.rates.split(',') if r.strip()]:
+            logger.info(f"Running rate step {rate}/s for {args.step_duration}s against {args.target}")
+            summaries.append(runner.run_step(rate, args.step_duration, drain=args.drain))
+        print_summary(summaries)
+        if args.csv:
+            write_csv(summaries, args.csv)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'generated_at': datetime.now(timezone.utc).isoformat(), 'steps': summaries}, f, indent=2)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Helpers for rendering metrics in the Prometheus text format.
+
+Shared by the ``/metrics`` sections of the SLA tracker, the cutover shadow
+writer and reader, and the rate limiter. ``/metrics`` adds a ``worker`` label
+to every sample, since each gunicorn worker counts on its own.
+"""
+
+import bisect
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(**labels):
+    """name="value" pairs for a sample, values escaped."""
+    return ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items())
+
+
+def add_labels(exposition, **labels):
+    """Text exposition with labels added to every sample (comment lines are kept as is)."""
+    extra = format_labels(**labels)
+    lines = []
+    for line in exposition.splitlines():
+        if line and not line.startswith('#'):
+            end = min(i for i in (line.find('{'), line.find(' ')) if i >= 0)
+            if line[end] == '{':
+                line = f"{line[:end + 1]}{extra},{line[end + 1:]}"
+            else:
+                line = f"{line[:end]}{{{extra}}}{line[end:]}"
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def format_bound(seconds):
+    """A histogram bucket's le label (None is +Inf)."""
+    return '+Inf' if seconds is None else f"{seconds:g}"
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in seconds."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        """[(upper bound or None for +Inf, cumulative count)]"""
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + [None], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
@@ -3,11 +3,31 @@
 Database migration utility for restructuring discount_requests table.
 
 This script provides utilities to migrate from the current structure to the new normalized structure.
+
+Migrations in migrations/ are applied statement by statement and recorded in
+the schema_migrations ledger, so an interrupted run resumes where it stopped.
+Statements can be annotated with SQL comments:
+
+    -- @chunk_by discount_requests.created_at MONTH
+        run once per created_at range, filtered with @chunk_start/@chunk_end
+        on CAST(created_at AS TIMESTAMP), then once more with both NULL for
+        rows without a created_at (the statement selects those when
+        @chunk_start IS NULL)
+    -- @parallel <group>
+        consecutive statements in the same group run concurrently
+
+migrations/rollback/<same file name> undoes a migration.
 """
 
 import os
+import re
 import sys
+import time
+import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from google.cloud import bigquery
 from google.oauth2 import service_account
@@ -16,6 +36,13 @@ from google.oauth2 import service_account
 sys.path.insert(0, str(Path(__file__).parent))
 
 from enhanced_data_access import DiscountDataAccess
+from request_events import materialize_projection
+from rollups import refresh_rollups
+from verify_consistency import verify_consistency, LEGACY_TABLES
+from pricing_index import PricingIndex, recompute_discounts
+from cost_guard import (
+    PlannedQuery, extract_queries, plan_costs, format_cost_table, load_baseline, save_baseline
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,6 +51,14 @@ logger = logging.getLogger(__name__)
 PROJECT_ID = 'gewportal2025'
 DATASET_ID = 'discount_management'
 MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+LEDGER_TABLE = 'schema_migrations'
+MIGRATION_WORKERS = int(os.getenv('MIGRATION_WORKERS', 4))
+# Attempts for a transaction aborted by a concurrent one on the same table
+MIGRATION_RETRIES = int(os.getenv('MIGRATION_RETRIES', 3))
+
+ANNOTATION = re.compile(r'^--\s*@(\w+)\s*(.*)$')
+CHUNK_UNITS = ('DAY', 'WEEK', 'MONTH', 'YEAR')
+DML_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'MERGE')
 
 def get_bigquery_client():
     """Get a BigQuery client."""
@@ -47,55 +82,412 @@ def get_bigquery_client():
         logger.error(f"Error initializing BigQuery client: {e}")
         return None
 
-def run_migration_file(client, migration_file):
-    """Run a single migration file."""
-    logger.info(f"Running migration: {migration_file.name}")
-    
-    try:
-        with open(migration_file, 'r') as f:
-            sql_content = f.read()
-        
-        # Split the SQL content by semicolons and execute each statement
-        statements = [stmt.strip() for stmt in sql_content.split(';') if stmt.strip()]
-        
-        for i, statement in enumerate(statements):
-            if statement:
-                logger.info(f"Executing statement {i+1}/{len(statements)}")
-                client.query(statement).result()
-                logger.info(f"Statement {i+1} completed successfully")
-        
-        logger.info(f"Migration {migration_file.name} completed successfully")
+class MigrationError(Exception):
+    """A migration file is malformed or cannot be applied/rolled back."""
+
+
+class Step:
+    """One statement of a migration file, with its annotations."""
+
+    def __init__(self, migration, index, sql, parallel=None, chunk_by=None):
+        self.migration = migration
+        self.index = index
+        self.sql = sql
+        self.parallel = parallel
+        self.chunk_by = chunk_by
+
+    @property
+    def key(self):
+        return str(self.index)
+
+    @property
+    def checksum(self):
+        """Hash of the statement and its annotations (plain comments don't count)."""
+        lines = [line.strip() for line in self.sql.splitlines()]
+        significant = [line for line in lines if line and (not line.startswith('--') or ANNOTATION.match(line))]
+        return hashlib.sha256('\n'.join(significant).encode()).hexdigest()[:16]
+
+    @property
+    def is_dml(self):
+        return sql_body(self.sql).upper().startswith(DML_PREFIXES)
+
+    def __repr__(self):
+        return f"{self.migration}#{self.index}"
+
+
+class Migration:
+    def __init__(self, path, steps):
+        self.path = path
+        self.name = path.stem
+        self.version = self.name.split('_')[0]
+        self.steps = steps
+
+    @property
+    def rollback_path(self):
+        return self.path.parent / 'rollback' / self.path.name
+
+
+def sql_body(statement):
+    """Statement text without its comment lines."""
+    return '\n'.join(line for line in statement.splitlines() if not line.strip().startswith('--')).strip()
+
+
+def split_statements(sql_content):
+    """Statements of a SQL file (split on ';', so SQL must not use ';' in strings or comments)."""
+    return [stmt.strip() for stmt in sql_content.split(';') if sql_body(stmt)]
+
+
+def parse_migration(path):
+    """Parse a migration file into steps, reading -- @parallel and -- @chunk_by annotations."""
+    steps = []
+    for index, statement in enumerate(split_statements(path.read_text()), 1):
+        annotations = {}
+        for line in statement.splitlines():
+            match = ANNOTATION.match(line.strip())
+            if match:
+                annotations[match.group(1)] = match.group(2).split()
+        unknown = set(annotations) - {'parallel', 'chunk_by'}
+        if unknown:
+            raise MigrationError(f"{path.name} statement {index}: unknown annotation(s) {sorted(unknown)}")
+
+        parallel = annotations.get('parallel')
+        if parallel is not None and len(parallel) != 1:
+            raise MigrationError(f"{path.name} statement {index}: use -- @parallel <group>")
+
+        chunk_by = annotations.get('chunk_by')
+        if chunk_by is not None:
+            if len(chunk_by) not in (1, 2) or chunk_by[0].count('.') != 1:
+                raise MigrationError(f"{path.name} statement {index}: use -- @chunk_by <table>.<column> [DAY|WEEK|MONTH|YEAR]")
+            unit = chunk_by[1].upper() if len(chunk_by) == 2 else 'MONTH'
+            if unit not in CHUNK_UNITS:
+                raise MigrationError(f"{path.name} statement {index}: chunk unit must be one of {CHUNK_UNITS}")
+            if '@chunk_start' not in statement or '@chunk_end' not in statement:
+                raise MigrationError(f"{path.name} statement {index}: chunked statements must filter on "
+                                     f"@chunk_start and @chunk_end")
+            if '@chunk_start IS NULL' not in statement:
+                raise MigrationError(f"{path.name} statement {index}: chunked statements must select rows "
+                                     f"without a value when @chunk_start IS NULL")
+            table, column = chunk_by[0].split('.')
+            chunk_by = (table, column, unit)
+
+        steps.append(Step(path.stem, index, statement, parallel=parallel[0] if parallel else None,
+                          chunk_by=chunk_by))
+    return Migration(path, steps)
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """All migrations in version order."""
+    return [parse_migration(path) for path in sorted(Path(directory).glob('*.sql'))]
+
+
+def unit_start(value, unit):
+    """Start of the DAY/WEEK (Monday)/MONTH/YEAR containing value, in UTC."""
+    value = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    day = datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    if unit == 'DAY':
+        return day
+    if unit == 'WEEK':
+        return day - timedelta(days=day.weekday())
+    if unit == 'MONTH':
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def next_unit(start, unit):
+    if unit == 'DAY':
+        return start + timedelta(days=1)
+    if unit == 'WEEK':
+        return start + timedelta(days=7)
+    if unit == 'MONTH':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start.replace(year=start.year + 1)
+
+
+def chunk_ranges(low, high, unit):
+    """[(start, end)) ranges of one unit each, covering low..high."""
+    if low is None or high is None:
+        return []
+    ranges = []
+    start = unit_start(low, unit)
+    while start <= high.replace(tzinfo=high.tzinfo or timezone.utc):
+        end = next_unit(start, unit)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+class MigrationLedger:
+    """schema_migrations: one row per applied statement, chunk, or completed chunked statement."""
+
+    def __init__(self, client, project_id=PROJECT_ID, dataset_id=DATASET_ID):
+        self.client = client
+        self.table = f"`{project_id}.{dataset_id}.{LEDGER_TABLE}`"
+
+    def ensure(self):
+        self.client.query(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                migration STRING NOT NULL,
+                step STRING NOT NULL,
+                chunk STRING NOT NULL, -- chunk start, or empty for the whole statement
+                checksum STRING NOT NULL,
+                applied_at TIMESTAMP NOT NULL,
+                duration_ms INT64
+            )
+        """).result()
+
+    def applied(self):
+        """{(migration, step, chunk): checksum}"""
+        rows = self.client.query(f"SELECT migration, step, chunk, checksum FROM {self.table}").result()
+        return {(row['migration'], row['step'], row['chunk']): row['checksum'] for row in rows}
+
+    def insert_sql(self):
+        return f"""
+            INSERT INTO {self.table} (migration, step, chunk, checksum, applied_at, duration_ms)
+            VALUES (@ledger_migration, @ledger_step, @ledger_chunk, @ledger_checksum,
+                    CURRENT_TIMESTAMP(), @ledger_duration_ms)
+        """
+
+    def insert_params(self, step, chunk, duration_ms=None):
+        return [
+            bigquery.ScalarQueryParameter('ledger_migration', 'STRING', step.migration),
+            bigquery.ScalarQueryParameter('ledger_step', 'STRING', step.key),
+            bigquery.ScalarQueryParameter('ledger_chunk', 'STRING', chunk),
+            bigquery.ScalarQueryParameter('ledger_checksum', 'STRING', step.checksum),
+            bigquery.ScalarQueryParameter('ledger_duration_ms', 'INT64', duration_ms),
+        ]
+
+    def record(self, step, chunk='', duration_ms=None):
+        job_config = bigquery.QueryJobConfig(query_parameters=self.insert_params(step, chunk, duration_ms))
+        self.client.query(self.insert_sql(), job_config=job_config).result()
+
+    def forget(self, migration):
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter('migration', 'STRING', migration)
+        ])
+        self.client.query(f"DELETE FROM {self.table} WHERE migration = @migration", job_config=job_config).result()
+
+
+class MigrationRunner:
+    """
+    Applies migrations statement by statement, recording each in schema_migrations.
+
+    DML statements run in a transaction together with their ledger row, so a
+    statement is applied exactly once however often the run is restarted.
+    Statements annotated with -- @chunk_by run once per created_at range, each
+    range checkpointed; consecutive statements sharing a -- @parallel group run
+    concurrently. max_chunks bounds how many chunks one run applies.
+    """
+
+    def __init__(self, client, project_id=PROJECT_ID, dataset_id=DATASET_ID,
+                 workers=MIGRATION_WORKERS, max_chunks=None):
+        self.client = client
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.workers = workers
+        self.max_chunks = max_chunks
+        self.ledger = MigrationLedger(client, project_id, dataset_id)
+        self.stopped = False
+        self._applied = {}
+        self._chunks_run = 0
+        self._lock = threading.Lock()
+
+    def _is_done(self, step, chunk=''):
+        return (step.migration, step.key, chunk) in self._applied
+
+    def status(self, migrations):
+        """[(migration, applied steps, total steps)]"""
+        self.ledger.ensure()
+        self._applied = self.ledger.applied()
+        return [(m.name, sum(1 for step in m.steps if self._is_done(step)), len(m.steps)) for m in migrations]
+
+    def run(self, migrations):
+        """Apply everything not yet applied. Returns False if stopped by max_chunks."""
+        self.ledger.ensure()
+        self._applied = self.ledger.applied()
+        for migration in migrations:
+            for step in migration.steps:
+                recorded = self._applied.get((step.migration, step.key, ''))
+                if recorded is not None and recorded != step.checksum:
+                    logger.warning(f"{step} changed since it was applied (checksum {recorded} -> {step.checksum}); "
+                                   f"not re-running it")
+            pending = [step for step in migration.steps if not self._is_done(step)]
+            if not pending:
+                logger.info(f"Migration {migration.name} already applied")
+                continue
+
+            logger.info(f"Running migration {migration.name}: {len(pending)}/{len(migration.steps)} statements pending")
+            for group in self._groups(pending):
+                self._run_group(group)
+                if self.stopped:
+                    logger.info(f"Stopped after {self._chunks_run} chunks (--max-chunks); run again to continue")
+                    return False
+            logger.info(f"Migration {migration.name} completed successfully")
         return True
-    except Exception as e:
-        logger.error(f"Error running migration {migration_file.name}: {e}")
-        return False
 
-def run_all_migrations():
-    """Run all migration files in order."""
+    def _groups(self, steps):
+        """Consecutive steps sharing a @parallel group form one group, others run alone."""
+        groups = []
+        for step in steps:
+            if groups and step.parallel and groups[-1][0].parallel == step.parallel:
+                groups[-1].append(step)
+            else:
+                groups.append([step])
+        return groups
+
+    def _run_group(self, group):
+        if len(group) == 1:
+            self._run_step(group[0])
+            return
+        logger.info(f"Running {group} in parallel")
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(group))) as executor:
+            futures = [executor.submit(self._run_step, step) for step in group]
+        errors = [future.exception() for future in futures if future.exception()]
+        if errors:
+            raise errors[0]
+
+    def _run_step(self, step):
+        if step.chunk_by is None:
+            self._execute(step)
+            return
+        for start, end in self._chunk_ranges(step):
+            chunk = start.isoformat() if start else 'null'
+            if self._is_done(step, chunk):
+                continue
+            with self._lock:
+                if self.max_chunks is not None and self._chunks_run >= self.max_chunks:
+                    self.stopped = True
+                if self.stopped:
+                    return
+                self._chunks_run += 1
+            self._execute(step, chunk, [
+                bigquery.ScalarQueryParameter('chunk_start', 'TIMESTAMP', start),
+                bigquery.ScalarQueryParameter('chunk_end', 'TIMESTAMP', end),
+            ])
+        # Every chunk is in; mark the statement itself as applied
+        self.ledger.record(step)
+        with self._lock:
+            self._applied[(step.migration, step.key, '')] = step.checksum
+
+    def _chunk_ranges(self, step):
+        """Chunk ranges of the column, and a (None, None) chunk last if some rows have no value."""
+        table, column, unit = step.chunk_by
+        # Unparseable values fail the query here rather than fall outside every chunk
+        query = f"""
+            SELECT MIN(CAST({column} AS TIMESTAMP)) AS low, MAX(CAST({column} AS TIMESTAMP)) AS high,
+                   COUNTIF({column} IS NULL) AS missing
+            FROM `{self.project_id}.{self.dataset_id}.{table}`
+        """
+        row = list(self.client.query(query).result())[0]
+        ranges = chunk_ranges(row['low'], row['high'], unit)
+        if row['missing']:
+            ranges.append((None, None))
+        return ranges
+
+    def _execute(self, step, chunk='', params=None):
+        label = f"{step} chunk {chunk}" if chunk else str(step)
+        started = time.monotonic()
+        if step.is_dml:
+            # The statement and its ledger row commit together
+            script = (f"BEGIN TRANSACTION;\n{step.sql};\n{self.ledger.insert_sql()};\nCOMMIT TRANSACTION;")
+            for attempt in range(1, MIGRATION_RETRIES + 1):
+                job_config = bigquery.QueryJobConfig(
+                    query_parameters=(params or []) + self.ledger.insert_params(step, chunk))
+                try:
+                    self.client.query(script, job_config=job_config).result()
+                    break
+                except Exception as e:
+                    # Concurrent transactions on one table abort rather than block; nothing was committed
+                    if 'concurrent' not in str(e).lower() or attempt == MIGRATION_RETRIES:
+                        raise MigrationError(f"{label} failed: {e}") from e
+                    logger.warning(f"{label} aborted by a concurrent transaction, retrying")
+                    time.sleep(2 ** attempt)
+        else:
+            try:
+                self.client.query(step.sql, job_config=bigquery.QueryJobConfig(query_parameters=params or [])).result()
+            except Exception as e:
+                raise MigrationError(f"{label} failed: {e}") from e
+            self.ledger.record(step, chunk, int((time.monotonic() - started) * 1000))
+        with self._lock:
+            self._applied[(step.migration, step.key, chunk)] = step.checksum
+        logger.info(f"{label} applied in {time.monotonic() - started:.1f}s")
+
+    def baseline(self, migrations, through=None):
+        """Record migrations up to version `through` as applied without running them."""
+        self.ledger.ensure()
+        self._applied = self.ledger.applied()
+        for migration in migrations:
+            if through is not None and migration.version > through:
+                break
+            for step in migration.steps:
+                if not self._is_done(step):
+                    self.ledger.record(step)
+            logger.info(f"Marked {migration.name} as applied")
+
+    def rollback(self, migrations, to_version=None):
+        """
+        Roll back applied migrations newer than to_version, newest first (the
+        latest one if to_version is None), using migrations/rollback/<file>.
+        """
+        self.ledger.ensure()
+        applied_names = {migration for migration, _, _ in self.ledger.applied()}
+        applied = [m for m in migrations if m.name in applied_names]
+        if to_version is None:
+            targets = applied[-1:]
+        else:
+            targets = [m for m in applied if m.version > to_version]
+        irreversible = [m.name for m in targets if not m.rollback_path.exists()]
+        if irreversible:
+            raise MigrationError(f"No rollback script for {irreversible}; roll back manually")
+
+        for migration in reversed(targets):
+            logger.info(f"Rolling back {migration.name}")
+            for statement in split_statements(migration.rollback_path.read_text()):
+                self.client.query(statement).result()
+            self.ledger.forget(migration.name)
+            logger.info(f"Rolled back {migration.name}")
+        return [m.name for m in targets]
+
+
+def run_all_migrations(workers=MIGRATION_WORKERS, max_chunks=None):
+    """Apply pending migrations. Returns False if stopped early by max_chunks."""
     client = get_bigquery_client()
     if not client:
-        logger.error("Cannot initialize BigQuery client")
-        return False
+        raise MigrationError("Cannot initialize BigQuery client")
     
-    # Get all migration files and sort them
-    migration_files = sorted(MIGRATIONS_DIR.glob('*.sql'))
-    
-    if not migration_files:
+    migrations = load_migrations()
+    if not migrations:
         logger.warning("No migration files found")
         return True
     
-    logger.info(f"Found {len(migration_files)} migration files")
-    
-    success_count = 0
-    for migration_file in migration_files:
-        if run_migration_file(client, migration_file):
-            success_count += 1
-        else:
-            logger.error(f"Migration failed: {migration_file.name}")
-            break
-    
-    logger.info(f"Completed {success_count}/{len(migration_files)} migrations successfully")
-    return success_count == len(migration_files)
+    logger.info(f"Found {len(migrations)} migration files")
+    return MigrationRunner(client, workers=workers, max_chunks=max_chunks).run(migrations)
+
+def plan_query_costs(save=False):
+    """
+    Dry-run every distinct query in the app, the data access layer and the
+    migrations and print their costs. Returns False if any query is over the
+    bytes-billed cap or has regressed against the saved baseline.
+    """
+    client = get_bigquery_client()
+    if not client:
+        raise MigrationError("Cannot initialize BigQuery client")
+
+    app_dir = Path(__file__).parent
+    queries = []
+    for source in ('app.py', 'enhanced_data_access.py'):
+        queries += extract_queries(app_dir / source, PROJECT_ID, DATASET_ID)
+    for migration in load_migrations():
+        for step in migration.steps:
+            # Chunked statements are costed for a single chunk
+            origin = f"{step}" + (f" (per {step.chunk_by[2].lower()})" if step.chunk_by else '')
+            param_types = {'chunk_start': 'TIMESTAMP', 'chunk_end': 'TIMESTAMP'} if step.chunk_by else {}
+            queries.append(PlannedQuery(origin, step.sql, param_types))
+
+    results = plan_costs(client, queries, load_baseline())
+    print(format_cost_table(results))
+    if save:
+        save_baseline(results)
+    return not any(r['regression'] or r['over_limit'] for r in results)
 
 def verify_migration():
     """Verify that the migration completed successfully."""
@@ -138,56 +530,18 @@ def verify_migration():
         logger.error(f"Migration verification failed: {e}")
         return False
 
-def rollback_migration():
-    """Rollback migration by dropping new tables (keeping original data safe)."""
+def rollback_migration(to_version=None):
+    """Roll back the latest migration, or every migration after to_version (original tables are never touched)."""
     client = get_bigquery_client()
     if not client:
         logger.error("Cannot initialize BigQuery client")
         return False
     
     try:
-        tables_to_drop = [
-            'students',
-            'courses',  # This will need careful handling as it replaces branch_cards_fees
-            'pricing_history',
-            'discount_requests_new',
-            'request_approvals',
-            'pricing_snapshots'
-        ]
-        
-        views_to_drop = [
-            'discount_requests_legacy_view',
-            'branch_cards_fees_view',
-            'active_discount_requests',
-            'discount_analytics'
-        ]
-        
-        # Drop views first
-        for view_name in views_to_drop:
-            try:
-                query = f"DROP VIEW IF EXISTS `{PROJECT_ID}.{DATASET_ID}.{view_name}`"
-                client.query(query).result()
-                logger.info(f"Dropped view: {view_name}")
-            except Exception as e:
-                logger.warning(f"Could not drop view {view_name}: {e}")
-        
-        # Drop tables
-        for table_name in tables_to_drop:
-            try:
-                # Skip courses table as it might replace branch_cards_fees
-                if table_name == 'courses':
-                    logger.warning("Skipping courses table - manual review required")
-                    continue
-                    
-                query = f"DROP TABLE IF EXISTS `{PROJECT_ID}.{DATASET_ID}.{table_name}`"
-                client.query(query).result()
-                logger.info(f"Dropped table: {table_name}")
-            except Exception as e:
-                logger.warning(f"Could not drop table {table_name}: {e}")
-        
-        logger.info("Rollback completed (courses table and original tables preserved)")
+        rolled_back = MigrationRunner(client).rollback(load_migrations(), to_version)
+        if not rolled_back:
+            logger.info("Nothing to roll back")
         return True
-        
     except Exception as e:
         logger.error(f"Rollback failed: {e}")
         return False
@@ -228,10 +582,26 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(description='Database migration utility')
-    parser.add_argument('action', choices=['migrate', 'verify', 'rollback', 'performance'],
+    parser.add_argument('action', choices=['migrate', 'status', 'baseline', 'verify', 'rollback', 'performance',
+                                           'project-events', 'rollups', 'cost', 'consistency',
+                                           'recompute-discounts'],
                        help='Action to perform')
     parser.add_argument('--force', action='store_true',
                        help='Force action without confirmation')
+    parser.add_argument('--to', dest='to_version',
+                       help='baseline: last version to mark applied. rollback: roll back every migration after it')
+    parser.add_argument('--workers', type=int, default=MIGRATION_WORKERS,
+                       help='Statements run concurrently within a @parallel group')
+    parser.add_argument('--max-chunks', type=int,
+                       help='Stop after this many chunks (run again to continue)')
+    parser.add_argument('--save-baseline', action='store_true',
+                       help='cost: save the planned costs as the regression baseline')
+    parser.add_argument('--since', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                       help='consistency: only compare requests created on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--apply', action='store_true',
+                       help='recompute-discounts: write the recomputed prices back (default: report only)')
+    parser.add_argument('--legacy-table', choices=LEGACY_TABLES, default='discount_requests',
+                       help='consistency: legacy side to compare (request_state when requests are event sourced)')
     
     args = parser.parse_args()
     
@@ -243,12 +613,28 @@ def main():
                 return
         
         logger.info("Starting database migration...")
-        if run_all_migrations():
-            logger.info("Migration completed successfully!")
-        else:
-            logger.error("Migration failed!")
+        try:
+            if run_all_migrations(workers=args.workers, max_chunks=args.max_chunks):
+                logger.info("Migration completed successfully!")
+        except Exception as e:
+            logger.error(f"Migration failed: {e}")
+            logger.error("Applied statements are recorded; run migrate again to resume.")
             sys.exit(1)
     
+    elif args.action in ('status', 'baseline'):
+        client = get_bigquery_client()
+        if client is None:
+            logger.error("Cannot initialize BigQuery client")
+            sys.exit(1)
+        runner = MigrationRunner(client)
+        if args.action == 'status':
+            for name, applied, total in runner.status(load_migrations()):
+                state = 'applied' if applied == total else 'pending' if applied == 0 else 'partial'
+                print(f"{name:45} {state:8} {applied}/{total} statements")
+        else:
+            # For datasets migrated before the ledger existed
+            runner.baseline(load_migrations(), args.to_version)
+    
     elif args.action == 'verify':
         logger.info("Verifying migration...")
         if verify_migration():
@@ -265,7 +651,7 @@ def main():
                 return
         
         logger.info("Rolling back migration...")
-        if rollback_migration():
+        if rollback_migration(args.to_version):
             logger.info("Rollback completed successfully!")
         else:
             logger.error("Rollback failed!")
@@ -273,6 +659,61 @@ def main():
     
     elif args.action == 'performance':
         generate_performance_report()
+    
+    elif args.action == 'project-events':
+        logger.info("Folding request events into request_state...")
+        if materialize_projection(get_bigquery_client(), PROJECT_ID, DATASET_ID) is None:
+            logger.error("Projection failed!")
+            sys.exit(1)
+    
+    elif args.action == 'rollups':
+        logger.info("Refreshing analytics rollups...")
+        try:
+            refresh_rollups(get_bigquery_client(), PROJECT_ID, DATASET_ID)
+        except Exception as e:
+            logger.error(f"Rollup refresh failed: {e}")
+            sys.exit(1)
+    
+    elif args.action == 'cost':
+        try:
+            within_budget = plan_query_costs(save=args.save_baseline)
+        except Exception as e:
+            logger.error(f"Cost plan failed: {e}")
+            sys.exit(1)
+        if not within_budget:
+            logger.error("Queries over the bytes-billed cap or regressed against the baseline")
+            sys.exit(1)
+    
+    elif args.action == 'consistency':
+        client = get_bigquery_client()
+        if client is None:
+            logger.error("Cannot initialize BigQuery client")
+            sys.exit(1)
+        try:
+            report = verify_consistency(client, PROJECT_ID, DATASET_ID, args.legacy_table, args.since)
+        except Exception as e:
+            logger.error(f"Consistency check failed: {e}")
+            sys.exit(1)
+        if not report.consistent:
+            sys.exit(1)
+    
+    elif args.action == 'recompute-discounts':
+        # Re-derive request prices and discount percentages from pricing_history
+        client = get_bigquery_client()
+        if client is None:
+            logger.error("Cannot initialize BigQuery client")
+            sys.exit(1)
+        try:
+            index = PricingIndex(lambda: client, PROJECT_ID, DATASET_ID)
+            changes = recompute_discounts(client, PROJECT_ID, DATASET_ID, index, apply=args.apply)
+        except Exception as e:
+            logger.error(f"Recomputation failed: {e}")
+            sys.exit(1)
+        for change in changes[:50]:
+            print(f"{change['enquiry_no']:14} installment {change['old_installment']} -> {change['installment']}, "
+                  f"discount {change['old_discount_percentage'] or 0:.1f}% -> {change['discount_percentage']:.1f}%")
+        if len(changes) > 50:
+            print(f"... and {len(changes) - 50} more")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
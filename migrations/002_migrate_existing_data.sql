@@ -1,5 +1,10 @@
 -- Migration 002: Migrate data from existing tables to new structure
 -- This migration populates the new tables with data from existing tables
+-- Request backfills run per month of discount_requests.created_at (-- @chunk_by),
+-- each month checkpointed in schema_migrations, and the pricing snapshot and
+-- approval backfills run in parallel (-- @parallel)
+-- created_at is an ISO string in discount_requests, so it is cast to TIMESTAMP
+-- and requests without one are migrated in a final chunk
 
 -- Generate UUIDs for courses based on branch_name and card_name combination
 -- Step 1: Populate courses table from branch_cards_fees
@@ -14,8 +19,11 @@ SELECT
     TRUE as is_active,
     CURRENT_TIMESTAMP() as created_at,
     CURRENT_TIMESTAMP() as updated_at
-FROM `gewportal2025.discount_management.branch_cards_fees`
-WHERE TRUE
+FROM `gewportal2025.discount_management.branch_cards_fees` f
+WHERE NOT EXISTS (
+    SELECT 1 FROM `gewportal2025.discount_management.courses` c
+    WHERE c.branch_name = f.branch_name AND c.card_name = f.card_name
+)
 QUALIFY ROW_NUMBER() OVER (PARTITION BY branch_name, card_name ORDER BY branch_name) = 1;
 
 -- Step 2: Create initial pricing history for all courses
@@ -30,9 +38,12 @@ SELECT
     NULL as end_date,
     'system_migration' as created_by,
     CURRENT_TIMESTAMP() as created_at
-FROM `gewportal2025.discount_management.courses`;
+FROM `gewportal2025.discount_management.courses`
+WHERE course_id NOT IN (SELECT course_id FROM `gewportal2025.discount_management.pricing_history`);
 
 -- Step 3: Populate students table from discount_requests
+-- Months run oldest first, so a student keeps the earliest request's details
+-- @chunk_by discount_requests.created_at MONTH
 INSERT INTO `gewportal2025.discount_management.students`
 (student_id, enquiry_no, student_name, mobile_no, created_at, updated_at)
 SELECT 
@@ -40,13 +51,16 @@ SELECT
     enquiry_no,
     student_name,
     mobile_no,
-    created_at,
-    created_at as updated_at
+    CAST(created_at AS TIMESTAMP) as created_at,
+    CAST(created_at AS TIMESTAMP) as updated_at
 FROM `gewportal2025.discount_management.discount_requests`
-WHERE TRUE
-QUALIFY ROW_NUMBER() OVER (PARTITION BY enquiry_no ORDER BY created_at) = 1;
+WHERE (CAST(created_at AS TIMESTAMP) >= @chunk_start AND CAST(created_at AS TIMESTAMP) < @chunk_end
+       OR @chunk_start IS NULL AND created_at IS NULL)
+  AND enquiry_no NOT IN (SELECT enquiry_no FROM `gewportal2025.discount_management.students`)
+QUALIFY ROW_NUMBER() OVER (PARTITION BY enquiry_no ORDER BY CAST(created_at AS TIMESTAMP)) = 1;
 
 -- Step 4: Migrate discount_requests to new structure
+-- @chunk_by discount_requests.created_at MONTH
 INSERT INTO `gewportal2025.discount_management.discount_requests_new`
 (request_id, student_id, course_id, requested_discount_amount, discount_reason, 
  remarks, requester_email, requester_name, status, created_at, updated_at)
@@ -60,13 +74,18 @@ SELECT
     dr.requester_email,
     dr.requester_name,
     dr.status,
-    dr.created_at,
-    COALESCE(dr.l2_approved_at, dr.l1_approved_at, dr.created_at) as updated_at
+    CAST(dr.created_at AS TIMESTAMP) as created_at,
+    COALESCE(CAST(dr.l2_approved_at AS TIMESTAMP), CAST(dr.l1_approved_at AS TIMESTAMP),
+             CAST(dr.created_at AS TIMESTAMP)) as updated_at
 FROM `gewportal2025.discount_management.discount_requests` dr
 JOIN `gewportal2025.discount_management.students` s ON dr.enquiry_no = s.enquiry_no
-JOIN `gewportal2025.discount_management.courses` c ON dr.branch_name = c.branch_name AND dr.card_name = c.card_name;
+JOIN `gewportal2025.discount_management.courses` c ON dr.branch_name = c.branch_name AND dr.card_name = c.card_name
+WHERE (CAST(dr.created_at AS TIMESTAMP) >= @chunk_start AND CAST(dr.created_at AS TIMESTAMP) < @chunk_end
+       OR @chunk_start IS NULL AND dr.created_at IS NULL);
 
 -- Step 5: Create pricing snapshots for all migrated requests
+-- @chunk_by discount_requests.created_at MONTH
+-- @parallel request_children
 INSERT INTO `gewportal2025.discount_management.pricing_snapshots`
 (snapshot_id, request_id, course_id, mrp_at_request, installment_at_request, created_at)
 SELECT 
@@ -75,12 +94,18 @@ SELECT
     drn.course_id,
     dr.mrp as mrp_at_request,
     dr.installment as installment_at_request,
-    dr.created_at
+    CAST(dr.created_at AS TIMESTAMP) as created_at
 FROM `gewportal2025.discount_management.discount_requests_new` drn
-JOIN `gewportal2025.discount_management.discount_requests` dr ON drn.created_at = dr.created_at AND drn.requester_email = dr.requester_email;
+JOIN `gewportal2025.discount_management.discount_requests` dr
+  ON (drn.created_at = CAST(dr.created_at AS TIMESTAMP) OR drn.created_at IS NULL AND dr.created_at IS NULL)
+  AND drn.requester_email = dr.requester_email
+WHERE (CAST(dr.created_at AS TIMESTAMP) >= @chunk_start AND CAST(dr.created_at AS TIMESTAMP) < @chunk_end
+       OR @chunk_start IS NULL AND dr.created_at IS NULL);
 
 -- Step 6: Migrate approval history
 -- Migrate L1 approvals
+-- @chunk_by discount_requests.created_at MONTH
+-- @parallel request_children
 INSERT INTO `gewportal2025.discount_management.request_approvals`
 (approval_id, request_id, approver_level, approver_email, approver_name, 
  action, approved_discount_amount, comments, approved_at)
@@ -93,13 +118,17 @@ SELECT
     CASE WHEN dr.status IN ('PENDING_L2', 'APPROVED') THEN 'APPROVED' ELSE 'REJECTED' END as action,
     dr.discounted_fees as approved_discount_amount,
     dr.l1_comments as comments,
-    dr.l1_approved_at as approved_at
+    CAST(dr.l1_approved_at AS TIMESTAMP) as approved_at
 FROM `gewportal2025.discount_management.discount_requests` dr
 JOIN `gewportal2025.discount_management.discount_requests_new` drn 
   ON dr.enquiry_no = (SELECT s.enquiry_no FROM `gewportal2025.discount_management.students` s WHERE s.student_id = drn.student_id)
-WHERE dr.l1_approver IS NOT NULL;
+WHERE dr.l1_approver IS NOT NULL
+  AND (CAST(dr.created_at AS TIMESTAMP) >= @chunk_start AND CAST(dr.created_at AS TIMESTAMP) < @chunk_end
+         OR @chunk_start IS NULL AND dr.created_at IS NULL);
 
 -- Migrate L2 approvals
+-- @chunk_by discount_requests.created_at MONTH
+-- @parallel request_children
 INSERT INTO `gewportal2025.discount_management.request_approvals`
 (approval_id, request_id, approver_level, approver_email, approver_name, 
  action, approved_discount_amount, comments, approved_at)
@@ -112,8 +141,10 @@ SELECT
     CASE WHEN dr.status = 'APPROVED' THEN 'APPROVED' ELSE 'REJECTED' END as action,
     dr.discounted_fees as approved_discount_amount,
     dr.l2_comments as comments,
-    dr.l2_approved_at as approved_at
+    CAST(dr.l2_approved_at AS TIMESTAMP) as approved_at
 FROM `gewportal2025.discount_management.discount_requests` dr
 JOIN `gewportal2025.discount_management.discount_requests_new` drn 
   ON dr.enquiry_no = (SELECT s.enquiry_no FROM `gewportal2025.discount_management.students` s WHERE s.student_id = drn.student_id)
-WHERE dr.l2_approver IS NOT NULL;
\ No newline at end of file
+WHERE dr.l2_approver IS NOT NULL
+  AND (CAST(dr.created_at AS TIMESTAMP) >= @chunk_start AND CAST(dr.created_at AS TIMESTAMP) < @chunk_end
+         OR @chunk_start IS NULL AND dr.created_at IS NULL);
\ No newline at end of file
@@ -0,0 +1,81 @@
+-- Migration 004: Append-only request event log and its materialized projection
+-- Request changes are recorded as immutable events; current state is folded
+-- into request_state incrementally (see request_events.py) instead of UPDATEs
+
+-- Step 1: Create request_events table (partitioned by day, clustered for per-request lookups)
+CREATE TABLE IF NOT EXISTS `gewportal2025.discount_management.request_events` (
+    event_id STRING NOT NULL,
+    enquiry_no STRING,
+    request_id STRING, -- discount_requests_new.request_id when written by the enhanced data access layer
+    event_type STRING NOT NULL, -- submitted, l1_approved, l2_approved, rejected
+    from_status STRING,
+    to_status STRING NOT NULL,
+    actor_email STRING,
+    actor_level STRING,
+    payload STRING, -- JSON: full request for submitted, approved_amount/comments for approvals
+    occurred_at TIMESTAMP NOT NULL
+)
+PARTITION BY DATE(occurred_at)
+CLUSTER BY enquiry_no, event_type;
+
+-- Step 2: Create request_state projection (legacy discount_requests shape)
+CREATE TABLE IF NOT EXISTS `gewportal2025.discount_management.request_state` (
+    enquiry_no STRING NOT NULL,
+    student_name STRING,
+    mobile_no STRING,
+    card_name STRING,
+    mrp FLOAT64,
+    installment FLOAT64,
+    discounted_fees FLOAT64,
+    discount_amount FLOAT64,
+    discount_percentage FLOAT64,
+    net_discount FLOAT64,
+    reason STRING,
+    remarks STRING,
+    requester_email STRING,
+    requester_name STRING,
+    branch_name STRING,
+    status STRING,
+    created_at TIMESTAMP,
+    l1_approver STRING,
+    l1_approved_at TIMESTAMP,
+    l1_comments STRING,
+    l2_approver STRING,
+    l2_approved_at TIMESTAMP,
+    l2_comments STRING,
+    last_event_id STRING,
+    last_event_at TIMESTAMP
+)
+CLUSTER BY status, branch_name;
+
+-- Step 3: Seed the projection from existing requests
+INSERT INTO `gewportal2025.discount_management.request_state`
+SELECT
+    dr.enquiry_no,
+    dr.student_name,
+    dr.mobile_no,
+    dr.card_name,
+    dr.mrp,
+    dr.installment,
+    dr.discounted_fees,
+    dr.discount_amount,
+    dr.discount_percentage,
+    dr.net_discount,
+    dr.reason,
+    dr.remarks,
+    dr.requester_email,
+    dr.requester_name,
+    dr.branch_name,
+    dr.status,
+    dr.created_at,
+    dr.l1_approver,
+    dr.l1_approved_at,
+    dr.l1_comments,
+    dr.l2_approver,
+    dr.l2_approved_at,
+    dr.l2_comments,
+    'seed' as last_event_id,
+    COALESCE(dr.l2_approved_at, dr.l1_approved_at, dr.created_at) as last_event_at
+FROM `gewportal2025.discount_management.discount_requests` dr
+WHERE dr.enquiry_no NOT IN (SELECT enquiry_no FROM `gewportal2025.discount_management.request_state`)
+QUALIFY ROW_NUMBER() OVER (PARTITION BY dr.enquiry_no ORDER BY dr.created_at) = 1
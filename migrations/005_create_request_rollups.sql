@@ -0,0 +1,51 @@
+-- Migration 005: Pre-aggregated rollups for the analytics dashboard
+-- Maintained incrementally by rollups.py (MERGE over the hours/days touched
+-- since the last run), so charts read O(days x branches) rows instead of
+-- scanning request history. Periods are in ROLLUP_TIMEZONE (Asia/Kolkata).
+
+-- Step 1: Hourly activity per branch
+CREATE TABLE IF NOT EXISTS `gewportal2025.discount_management.request_rollups_hourly` (
+    period_start TIMESTAMP NOT NULL, -- start of the local hour
+    branch_name STRING NOT NULL,
+    submitted INT64 NOT NULL, -- requests created in the hour
+    discount_percentage_sum FLOAT64 NOT NULL, -- over submitted requests
+    l1_approved INT64 NOT NULL,
+    l1_rejected INT64 NOT NULL,
+    l1_approve_seconds_sum INT64 NOT NULL, -- created -> L1 approval, over l1_approved
+    l2_approved INT64 NOT NULL,
+    l2_rejected INT64 NOT NULL,
+    l2_approve_seconds_sum INT64 NOT NULL, -- L1 approval -> L2 approval, over l2_approved
+    approved_net_discount_sum FLOAT64 NOT NULL, -- over l2_approved
+    updated_at TIMESTAMP NOT NULL
+)
+PARTITION BY TIMESTAMP_TRUNC(period_start, MONTH)
+CLUSTER BY branch_name;
+
+-- Step 2: Daily activity per branch (folded from the hourly rollup)
+CREATE TABLE IF NOT EXISTS `gewportal2025.discount_management.request_rollups_daily` (
+    day DATE NOT NULL,
+    branch_name STRING NOT NULL,
+    submitted INT64 NOT NULL,
+    discount_percentage_sum FLOAT64 NOT NULL,
+    l1_approved INT64 NOT NULL,
+    l1_rejected INT64 NOT NULL,
+    l1_approve_seconds_sum INT64 NOT NULL,
+    l2_approved INT64 NOT NULL,
+    l2_rejected INT64 NOT NULL,
+    l2_approve_seconds_sum INT64 NOT NULL,
+    approved_net_discount_sum FLOAT64 NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+)
+PARTITION BY DATE_TRUNC(day, MONTH)
+CLUSTER BY branch_name;
+
+-- Step 3: Daily discount % distribution of submitted requests per branch
+CREATE TABLE IF NOT EXISTS `gewportal2025.discount_management.request_discount_distribution_daily` (
+    day DATE NOT NULL,
+    branch_name STRING NOT NULL,
+    bucket INT64 NOT NULL, -- lower bound of the discount % bucket (5 points wide)
+    requests INT64 NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+)
+PARTITION BY DATE_TRUNC(day, MONTH)
+CLUSTER BY branch_name;
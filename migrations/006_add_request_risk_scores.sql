@@ -0,0 +1,13 @@
+-- Migration 006: Risk score of each request, computed at submission
+-- Scored in memory by anomaly_scoring.py against rolling per-branch, card and
+-- requester statistics. Requests submitted before this migration have no score.
+
+-- Step 1: Risk score columns on the legacy requests table
+ALTER TABLE `gewportal2025.discount_management.discount_requests`
+    ADD COLUMN IF NOT EXISTS risk_score FLOAT64, -- 0 to 100
+    ADD COLUMN IF NOT EXISTS risk_reasons STRING; -- reasons behind the score, one per line
+
+-- Step 2: Same columns on the request_state projection
+ALTER TABLE `gewportal2025.discount_management.request_state`
+    ADD COLUMN IF NOT EXISTS risk_score FLOAT64,
+    ADD COLUMN IF NOT EXISTS risk_reasons STRING;
@@ -0,0 +1,22 @@
+-- Migration 007: L1 approver each request is assigned to
+-- Set at submission by approver_assignment.py from the branch's approver pool.
+-- Pending requests are backfilled with the previous fixed routing so they stay
+-- in the same approver's queue.
+
+-- Step 1: Assignment column on the legacy requests table
+ALTER TABLE `gewportal2025.discount_management.discount_requests`
+    ADD COLUMN IF NOT EXISTS assigned_to STRING; -- L1 approver email
+
+-- Step 2: Same column on the request_state projection
+ALTER TABLE `gewportal2025.discount_management.request_state`
+    ADD COLUMN IF NOT EXISTS assigned_to STRING;
+
+-- Step 3: Backfill pending requests on the legacy table
+UPDATE `gewportal2025.discount_management.discount_requests`
+SET assigned_to = IF(branch_name IN ('Kolkata', 'Siliguri', 'Bhubaneshwar'), 'raja.ray@pw.live', 'praduman.shukla@pw.live')
+WHERE status = 'PENDING_L1' AND assigned_to IS NULL;
+
+-- Step 4: Backfill pending requests on the projection
+UPDATE `gewportal2025.discount_management.request_state`
+SET assigned_to = IF(branch_name IN ('Kolkata', 'Siliguri', 'Bhubaneshwar'), 'raja.ray@pw.live', 'praduman.shukla@pw.live')
+WHERE status = 'PENDING_L1' AND assigned_to IS NULL;
@@ -0,0 +1,37 @@
+-- Migration 008: Current status of each request, one row per request
+-- Every request event is appended in a transaction that also moves the
+-- request's row here (see request_events.py). Updates of this table are
+-- conflict-checked by BigQuery, so of two workers changing the same request
+-- at once only one commits.
+
+-- Step 1: Create request_heads
+CREATE TABLE IF NOT EXISTS `gewportal2025.discount_management.request_heads` (
+    enquiry_no STRING NOT NULL,
+    status STRING NOT NULL,
+    event_id STRING, -- last event applied
+    updated_at TIMESTAMP
+)
+CLUSTER BY enquiry_no;
+
+-- Step 2: Seed from the latest event of each request, then requests with no events
+INSERT INTO `gewportal2025.discount_management.request_heads` (enquiry_no, status, event_id, updated_at)
+SELECT enquiry_no, status, event_id, updated_at
+FROM (
+    SELECT enquiry_no, latest.to_status AS status, latest.event_id, latest.occurred_at AS updated_at
+    FROM (
+        SELECT
+            enquiry_no,
+            ARRAY_AGG(STRUCT(to_status, event_id, occurred_at) ORDER BY occurred_at DESC, event_id DESC LIMIT 1)[OFFSET(0)] AS latest
+        FROM `gewportal2025.discount_management.request_events`
+        WHERE enquiry_no IS NOT NULL
+        GROUP BY enquiry_no
+    )
+    UNION ALL
+    SELECT s.enquiry_no, s.status, s.last_event_id, s.last_event_at
+    FROM `gewportal2025.discount_management.request_state` s
+    WHERE s.status IS NOT NULL
+      AND s.enquiry_no NOT IN (
+          SELECT enquiry_no FROM `gewportal2025.discount_management.request_events` WHERE enquiry_no IS NOT NULL
+      )
+)
+WHERE enquiry_no NOT IN (SELECT enquiry_no FROM `gewportal2025.discount_management.request_heads`)
@@ -0,0 +1,18 @@
+-- Migration 009: Approver assignment on the normalized requests table
+-- The normalized approver queue filters on the same assigned_to as the legacy
+-- queue (migration 007), so both stacks show an approver the same requests.
+
+-- Step 1: Assignment column on the normalized requests table
+ALTER TABLE `gewportal2025.discount_management.discount_requests_new`
+    ADD COLUMN IF NOT EXISTS assigned_to STRING; -- L1 approver email
+
+-- Step 2: Copy the assignment of pending requests from the legacy table
+UPDATE `gewportal2025.discount_management.discount_requests_new` drn
+SET assigned_to = dr.assigned_to
+FROM `gewportal2025.discount_management.discount_requests` dr
+JOIN `gewportal2025.discount_management.students` s ON dr.enquiry_no = s.enquiry_no
+WHERE drn.student_id = s.student_id
+  AND drn.requester_email = dr.requester_email
+  AND drn.status = 'PENDING_L1'
+  AND drn.assigned_to IS NULL
+  AND dr.assigned_to IS NOT NULL
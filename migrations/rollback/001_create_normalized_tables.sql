@@ -0,0 +1,8 @@
+-- Rollback 001: Drop the normalized tables
+-- courses is kept because it may replace branch_cards_fees, so review it manually
+
+DROP TABLE IF EXISTS `gewportal2025.discount_management.pricing_snapshots`;
+DROP TABLE IF EXISTS `gewportal2025.discount_management.request_approvals`;
+DROP TABLE IF EXISTS `gewportal2025.discount_management.discount_requests_new`;
+DROP TABLE IF EXISTS `gewportal2025.discount_management.pricing_history`;
+DROP TABLE IF EXISTS `gewportal2025.discount_management.students`
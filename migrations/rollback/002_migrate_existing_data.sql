@@ -0,0 +1,8 @@
+-- Rollback 002: Remove the backfilled data (the tables stay, see rollback 001)
+-- courses is kept (step 1 of 002 skips courses that already exist)
+
+TRUNCATE TABLE `gewportal2025.discount_management.request_approvals`;
+TRUNCATE TABLE `gewportal2025.discount_management.pricing_snapshots`;
+TRUNCATE TABLE `gewportal2025.discount_management.discount_requests_new`;
+TRUNCATE TABLE `gewportal2025.discount_management.students`;
+DELETE FROM `gewportal2025.discount_management.pricing_history` WHERE created_by = 'system_migration'
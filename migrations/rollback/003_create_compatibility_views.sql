@@ -0,0 +1,6 @@
+-- Rollback 003: Drop the compatibility views
+
+DROP VIEW IF EXISTS `gewportal2025.discount_management.discount_analytics`;
+DROP VIEW IF EXISTS `gewportal2025.discount_management.active_discount_requests`;
+DROP VIEW IF EXISTS `gewportal2025.discount_management.branch_cards_fees_view`;
+DROP VIEW IF EXISTS `gewportal2025.discount_management.discount_requests_legacy_view`
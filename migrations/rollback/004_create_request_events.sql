@@ -0,0 +1,6 @@
+-- Rollback 004: Drop the request event log and its projection
+-- The events are the only record of requests submitted with
+-- EVENT_SOURCED_REQUESTS=true; export them first.
+
+DROP TABLE IF EXISTS `gewportal2025.discount_management.request_state`;
+DROP TABLE IF EXISTS `gewportal2025.discount_management.request_events`
@@ -0,0 +1,5 @@
+-- Rollback 005: Drop the analytics rollups (rebuilt with migrate_database.py rollups --full)
+
+DROP TABLE IF EXISTS `gewportal2025.discount_management.request_discount_distribution_daily`;
+DROP TABLE IF EXISTS `gewportal2025.discount_management.request_rollups_daily`;
+DROP TABLE IF EXISTS `gewportal2025.discount_management.request_rollups_hourly`
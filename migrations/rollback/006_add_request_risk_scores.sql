@@ -0,0 +1,9 @@
+-- Rollback 006: Drop the risk score columns
+
+ALTER TABLE `gewportal2025.discount_management.request_state`
+    DROP COLUMN IF EXISTS risk_reasons,
+    DROP COLUMN IF EXISTS risk_score;
+
+ALTER TABLE `gewportal2025.discount_management.discount_requests`
+    DROP COLUMN IF EXISTS risk_reasons,
+    DROP COLUMN IF EXISTS risk_score
@@ -0,0 +1,7 @@
+-- Rollback 007: Drop the approver assignment column
+
+ALTER TABLE `gewportal2025.discount_management.request_state`
+    DROP COLUMN IF EXISTS assigned_to;
+
+ALTER TABLE `gewportal2025.discount_management.discount_requests`
+    DROP COLUMN IF EXISTS assigned_to
@@ -0,0 +1,3 @@
+-- Rollback 008: Drop the request heads table
+
+DROP TABLE IF EXISTS `gewportal2025.discount_management.request_heads`
@@ -0,0 +1,4 @@
+-- Rollback 009: Drop the assignment column from the normalized requests table
+
+ALTER TABLE `gewportal2025.discount_management.discount_requests_new`
+    DROP COLUMN IF EXISTS assigned_to
@@ -0,0 +1,168 @@
+"""
+Digest delivery for approver notifications.
+
+With NOTIFICATION_DIGEST_MINUTES > 0, approval notifications are queued per
+recipient instead of being mailed one by one. Every interval each approver
+gets one summary email of everything queued for them, and the CC list gets a
+single combined digest instead of a copy of every email. Urgent requests
+(discount percentage at or above NOTIFICATION_URGENT_PERCENT) bypass the
+queue and are sent immediately.
+
+A digest that fails to send is queued again for the next flush, up to
+NOTIFICATION_DIGEST_MAX_ATTEMPTS sends; after that its notifications are
+dropped and logged.
+
+The queue is per process and in memory: anything still queued is flushed at
+shutdown, but a crashed worker loses its pending digest. The approval queue
+itself is unaffected, so a lost digest only delays the nudge.
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from notifications import render_digest
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_DIGEST_MINUTES = float(os.getenv('NOTIFICATION_DIGEST_MINUTES', 0))
+NOTIFICATION_URGENT_PERCENT = float(os.getenv('NOTIFICATION_URGENT_PERCENT', 60))
+NOTIFICATION_DIGEST_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_DIGEST_MAX_ATTEMPTS', 3))
+
+# _pending key of the combined digest to the CC list
+CC_DIGEST = None
+
+
+class DigestScheduler:
+    """Collects notifications per recipient and sends them as periodic digests."""
+
+    def __init__(self, send_fn, cc_emails, interval_minutes=NOTIFICATION_DIGEST_MINUTES,
+                 urgent_percent=NOTIFICATION_URGENT_PERCENT, max_attempts=NOTIFICATION_DIGEST_MAX_ATTEMPTS):
+        self.send_fn = send_fn
+        self.cc_emails = list(cc_emails)
+        self.interval = interval_minutes * 60
+        self.urgent_percent = urgent_percent
+        self.max_attempts = max_attempts
+        self._pending = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self.sent_immediately = 0
+        self.queued = 0
+        self.digests_sent = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def is_urgent(self, context):
+        return float(context.get('discount_percentage') or 0) >= self.urgent_percent
+
+    def notify(self, recipients, kind, context, subject, html_body, text_body=None, urgent=False):
+        """Send now (digest disabled or urgent) or queue for each recipient's next digest."""
+        if not self.enabled or urgent or self.is_urgent(context):
+            self.sent_immediately += 1
+            return self.send_fn(recipients, subject, html_body, text_body)
+
+        item = {'kind': kind, 'subject': subject, 'context': context}
+        with self._lock:
+            # Keyed by (kind, enquiry) so a re-notification replaces the earlier entry
+            for recipient in list(recipients) + ([CC_DIGEST] if self.cc_emails else []):
+                self._pending.setdefault(recipient, OrderedDict())[(kind, context.get('enquiry_no'))] = item
+            self.queued += 1
+        self._ensure_timer()
+        return True
+
+    def pending_count(self):
+        with self._lock:
+            return sum(len(items) for recipient, items in self._pending.items() if recipient is not CC_DIGEST)
+
+    def maybe_flush(self):
+        """Kick a background flush if the interval has elapsed (cheap to call per request)."""
+        if not self.enabled or time.monotonic() - self._last_flush < self.interval:
+            return
+        if self._flush_lock.locked():
+            return
+        threading.Thread(target=self.flush, daemon=True).start()
+
+    def flush(self):
+        """Send one digest per queued recipient plus one combined digest to the CC list."""
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._last_flush = time.monotonic()
+            if not pending:
+                return 0
+
+            sent = 0
+            failed = {}
+            # The CC list's combined digest goes last
+            for recipient, items in sorted(pending.items(), key=lambda entry: entry[0] is CC_DIGEST):
+                if self._send_digest(recipient, items):
+                    sent += 1
+                else:
+                    failed[recipient] = items
+            self._requeue(pending, failed)
+
+            self.digests_sent += sent
+            logger.info(f"Sent {sent} notification digests, {len(failed)} failed")
+            return sent
+        finally:
+            self._flush_lock.release()
+
+    def _send_digest(self, recipient, items):
+        """Send one recipient's digest (or the CC list's). Returns True if it was sent."""
+        try:
+            subject, html_body, text_body = render_digest(list(items.values()))
+            if recipient is CC_DIGEST:
+                return bool(self.send_fn(self.cc_emails[:1], subject, html_body, text_body,
+                                         cc_emails=self.cc_emails[1:]))
+            return bool(self.send_fn([recipient], subject, html_body, text_body, cc_emails=[]))
+        except Exception as e:
+            logger.error(f"Error sending notification digest to {recipient or 'the CC list'}: {e}")
+            return False
+
+    def _requeue(self, pending, failed):
+        """Queue failed digests for the next flush, dropping those that reached max_attempts."""
+        with self._lock:
+            for recipient in pending:
+                if recipient not in failed:
+                    self._failures.pop(recipient, None)
+            for recipient, items in failed.items():
+                attempts = self._failures.get(recipient, 0) + 1
+                if attempts >= self.max_attempts:
+                    self._failures.pop(recipient, None)
+                    self.dropped += len(items)
+                    logger.error(f"Digest to {recipient or 'the CC list'} failed {attempts} times; "
+                                 f"{len(items)} notifications dropped")
+                    continue
+                self._failures[recipient] = attempts
+                # Entries queued since the flush started are newer and win
+                requeued = OrderedDict(items)
+                requeued.update(self._pending.get(recipient, {}))
+                self._pending[recipient] = requeued
+
+    def _ensure_timer(self):
+        if self._timer is not None:
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Thread(target=self._run, name='notification-digest', daemon=True)
+            self._timer.start()
+
+    def _run(self):
+        while True:
+            time.sleep(max(self.interval - (time.monotonic() - self._last_flush), 1))
+            if time.monotonic() - self._last_flush >= self.interval:
+                self.flush()
+
+    def register_shutdown_flush(self):
+        atexit.register(self.flush)
@@ -0,0 +1,174 @@
+"""
+Notification templating for approval emails.
+
+Email bodies live in templates/email as Jinja templates (an HTML and a plain
+text variant per notification). The templates are compiled once at import,
+every notification is rendered from the same request context, and rendered
+bodies are cached per event so a fan-out to several approvers (or a retry)
+renders once.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+logger = logging.getLogger(__name__)
+
+# Public URL of the app, used for the links in notification emails
+APP_BASE_URL = os.getenv('APP_BASE_URL', 'https://discount-app-644139762582.asia-south2.run.app').rstrip('/')
+
+EMAIL_TEMPLATE_DIR = Path(__file__).parent / 'templates' / 'email'
+
+L1_APPROVAL_REQUIRED = 'l1_approval_required'
+L2_APPROVAL_REQUIRED = 'l2_approval_required'
+
+NOTIFICATION_SUBJECTS = {
+    L1_APPROVAL_REQUIRED: 'New Discount Request - {enquiry_no}',
+    L2_APPROVAL_REQUIRED: 'L2 Approval Required - {enquiry_no}',
+}
+
+NOTIFICATION_LABELS = {
+    L1_APPROVAL_REQUIRED: 'L1 approval required',
+    L2_APPROVAL_REQUIRED: 'L2 approval required',
+}
+
+DIGEST = 'digest'
+
+RENDER_CACHE_SIZE = int(os.getenv('NOTIFICATION_RENDER_CACHE_SIZE', 256))
+
+
+def format_inr(value):
+    """Format an amount as rupees with thousands separators."""
+    return f"₹{float(value or 0):,.2f}"
+
+
+def format_percent(value):
+    return f"{float(value or 0):,.2f}%"
+
+
+_env = Environment(
+    loader=FileSystemLoader(str(EMAIL_TEMPLATE_DIR)),
+    autoescape=select_autoescape(['html']),
+    undefined=StrictUndefined,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+_env.filters['inr'] = format_inr
+_env.filters['percent'] = format_percent
+
+# Compile every notification template up front so a template error fails at
+# startup and no request pays for parsing
+_templates = {
+    kind: (_env.get_template(f'{kind}.html'), _env.get_template(f'{kind}.txt'))
+    for kind in NOTIFICATION_SUBJECTS
+}
+
+_digest_templates = (_env.get_template(f'{DIGEST}.html'), _env.get_template(f'{DIGEST}.txt'))
+
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+
+def _field(row, name, default=None):
+    """Read a column from a dict, a BigQuery Row or a projection row."""
+    try:
+        value = row[name]
+    except (KeyError, IndexError, TypeError):
+        return default
+    return default if value is None else value
+
+
+def build_request_context(row, **extra):
+    """Build the shared render context for a request row."""
+    mrp = float(_field(row, 'mrp', 0))
+    installment = float(_field(row, 'installment', 0))
+    discounted_fees = float(_field(row, 'discounted_fees', 0))
+    net_discount = float(_field(row, 'net_discount', mrp - discounted_fees))
+    context = {
+        'enquiry_no': _field(row, 'enquiry_no', ''),
+        'student_name': _field(row, 'student_name', ''),
+        'mobile_no': _field(row, 'mobile_no', ''),
+        'branch_name': _field(row, 'branch_name', ''),
+        'card_name': _field(row, 'card_name', ''),
+        'mrp': mrp,
+        'installment': installment,
+        'discounted_fees': discounted_fees,
+        'net_discount': net_discount,
+        'discount_percentage': net_discount / installment * 100 if installment else 0.0,
+        'reason': _field(row, 'reason', ''),
+        'requester_name': _field(row, 'requester_name', ''),
+        'requester_email': _field(row, 'requester_email', ''),
+        'l1_approver': _field(row, 'l1_approver', ''),
+        'login_url': f"{APP_BASE_URL}/login",
+        'approve_url': f"{APP_BASE_URL}/approve_request",
+    }
+    context.update(extra)
+    return context
+
+
+def render_notification(kind, context, cache_key=None):
+    """
+    Render a notification. Returns (subject, html_body, text_body).
+
+    With cache_key (e.g. the event id) the rendered bodies are reused by later
+    calls for the same event.
+    """
+    key = (kind, cache_key)
+    if cache_key is not None:
+        with _render_cache_lock:
+            cached = _render_cache.get(key)
+            if cached is not None:
+                _render_cache.move_to_end(key)
+                return cached
+
+    html_template, text_template = _templates[kind]
+    rendered = (
+        NOTIFICATION_SUBJECTS[kind].format(**context),
+        html_template.render(context),
+        text_template.render(context),
+    )
+
+    if cache_key is not None:
+        with _render_cache_lock:
+            _render_cache[key] = rendered
+            while len(_render_cache) > RENDER_CACHE_SIZE:
+                _render_cache.popitem(last=False)
+    return rendered
+
+
+def render_digest(items, subject=None):
+    """
+    Render a digest of queued notifications. Returns (subject, html_body, text_body).
+
+    items are dicts with the notification kind and its render context.
+    """
+    context = {
+        'items': [dict(item['context'], label=NOTIFICATION_LABELS.get(item['kind'], item['kind']))
+                  for item in items],
+        'login_url': f"{APP_BASE_URL}/login",
+        'approve_url': f"{APP_BASE_URL}/approve_request",
+    }
+    subject = subject or f"Discount Requests Digest - {len(items)} awaiting approval"
+    html_template, text_template = _digest_templates
+    return subject, html_template.render(context), text_template.render(context)
+
+
+def build_message(subject, html_body, sender, to_email, cc_emails=None, text_body=None):
+    """Build the MIME message: multipart text+HTML when a text body is given."""
+    if text_body is None:
+        msg = MIMEText(html_body, 'html')
+    else:
+        msg = MIMEMultipart('alternative')
+        msg.attach(MIMEText(text_body, 'plain', 'utf-8'))
+        msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = to_email
+    if cc_emails:
+        msg['Cc'] = ', '.join(cc_emails)
+    return msg
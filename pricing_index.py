@@ -0,0 +1,308 @@
+"""
+Price-as-of-date lookups over pricing_history.
+
+pricing_history (migration 001) has one row per price a course has had,
+valid from effective_date until end_date (NULL while current). PricingIndex
+reads the whole table in one query and keeps, per course_id, the interval
+start times in a sorted list, so the price in force at any moment is one
+bisect. Batch lookups sort each course's timestamps and sweep its intervals
+once; the historic discount percentage recomputation uses them.
+
+reprice_course() is the admin path. In one BigQuery transaction it closes
+the open interval, opens the new one, and updates the current price in
+courses and branch_cards_fees (which the CatalogCache reads).
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+import uuid
+from datetime import date, datetime, timezone
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+PRICING_CACHE_SECONDS = int(os.getenv('PRICING_CACHE_SECONDS', 300))
+# Rows per MERGE when writing recomputed prices back
+RECOMPUTE_BATCH_SIZE = int(os.getenv('RECOMPUTE_BATCH_SIZE', 5000))
+
+
+def to_epoch(value):
+    """Seconds since the epoch for a datetime, date or ISO string (naive means UTC)."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class PriceIntervals:
+    """Non-overlapping price intervals of one course, ordered by start."""
+
+    def __init__(self, rows):
+        """rows: dicts with effective_date, end_date, mrp and installment."""
+        rows = sorted(rows, key=lambda row: to_epoch(row['effective_date']))
+        self.starts = [to_epoch(row['effective_date']) for row in rows]
+        self.ends = []
+        self.prices = []
+        for index, row in enumerate(rows):
+            end = to_epoch(row.get('end_date'))
+            # An interval left open (or overlapping) ends where the next one starts
+            if index + 1 < len(rows) and (end is None or end > self.starts[index + 1]):
+                end = self.starts[index + 1]
+            self.ends.append(end)
+            self.prices.append({'mrp': float(row['mrp']), 'installment': float(row['installment']),
+                                'effective_date': row['effective_date'], 'end_date': row.get('end_date')})
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _price(self, index, when):
+        if index < 0 or (self.ends[index] is not None and when >= self.ends[index]):
+            return None
+        return self.prices[index]
+
+    def at(self, when):
+        """Price in force at epoch seconds when, or None."""
+        return self._price(bisect.bisect_right(self.starts, when) - 1, when)
+
+    def sweep(self, times):
+        """Prices at each of the (ascending) epoch times, in one pass."""
+        result = []
+        index = -1
+        for when in times:
+            while index + 1 < len(self.starts) and self.starts[index + 1] <= when:
+                index += 1
+            result.append(self._price(index, when))
+        return result
+
+
+class PricingIndex:
+    """Per-course price intervals from pricing_history, cached in process."""
+
+    def __init__(self, client_getter, project_id, dataset_id, ttl=PRICING_CACHE_SECONDS):
+        self.client_getter = client_getter
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.ttl = ttl
+        self._index = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        client = self.client_getter()
+        if not client:
+            logger.error("BigQuery client not available for pricing history")
+            return None
+        query = f"""
+            SELECT c.course_id, c.branch_name, c.card_name, c.is_active,
+                   ph.mrp, ph.installment, ph.effective_date, ph.end_date
+            FROM `{self.project_id}.{self.dataset_id}.courses` c
+            JOIN `{self.project_id}.{self.dataset_id}.pricing_history` ph ON ph.course_id = c.course_id
+        """
+        rows_by_course = {}
+        courses = {}
+        for row in client.query(query).result():
+            row = dict(row.items())
+            rows_by_course.setdefault(row['course_id'], []).append(row)
+            key = (row['branch_name'], row['card_name'])
+            # Prefer the active course when a branch/card was recreated
+            if key not in courses or row['is_active']:
+                courses[key] = row['course_id']
+        intervals = {course_id: PriceIntervals(rows) for course_id, rows in rows_by_course.items()}
+        logger.info(f"Loaded pricing history: {sum(len(i) for i in intervals.values())} intervals "
+                    f"for {len(intervals)} courses")
+        return courses, intervals
+
+    def _get(self):
+        if self._index is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return self._index
+        with self._lock:
+            if self._index is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._index
+            try:
+                index = self._load()
+            except Exception as e:
+                logger.error(f"Error loading pricing history: {e}")
+                index = None
+            if index is not None:
+                self._index = index
+                self._loaded_at = time.monotonic()
+            # On failure keep serving the previous index, if any
+            return self._index or ({}, {})
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def course_id(self, branch_name, card_name):
+        return self._get()[0].get((branch_name, card_name))
+
+    def history(self, branch_name, card_name):
+        """Every price the branch/card has had, oldest first."""
+        courses, intervals = self._get()
+        course = intervals.get(courses.get((branch_name, card_name)))
+        return [dict(price) for price in course.prices] if course else []
+
+    def price_as_of(self, branch_name, card_name, when):
+        """{'mrp', 'installment', 'effective_date', 'end_date'} in force at when, or None."""
+        courses, intervals = self._get()
+        course = intervals.get(courses.get((branch_name, card_name)))
+        price = course.at(to_epoch(when)) if course else None
+        return dict(price) if price else None
+
+    def prices_as_of(self, lookups):
+        """Prices for many (branch_name, card_name, when) lookups, in the same order."""
+        courses, intervals = self._get()
+        by_course = {}
+        for position, (branch_name, card_name, when) in enumerate(lookups):
+            course_id = courses.get((branch_name, card_name))
+            if course_id in intervals and when is not None:
+                by_course.setdefault(course_id, []).append((to_epoch(when), position))
+
+        result = [None] * len(lookups)
+        for course_id, points in by_course.items():
+            points.sort()
+            for (_, position), price in zip(points, intervals[course_id].sweep([when for when, _ in points])):
+                result[position] = price
+        return result
+
+
+def reprice_course(client, project_id, dataset_id, course_id, mrp, installment, effective_date, created_by):
+    """
+    Close the course's open price interval at effective_date and open a new one,
+    updating the current price in courses and branch_cards_fees, atomically.
+
+    effective_date may be in the past (a retroactive repricing), but not before
+    the start of the current interval or in the future: the catalog tables only
+    hold the price in force now.
+    """
+    if mrp <= 0 or installment <= 0:
+        raise ValueError("MRP and installment must be greater than 0")
+    if installment > mrp:
+        raise ValueError("Installment cannot be greater than MRP")
+    if effective_date.tzinfo is None:
+        effective_date = effective_date.replace(tzinfo=timezone.utc)
+    if effective_date > datetime.now(timezone.utc):
+        raise ValueError("Future-dated prices are not supported")
+
+    table = f"{project_id}.{dataset_id}"
+    script = f"""
+        BEGIN TRANSACTION;
+        ASSERT NOT EXISTS (
+            SELECT 1 FROM `{table}.pricing_history`
+            WHERE course_id = @course_id AND effective_date >= @effective_date
+        ) AS 'A price for this course already starts on or after the effective date';
+        UPDATE `{table}.pricing_history`
+        SET end_date = @effective_date
+        WHERE course_id = @course_id AND (end_date IS NULL OR end_date > @effective_date);
+        INSERT INTO `{table}.pricing_history`
+        (history_id, course_id, mrp, installment, effective_date, end_date, created_by, created_at)
+        VALUES (@history_id, @course_id, @mrp, @installment, @effective_date, NULL, @created_by, CURRENT_TIMESTAMP());
+        UPDATE `{table}.courses`
+        SET mrp = @mrp, installment = @installment, updated_at = CURRENT_TIMESTAMP()
+        WHERE course_id = @course_id;
+        UPDATE `{table}.branch_cards_fees` f
+        SET mrp = @mrp, installment = @installment
+        FROM `{table}.courses` c
+        WHERE c.course_id = @course_id AND f.branch_name = c.branch_name AND f.card_name = c.card_name;
+        COMMIT TRANSACTION;
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter('history_id', 'STRING', str(uuid.uuid4())),
+        bigquery.ScalarQueryParameter('course_id', 'STRING', course_id),
+        bigquery.ScalarQueryParameter('mrp', 'NUMERIC', round(mrp, 2)),
+        bigquery.ScalarQueryParameter('installment', 'NUMERIC', round(installment, 2)),
+        bigquery.ScalarQueryParameter('effective_date', 'TIMESTAMP', effective_date),
+        bigquery.ScalarQueryParameter('created_by', 'STRING', created_by),
+    ])
+    client.query(script, job_config=job_config).result()
+    logger.info(f"Repriced course {course_id} from {effective_date.isoformat()}: MRP {mrp}, "
+                f"installment {installment} (by {created_by})")
+
+
+def recompute_discounts(client, project_id, dataset_id, index, apply=False):
+    """
+    Re-derive mrp, installment and discount_percentage of every legacy request
+    from the price in force when it was created. Returns the changed rows;
+    with apply they are written back to discount_requests.
+
+    Requests are keyed by (enquiry_no, requester_email), as the legacy
+    duplicate check allows one enquiry per requester. Rows whose created_at
+    does not parse are skipped and counted.
+    """
+    query = f"""
+        SELECT enquiry_no, requester_email, branch_name, card_name, created_at, mrp, installment,
+               discount_amount, discount_percentage
+        FROM `{project_id}.{dataset_id}.discount_requests`
+    """
+    rows = []
+    unparseable = 0
+    for row in client.query(query).result():
+        row = dict(row.items())
+        try:
+            to_epoch(row['created_at'])
+        except (TypeError, ValueError):
+            unparseable += 1
+            continue
+        rows.append(row)
+    if unparseable:
+        logger.warning(f"Skipped {unparseable} requests whose created_at could not be parsed")
+    prices = index.prices_as_of([(row['branch_name'], row['card_name'], row['created_at']) for row in rows])
+
+    changes = []
+    seen = set()
+    for row, price in zip(rows, prices):
+        if price is None:
+            continue
+        if (abs((row['mrp'] or 0) - price['mrp']) < 0.005
+                and abs((row['installment'] or 0) - price['installment']) < 0.005):
+            continue
+        key = (row['enquiry_no'], row['requester_email'])
+        if key in seen:
+            # An exact duplicate row; the MERGE may match each target row once
+            continue
+        seen.add(key)
+        discount_amount = row['discount_amount'] or 0
+        changes.append({
+            'enquiry_no': row['enquiry_no'], 'requester_email': row['requester_email'],
+            'old_mrp': row['mrp'], 'mrp': price['mrp'],
+            'old_installment': row['installment'], 'installment': price['installment'],
+            'old_discount_percentage': row['discount_percentage'],
+            'discount_percentage': discount_amount / price['installment'] * 100 if price['installment'] else 0,
+        })
+    logger.info(f"{len(changes)} of {len(rows)} requests were priced differently from pricing_history")
+
+    if apply:
+        merge = f"""
+            MERGE `{project_id}.{dataset_id}.discount_requests` dr
+            USING UNNEST(@changes) c
+            ON dr.enquiry_no = c.enquiry_no AND dr.requester_email IS NOT DISTINCT FROM c.requester_email
+            WHEN MATCHED THEN UPDATE SET
+                mrp = c.mrp,
+                installment = c.installment,
+                discounted_fees = c.mrp - dr.discount_amount,
+                discount_percentage = c.discount_percentage
+        """
+        for start in range(0, len(changes), RECOMPUTE_BATCH_SIZE):
+            batch = changes[start:start + RECOMPUTE_BATCH_SIZE]
+            structs = [bigquery.StructQueryParameter(
+                None,
+                bigquery.ScalarQueryParameter('enquiry_no', 'STRING', change['enquiry_no']),
+                bigquery.ScalarQueryParameter('requester_email', 'STRING', change['requester_email']),
+                bigquery.ScalarQueryParameter('mrp', 'FLOAT64', change['mrp']),
+                bigquery.ScalarQueryParameter('installment', 'FLOAT64', change['installment']),
+                bigquery.ScalarQueryParameter('discount_percentage', 'FLOAT64', change['discount_percentage']),
+            ) for change in batch]
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ArrayQueryParameter('changes', 'STRUCT', structs)]
+            )
+            client.query(merge, job_config=job_config).result()
+        logger.info(f"Updated {len(changes)} requests in discount_requests")
+    return changes
@@ -0,0 +1,213 @@
+"""
+Token-bucket rate limiting of logins and the unauthenticated APIs.
+
+Each limited endpoint has per-IP and/or per-user buckets. A limit of
+"N/minute" is a bucket of N tokens refilled at N per minute: bursts of up to
+N requests pass, and the sustained rate is N per minute. A request that finds
+its bucket empty gets 429 with Retry-After, before any BigQuery job is made.
+
+Buckets live in process memory: the allowed path is a dict lookup and a
+little arithmetic under a lock, with no I/O. Each gunicorn worker keeps its
+own buckets, so an instance with W workers allows up to W times a limit.
+With RATE_LIMIT_REDIS_URL set (and the redis package installed) buckets are
+shared by every worker of every instance, updated atomically by a Lua
+script. If Redis is unreachable, requests are allowed.
+
+Limits default to DEFAULT_RATE_LIMITS and are overridden per Flask endpoint
+by RATE_LIMITS, a JSON object, e.g. {"get_mrp_api": {"ip": "600/minute"}}.
+An endpoint set to null is not limited.
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import threading
+
+from metrics import format_labels
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')
+# Proxies in front of the app that append the client address to X-Forwarded-For
+RATE_LIMIT_PROXY_HOPS = int(os.getenv('RATE_LIMIT_PROXY_HOPS', 1))
+# Idle buckets are dropped once this many are held in memory
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv('RATE_LIMIT_MAX_BUCKETS', 100000))
+
+DEFAULT_RATE_LIMITS = {
+    # Every attempt runs a BigQuery query; user is the email being logged in as
+    'login': {'methods': ['POST'], 'ip': '30/minute', 'user': '5/minute'},
+    'get_cards_api': {'ip': '300/minute', 'user': '60/minute'},
+    'get_mrp_api': {'ip': '300/minute', 'user': '60/minute'},
+}
+SCOPES = ('ip', 'user')
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+TOKEN_BUCKET_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = capacity
+if bucket[1] then
+    tokens = math.min(capacity, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+end
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+def parse_rate(value):
+    """(capacity, tokens per second) for a limit like "5/minute"."""
+    try:
+        count, period = str(value).split('/')
+        count = int(count)
+        seconds = PERIODS[period.strip().lower()]
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid rate limit {value!r}; use N/second, N/minute or N/hour")
+    if count <= 0:
+        raise ValueError(f"Invalid rate limit {value!r}; N must be positive")
+    return count, count / seconds
+
+
+def client_ip(forwarded_for, remote_addr, hops=RATE_LIMIT_PROXY_HOPS):
+    """
+    The client address: the entry the nearest trusted proxy appended to
+    X-Forwarded-For (earlier entries can be forged by the client).
+    """
+    addresses = [address.strip() for address in (forwarded_for or '').split(',') if address.strip()]
+    if hops > 0 and len(addresses) >= hops:
+        return addresses[-hops]
+    return remote_addr
+
+
+class MemoryBucketStore:
+    """Token buckets in this process."""
+
+    def __init__(self, max_buckets=RATE_LIMIT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now=None):
+        """Take a token; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            retry_after = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            if bucket is None and len(self._buckets) >= self.max_buckets:
+                self._prune(now)
+            # (tokens, updated at, refilled at)
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            return retry_after
+
+    def _prune(self, now):
+        # A refilled bucket is the same as no bucket
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        if len(self._buckets) >= self.max_buckets:
+            logger.warning(f"{len(self._buckets)} rate limit buckets in use; resetting them")
+            self._buckets = {}
+
+
+class RedisBucketStore:
+    """Token buckets shared by every instance through Redis."""
+
+    def __init__(self, url, prefix='rate_limit:'):
+        import redis
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self._script = self._client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        try:
+            return float(self._script(keys=[self.prefix + key], args=[capacity, rate, now]))
+        except Exception as e:
+            logger.warning(f"Rate limit store unavailable, allowing request: {e}")
+            return 0.0
+
+
+class RateLimiter:
+    """Per-endpoint, per-IP and per-user token buckets."""
+
+    def __init__(self, limits=None, store=None, enabled=RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self.store = store or MemoryBucketStore()
+        self.limits = {}
+        for endpoint, spec in (DEFAULT_RATE_LIMITS if limits is None else limits).items():
+            if not spec:
+                continue
+            unknown = set(spec) - set(SCOPES) - {'methods'}
+            if unknown:
+                raise ValueError(f"Unknown rate limit keys for {endpoint}: {', '.join(sorted(unknown))}")
+            methods = spec.get('methods')
+            self.limits[endpoint] = {
+                'methods': {method.upper() for method in methods} if methods else None,
+                'buckets': [(scope, *parse_rate(spec[scope])) for scope in SCOPES if spec.get(scope)],
+            }
+        self.limited = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Limiter over DEFAULT_RATE_LIMITS with RATE_LIMITS overrides, in Redis if configured."""
+        limits = dict(DEFAULT_RATE_LIMITS)
+        try:
+            limits.update(json.loads(os.getenv('RATE_LIMITS') or '{}'))
+        except ValueError as e:
+            logger.error(f"Invalid RATE_LIMITS: {e}; using the defaults")
+        store = None
+        if RATE_LIMIT_REDIS_URL:
+            try:
+                store = RedisBucketStore(RATE_LIMIT_REDIS_URL)
+            except ImportError:
+                logger.error("RATE_LIMIT_REDIS_URL is set but the redis package is not installed; "
+                             "rate limits are per instance")
+        return cls(limits, store)
+
+    def check(self, endpoint, method, ip=None, user=None, now=None):
+        """Take a token from each applicable bucket; returns 0 if allowed, else seconds to wait."""
+        limit = self.limits.get(endpoint) if self.enabled else None
+        if limit is None or (limit['methods'] is not None and method not in limit['methods']):
+            return 0.0
+        identities = {'ip': ip, 'user': user}
+        retry_after = 0.0
+        for scope, capacity, rate in limit['buckets']:
+            identity = identities[scope]
+            if not identity:
+                continue
+            wait = self.store.take(f"{endpoint}:{scope}:{identity}", capacity, rate, now)
+            if wait > 0:
+                with self._lock:
+                    self.limited[(endpoint, scope)] = self.limited.get((endpoint, scope), 0) + 1
+                retry_after = max(retry_after, wait)
+        return retry_after
+
+    def render_metrics(self):
+        """Prometheus text exposition of rejected requests."""
+        lines = ['# HELP rate_limited_requests_total Requests rejected with 429 by a rate limit',
+                 '# TYPE rate_limited_requests_total counter']
+        with self._lock:
+            for (endpoint, scope), count in sorted(self.limited.items()):
+                lines.append(f"rate_limited_requests_total{{{format_labels(endpoint=endpoint, scope=scope)}}} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def retry_after_header(retry_after):
+    """Whole seconds for a Retry-After header (at least 1)."""
+    return str(max(1, math.ceil(retry_after)))
@@ -0,0 +1,88 @@
+"""
+Incremental change feed for discount requests.
+
+Clients poll ``/api/requests/changes?since=<watermark>`` and get back only the
+requests inserted or updated since their last poll, plus a new watermark.
+The watermark is an opaque token over (last change time, enquiry_no), so
+pages split between requests changed at the same instant are exact.
+
+A watermark never moves past ``now - CHANGES_SETTLE_SECONDS``: a change that
+becomes visible late (streaming insert lag, another worker's clock) still
+lands after the watermark a client already holds, so polling never skips it.
+"""
+
+import os
+import json
+import base64
+from datetime import datetime, timedelta, timezone
+from request_events import to_iso
+
+CHANGES_SETTLE_SECONDS = int(os.getenv('CHANGES_SETTLE_SECONDS', 10))
+CHANGES_PAGE_SIZE = 500
+
+# Columns returned per change: enough to update a queue card or a dashboard row
+CHANGE_COLUMNS = [
+    'request_id', 'enquiry_no', 'status', 'student_name', 'branch_name', 'card_name', 'mrp',
+    'discounted_fees', 'net_discount', 'requester_email', 'l1_approver', 'l2_approver',
+]
+
+EPOCH_KEY = ('', '')
+
+
+def encode_watermark(key):
+    """Encode a (changed_at, enquiry_no) key as an opaque URL-safe token."""
+    raw = json.dumps(list(key), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_watermark(token):
+    """Decode a watermark token; an empty token means 'from the beginning'."""
+    if not token:
+        return EPOCH_KEY
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        changed_at, enquiry_no = json.loads(raw)
+        return (to_iso(changed_at) or '', str(enquiry_no))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid watermark: {token}")
+
+
+def settled_until(now=None):
+    """Upper bound for the next watermark: changes newer than this may still arrive."""
+    now = now or datetime.now(timezone.utc)
+    # '\uffff' sorts after every enquiry_no at that instant
+    return (to_iso(now - timedelta(seconds=CHANGES_SETTLE_SECONDS)), '\uffff')
+
+
+def compact_change(row, changed_at):
+    change = {name: row.get(name) for name in CHANGE_COLUMNS}
+    for name in ('mrp', 'discounted_fees', 'net_discount'):
+        if change[name] is not None:
+            change[name] = float(change[name])
+    change['changed_at'] = changed_at
+    return change
+
+
+def build_changes_response(rows, since, until, limit=CHANGES_PAGE_SIZE,
+                           changed_at_column='last_event_at', key_column='enquiry_no', visible=None):
+    """
+    Build the JSON body for a page of changes.
+
+    rows are the changes in (since, until], oldest first, fetched with at most
+    limit + 1 rows so a further page can be detected. visible filters what the
+    caller may see without affecting how far the watermark advances.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = [compact_change(row, to_iso(row.get(changed_at_column)))
+               for row in rows if visible is None or visible(row)]
+    if has_more:
+        watermark = (to_iso(rows[-1].get(changed_at_column)), str(rows[-1].get(key_column)))
+    else:
+        # Nothing else can change inside (since, until], so the whole window is consumed
+        watermark = max(since, until)
+    return {
+        'changes': changes,
+        'watermark': encode_watermark(watermark),
+        'has_more': has_more,
+    }
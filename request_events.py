@@ -0,0 +1,644 @@
+"""
+Append-only request event log with an incrementally maintained projection.
+
+Every change to a discount request is recorded as one immutable row in
+`request_events` (submitted, l1_approved, l2_approved, rejected). Current
+state is never updated in place on the request path; instead it is folded
+from the event stream:
+
+- each app process keeps an in-memory RequestProjection, bootstrapped from the
+  materialized `request_state` table and kept current by tailing events newer
+  than its watermark;
+- `materialize_projection()` (run via `migrate_database.py project-events`)
+  folds new events into `request_state` with one MERGE, off the request path.
+
+Events are folded in (occurred_at, event_id) order and an event only applies
+if its from_status matches the current status, so every process (and the
+materializer) converges on the same first-writer-wins result. Events are
+appended in a transaction that also moves the request's row in
+`request_heads` (migration 008), so of two workers submitting the same
+enquiry or approving the same request at once, only one is told it applied.
+"""
+
+import json
+import uuid
+import random
+import bisect
+import logging
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+from google.cloud import bigquery
+
+from approval_workflow import (get_transition, STATUS_PENDING_L1,
+                               STATUS_APPROVED, STATUS_REJECTED)
+
+logger = logging.getLogger(__name__)
+
+EVENT_SUBMITTED = 'submitted'
+EVENT_L1_APPROVED = 'l1_approved'
+EVENT_L2_APPROVED = 'l2_approved'
+EVENT_REJECTED = 'rejected'
+
+# Streaming inserts from other processes can become visible slightly out of
+# order, so each tail re-reads this window behind the watermark
+SYNC_OVERLAP = timedelta(seconds=120)
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f+00:00'
+
+# Attempts at an append transaction BigQuery aborts for a concurrent update of request_heads
+APPEND_ATTEMPTS = 5
+
+EVENT_COLUMNS = ['event_id', 'enquiry_no', 'request_id', 'event_type', 'from_status', 'to_status',
+                 'actor_email', 'actor_level', 'payload', 'occurred_at']
+
+# Columns of the compact request_state projection (legacy discount_requests shape)
+REQUEST_COLUMNS = [
+    ('enquiry_no', 'STRING'), ('student_name', 'STRING'), ('mobile_no', 'STRING'),
+    ('card_name', 'STRING'), ('mrp', 'FLOAT'), ('installment', 'FLOAT'),
+    ('discounted_fees', 'FLOAT'), ('discount_amount', 'FLOAT'), ('discount_percentage', 'FLOAT'),
+    ('net_discount', 'FLOAT'), ('reason', 'STRING'), ('remarks', 'STRING'),
+    ('requester_email', 'STRING'), ('requester_name', 'STRING'), ('branch_name', 'STRING'),
+    ('status', 'STRING'), ('created_at', 'TIMESTAMP'),
+    ('l1_approver', 'STRING'), ('l1_approved_at', 'TIMESTAMP'), ('l1_comments', 'STRING'),
+    ('l2_approver', 'STRING'), ('l2_approved_at', 'TIMESTAMP'), ('l2_comments', 'STRING'),
+    ('last_event_id', 'STRING'), ('last_event_at', 'TIMESTAMP'),
+    ('risk_score', 'FLOAT'), ('risk_reasons', 'STRING'), ('assigned_to', 'STRING'),
+]
+REQUEST_STATE_SCHEMA = [bigquery.SchemaField(name, field_type) for name, field_type in REQUEST_COLUMNS]
+TIMESTAMP_COLUMNS = [name for name, field_type in REQUEST_COLUMNS if field_type == 'TIMESTAMP']
+
+
+def to_iso(value):
+    """Normalize a datetime or ISO string to a fixed-width UTC string (sortable)."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def event_type_for(approver_level, action):
+    """Map an approval action to its event type."""
+    if action == 'REJECT':
+        return EVENT_REJECTED
+    return EVENT_L1_APPROVED if approver_level == 'L1' else EVENT_L2_APPROVED
+
+
+def build_event(event_type, enquiry_no, from_status, to_status, actor_email, actor_level,
+                payload=None, request_id=None, occurred_at=None):
+    """Build an event row as stored in request_events."""
+    return {
+        'event_id': str(uuid.uuid4()),
+        'enquiry_no': enquiry_no,
+        'request_id': request_id,
+        'event_type': event_type,
+        'from_status': from_status,
+        'to_status': to_status,
+        'actor_email': actor_email,
+        'actor_level': actor_level,
+        'payload': json.dumps(payload or {}, default=str),
+        'occurred_at': to_iso(occurred_at or datetime.now(timezone.utc)),
+    }
+
+
+def _run_transaction(client, query, params, description):
+    """
+    Rows of a multi-statement transaction's final SELECT, or None on error.
+
+    BigQuery aborts a transaction whose mutation of request_heads conflicts
+    with one committed since it started; those are retried after a short
+    random backoff, and then see the other transaction's result.
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=params)
+    for attempt in range(APPEND_ATTEMPTS):
+        try:
+            return list(client.query(query, job_config=job_config).result())
+        except Exception as e:
+            if 'concurrent update' in str(e).lower() and attempt < APPEND_ATTEMPTS - 1:
+                logger.info(f"Retrying {description} after a concurrent update: {e}")
+                time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+                continue
+            logger.error(f"Error appending {description}: {e}")
+            return None
+
+
+def append_event_if_current(client, project_id, dataset_id, event, check_state=True):
+    """
+    Append a transition event and move the request's row in request_heads.
+
+    Both run in one transaction. With check_state the UPDATE only matches
+    while the request is in the event's from_status, and the event is
+    appended only if it did. The UPDATE is mutating DML, so BigQuery aborts
+    one of two transactions updating request_heads at once rather than let
+    both read the old status; the retry then finds the status moved on.
+    Without check_state (mirroring a transition already applied to
+    discount_requests) the row is moved and the event appended regardless.
+    Returns True if the event was appended, False if the request was not in
+    from_status and None on error.
+    """
+    if not client:
+        return None
+    heads_table = f"`{project_id}.{dataset_id}.request_heads`"
+    condition = "AND status = @from_status" if check_state else ""
+    query = f"""
+        DECLARE applied BOOL DEFAULT FALSE;
+        BEGIN TRANSACTION;
+        UPDATE {heads_table}
+        SET status = @to_status, event_id = @event_id, updated_at = @occurred_at
+        WHERE enquiry_no = @enquiry_no {condition};
+        SET applied = @@row_count = 1 OR NOT @check_state;
+        IF applied THEN
+            INSERT INTO `{project_id}.{dataset_id}.request_events` ({', '.join(EVENT_COLUMNS)})
+            VALUES ({', '.join(f'@{name}' for name in EVENT_COLUMNS)});
+            COMMIT TRANSACTION;
+        ELSE
+            ROLLBACK TRANSACTION;
+        END IF;
+        SELECT applied;
+    """
+    params = [bigquery.ScalarQueryParameter(name, 'STRING', event[name])
+              for name in EVENT_COLUMNS if name != 'occurred_at']
+    params.append(bigquery.ScalarQueryParameter('occurred_at', 'TIMESTAMP',
+                                                datetime.fromisoformat(event['occurred_at'])))
+    params.append(bigquery.ScalarQueryParameter('check_state', 'BOOL', check_state))
+    rows = _run_transaction(client, query, params, f"request event for {event['enquiry_no']}")
+    if rows is None:
+        return None
+    return bool(rows and rows[0]['applied'])
+
+
+def append_submissions(client, project_id, dataset_id, events):
+    """
+    Append submitted events for requests not yet in request_heads.
+
+    One transaction MERGEs a row per request into request_heads and appends
+    the events whose row it created. The MERGE has an UPDATE clause, so it is
+    mutating DML and BigQuery aborts one of two submissions of the same
+    enquiry made at once instead of letting both insert. Returns the set of
+    appended event_ids, or None on error.
+    """
+    if not client or not events:
+        return None
+    heads_table = f"`{project_id}.{dataset_id}.request_heads`"
+    # Array parameters cannot hold NULLs, so missing values travel as ''
+    arrays = {name: [event[name] or '' for event in events]
+              for name in EVENT_COLUMNS if name not in ('event_type', 'from_status', 'to_status', 'actor_level',
+                                                       'occurred_at')}
+    values = {name: f"NULLIF(@{name}s[OFFSET(i)], '')" for name in arrays}
+    values.update(event_type='@event_type', from_status='CAST(NULL AS STRING)', to_status='@to_status',
+                  actor_level='@actor_level', occurred_at='@occurred_ats[OFFSET(i)]')
+    query = f"""
+        BEGIN TRANSACTION;
+        MERGE {heads_table} T
+        USING (
+            SELECT enquiry_no, @event_ids[OFFSET(i)] AS event_id, @occurred_ats[OFFSET(i)] AS updated_at
+            FROM UNNEST(@enquiry_nos) AS enquiry_no WITH OFFSET i
+        ) S
+        ON T.enquiry_no = S.enquiry_no
+        WHEN MATCHED THEN UPDATE SET updated_at = T.updated_at
+        WHEN NOT MATCHED THEN INSERT (enquiry_no, status, event_id, updated_at)
+            VALUES (S.enquiry_no, @to_status, S.event_id, S.updated_at);
+        INSERT INTO `{project_id}.{dataset_id}.request_events` ({', '.join(EVENT_COLUMNS)})
+        SELECT {', '.join(values[name] for name in EVENT_COLUMNS)}
+        FROM UNNEST(@event_ids) AS event_id WITH OFFSET i
+        WHERE event_id IN (SELECT event_id FROM {heads_table} WHERE enquiry_no IN UNNEST(@enquiry_nos));
+        COMMIT TRANSACTION;
+        SELECT event_id FROM {heads_table} WHERE event_id IN UNNEST(@event_ids);
+    """
+    params = [bigquery.ArrayQueryParameter(f'{name}s', 'STRING', value) for name, value in arrays.items()]
+    params.append(bigquery.ArrayQueryParameter('occurred_ats', 'TIMESTAMP',
+                                               [datetime.fromisoformat(e['occurred_at']) for e in events]))
+    params += [bigquery.ScalarQueryParameter('event_type', 'STRING', EVENT_SUBMITTED),
+               bigquery.ScalarQueryParameter('to_status', 'STRING', STATUS_PENDING_L1),
+               bigquery.ScalarQueryParameter('actor_level', 'STRING', events[0]['actor_level'])]
+    rows = _run_transaction(client, query, params, f"{len(events)} submitted events")
+    if rows is None:
+        return None
+    return {row['event_id'] for row in rows}
+
+
+def fold_event(row, event):
+    """Return the request row after applying event, or None if it does not apply."""
+    payload = event['payload']
+    if isinstance(payload, str):
+        payload = json.loads(payload or '{}')
+
+    if event['event_type'] == EVENT_SUBMITTED:
+        if row is not None:
+            return None
+        new_row = {name: payload.get(name) for name, _ in REQUEST_COLUMNS}
+        new_row['enquiry_no'] = event['enquiry_no']
+        new_row['created_at'] = to_iso(payload.get('created_at')) or event['occurred_at']
+    else:
+        if row is None or row['status'] != event['from_status']:
+            return None
+        new_row = dict(row)
+        level = (event['actor_level'] or '').lower()
+        if level in ('l1', 'l2'):
+            new_row[f'{level}_approver'] = event['actor_email']
+            new_row[f'{level}_approved_at'] = event['occurred_at']
+            new_row[f'{level}_comments'] = payload.get('comments')
+        approved_amount = payload.get('approved_amount')
+        if event['event_type'] != EVENT_REJECTED and approved_amount is not None:
+            new_row['discounted_fees'] = approved_amount
+            new_row['net_discount'] = (row.get('mrp') or 0) - approved_amount
+
+    new_row['status'] = event['to_status']
+    new_row['last_event_id'] = event['event_id']
+    new_row['last_event_at'] = event['occurred_at']
+    return new_row
+
+
+class RequestProjection:
+    """In-memory current state of all requests, updated one event at a time."""
+
+    def __init__(self):
+        self.rows = {}
+        self._base = {}
+        self._events = {}
+        self._by_status = {}
+        self._by_created = []
+        self._by_updated = []
+        self._dirty = set()
+        self.counters = {'total': 0, 'pending': 0, 'approved': 0, 'rejected': 0}
+
+    @staticmethod
+    def _counter_for(status):
+        if not status:
+            return None
+        if status.startswith('PENDING'):
+            return 'pending'
+        return {STATUS_APPROVED: 'approved', STATUS_REJECTED: 'rejected'}.get(status)
+
+    def _set_row(self, enquiry_no, new_row):
+        old_row = self.rows.get(enquiry_no)
+        if old_row is not None:
+            self._by_status.get(old_row['status'], set()).discard(enquiry_no)
+            counter = self._counter_for(old_row['status'])
+            if counter:
+                self.counters[counter] -= 1
+            for index_list, column in ((self._by_created, 'created_at'), (self._by_updated, 'last_event_at')):
+                index = bisect.bisect_left(index_list, (old_row[column] or '', enquiry_no))
+                if index < len(index_list) and index_list[index][1] == enquiry_no:
+                    index_list.pop(index)
+        else:
+            self.counters['total'] += 1
+
+        self.rows[enquiry_no] = new_row
+        self._by_status.setdefault(new_row['status'], set()).add(enquiry_no)
+        counter = self._counter_for(new_row['status'])
+        if counter:
+            self.counters[counter] += 1
+        bisect.insort(self._by_created, (new_row['created_at'] or '', enquiry_no))
+        bisect.insort(self._by_updated, (new_row['last_event_at'] or '', enquiry_no))
+
+    def load_row(self, row):
+        """Seed the projection with a materialized request_state row."""
+        row = dict(row)
+        for name in TIMESTAMP_COLUMNS:
+            row[name] = to_iso(row.get(name))
+        self._base[row['enquiry_no']] = row
+        self._set_row(row['enquiry_no'], row)
+
+    def apply(self, event):
+        """
+        Apply one event. Returns the new row if the event changed state.
+
+        Events arriving out of order re-fold that request from its base state so
+        the result only depends on (occurred_at, event_id) ordering.
+        """
+        enquiry_no = event['enquiry_no']
+        if not enquiry_no:
+            return None
+        events = self._events.setdefault(enquiry_no, [])
+        key = (event['occurred_at'], event['event_id'])
+        if any((e['occurred_at'], e['event_id']) == key for e in events):
+            return None
+        previous = self.rows.get(enquiry_no)
+
+        if not events or key > (events[-1]['occurred_at'], events[-1]['event_id']):
+            events.append(event)
+            new_row = fold_event(previous, event)
+        else:
+            events.append(event)
+            events.sort(key=lambda e: (e['occurred_at'], e['event_id']))
+            new_row = self._base.get(enquiry_no)
+            for e in events:
+                new_row = fold_event(new_row, e) or new_row
+            if new_row == previous:
+                new_row = None
+
+        if new_row is None:
+            return None
+        self._set_row(enquiry_no, new_row)
+        self._dirty.add(enquiry_no)
+        return new_row
+
+    def compact(self, cutoff):
+        """Fold retained events older than cutoff into each request's base state."""
+        for enquiry_no in list(self._events):
+            events = self._events[enquiry_no]
+            if events and events[-1]['occurred_at'] < cutoff:
+                self._base[enquiry_no] = self.rows.get(enquiry_no)
+                del self._events[enquiry_no]
+
+    def get(self, enquiry_no):
+        return self.rows.get(enquiry_no)
+
+    def by_status(self, status, branch_in=None, branch_not_in=None, assigned_to=None):
+        """Requests in a status, newest first, optionally filtered by branch or assigned approver."""
+        rows = [self.rows[e] for e in self._by_status.get(status, ())]
+        if assigned_to is not None:
+            rows = [r for r in rows if r.get('assigned_to') in assigned_to]
+        if branch_in is not None:
+            rows = [r for r in rows if r['branch_name'] in branch_in]
+        if branch_not_in is not None:
+            rows = [r for r in rows if r['branch_name'] not in branch_not_in]
+        return sorted(rows, key=lambda r: r['created_at'] or '', reverse=True)
+
+    def recent(self, limit=5):
+        return [self.rows[e] for _, e in reversed(self._by_created[-limit:])]
+
+    def changed_since(self, since, until, limit=None):
+        """
+        Requests whose last change falls in (since, until], oldest change first.
+
+        since and until are (last_event_at, enquiry_no) keys so a page boundary
+        between requests changed at the same instant is exact.
+        """
+        start = bisect.bisect_right(self._by_updated, since)
+        end = bisect.bisect_right(self._by_updated, until)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [self.rows[e] for _, e in self._by_updated[start:end]]
+
+    def dirty_rows(self):
+        return [self.rows[e] for e in self._dirty if e in self.rows]
+
+
+class RequestEventLog:
+    """Writes request events and keeps this process's projection current."""
+
+    def __init__(self, client_getter, project_id, dataset_id, sync_interval=5):
+        self.client_getter = client_getter
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.sync_interval = sync_interval
+        self.projection = RequestProjection()
+        self.watermark = None
+        self.loaded = False
+        self._listeners = []
+        self._seen = {}
+        self._transition_locks = {}
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._last_sync = 0.0
+        self._last_load_attempt = None
+
+    def subscribe(self, listener, local_only=False):
+        """
+        Register listener(event, row, previous_status) for applied events.
+
+        local_only listeners only see events recorded by this process, not
+        those tailed from other workers.
+        """
+        self._listeners.append((listener, local_only))
+
+    def _notify(self, event, row, previous_status, local=False):
+        for listener, local_only in self._listeners:
+            if local_only and not local:
+                continue
+            try:
+                listener(event, row, previous_status)
+            except Exception as e:
+                logger.error(f"Request event listener {listener} failed: {e}")
+
+    def _apply(self, event, local=False):
+        with self._lock:
+            if event['event_id'] in self._seen:
+                return None
+            self._seen[event['event_id']] = event['occurred_at']
+            previous = self.projection.get(event['enquiry_no'])
+            row = self.projection.apply(event)
+            if event['occurred_at'] and (self.watermark is None or event['occurred_at'] > self.watermark):
+                self.watermark = event['occurred_at']
+        if row is not None:
+            self._notify(event, row, previous['status'] if previous else None, local)
+        return row
+
+    def ensure_loaded(self):
+        """Bootstrap the projection from request_state once per process."""
+        if self.loaded:
+            return True
+        if self._last_load_attempt is not None and time.monotonic() - self._last_load_attempt < self.sync_interval:
+            return False
+        client = self.client_getter()
+        if not client:
+            return False
+        with self._lock:
+            if self.loaded:
+                return True
+            self._last_load_attempt = time.monotonic()
+            try:
+                query = f"SELECT * FROM `{self.project_id}.{self.dataset_id}.request_state`"
+                for row in client.query(query).result():
+                    row = dict(row.items())
+                    self.projection.load_row(row)
+                    last_event_at = to_iso(row.get('last_event_at'))
+                    if last_event_at and (self.watermark is None or last_event_at > self.watermark):
+                        self.watermark = last_event_at
+                self.loaded = True
+                logger.info(f"Loaded {len(self.projection.rows)} requests into projection "
+                            f"(watermark {self.watermark})")
+            except Exception as e:
+                logger.error(f"Error loading request_state projection: {e}")
+                return False
+        self.sync(force=True)
+        return True
+
+    def sync(self, force=False):
+        """Tail request_events newer than the watermark (rate limited)."""
+        if not self.loaded and not self.ensure_loaded():
+            return False
+        if not force and time.monotonic() - self._last_sync < self.sync_interval:
+            return True
+        if not self._sync_lock.acquire(blocking=force):
+            return True
+        try:
+            client = self.client_getter()
+            if not client:
+                return False
+            since = datetime(1970, 1, 1, tzinfo=timezone.utc)
+            if self.watermark:
+                since = datetime.fromisoformat(self.watermark) - SYNC_OVERLAP
+            query = f"""
+                SELECT event_id, enquiry_no, request_id, event_type, from_status, to_status,
+                       actor_email, actor_level, payload, occurred_at
+                FROM `{self.project_id}.{self.dataset_id}.request_events`
+                WHERE occurred_at > @since
+                ORDER BY occurred_at, event_id
+            """
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ScalarQueryParameter('since', 'TIMESTAMP', since)]
+            )
+            for row in client.query(query, job_config=job_config).result():
+                event = dict(row.items())
+                event['occurred_at'] = to_iso(event['occurred_at'])
+                self._apply(event)
+            self._last_sync = time.monotonic()
+            if self.watermark:
+                cutoff = to_iso(datetime.fromisoformat(self.watermark) - 2 * SYNC_OVERLAP)
+                with self._lock:
+                    self._seen = {k: v for k, v in self._seen.items() if v >= cutoff}
+                    self.projection.compact(cutoff)
+            return True
+        except Exception as e:
+            logger.error(f"Error syncing request events: {e}")
+            return False
+        finally:
+            self._sync_lock.release()
+
+    def record_submission(self, data, actor_level=None, request_id=None):
+        """
+        Append a submitted event for a new request. Returns (applied, row).
+
+        Not applied if the enquiry was already submitted, by any worker (see
+        append_submissions).
+        """
+        event = build_event(EVENT_SUBMITTED, data['enquiry_no'], None, STATUS_PENDING_L1,
+                            data.get('requester_email'), actor_level, payload=data, request_id=request_id)
+        appended = append_submissions(self.client_getter(), self.project_id, self.dataset_id, [event])
+        if not appended:
+            if appended is not None:
+                self.sync(force=True)
+            return False, self.projection.get(data['enquiry_no'])
+        row = self._apply(event, local=True)
+        return True, row or self.projection.get(data['enquiry_no'])
+
+    def record_submissions(self, datas, actor_level=None):
+        """Append submitted events for many new requests in one transaction. Returns the applied rows."""
+        events = {}
+        for data in datas:
+            events.setdefault(data['enquiry_no'], build_event(
+                EVENT_SUBMITTED, data['enquiry_no'], None, STATUS_PENDING_L1,
+                data.get('requester_email'), actor_level, payload=data))
+        appended = append_submissions(self.client_getter(), self.project_id, self.dataset_id,
+                                      list(events.values()))
+        if appended is None:
+            return []
+        rows = [self._apply(event, local=True) or self.projection.get(event['enquiry_no'])
+                for event in events.values() if event['event_id'] in appended]
+        return [row for row in rows if row is not None]
+
+    def record_transition(self, enquiry_no, approver_level, action, actor_email,
+                          comments='', approved_amount=None, check_state=True, request_id=None):
+        """
+        Append an approval event. Returns (applied, row).
+
+        With check_state the append itself is conditional (see
+        append_event_if_current), so of two approvers acting at once, in this
+        process or another, only one is told the transition applied.
+        Transitions of one request in this process are serialized, which
+        spares BigQuery the aborted transactions.
+        """
+        transition = get_transition(approver_level, action)
+        if transition is None:
+            return False, None
+        expected_status, new_status = transition
+        payload = {'comments': comments, 'approved_amount': approved_amount}
+        event = build_event(event_type_for(approver_level, action), enquiry_no, expected_status,
+                            new_status, actor_email, approver_level, payload=payload, request_id=request_id)
+        if not check_state:
+            if not append_event_if_current(self.client_getter(), self.project_id, self.dataset_id, event,
+                                           check_state=False):
+                return False, None
+            row = self._apply(event, local=True)
+            return True, row or self.projection.get(enquiry_no)
+
+        with self._transition_lock(enquiry_no):
+            appended = append_event_if_current(self.client_getter(), self.project_id, self.dataset_id, event)
+        if not appended:
+            if appended is False:
+                # Pick up whichever event moved the request on
+                self.sync(force=True)
+            return False, self.projection.get(enquiry_no)
+        row = self._apply(event, local=True)
+        if row is None:
+            # This process has not seen the request reach expected_status yet
+            self.sync(force=True)
+            row = self.projection.get(enquiry_no)
+        return True, row
+
+    def _transition_lock(self, enquiry_no):
+        with self._lock:
+            lock = self._transition_locks.get(enquiry_no)
+            if lock is None:
+                if len(self._transition_locks) >= 1024:
+                    self._transition_locks = {key: held for key, held in self._transition_locks.items()
+                                              if held.locked()}
+                lock = self._transition_locks[enquiry_no] = threading.Lock()
+            return lock
+
+    def with_rows(self, fn):
+        """
+        Call fn(rows) with every projection row while no event can be applied.
+
+        Listeners seeding their own state from the projection use this so each
+        event is either in the seed or notified after it.
+        """
+        with self._lock:
+            return fn(list(self.projection.rows.values()))
+
+    def get_request(self, enquiry_no):
+        self.sync()
+        return self.projection.get(enquiry_no)
+
+    def pending_requests(self, status, branch_in=None, branch_not_in=None, assigned_to=None):
+        self.sync()
+        return self.projection.by_status(status, branch_in, branch_not_in, assigned_to)
+
+    def changes_since(self, since, until, limit=None):
+        """Projection rows changed in (since, until] (see RequestProjection.changed_since)."""
+        self.sync()
+        with self._lock:
+            return self.projection.changed_since(since, until, limit)
+
+    def dashboard_stats(self):
+        """(total, pending, approved, rejected, recent) from the projection."""
+        self.sync()
+        counters = self.projection.counters
+        return (counters['total'], counters['pending'], counters['approved'],
+                counters['rejected'], self.projection.recent(5))
+
+
+def materialize_projection(client, project_id, dataset_id):
+    """Fold new events into the request_state table with a single MERGE."""
+    event_log = RequestEventLog(lambda: client, project_id, dataset_id, sync_interval=0)
+    if not event_log.ensure_loaded():
+        return None
+    rows = event_log.projection.dirty_rows()
+    if not rows:
+        logger.info("request_state is up to date")
+        return 0
+
+    staging_table = f"{project_id}.{dataset_id}.request_state_staging"
+    load_config = bigquery.LoadJobConfig(schema=REQUEST_STATE_SCHEMA, write_disposition='WRITE_TRUNCATE')
+    client.load_table_from_json(rows, staging_table, job_config=load_config).result()
+
+    columns = [name for name, _ in REQUEST_COLUMNS]
+    merge_query = f"""
+        MERGE `{project_id}.{dataset_id}.request_state` T
+        USING `{staging_table}` S
+        ON T.enquiry_no = S.enquiry_no
+        WHEN MATCHED THEN UPDATE SET {', '.join(f'{c} = S.{c}' for c in columns if c != 'enquiry_no')}
+        WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) VALUES ({', '.join(f'S.{c}' for c in columns)})
+    """
+    client.query(merge_query).result()
+    logger.info(f"Materialized {len(rows)} changed requests into request_state")
+    return len(rows)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained rollups behind the /analytics dashboard.
+
+Request activity (submissions, L1/L2 decisions and how long they took) is
+folded into hourly and daily per-branch rollup tables, plus a daily discount
+% distribution (migration 005). Each refresh recomputes only the local days
+touched since the last refresh, with one MERGE per table, so a run costs the
+recent activity rather than the whole history. Charts then read
+O(days x branches) rollup rows.
+
+Run it on a schedule (e.g. hourly from Cloud Scheduler or cron):
+    python rollups.py [--full] [--source request_state]
+"""
+
+import os
+import re
+import sys
+import logging
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_TIMEZONE = os.getenv('ROLLUP_TIMEZONE', 'Asia/Kolkata')
+# Days before the last rolled-up day that are recomputed, for writes that land late
+ROLLUP_LOOKBACK_DAYS = int(os.getenv('ROLLUP_LOOKBACK_DAYS', 1))
+DISCOUNT_BUCKET_WIDTH = 5
+MAX_DAYS = {'day': 366, 'hour': 7}
+
+HOURLY_TABLE = 'request_rollups_hourly'
+DAILY_TABLE = 'request_rollups_daily'
+DISTRIBUTION_TABLE = 'request_discount_distribution_daily'
+
+METRIC_COLUMNS = [
+    'submitted', 'discount_percentage_sum', 'l1_approved', 'l1_rejected', 'l1_approve_seconds_sum',
+    'l2_approved', 'l2_rejected', 'l2_approve_seconds_sum', 'approved_net_discount_sum',
+]
+
+EPOCH_DAY = date(1970, 1, 1)
+
+if not re.match(r'^[A-Za-z_]+(/[A-Za-z_+\-0-9]+)*$', ROLLUP_TIMEZONE):
+    raise ValueError(f"Invalid ROLLUP_TIMEZONE: {ROLLUP_TIMEZONE}")
+
+
+def _merge_metrics(target_key, period_expression, source, since_condition):
+    """MERGE statement that replaces a rollup's rows for every period since @since_day."""
+    key_columns = target_key.split(', ')
+    on = ' AND '.join(f"T.{column} = S.{column}" for column in key_columns)
+    period_column = key_columns[0]
+    return f"""
+        MERGE {{target}} T
+        USING (
+            SELECT {period_expression} AS {period_column}, branch_name,
+                   {', '.join(f'SUM({c}) AS {c}' for c in METRIC_COLUMNS)}
+            FROM {source}
+            WHERE {since_condition}
+            GROUP BY {target_key}
+        ) S
+        ON {on}
+        WHEN MATCHED THEN UPDATE SET
+            {', '.join(f'{c} = S.{c}' for c in METRIC_COLUMNS)}, updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT ({target_key}, {', '.join(METRIC_COLUMNS)}, updated_at)
+            VALUES ({', '.join(f'S.{c}' for c in key_columns)}, {', '.join(f'S.{c}' for c in METRIC_COLUMNS)},
+                    CURRENT_TIMESTAMP())
+        WHEN NOT MATCHED BY SOURCE AND {{target_since}} THEN DELETE
+    """
+
+
+def _requests_cte(source_table):
+    # Timestamps are ISO strings in discount_requests and TIMESTAMPs in request_state
+    return f"""
+        WITH requests AS (
+            SELECT
+                branch_name, status,
+                SAFE_CAST(created_at AS TIMESTAMP) AS created_at,
+                SAFE_CAST(l1_approved_at AS TIMESTAMP) AS l1_at,
+                SAFE_CAST(l2_approved_at AS TIMESTAMP) AS l2_at,
+                CAST(discount_percentage AS FLOAT64) AS discount_percentage,
+                CAST(net_discount AS FLOAT64) AS net_discount
+            FROM `{source_table}`
+        )
+    """
+
+
+def hourly_merge_sql(project_id, dataset_id, source_table):
+    """Recompute hourly rollups from request activity since local midnight of @since_day."""
+    since = f"TIMESTAMP(@since_day, '{ROLLUP_TIMEZONE}')"
+    l1_approved = "(status IN ('PENDING_L2', 'APPROVED') OR l2_at IS NOT NULL)"
+    activity = f"""(
+            {_requests_cte(source_table)}
+            SELECT created_at AS at, branch_name, 1 AS submitted,
+                   IFNULL(discount_percentage, 0) AS discount_percentage_sum,
+                   0 AS l1_approved, 0 AS l1_rejected, 0 AS l1_approve_seconds_sum,
+                   0 AS l2_approved, 0 AS l2_rejected, 0 AS l2_approve_seconds_sum,
+                   0.0 AS approved_net_discount_sum
+            FROM requests WHERE created_at >= {since}
+            UNION ALL
+            SELECT l1_at, branch_name, 0, 0.0,
+                   IF({l1_approved}, 1, 0),
+                   IF(status = 'REJECTED' AND l2_at IS NULL, 1, 0),
+                   IF({l1_approved}, TIMESTAMP_DIFF(l1_at, created_at, SECOND), 0),
+                   0, 0, 0, 0.0
+            FROM requests WHERE l1_at >= {since}
+            UNION ALL
+            SELECT l2_at, branch_name, 0, 0.0, 0, 0, 0,
+                   IF(status = 'APPROVED', 1, 0),
+                   IF(status = 'REJECTED', 1, 0),
+                   IF(status = 'APPROVED', TIMESTAMP_DIFF(l2_at, l1_at, SECOND), 0),
+                   IF(status = 'APPROVED', IFNULL(net_discount, 0), 0)
+            FROM requests WHERE l2_at >= {since}
+        )"""
+    sql = _merge_metrics('period_start, branch_name', f"TIMESTAMP_TRUNC(at, HOUR, '{ROLLUP_TIMEZONE}')",
+                         activity, 'TRUE')
+    return sql.format(target=f"`{project_id}.{dataset_id}.{HOURLY_TABLE}`",
+                      target_since=f"T.period_start >= {since}")
+
+
+def daily_merge_sql(project_id, dataset_id):
+    """Fold the hourly rollup into days, for days since @since_day."""
+    sql = _merge_metrics('day, branch_name', f"DATE(period_start, '{ROLLUP_TIMEZONE}')",
+                         f"`{project_id}.{dataset_id}.{HOURLY_TABLE}`",
+                         f"period_start >= TIMESTAMP(@since_day, '{ROLLUP_TIMEZONE}')")
+    return sql.format(target=f"`{project_id}.{dataset_id}.{DAILY_TABLE}`", target_since="T.day >= @since_day")
+
+
+def distribution_merge_sql(project_id, dataset_id, source_table):
+    """Recompute the daily discount % distribution of requests submitted since @since_day."""
+    return f"""
+        MERGE `{project_id}.{dataset_id}.{DISTRIBUTION_TABLE}` T
+        USING (
+            {_requests_cte(source_table)}
+            SELECT DATE(created_at, '{ROLLUP_TIMEZONE}') AS day, branch_name,
+                   LEAST(GREATEST(CAST(FLOOR(IFNULL(discount_percentage, 0) / {DISCOUNT_BUCKET_WIDTH})
+                                       * {DISCOUNT_BUCKET_WIDTH} AS INT64), 0), 100) AS bucket,
+                   COUNT(*) AS requests
+            FROM requests
+            WHERE created_at >= TIMESTAMP(@since_day, '{ROLLUP_TIMEZONE}')
+            GROUP BY day, branch_name, bucket
+        ) S
+        ON T.day = S.day AND T.branch_name = S.branch_name AND T.bucket = S.bucket
+        WHEN MATCHED THEN UPDATE SET requests = S.requests, updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT (day, branch_name, bucket, requests, updated_at)
+            VALUES (S.day, S.branch_name, S.bucket, S.requests, CURRENT_TIMESTAMP())
+        WHEN NOT MATCHED BY SOURCE AND T.day >= @since_day THEN DELETE
+    """
+
+
+def rollup_since(client, project_id, dataset_id):
+    """First local day to recompute: the last rolled-up day minus the lookback."""
+    query = f"SELECT MAX(day) AS last_day FROM `{project_id}.{dataset_id}.{DAILY_TABLE}`"
+    rows = list(client.query(query).result())
+    last_day = rows[0]['last_day'] if rows else None
+    if last_day is None:
+        return EPOCH_DAY
+    return last_day - timedelta(days=ROLLUP_LOOKBACK_DAYS)
+
+
+def refresh_rollups(client, project_id, dataset_id, source_table='discount_requests', full=False):
+    """
+    Bring the rollup tables up to date. Returns the first day recomputed.
+
+    source_table is discount_requests, or request_state when requests are
+    event-sourced. full recomputes the whole history.
+    """
+    since_day = EPOCH_DAY if full else rollup_since(client, project_id, dataset_id)
+    source = f"{project_id}.{dataset_id}.{source_table}"
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter('since_day', 'DATE', since_day),
+    ])
+    # Daily is folded from hourly, so hourly must be merged first
+    for name, sql in (('hourly', hourly_merge_sql(project_id, dataset_id, source)),
+                      ('daily', daily_merge_sql(project_id, dataset_id)),
+                      ('distribution', distribution_merge_sql(project_id, dataset_id, source))):
+        job = client.query(sql, job_config=job_config)
+        job.result()
+        logger.info(f"Rolled up {name} since {since_day}: {job.num_dml_affected_rows or 0} rows changed")
+    return since_day
+
+
+def local_today():
+    return datetime.now(ZoneInfo(ROLLUP_TIMEZONE)).date()
+
+
+def _hours(seconds, count):
+    return round(seconds / count / 3600, 2) if count else None
+
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def _periods(date_from, date_to, granularity):
+    """Every period label in the range, so charts show gaps as zeros."""
+    if granularity == 'day':
+        return [(date_from + timedelta(days=n)).isoformat() for n in range((date_to - date_from).days + 1)]
+    tz = ZoneInfo(ROLLUP_TIMEZONE)
+    start = datetime(date_from.year, date_from.month, date_from.day, tzinfo=tz)
+    hours = ((date_to - date_from).days + 1) * 24
+    return [(start + timedelta(hours=n)).strftime('%Y-%m-%dT%H:00') for n in range(hours)]
+
+
+def _period_label(value, granularity):
+    if granularity == 'day':
+        return value.isoformat()
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(ZoneInfo(ROLLUP_TIMEZONE)).strftime('%Y-%m-%dT%H:00')
+
+
+def load_trends(client, project_id, dataset_id, date_from, date_to, granularity='day', branch=None,
+                branch_filter=''):
+    """
+    Chart data for a local date range (inclusive), read from the rollups.
+
+    Returns per-period submissions/decisions/time to approve, per-branch
+    approval rates and the discount % distribution.
+    """
+    if granularity not in MAX_DAYS:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    if date_from > date_to:
+        raise ValueError("The start date must not be after the end date")
+    if (date_to - date_from).days + 1 > MAX_DAYS[granularity]:
+        raise ValueError(f"At most {MAX_DAYS[granularity]} days can be charted by {granularity}")
+
+    params = [
+        bigquery.ScalarQueryParameter('date_from', 'DATE', date_from),
+        bigquery.ScalarQueryParameter('date_to', 'DATE', date_to),
+    ]
+    branch_condition = branch_filter
+    if branch:
+        branch_condition += " AND branch_name = @branch_name"
+        params.append(bigquery.ScalarQueryParameter('branch_name', 'STRING', branch))
+    job_config = bigquery.QueryJobConfig(query_parameters=params)
+
+    if granularity == 'day':
+        table, period_column, range_condition = DAILY_TABLE, 'day', "day BETWEEN @date_from AND @date_to"
+    else:
+        table, period_column = HOURLY_TABLE, 'period_start'
+        range_condition = (f"period_start >= TIMESTAMP(@date_from, '{ROLLUP_TIMEZONE}') "
+                           f"AND period_start < TIMESTAMP(DATE_ADD(@date_to, INTERVAL 1 DAY), '{ROLLUP_TIMEZONE}')")
+    rollup_query = f"""
+        SELECT {period_column} AS period, branch_name, {', '.join(METRIC_COLUMNS)}
+        FROM `{project_id}.{dataset_id}.{table}`
+        WHERE {range_condition} {branch_condition}
+    """
+    distribution_query = f"""
+        SELECT bucket, SUM(requests) AS requests
+        FROM `{project_id}.{dataset_id}.{DISTRIBUTION_TABLE}`
+        WHERE day BETWEEN @date_from AND @date_to {branch_condition}
+        GROUP BY bucket
+        ORDER BY bucket
+    """
+
+    empty = dict.fromkeys(METRIC_COLUMNS, 0)
+    periods = {label: dict(empty) for label in _periods(date_from, date_to, granularity)}
+    branches = {}
+    for row in client.query(rollup_query, job_config=job_config).result():
+        label = _period_label(row['period'], granularity)
+        for totals in (periods.setdefault(label, dict(empty)),
+                       branches.setdefault(row['branch_name'], dict(empty))):
+            for column in METRIC_COLUMNS:
+                totals[column] += row[column] or 0
+
+    def summarize(totals):
+        rejected = totals['l1_rejected'] + totals['l2_rejected']
+        return {
+            'submitted': totals['submitted'],
+            'approved': totals['l2_approved'],
+            'rejected': rejected,
+            'approval_rate': _ratio(totals['l2_approved'], totals['l2_approved'] + rejected),
+            'l1_hours_to_approve': _hours(totals['l1_approve_seconds_sum'], totals['l1_approved']),
+            'l2_hours_to_approve': _hours(totals['l2_approve_seconds_sum'], totals['l2_approved']),
+            'approved_net_discount': round(totals['approved_net_discount_sum'], 2),
+        }
+
+    overall = dict(empty)
+    for totals in branches.values():
+        for column in METRIC_COLUMNS:
+            overall[column] += totals[column]
+
+    return {
+        'granularity': granularity,
+        'periods': [dict(summarize(totals), period=label) for label, totals in sorted(periods.items())],
+        'branches': [dict(summarize(totals), branch_name=name,
+                          avg_discount_percentage=round(totals['discount_percentage_sum'] / totals['submitted'], 2)
+                          if totals['submitted'] else None)
+                     for name, totals in sorted(branches.items())],
+        'discount_distribution': [
+            {'bucket': f"{row['bucket']}-{row['bucket'] + DISCOUNT_BUCKET_WIDTH}%", 'requests': row['requests']}
+            for row in client.query(distribution_query, job_config=job_config).result()
+        ],
+        'totals': summarize(overall),
+    }
+
+
+def main():
+    """Refresh the rollups from the command line."""
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description='Refresh the analytics rollup tables')
+    parser.add_argument('--full', action='store_true', help='Recompute the whole history')
+    parser.add_argument('--source', choices=['discount_requests', 'request_state'],
+                        help='Request table to roll up (default: request_state when EVENT_SOURCED_REQUESTS=true)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, str(Path(__file__).parent))
+    import app as discount_app
+
+    client = discount_app.get_bigquery_client()
+    if client is None:
+        logger.error("BigQuery client not available")
+        sys.exit(1)
+    source = args.source or ('request_state' if discount_app.EVENT_SOURCED_REQUESTS else 'discount_requests')
+    try:
+        refresh_rollups(client, discount_app.project_id, discount_app.dataset_id, source, full=args.full)
+    except Exception as e:
+        logger.error(f"Rollup refresh failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
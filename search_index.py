@@ -0,0 +1,186 @@
+"""
+In-process search over discount requests.
+
+An inverted trigram index over enquiry_no, student_name, mobile_no,
+requester_email and branch_name answers substring and prefix queries
+("EN12345", "ravi kum", "98765", "kolk") without a LIKE scan in BigQuery.
+Each word is indexed with a leading start marker, so two-letter queries
+match word prefixes and longer queries match anywhere; candidates from the
+posting-list intersection are then verified and ranked (exact field > field
+prefix > word prefix > substring, weighted by field).
+
+The index is seeded from the request event log's projection and kept
+current by subscribing to its events, like the SLA tracker.
+"""
+
+import re
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SEARCH_RESULT_LIMIT = 20
+MIN_TERM_LENGTH = 2
+START = '^'
+
+# Field -> ranking weight
+SEARCH_FIELDS = {
+    'enquiry_no': 3,
+    'mobile_no': 3,
+    'student_name': 2,
+    'requester_email': 1,
+    'branch_name': 1,
+}
+
+RESULT_COLUMNS = ['enquiry_no', 'student_name', 'mobile_no', 'branch_name', 'card_name',
+                  'requester_email', 'status', 'created_at']
+
+_WORD_SPLIT = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(value):
+    return str(value or '').lower().strip()
+
+
+def words(text):
+    return [word for word in _WORD_SPLIT.split(text) if word]
+
+
+def grams(word):
+    """Trigrams of a word with a start marker ('^ra', 'rav', 'avi' for 'ravi')."""
+    padded = START + word
+    if len(padded) < 3:
+        return {padded}
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def query_grams(term):
+    """Grams every match of term must contain (prefix-only for two-letter terms)."""
+    if len(term) < 3:
+        return {START + term}
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def match_score(term, field_text, field_words):
+    if field_text == term:
+        return 100
+    if field_text.startswith(term):
+        return 50
+    if any(word.startswith(term) for word in field_words):
+        return 30
+    if len(term) >= 3 and term in field_text:
+        return 10
+    return 0
+
+
+class SearchIndex:
+    """Trigram inverted index over the searchable request fields."""
+
+    def __init__(self, event_log=None):
+        self.event_log = event_log
+        self.seeded = False
+        self._postings = {}
+        self._docs = {}
+        self._rows = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, row):
+        """Index (or re-index) one request row."""
+        enquiry_no = row.get('enquiry_no')
+        if not enquiry_no:
+            return
+        fields = {}
+        for name in SEARCH_FIELDS:
+            text = normalize(row.get(name))
+            if name == 'mobile_no':
+                text = re.sub(r'\D', '', text)
+            fields[name] = (text, words(text))
+        doc_grams = set()
+        for text, field_words in fields.values():
+            for word in field_words:
+                doc_grams |= grams(word)
+        with self._lock:
+            self.remove(enquiry_no)
+            self._docs[enquiry_no] = (fields, doc_grams)
+            self._rows[enquiry_no] = {name: row.get(name) for name in RESULT_COLUMNS}
+            for gram in doc_grams:
+                self._postings.setdefault(gram, set()).add(enquiry_no)
+
+    def remove(self, enquiry_no):
+        with self._lock:
+            doc = self._docs.pop(enquiry_no, None)
+            self._rows.pop(enquiry_no, None)
+            if doc is None:
+                return
+            for gram in doc[1]:
+                postings = self._postings.get(gram)
+                if postings is not None:
+                    postings.discard(enquiry_no)
+                    if not postings:
+                        del self._postings[gram]
+
+    def _seed(self, rows):
+        with self._lock:
+            for row in rows:
+                self.add(row)
+            self.seeded = True
+        logger.info(f"Search index seeded with {len(self._docs)} requests")
+
+    def ensure_seeded(self):
+        """Seed from the event log's projection once it is loaded; later calls tail new events."""
+        if self.event_log is None:
+            return True
+        if not self.seeded:
+            if not self.event_log.ensure_loaded():
+                return False
+            with self._lock:
+                if not self.seeded:
+                    self.event_log.with_rows(self._seed)
+        self.event_log.sync()
+        return True
+
+    def on_request_event(self, event, row, previous_status):
+        """RequestEventLog listener: re-index the changed request."""
+        if self.seeded:
+            self.add(row)
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT, visible=None):
+        """
+        Ranked requests matching every term of query.
+
+        visible(row) filters what the caller may see. Results carry a score;
+        ties go to the newest request.
+        """
+        terms = [term for term in words(normalize(query)) if len(term) >= MIN_TERM_LENGTH]
+        if not terms:
+            return []
+        with self._lock:
+            candidates = None
+            for term in terms:
+                postings = [self._postings.get(gram, set()) for gram in query_grams(term)]
+                matches = set.intersection(*postings) if postings else set()
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    return []
+
+            results = []
+            for enquiry_no in candidates:
+                fields, _ = self._docs[enquiry_no]
+                score = 0
+                for term in terms:
+                    best = max(match_score(term, text, field_words) * SEARCH_FIELDS[name]
+                               for name, (text, field_words) in fields.items())
+                    if not best:
+                        break  # the grams matched across words, not the term itself
+                    score += best
+                else:
+                    row = self._rows[enquiry_no]
+                    if visible is None or visible(row):
+                        results.append(dict(row, score=score))
+
+        results.sort(key=lambda r: str(r.get('created_at') or ''), reverse=True)
+        results.sort(key=lambda r: r['score'], reverse=True)
+        return results[:limit]
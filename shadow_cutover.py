@@ -0,0 +1,273 @@
+"""
+Cutover to the normalized schema, rehearsed on production traffic.
+
+CUTOVER_MODE decides how the app uses the normalized tables (students,
+discount_requests_new, pricing_snapshots, request_approvals) before
+USE_ENHANCED_DATA_ACCESS is switched on:
+
+- ``off`` (default): not at all;
+- ``dual_write``: every submission and approval this process records is
+  mirrored into the normalized tables by a background thread, in event order
+  and off the request path (ShadowWriter, a local-only event log listener);
+- ``shadow``: dual writes, plus a sampled fraction (SHADOW_READ_SAMPLE_RATE) of
+  reads is repeated against DiscountDataAccess in the background, compared
+  with what the legacy path returned and timed on both stacks (ShadowReader).
+
+Mirror failures and read mismatches are logged; counts and latency histograms
+are rendered for ``/metrics``.
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from request_events import EVENT_SUBMITTED, EVENT_REJECTED
+from metrics import Histogram, format_labels, format_bound
+from sla_tracker import to_epoch
+
+logger = logging.getLogger(__name__)
+
+CUTOVER_MODES = ('off', 'dual_write', 'shadow')
+CUTOVER_MODE = os.getenv('CUTOVER_MODE', 'off').lower()
+SHADOW_READ_SAMPLE_RATE = float(os.getenv('SHADOW_READ_SAMPLE_RATE', 0.05))
+SHADOW_READ_WORKERS = int(os.getenv('SHADOW_READ_WORKERS', 2))
+# Events waiting to be mirrored; beyond this new events are dropped (and counted)
+SHADOW_WRITE_QUEUE_SIZE = int(os.getenv('SHADOW_WRITE_QUEUE_SIZE', 10000))
+
+# Histogram bucket upper bounds in seconds
+READ_BUCKETS_SECONDS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+LAG_BUCKETS_SECONDS = [1, 5, 15, 60, 300, 900, 3600]
+
+if CUTOVER_MODE not in CUTOVER_MODES:
+    logger.warning(f"Unknown CUTOVER_MODE {CUTOVER_MODE!r}; using 'off'")
+    CUTOVER_MODE = 'off'
+
+
+class ShadowWriter:
+    """Mirrors recorded request events into the normalized tables."""
+
+    def __init__(self, data_access_getter, queue_size=SHADOW_WRITE_QUEUE_SIZE):
+        """data_access_getter() returns a DiscountDataAccess (or None if BigQuery is unavailable)."""
+        self.data_access_getter = data_access_getter
+        self.counts = {'mirrored': 0, 'failed': 0, 'dropped': 0}
+        self.lag = Histogram(LAG_BUCKETS_SECONDS)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def on_request_event(self, event, row, previous_status):
+        """RequestEventLog listener (subscribe with local_only=True)."""
+        if event.get('request_id'):
+            # Recorded by the enhanced data access path, already in the normalized tables
+            return
+        try:
+            self._queue.put_nowait((event, dict(row)))
+        except queue.Full:
+            with self._lock:
+                self.counts['dropped'] += 1
+            logger.error(f"Shadow write queue full; {event['event_type']} for {event['enquiry_no']} not mirrored")
+            return
+        self._ensure_started()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='shadow-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # One thread, so a request's approvals are mirrored after its submission
+        while True:
+            event, row = self._queue.get()
+            try:
+                mirrored = self.mirror(event, row)
+            except Exception as e:
+                logger.error(f"Error mirroring {event['event_type']} for {event['enquiry_no']}: {e}")
+                mirrored = False
+            occurred = to_epoch(event.get('occurred_at'))
+            with self._lock:
+                self.counts['mirrored' if mirrored else 'failed'] += 1
+                if mirrored and occurred:
+                    self.lag.observe(max(0.0, time.time() - occurred))
+            self._queue.task_done()
+
+    def join(self):
+        """Block until every queued event has been mirrored (or failed)."""
+        self._queue.join()
+
+    def mirror(self, event, row):
+        """Apply one event to the normalized tables. Returns True on success."""
+        data_access = self.data_access_getter()
+        if data_access is None or not data_access.client:
+            return False
+        if event['event_type'] == EVENT_SUBMITTED:
+            return self._mirror_submission(data_access, event, row)
+        return self._mirror_transition(data_access, event)
+
+    def _mirror_submission(self, data_access, event, row):
+        course = data_access.get_course_details(row['branch_name'], row['card_name'])
+        if not course:
+            logger.warning(f"Not mirroring {row['enquiry_no']}: no course for {row['branch_name']}/{row['card_name']}")
+            return False
+        student_id = data_access.create_or_get_student(row['enquiry_no'], row['student_name'], row['mobile_no'])
+        if not student_id:
+            return False
+        # Snapshot the prices the request was made at, not today's catalog
+        pricing = dict(course, mrp=row.get('mrp') or course['mrp'],
+                       installment=row.get('installment') or course['installment'])
+        request_id = data_access.create_discount_request(
+            student_id=student_id,
+            course_id=course['course_id'],
+            course_details=pricing,
+            requested_discount_amount=row['discount_amount'],
+            discount_reason=row['reason'],
+            remarks=row.get('remarks'),
+            requester_email=row['requester_email'],
+            requester_name=row['requester_name'],
+            request_id=event.get('request_id'),
+            # Keeps the request in the same date shard for verify_consistency.py
+            created_at=row.get('created_at'),
+            assigned_to=row.get('assigned_to'),
+        )
+        return request_id is not None
+
+    def _mirror_transition(self, data_access, event):
+        request_id = data_access.get_request_id(event['enquiry_no'])
+        if request_id is None:
+            logger.warning(f"Not mirroring {event['event_type']} for {event['enquiry_no']}: "
+                           f"request not in discount_requests_new")
+            return False
+        payload = event['payload']
+        if isinstance(payload, str):
+            payload = json.loads(payload or '{}')
+        return data_access.approve_or_reject_request(
+            request_id=request_id,
+            action='REJECT' if event['event_type'] == EVENT_REJECTED else 'APPROVE',
+            approver_level=event['actor_level'],
+            approver_email=event['actor_email'],
+            # Approver names are not in the event (migration 002 does the same)
+            approver_name=f"{event['actor_level']} Approver",
+            approved_amount=payload.get('approved_amount'),
+            comments=payload.get('comments') or '',
+        )
+
+    def render_metrics(self):
+        """Prometheus text exposition of the dual-write counters."""
+        lines = ['# HELP cutover_shadow_writes_total Request events mirrored into the normalized tables',
+                 '# TYPE cutover_shadow_writes_total counter']
+        with self._lock:
+            for result, count in sorted(self.counts.items()):
+                lines.append(f"cutover_shadow_writes_total{{{format_labels(result=result)}}} {count}")
+            lines += ['# HELP cutover_shadow_write_queue_depth Request events waiting to be mirrored',
+                      '# TYPE cutover_shadow_write_queue_depth gauge',
+                      f"cutover_shadow_write_queue_depth {self._queue.qsize()}",
+                      '# HELP cutover_shadow_write_lag_seconds Time from an event to its mirrored write',
+                      '# TYPE cutover_shadow_write_lag_seconds histogram']
+            for bound, count in self.lag.cumulative():
+                lines.append(f'cutover_shadow_write_lag_seconds_bucket{{le="{format_bound(bound)}"}} {count}')
+            lines.append(f"cutover_shadow_write_lag_seconds_sum {self.lag.sum:.3f}")
+            lines.append(f"cutover_shadow_write_lag_seconds_count {self.lag.count}")
+        return '\n'.join(lines) + '\n'
+
+
+def describe_mismatch(expected, actual):
+    """Short description of how the normalized result differs from the legacy one."""
+    if isinstance(expected, (set, frozenset)) and isinstance(actual, (set, frozenset)):
+        missing, extra = sorted(expected - actual), sorted(actual - expected)
+        return (f"{len(missing)} missing {missing[:5]}, {len(extra)} extra {extra[:5]} "
+                f"({len(expected)} legacy, {len(actual)} normalized)")
+    return f"legacy {expected!r}, normalized {actual!r}"
+
+
+class ReadStats:
+    def __init__(self):
+        self.reads = 0
+        self.mismatches = 0
+        self.errors = 0
+        self.seconds = {'legacy': Histogram(READ_BUCKETS_SECONDS), 'normalized': Histogram(READ_BUCKETS_SECONDS)}
+
+
+class ShadowReader:
+    """Repeats a sample of reads on the normalized stack and compares the results."""
+
+    def __init__(self, sample_rate=SHADOW_READ_SAMPLE_RATE, workers=SHADOW_READ_WORKERS):
+        self.sample_rate = sample_rate
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shadow-read')
+
+    def read(self, name, legacy, normalized, key=None):
+        """
+        Return legacy(). For a sampled fraction of calls, normalized() also runs
+        in the background and key(result) of the two is compared.
+        """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return legacy()
+        started = time.perf_counter()
+        result = legacy()
+        legacy_seconds = time.perf_counter() - started
+        try:
+            self._executor.submit(self._compare, name, result, legacy_seconds, normalized, key or (lambda value: value))
+        except RuntimeError:
+            pass  # shutting down
+        return result
+
+    def _stats_for(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = ReadStats()
+        return stats
+
+    def _compare(self, name, legacy_result, legacy_seconds, normalized, key):
+        started = time.perf_counter()
+        try:
+            normalized_result = normalized()
+            normalized_seconds = time.perf_counter() - started
+            expected, actual = key(legacy_result), key(normalized_result)
+        except Exception as e:
+            logger.error(f"Shadow read {name} failed: {e}")
+            with self._lock:
+                self._stats_for(name).errors += 1
+            return
+        with self._lock:
+            stats = self._stats_for(name)
+            stats.reads += 1
+            stats.seconds['legacy'].observe(legacy_seconds)
+            stats.seconds['normalized'].observe(normalized_seconds)
+            if expected != actual:
+                stats.mismatches += 1
+        if expected != actual:
+            logger.warning(f"Shadow read mismatch for {name}: {describe_mismatch(expected, actual)}")
+
+    def close(self):
+        """Wait for in-flight comparisons."""
+        self._executor.shutdown(wait=True)
+
+    def render_metrics(self):
+        """Prometheus text exposition of shadow read results and latencies."""
+        lines = []
+        with self._lock:
+            stats = sorted(self._stats.items())
+            for metric, attribute, help_text in (
+                    ('cutover_shadow_reads_total', 'reads', 'Reads compared between the legacy and normalized stacks'),
+                    ('cutover_shadow_read_mismatches_total', 'mismatches', 'Compared reads whose results differed'),
+                    ('cutover_shadow_read_errors_total', 'errors', 'Shadow reads that failed on the normalized stack')):
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+                for name, read_stats in stats:
+                    lines.append(f"{metric}{{{format_labels(read=name)}}} {getattr(read_stats, attribute)}")
+
+            lines += ['# HELP cutover_read_seconds Latency of sampled reads on each stack',
+                      '# TYPE cutover_read_seconds histogram']
+            for name, read_stats in stats:
+                for stack, histogram in sorted(read_stats.seconds.items()):
+                    labels = format_labels(read=name, stack=stack)
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'cutover_read_seconds_bucket{{{labels},le="{format_bound(bound)}"}} {count}')
+                    lines.append(f"cutover_read_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                    lines.append(f"cutover_read_seconds_count{{{labels}}} {histogram.count}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,280 @@
+"""
+Approval SLA tracking: queue depth, queue age and time-in-state.
+
+The tracker subscribes to the request event log (request_events.py) and is
+seeded once from its in-memory projection; after that every submission and
+approval updates it in O(log n), with no re-scan of discount_requests:
+
+- each approver queue (see the app's route function) keeps its pending
+  requests sorted by the time they entered the queue, so depth, the oldest
+  request and an age histogram are a few bisects at scrape time;
+- every completed state (PENDING_L1, PENDING_L2) records how long the request
+  spent there in a per-approver histogram;
+- requests older than their level's SLA fire the escalation hooks once.
+
+Metrics are rendered in the Prometheus text format for ``/metrics``.
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+from datetime import datetime
+
+from approval_workflow import STATUS_PENDING_L1, STATUS_PENDING_L2
+from metrics import Histogram, format_labels, format_bound
+
+logger = logging.getLogger(__name__)
+
+SLA_L1_HOURS = float(os.getenv('SLA_L1_HOURS', 24))
+SLA_L2_HOURS = float(os.getenv('SLA_L2_HOURS', 48))
+# How often escalations are checked (and other workers' events tailed)
+SLA_CHECK_SECONDS = int(os.getenv('SLA_CHECK_SECONDS', 60))
+
+# Histogram bucket upper bounds in seconds: 15m, 1h, 4h, 8h, 1d, 2d, 3d, 1w
+SLA_BUCKETS_SECONDS = [900, 3600, 4 * 3600, 8 * 3600, 24 * 3600, 48 * 3600, 72 * 3600, 168 * 3600]
+
+PENDING_STATUSES = (STATUS_PENDING_L1, STATUS_PENDING_L2)
+
+
+def to_epoch(value):
+    """Seconds since the epoch for an ISO timestamp (as kept in the projection)."""
+    if not value:
+        return None
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def entered_at(row):
+    """When a pending request entered its current status."""
+    if row['status'] == STATUS_PENDING_L2:
+        return to_epoch(row.get('l1_approved_at') or row.get('last_event_at'))
+    return to_epoch(row.get('created_at') or row.get('last_event_at'))
+
+
+class QueueIndex:
+    """Pending requests of one queue, ordered by the time they entered it."""
+
+    def __init__(self):
+        self.entries = []
+        self.entered_sum = 0.0
+
+    def add(self, entered, enquiry_no):
+        bisect.insort(self.entries, (entered, enquiry_no))
+        self.entered_sum += entered
+
+    def remove(self, entered, enquiry_no):
+        index = bisect.bisect_left(self.entries, (entered, enquiry_no))
+        if index < len(self.entries) and self.entries[index] == (entered, enquiry_no):
+            self.entries.pop(index)
+            self.entered_sum -= entered
+
+    def older_than(self, cutoff):
+        """Entries that entered the queue at or before cutoff, oldest first."""
+        return self.entries[:bisect.bisect_right(self.entries, (cutoff, '\uffff'))]
+
+    def age_histogram(self, now, bounds=SLA_BUCKETS_SECONDS):
+        """Cumulative [(bound, count)] of current ages, computed with one bisect per bucket."""
+        result = []
+        for bound in bounds:
+            younger = len(self.entries) - bisect.bisect_left(self.entries, (now - bound, ''))
+            result.append((bound, younger))
+        result.append((None, len(self.entries)))
+        return result
+
+
+class SLATracker:
+    """Incremental queue depth/age and time-in-state metrics, with escalation hooks."""
+
+    def __init__(self, event_log, route, thresholds=None, check_interval=SLA_CHECK_SECONDS):
+        """
+        route(status, branch_name, assigned_to) names the approver queue a
+        pending request waits in; thresholds maps a pending status to its SLA in seconds.
+        """
+        self.event_log = event_log
+        self.route = route
+        self.thresholds = thresholds or {
+            STATUS_PENDING_L1: SLA_L1_HOURS * 3600,
+            STATUS_PENDING_L2: SLA_L2_HOURS * 3600,
+        }
+        self.check_interval = check_interval
+        self.seeded = False
+        self._queues = {}
+        self._tracked = {}
+        self._state_seconds = {}
+        self._breaches = {}
+        self._escalated = set()
+        self._hooks = []
+        self._lock = threading.RLock()
+        self._check_lock = threading.Lock()
+        self._last_check = 0.0
+
+    def add_escalation_hook(self, hook):
+        """Register hook(request, status, age_seconds, threshold_seconds) for SLA breaches."""
+        self._hooks.append(hook)
+
+    def _track(self, row, entered):
+        status = row['status']
+        key = (self.route(status, row.get('branch_name'), row.get('assigned_to')), status)
+        self._queues.setdefault(key, QueueIndex()).add(entered, row['enquiry_no'])
+        self._tracked[row['enquiry_no']] = {
+            'key': key,
+            'entered': entered,
+            'enquiry_no': row['enquiry_no'],
+            'student_name': row.get('student_name'),
+            'branch_name': row.get('branch_name'),
+        }
+
+    def _untrack(self, enquiry_no):
+        tracked = self._tracked.pop(enquiry_no, None)
+        if tracked is not None:
+            self._queues[tracked['key']].remove(tracked['entered'], enquiry_no)
+            self._escalated.discard((enquiry_no, tracked['key'][1]))
+        return tracked
+
+    def _seed(self, rows):
+        with self._lock:
+            for row in rows:
+                if row['status'] in PENDING_STATUSES:
+                    entered = entered_at(row)
+                    if entered is not None:
+                        self._track(row, entered)
+            self.seeded = True
+        logger.info(f"SLA tracker seeded with {len(self._tracked)} pending requests")
+
+    def ensure_seeded(self):
+        """Seed from the event log's projection once it is loaded."""
+        if self.seeded:
+            return True
+        if not self.event_log.ensure_loaded():
+            return False
+        with self._lock:
+            if not self.seeded:
+                self.event_log.with_rows(self._seed)
+        return True
+
+    def on_request_event(self, event, row, previous_status):
+        """RequestEventLog listener: move the request between queues and time the state it left."""
+        if not self.seeded:
+            return
+        occurred = to_epoch(event.get('occurred_at'))
+        with self._lock:
+            tracked = self._tracked.get(row['enquiry_no'])
+            if tracked is not None and tracked['key'][1] == row['status']:
+                return  # already reflected by the seed
+            self._untrack(row['enquiry_no'])
+            if tracked is not None and occurred is not None and tracked['key'][1] == previous_status:
+                histogram_key = (previous_status, event.get('actor_email') or '')
+                self._state_seconds.setdefault(histogram_key, Histogram(SLA_BUCKETS_SECONDS)).observe(
+                    max(occurred - tracked['entered'], 0))
+            if row['status'] in PENDING_STATUSES and occurred is not None:
+                self._track(row, occurred)
+
+    def check_escalations(self, now=None):
+        """Fire hooks for requests that passed their SLA since the last check. Returns how many."""
+        now = now or time.time()
+        breached = []
+        with self._lock:
+            for (queue, status), index in self._queues.items():
+                threshold = self.thresholds.get(status)
+                if threshold is None:
+                    continue
+                for entered, enquiry_no in index.older_than(now - threshold):
+                    if (enquiry_no, status) in self._escalated:
+                        continue
+                    self._escalated.add((enquiry_no, status))
+                    self._breaches[status] = self._breaches.get(status, 0) + 1
+                    breached.append((dict(self._tracked[enquiry_no], queue=queue), status, now - entered, threshold))
+        for request, status, age, threshold in breached:
+            for hook in self._hooks:
+                try:
+                    hook(request, status, age, threshold)
+                except Exception as e:
+                    logger.error(f"SLA escalation hook {hook} failed: {e}")
+        return len(breached)
+
+    def check(self):
+        """Tail new events and run the escalation check."""
+        if not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            if self.ensure_seeded():
+                self.event_log.sync()
+                self.check_escalations()
+        except Exception as e:
+            logger.error(f"SLA check failed: {e}")
+        finally:
+            self._check_lock.release()
+
+    def maybe_check(self):
+        """Kick a background check if the interval has elapsed (cheap to call per request)."""
+        if time.monotonic() - self._last_check < self.check_interval or self._check_lock.locked():
+            return
+        threading.Thread(target=self.check, daemon=True).start()
+
+    def summary(self, now=None):
+        """Per-queue depth, oldest age and SLA breaches, for the dashboard."""
+        now = now or time.time()
+        result = []
+        with self._lock:
+            for (queue, status), index in sorted(self._queues.items()):
+                if not index.entries:
+                    continue
+                threshold = self.thresholds.get(status)
+                result.append({
+                    'queue': queue,
+                    'status': status,
+                    'depth': len(index.entries),
+                    'oldest_hours': round((now - index.entries[0][0]) / 3600, 1),
+                    'average_hours': round((now * len(index.entries) - index.entered_sum)
+                                           / len(index.entries) / 3600, 1),
+                    'breached': len(index.older_than(now - threshold)) if threshold else 0,
+                    'sla_hours': round(threshold / 3600, 1) if threshold else None,
+                })
+        return result
+
+    def render_metrics(self, now=None):
+        """Prometheus text exposition of the SLA metrics."""
+        now = now or time.time()
+        lines = []
+        with self._lock:
+            queues = sorted(self._queues.items())
+            lines += ['# HELP discount_request_queue_depth Requests waiting in each approver queue',
+                      '# TYPE discount_request_queue_depth gauge']
+            for (queue, status), index in queues:
+                lines.append(f"discount_request_queue_depth{{{format_labels(queue=queue, status=status)}}} "
+                             f"{len(index.entries)}")
+
+            lines += ['# HELP discount_request_queue_oldest_seconds Age of the oldest request in each queue',
+                      '# TYPE discount_request_queue_oldest_seconds gauge']
+            for (queue, status), index in queues:
+                oldest = now - index.entries[0][0] if index.entries else 0
+                lines.append(f"discount_request_queue_oldest_seconds{{{format_labels(queue=queue, status=status)}}} "
+                             f"{oldest:.0f}")
+
+            lines += ['# HELP discount_request_queue_age_seconds Current age of the requests in each queue',
+                      '# TYPE discount_request_queue_age_seconds histogram']
+            for (queue, status), index in queues:
+                labels = format_labels(queue=queue, status=status)
+                for bound, count in index.age_histogram(now):
+                    lines.append(f'discount_request_queue_age_seconds_bucket{{{labels},le="{format_bound(bound)}"}} {count}')
+                age_sum = now * len(index.entries) - index.entered_sum
+                lines.append(f"discount_request_queue_age_seconds_sum{{{labels}}} {age_sum:.0f}")
+                lines.append(f"discount_request_queue_age_seconds_count{{{labels}}} {len(index.entries)}")
+
+            lines += ['# HELP discount_request_state_seconds Time requests spent in a status before an approver acted',
+                      '# TYPE discount_request_state_seconds histogram']
+            for (status, approver), histogram in sorted(self._state_seconds.items()):
+                labels = format_labels(status=status, approver=approver)
+                for bound, count in histogram.cumulative():
+                    lines.append(f'discount_request_state_seconds_bucket{{{labels},le="{format_bound(bound)}"}} {count}')
+                lines.append(f"discount_request_state_seconds_sum{{{labels}}} {histogram.sum:.0f}")
+                lines.append(f"discount_request_state_seconds_count{{{labels}}} {histogram.count}")
+
+            lines += ['# HELP discount_request_sla_breaches_total Requests that passed their SLA in a status',
+                      '# TYPE discount_request_sla_breaches_total counter']
+            for status in PENDING_STATUSES:
+                lines.append(f"discount_request_sla_breaches_total{{{format_labels(status=status)}}} "
+                             f"{self._breaches.get(status, 0)}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,130 @@
+"""
+Per-student request history, cached in process.
+
+A student's history (see DiscountDataAccess.get_student_history) comes from
+one joined query over students, discount_requests_new and request_approvals.
+Approvers open it for every request they review, so results are kept in a
+small LRU cache. Entries are dropped when the request event log reports a new
+request or approval for the same enquiry number or mobile number, and expire
+after STUDENT_HISTORY_CACHE_SECONDS regardless.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+STUDENT_HISTORY_CACHE_SIZE = int(os.getenv('STUDENT_HISTORY_CACHE_SIZE', 1024))
+STUDENT_HISTORY_CACHE_SECONDS = int(os.getenv('STUDENT_HISTORY_CACHE_SECONDS', 600))
+
+
+def identities(enquiry_no=None, mobile_no=None):
+    """Invalidation keys for a student: its enquiry number and normalized mobile number."""
+    keys = set()
+    if enquiry_no:
+        keys.add(('enquiry_no', enquiry_no))
+    mobile = re.sub(r'\D', '', str(mobile_no or ''))
+    if mobile:
+        keys.add(('mobile_no', mobile))
+    return keys
+
+
+def summarize_history(history):
+    """Counts an approver looks at first: requests by status, branches and enquiry numbers."""
+    requests = history['requests'] if history else []
+    statuses = [row['status'] for row in requests]
+    return {
+        'requests': len(requests),
+        'approved': statuses.count('APPROVED'),
+        'rejected': statuses.count('REJECTED'),
+        'pending': sum(1 for status in statuses if status and status.startswith('PENDING')),
+        'branches': sorted({row['branch_name'] for row in requests if row.get('branch_name')}),
+        'enquiry_numbers': sorted({row['enquiry_no'] for row in requests if row.get('enquiry_no')}),
+    }
+
+
+class StudentHistoryCache:
+    """LRU cache of student histories keyed by enquiry number."""
+
+    def __init__(self, loader, maxsize=STUDENT_HISTORY_CACHE_SIZE, ttl=STUDENT_HISTORY_CACHE_SECONDS):
+        """loader(enquiry_no) returns the history dict, or None if it could not be loaded."""
+        self.loader = loader
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._keys_by_identity = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _identities_of(self, enquiry_no, history):
+        keys = identities(enquiry_no)
+        for row in [history.get('student') or {}] + history.get('requests', []):
+            keys |= identities(row.get('enquiry_no'), row.get('mobile_no'))
+        return keys
+
+    def _drop(self, enquiry_no):
+        entry = self._entries.pop(enquiry_no, None)
+        if entry is None:
+            return
+        for identity in entry[2]:
+            cached = self._keys_by_identity.get(identity)
+            if cached is not None:
+                cached.discard(enquiry_no)
+                if not cached:
+                    del self._keys_by_identity[identity]
+
+    def get(self, enquiry_no):
+        """The student's history, from the cache when fresh."""
+        with self._lock:
+            entry = self._entries.get(enquiry_no)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(enquiry_no)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        history = self.loader(enquiry_no)
+        if history is None:
+            return None
+
+        with self._lock:
+            # An invalidation while loading may mean the result is already stale
+            if generation == self._generation:
+                self._drop(enquiry_no)
+                keys = self._identities_of(enquiry_no, history)
+                self._entries[enquiry_no] = (time.monotonic(), history, keys)
+                for identity in keys:
+                    self._keys_by_identity.setdefault(identity, set()).add(enquiry_no)
+                while len(self._entries) > self.maxsize:
+                    self._drop(next(iter(self._entries)))
+        return history
+
+    def invalidate(self, enquiry_no=None, mobile_no=None):
+        """Drop every cached history that includes this enquiry or mobile number."""
+        with self._lock:
+            self._generation += 1
+            stale = set()
+            for identity in identities(enquiry_no, mobile_no):
+                stale |= self._keys_by_identity.get(identity, set())
+            for key in stale:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_identity.clear()
+
+    def on_request_event(self, event, row, previous_status):
+        """RequestEventLog listener: new requests and approvals change the student's history."""
+        self.invalidate(row.get('enquiry_no'), row.get('mobile_no'))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-mapped Arrow analytics snapshot.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import pyarrow as pa
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from analytics_snapshot import AnalyticsSnapshot, SNAPSHOT_SCHEMA
+from live_updates import QueueScope
+from fake_bigquery import ArrowRows, FakeClient
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+
+def snapshot_row(enquiry_no, branch, status, created_at, percentage, net_discount, card='Lakshya'):
+    return {
+        'enquiry_no': enquiry_no, 'branch_name': branch, 'card_name': card,
+        'requester_email': 'counselor@pw.live', 'status': status,
+        'created_at': created_at, 'month': created_at.strftime('%Y-%m'),
+        'mrp': 50000.0, 'installment': 40000.0, 'discount_percentage': percentage,
+        'net_discount': net_discount,
+        'is_approved': int(status == 'APPROVED'), 'is_rejected': int(status == 'REJECTED'),
+        'is_pending': int(status.startswith('PENDING')),
+    }
+
+
+ROWS = [
+    snapshot_row('EN000000001', 'Delhi', 'APPROVED', datetime(2025, 1, 5, tzinfo=timezone.utc), 40.0, 16000.0),
+    snapshot_row('EN000000002', 'Delhi', 'REJECTED', datetime(2025, 1, 31, 23, tzinfo=timezone.utc), 50.0, 20000.0),
+    snapshot_row('EN000000003', 'Delhi', 'PENDING_L1', datetime(2025, 2, 1, tzinfo=timezone.utc), 35.0, 14000.0),
+    snapshot_row('EN000000004', 'Kolkata', 'APPROVED', datetime(2025, 2, 10, tzinfo=timezone.utc), 45.0, 18000.0),
+]
+
+
+class SnapshotClient(FakeClient):
+    """Answers the snapshot query with ROWS in two batches, to check the snapshot is appended batch by batch."""
+
+    def __init__(self):
+        super().__init__(ArrowRows([pa.RecordBatch.from_pylist(ROWS[:2], schema=SNAPSHOT_SCHEMA),
+                                    pa.RecordBatch.from_pylist(ROWS[2:], schema=SNAPSHOT_SCHEMA)]))
+
+
+class TestAnalyticsSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'snapshot.arrow')
+        self.client = SnapshotClient()
+        self.snapshot = AnalyticsSnapshot(lambda: self.client, PROJECT_ID, DATASET_ID, path=self.path, ttl=60)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_group_by_branch(self):
+        groups = self.snapshot.summarize(['branch'])
+        self.assertEqual([g['branch'] for g in groups], ['Delhi', 'Kolkata'])
+        delhi = groups[0]
+        self.assertEqual((delhi['total'], delhi['approved'], delhi['rejected'], delhi['pending']), (3, 1, 1, 1))
+        self.assertEqual(delhi['approval_rate'], 0.5)
+        self.assertEqual(delhi['avg_discount_percentage'], 41.67)
+        self.assertEqual(delhi['approved_net_discount'], 16000.0)
+
+        # Served from the mapped snapshot: one BigQuery job in total
+        self.snapshot.summarize(['month', 'status'])
+        self.assertEqual(len(self.client.queries), 1)
+
+    def test_filters_and_scope(self):
+        january = self.snapshot.summarize(['month'], date_from=date(2025, 1, 1), date_to=date(2025, 1, 31))
+        self.assertEqual([(g['month'], g['total']) for g in january], [('2025-01', 2)])
+
+        east = self.snapshot.summarize([], scope=QueueScope('PENDING_L1', branch_in=['Kolkata']))
+        self.assertEqual(east[0]['total'], 1)
+        self.assertEqual(self.snapshot.summarize(['branch'], branch='Mumbai'), [])
+        with self.assertRaises(ValueError):
+            self.snapshot.summarize(['mobile_no'])
+
+    def test_snapshot_source(self):
+        self.snapshot.table()
+        self.assertIn(f'`{PROJECT_ID}.{DATASET_ID}.discount_requests`', self.client.queries[-1][0])
+        event_sourced = AnalyticsSnapshot(lambda: self.client, PROJECT_ID, DATASET_ID,
+                                          path=os.path.join(self.tmpdir.name, 'state.arrow'), source='request_state')
+        event_sourced.refresh()
+        self.assertIn(f'`{PROJECT_ID}.{DATASET_ID}.request_state`', self.client.queries[-1][0])
+
+    def test_fresh_file_is_reused_by_another_worker(self):
+        self.snapshot.table()
+        other = AnalyticsSnapshot(lambda: self.client, PROJECT_ID, DATASET_ID, path=self.path, ttl=60)
+        self.assertEqual(other.table().num_rows, 4)
+        self.assertEqual(len(self.client.queries), 1)
+
+    def test_stale_snapshot_keeps_serving_while_refreshing(self):
+        self.snapshot.table()
+        self.snapshot.ttl = 0
+        self.assertEqual(self.snapshot.table().num_rows, 4)
+        deadline = time.monotonic() + 5
+        while len(self.client.queries) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.client.queries), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tests for submission-time risk scoring.
+"""
+
+import sys
+import time
+import random
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from anomaly_scoring import (RunningStats, PercentileSketch, RiskScorer, RISK_MIN_HISTORY, RISK_RATE_LIMIT,
+                             RISK_DUPLICATE_WINDOW_SECONDS)
+from request_events import EVENT_SUBMITTED
+
+NOW = 1760000000.0
+DAY = 86400
+
+
+def request(enquiry_no, percentage, requester='a@pw.live', mobile=None, branch='Delhi', card='JEE'):
+    return {'enquiry_no': enquiry_no, 'branch_name': branch, 'card_name': card, 'requester_email': requester,
+            'mobile_no': mobile or f"9{enquiry_no[-9:]}", 'discount_percentage': percentage,
+            'discount_amount': percentage * 800}
+
+
+def history(count=200, seed=1):
+    """Requests spread over the last 30 days, 30-50% off, from ten requesters."""
+    rng = random.Random(seed)
+    return [(NOW - DAY * 30 + i * DAY * 30 / count,
+             request(f"EN{i:09d}", rng.uniform(30, 50), requester=f"r{i % 10}@pw.live"))
+            for i in range(count)]
+
+
+class TestStatistics(unittest.TestCase):
+
+    def test_running_stats(self):
+        stats = RunningStats()
+        for value in [30, 40, 50]:
+            stats.add(value)
+        self.assertEqual(stats.mean, 40)
+        self.assertAlmostEqual(stats.std, 10)
+        self.assertAlmostEqual(stats.z_score(60), 2)
+        self.assertEqual(RunningStats().z_score(60), 0)
+
+    def test_percentile_sketch(self):
+        sketch = PercentileSketch()
+        for value in range(100):
+            sketch.add(value + 0.5)
+        self.assertAlmostEqual(sketch.rank(10.2), 0.105)
+        self.assertEqual(sketch.rank(150), 1.0)
+        self.assertEqual(PercentileSketch().rank(50), 0)
+
+
+class TestRiskScorer(unittest.TestCase):
+
+    def setUp(self):
+        self.scorer = RiskScorer()
+        for when, row in history():
+            self.scorer.observe(row, when)
+
+    def test_typical_request_scores_zero(self):
+        self.assertEqual(self.scorer.score(request('EN100000001', 40.0, requester='r1@pw.live'), NOW), (0, []))
+
+    def test_outlier(self):
+        score, reasons = self.scorer.score(request('EN100000001', 85.0, requester='r1@pw.live'), NOW)
+        self.assertGreaterEqual(score, 35 + 15)
+        self.assertIn('Discount 85.0% is above', reasons[0])
+        # A card without enough history falls back to its branch
+        score, _ = self.scorer.score(request('EN100000001', 85.0, requester='new@pw.live', card='NEET'), NOW)
+        self.assertEqual(score, 35)
+        self.assertEqual(self.scorer.score(request('EN100000001', 85.0, branch='Patna'), NOW)[0], 0)
+
+    def test_request_rate(self):
+        for i in range(RISK_RATE_LIMIT):
+            self.scorer.observe(request(f"EN2000000{i:02d}", 30.0 + i, requester='busy@pw.live'), NOW - 60 * i)
+        score, reasons = self.scorer.score(request('EN200000099', 40.0, requester='busy@pw.live'), NOW)
+        self.assertEqual(score, 25)
+        self.assertIn(f"{RISK_RATE_LIMIT + 1} requests from this requester", reasons[0])
+        # Submissions outside the window stop counting
+        self.assertEqual(self.scorer.score(request('EN200000099', 40.0, requester='busy@pw.live'), NOW + DAY)[0], 0)
+
+    def test_near_duplicates(self):
+        self.scorer.observe(request('EN300000001', 40.0, mobile='9999999999'), NOW - DAY)
+        score, reasons = self.scorer.score(request('EN300000002', 40.0, mobile='9999999999'), NOW)
+        self.assertEqual((score, reasons), (25, ['Same mobile number as EN300000001']))
+        # Same requester, card and discount under another student
+        score, reasons = self.scorer.score(request('EN300000003', 40.0, mobile='8888888888'), NOW)
+        self.assertEqual((score, reasons), (25, ['Same card and discount as EN300000001']))
+        # Resubmitting the same enquiry, or long after, is not a near-duplicate
+        self.assertEqual(self.scorer.score(request('EN300000001', 40.0, mobile='9999999999'), NOW)[0], 0)
+        self.assertEqual(self.scorer.score(request('EN300000002', 40.0, mobile='9999999999'), NOW + 30 * DAY)[0], 0)
+
+    def test_old_near_duplicates_are_dropped(self):
+        scorer = RiskScorer()
+        scorer.observe(request('EN300000001', 40.0, mobile='9999999999'), NOW - RISK_DUPLICATE_WINDOW_SECONDS - 1)
+        scorer.observe(request('EN300000002', 41.0, mobile='8888888888'), NOW - DAY)
+        self.assertEqual(len(scorer._by_mobile), 2)
+        scorer.observe(request('EN300000003', 42.0, mobile='7777777777'), NOW)
+        self.assertEqual(set(scorer._by_mobile), {'8888888888', '7777777777'})
+        self.assertEqual([match[1] for match in scorer._by_offer.values()], ['EN300000002', 'EN300000003'])
+
+    def test_scoring_is_fast(self):
+        rows = [request(f"EN4{i:08d}", 30 + i % 50, requester=f"r{i % 10}@pw.live") for i in range(10000)]
+        started = time.perf_counter()
+        for row in rows:
+            self.scorer.score(row, NOW)
+        self.assertLess((time.perf_counter() - started) / len(rows), 0.0005)
+
+
+class FakeEventLog:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def ensure_loaded(self):
+        return True
+
+    def with_rows(self, fn):
+        return fn(self.rows)
+
+
+class TestEventLogFeed(unittest.TestCase):
+
+    def test_seeded_from_projection_and_kept_current(self):
+        rows = []
+        for when, row in history(RISK_MIN_HISTORY):
+            row['created_at'] = time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime(when))
+            rows.append(row)
+        scorer = RiskScorer(FakeEventLog(rows))
+        # Events before seeding are covered by the projection
+        scorer.on_request_event({'event_type': EVENT_SUBMITTED}, rows[0], None)
+        self.assertTrue(scorer.ensure_seeded())
+        self.assertEqual(scorer._groups[('card', 'Delhi', 'JEE')].stats.count, RISK_MIN_HISTORY)
+
+        row = dict(request('EN500000001', 40.0, mobile='7777777777'), created_at=rows[-1]['created_at'])
+        scorer.on_request_event({'event_type': EVENT_SUBMITTED}, row, None)
+        scorer.on_request_event({'event_type': 'l1_approved'}, row, 'PENDING_L1')
+        self.assertEqual(scorer._groups[('card', 'Delhi', 'JEE')].stats.count, RISK_MIN_HISTORY + 1)
+        self.assertEqual(scorer.score(request('EN500000002', 40.0, mobile='7777777777'), NOW)[1],
+                         ['Same mobile number as EN500000001'])
+
+    def test_seeded_in_background(self):
+        rows = [dict(row, created_at=time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime(when)))
+                for when, row in history(RISK_MIN_HISTORY)]
+        scorer = RiskScorer(FakeEventLog(rows))
+        # Scored against empty statistics until seeded
+        self.assertEqual(scorer.score(request('EN500000001', 95.0), NOW), (0, []))
+        scorer.seed_in_background()
+        deadline = time.monotonic() + 10
+        while not scorer.seeded and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(scorer.seeded)
+        self.assertEqual(scorer._groups[('card', 'Delhi', 'JEE')].stats.count, RISK_MIN_HISTORY)
+        self.assertGreater(scorer.score(request('EN500000001', 95.0), NOW)[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
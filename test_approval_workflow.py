@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for the approval state machine and its conditional status updates.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from approval_workflow import get_transition, build_legacy_transition, apply_legacy_transition
+from enhanced_data_access import DiscountDataAccess
+from fake_bigquery import FakeClient, FakeJob, query_params
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+
+class DMLClient(FakeClient):
+    """Reports a fixed number of affected rows for every job."""
+
+    def __init__(self, affected=1):
+        super().__init__()
+        self.affected = affected
+
+    def respond(self, query, params):
+        return FakeJob(num_dml_affected_rows=self.affected)
+
+
+def recorded(client, index):
+    """(whitespace-normalized query, params) of a recorded job."""
+    query, job_config = client.queries[index]
+    return ' '.join(query.split()), query_params(job_config)
+
+
+class TransitionTableTests(unittest.TestCase):
+    """Allowed transitions per approver level."""
+
+    def test_allowed_transitions(self):
+        self.assertEqual(get_transition('L1', 'APPROVE'), ('PENDING_L1', 'PENDING_L2'))
+        self.assertEqual(get_transition('L1', 'REJECT'), ('PENDING_L1', 'REJECTED'))
+        self.assertEqual(get_transition('L2', 'APPROVE'), ('PENDING_L2', 'APPROVED'))
+        self.assertEqual(get_transition('L2', 'REJECT'), ('PENDING_L2', 'REJECTED'))
+
+    def test_disallowed_transitions(self):
+        self.assertIsNone(get_transition('Requester', 'APPROVE'))
+        self.assertIsNone(get_transition('L1', 'CANCEL'))
+        with self.assertRaises(ValueError):
+            build_legacy_transition(PROJECT_ID, DATASET_ID, 'EN123456789', 'L3', 'APPROVE', 'a@pw.live')
+
+
+class LegacyTransitionTests(unittest.TestCase):
+    """Conditional UPDATE against discount_requests."""
+
+    def test_update_is_conditional_on_expected_status(self):
+        client = DMLClient(affected=1)
+        applied = apply_legacy_transition(client, PROJECT_ID, DATASET_ID, 'EN123456789', 'L1', 'APPROVE',
+                                          'raja.ray@pw.live', 'ok', 25000.0)
+        self.assertTrue(applied)
+        self.assertEqual(len(client.queries), 1, "Transition must be a single job with no prior read")
+        query, params = recorded(client, 0)
+        self.assertIn('WHERE enquiry_no = @enquiry_no AND status = @expected_status', query)
+        self.assertIn('net_discount = mrp - @approved_amount', query)
+        self.assertEqual(params['expected_status'], 'PENDING_L1')
+        self.assertEqual(params['new_status'], 'PENDING_L2')
+        self.assertEqual(params['approved_amount'], 25000.0)
+
+    def test_reject_does_not_touch_amounts(self):
+        query, params = build_legacy_transition(PROJECT_ID, DATASET_ID, 'EN123456789', 'L2', 'REJECT',
+                                                'l2@pw.live', 'no')
+        self.assertIn('l2_approver = @approver_email', query)
+        self.assertNotIn('discounted_fees', query)
+        self.assertEqual(params[0].value, 'REJECTED')
+
+    def test_lost_race_reports_failure(self):
+        client = DMLClient(affected=0)
+        applied = apply_legacy_transition(client, PROJECT_ID, DATASET_ID, 'EN123456789', 'L2', 'APPROVE',
+                                          'l2@pw.live', '', 20000.0)
+        self.assertFalse(applied)
+
+
+class EnhancedTransitionTests(unittest.TestCase):
+    """Conditional UPDATE against discount_requests_new."""
+
+    def test_lost_race_skips_approval_record(self):
+        client = DMLClient(affected=0)
+        data_access = DiscountDataAccess(client, PROJECT_ID, DATASET_ID)
+        self.assertFalse(data_access.approve_or_reject_request('req-1', 'APPROVE', 'L1', 'a@pw.live', 'A', 100.0))
+        self.assertEqual(len(client.queries), 1)
+        self.assertIn('AND status = @expected_status', recorded(client, 0)[0])
+
+    def test_applied_transition_records_approval(self):
+        client = DMLClient(affected=1)
+        data_access = DiscountDataAccess(client, PROJECT_ID, DATASET_ID)
+        self.assertTrue(data_access.approve_or_reject_request('req-1', 'REJECT', 'L2', 'b@pw.live', 'B'))
+        self.assertEqual(len(client.queries), 2)
+        self.assertIn('request_approvals', recorded(client, 1)[0])
+
+    def test_invalid_transition(self):
+        client = DMLClient()
+        data_access = DiscountDataAccess(client, PROJECT_ID, DATASET_ID)
+        self.assertFalse(data_access.approve_or_reject_request('req-1', 'APPROVE', 'L9', 'c@pw.live', 'C'))
+        self.assertEqual(client.queries, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tests for workload-balanced L1 approver assignment.
+"""
+
+import sys
+import unittest
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from approver_assignment import ApproverPools, ApproverAssigner
+from enhanced_data_access import DiscountDataAccess
+from fake_bigquery import FakeClient, query_params
+from request_events import EVENT_SUBMITTED, EVENT_L1_APPROVED
+
+NOW = datetime(2026, 11, 2, 12, tzinfo=ZoneInfo('Asia/Kolkata'))
+
+CONFIG = {
+    'pools': [
+        {'branches': ['Kolkata', 'Siliguri'], 'approvers': [{'email': 'east1@pw.live', 'weight': 2},
+                                                          {'email': 'east2@pw.live'}]},
+        {'approvers': [{'email': 'rest1@pw.live'}, {'email': 'rest2@pw.live'}]},
+    ],
+    'delegations': [
+        {'from': 'east1@pw.live', 'to': 'rest2@pw.live', 'start': '2026-11-01', 'until': '2026-11-08'},
+        {'from': 'rest1@pw.live', 'until': '2026-11-01'},
+    ],
+}
+
+
+def pending_row(enquiry_no, assigned_to, status='PENDING_L1'):
+    return {'enquiry_no': enquiry_no, 'branch_name': 'Delhi', 'status': status, 'assigned_to': assigned_to}
+
+
+class FakeEventLog:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def ensure_loaded(self):
+        return True
+
+    def with_rows(self, fn):
+        return fn(self.rows)
+
+
+class TestApproverPools(unittest.TestCase):
+
+    def test_default_pools_keep_the_previous_routing(self):
+        pools = ApproverPools()
+        self.assertEqual(list(pools.pool_for('Kolkata')), ['raja.ray@pw.live'])
+        self.assertEqual(list(pools.pool_for('Delhi')), ['praduman.shukla@pw.live'])
+        self.assertEqual(pools.branch_scope({'raja.ray@pw.live'}), ({'Kolkata', 'Siliguri', 'Bhubaneshwar'}, None))
+        self.assertEqual(pools.branch_scope({'praduman.shukla@pw.live'}),
+                         (None, {'Kolkata', 'Siliguri', 'Bhubaneshwar'}))
+
+    def test_delegations_in_effect(self):
+        pools = ApproverPools(CONFIG)
+        self.assertEqual(pools.away(NOW), {'east1@pw.live': 'rest2@pw.live'})
+        self.assertEqual(pools.away(datetime(2026, 10, 31, 23, tzinfo=ZoneInfo('Asia/Kolkata'))),
+                         {'rest1@pw.live': None})
+        self.assertEqual(pools.away(datetime(2026, 11, 8, tzinfo=ZoneInfo('Asia/Kolkata'))), {})
+        with self.assertRaises(ValueError):
+            ApproverPools({'pools': [{'approvers': [{'email': 'a@pw.live', 'weight': 0}]}]})
+
+
+class TestApproverAssigner(unittest.TestCase):
+
+    def test_least_pending_balances_by_weight(self):
+        assigner = ApproverAssigner(ApproverPools(CONFIG))
+        after_delegation = datetime(2026, 11, 9, tzinfo=ZoneInfo('Asia/Kolkata'))
+        counts = Counter(assigner.assign_many(['Kolkata'] * 30, after_delegation))
+        self.assertEqual(counts, {'east1@pw.live': 20, 'east2@pw.live': 10})
+
+    def test_least_pending_uses_live_queue_depth(self):
+        assigner = ApproverAssigner(ApproverPools(CONFIG), FakeEventLog([
+            pending_row('EN000000001', 'rest1@pw.live'), pending_row('EN000000002', 'rest1@pw.live'),
+            pending_row('EN000000003', 'rest2@pw.live', status='APPROVED'),
+        ]))
+        self.assertTrue(assigner.ensure_seeded())
+        self.assertEqual(assigner.assign('Delhi', NOW), 'rest2@pw.live')
+
+        assigner.on_request_event({'event_type': EVENT_SUBMITTED}, pending_row('EN000000004', 'rest2@pw.live'), None)
+        assigner.on_request_event({'event_type': EVENT_SUBMITTED}, pending_row('EN000000005', 'rest2@pw.live'), None)
+        # A replayed event is not counted twice
+        assigner.on_request_event({'event_type': EVENT_SUBMITTED}, pending_row('EN000000005', 'rest2@pw.live'), None)
+        self.assertEqual((assigner.pending('rest1@pw.live'), assigner.pending('rest2@pw.live')), (2, 2))
+        assigner.on_request_event({'event_type': EVENT_L1_APPROVED},
+                                  pending_row('EN000000001', 'rest1@pw.live', status='PENDING_L2'), 'PENDING_L1')
+        self.assertEqual(assigner.assign('Delhi', NOW), 'rest1@pw.live')
+
+    def test_weighted_round_robin(self):
+        assigner = ApproverAssigner(ApproverPools(CONFIG), strategy='round_robin')
+        after_delegation = datetime(2026, 11, 9, tzinfo=ZoneInfo('Asia/Kolkata'))
+        assigned = assigner.assign_many(['Siliguri'] * 6, after_delegation)
+        self.assertEqual(assigned, ['east1@pw.live', 'east2@pw.live', 'east1@pw.live'] * 2)
+        with self.assertRaises(ValueError):
+            ApproverAssigner(ApproverPools(), strategy='random')
+
+    def test_delegation(self):
+        assigner = ApproverAssigner(ApproverPools(CONFIG))
+        # east1 is away: the delegate takes their share alongside east2
+        self.assertEqual(set(assigner.assign_many(['Kolkata'] * 6, NOW)), {'rest2@pw.live', 'east2@pw.live'})
+
+        scope = assigner.queue_scope('rest2@pw.live', NOW)
+        self.assertEqual(scope.assigned_to, {'rest2@pw.live', 'east1@pw.live'})
+        self.assertEqual((scope.branch_in, scope.branch_not_in), (None, None))
+        self.assertTrue(scope.matches('PENDING_L1', 'Kolkata', 'east1@pw.live'))
+        self.assertFalse(scope.matches('PENDING_L1', 'Kolkata', 'east2@pw.live'))
+
+        scope = assigner.queue_scope('east2@pw.live', NOW)
+        self.assertEqual((scope.assigned_to, scope.branch_in), ({'east2@pw.live'}, {'Kolkata', 'Siliguri'}))
+        # Approvers in no pool keep seeing every pending L1 request
+        scope = assigner.queue_scope('supervisor@pw.live', NOW)
+        self.assertIsNone(scope.assigned_to)
+        self.assertTrue(scope.matches('PENDING_L1', 'Kolkata', 'east2@pw.live'))
+
+    def test_normalized_queue_uses_the_same_scope(self):
+        assigner = ApproverAssigner(ApproverPools(CONFIG))
+        client = FakeClient()
+        access = DiscountDataAccess(client, 'gewportal2025', 'discount_management')
+
+        access.get_pending_requests_for_approver('L1', 'rest2@pw.live', assigner.queue_scope('rest2@pw.live', NOW))
+        query, job_config = client.queries[-1]
+        self.assertIn('dr.assigned_to IN UNNEST(@assignees)', query)
+        self.assertEqual(query_params(job_config)['assignees'], ['east1@pw.live', 'rest2@pw.live'])
+
+        access.get_pending_requests_for_approver('L1', 'supervisor@pw.live',
+                                                 assigner.queue_scope('supervisor@pw.live', NOW))
+        query, job_config = client.queries[-1]
+        self.assertNotIn('assigned_to', query)
+        self.assertEqual(query_params(job_config), {'status': 'PENDING_L1'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the BigQuery client's HTTP connection pool wiring.
+"""
+
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from google.auth.credentials import AnonymousCredentials
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Skip the Secret Manager lookup app.py does on import
+os.environ.setdefault('K_SERVICE', 'discount-app-test')
+
+import app
+
+
+class TestBigQueryHttpPool(unittest.TestCase):
+
+    def test_pool_size_follows_serving_mode(self):
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertEqual(app.bigquery_http_pool_size('sync'), 10)
+            self.assertEqual(app.bigquery_http_pool_size('async'), 200)
+        with mock.patch.dict(os.environ, {'GUNICORN_WORKER_CONNECTIONS': '500'}, clear=True):
+            self.assertEqual(app.bigquery_http_pool_size('async'), 500)
+            self.assertEqual(app.bigquery_http_pool_size('sync'), 10)
+        with mock.patch.dict(os.environ, {'BIGQUERY_HTTP_POOL_SIZE': '64'}, clear=True):
+            self.assertEqual(app.bigquery_http_pool_size('async'), 64)
+
+    def test_client_is_built_with_the_pooled_session(self):
+        credentials = AnonymousCredentials()
+        patches = [
+            mock.patch.object(app, 'client', None),
+            mock.patch.object(app, 'BIGQUERY_HTTP_POOL_SIZE', 200),
+            mock.patch.dict(os.environ, {'GOOGLE_APPLICATION_CREDENTIALS': ''}),
+            mock.patch('app.google.auth.default', return_value=(credentials, 'gewportal2025')),
+            mock.patch('app.bigquery.Client'),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.assertIsNotNone(app.get_bigquery_client())
+
+        kwargs = app.bigquery.Client.call_args.kwargs
+        self.assertIs(kwargs['credentials'], credentials)
+        adapter = kwargs['_http'].get_adapter('https://bigquery.googleapis.com')
+        self.assertEqual(adapter._pool_maxsize, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tests for the bulk request import pipeline.
+"""
+
+import io
+import sys
+import csv
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import EventStoreClient, FakeJob
+from bulk_import import BulkImporter, iter_upload_rows, error_report_csv
+from catalog import CatalogCache
+from request_events import RequestEventLog
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+HEADER = 'enquiry_no,student_name,mobile_no,branch_name,card_name,mrp,installment,discount_amount,reason'
+
+
+def validate_enquiry_no(enquiry_no):
+    return enquiry_no.startswith('EN') and len(enquiry_no) == 11 and enquiry_no[2:].isdigit()
+
+
+class FakeClient(EventStoreClient):
+    """Serves the catalog and existing enquiries; records loads and appended events."""
+
+    def __init__(self, existing=(), append_error=None):
+        super().__init__()
+        self.existing = set(existing)
+        self.append_error = append_error
+        self.loads = []
+
+    def respond(self, query, params):
+        if 'branch_cards_fees' in query:
+            return [{'branch_name': 'Delhi', 'card_name': 'Lakshya', 'mrp': 50000, 'installment': 40000}]
+        if 'discount_requests' in query:
+            return [{'enquiry_no': e} for e in self.existing]
+        if 'BEGIN TRANSACTION' in query and self.append_error:
+            raise self.append_error
+        return super().respond(query, params)
+
+    def load_table_from_json(self, rows, destination, job_config=None):
+        self.loads.append((destination, list(rows)))
+        return FakeJob()
+
+
+def upload(*lines):
+    return iter_upload_rows(io.BytesIO('\n'.join((HEADER,) + lines).encode()), 'requests.csv')
+
+
+def make_importer(client, notify=None, assign=None, event_sourced=False):
+    client_getter = lambda: client
+    return BulkImporter(
+        client_getter, PROJECT_ID, DATASET_ID, CatalogCache(client_getter, PROJECT_ID, DATASET_ID),
+        RequestEventLog(client_getter, PROJECT_ID, DATASET_ID), validate_enquiry_no,
+        get_approvers_for_branch=lambda branch, level: [('l1@pw.live', 'L1')], notify=notify, assign=assign,
+        event_sourced=event_sourced
+    )
+
+
+class BulkImportTests(unittest.TestCase):
+
+    def test_valid_rows_are_loaded_in_one_batch(self):
+        client = FakeClient()
+        sent = []
+        importer = make_importer(client, notify=lambda to, subject, html, text: sent.append((to, subject)) or True)
+        result = importer.run(upload(
+            'EN000000001,A,9000000001,Delhi,Lakshya,50000,40000,20000,Sibling',
+            'EN000000002,B,9000000002,Delhi,Lakshya,50000,40000,16000,Merit',
+        ), 'c@pw.live', 'Counselor')
+        self.assertEqual(len(result.imported), 2)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(len(client.loads), 1)
+        self.assertEqual(len(client.loads[0][1]), 2)
+        self.assertEqual(len(client.inserted), 2)
+        self.assertEqual(sent, [(['l1@pw.live'], 'Bulk Discount Requests - 2 awaiting L1 approval')])
+        self.assertEqual(sum('branch_cards_fees' in q for q, _ in client.queries), 1)
+
+    def test_rows_are_assigned_and_each_approver_notified_once(self):
+        sent = []
+        importer = make_importer(FakeClient(), notify=lambda to, subject, html, text: sent.append((to, subject)) or True,
+                                 assign=lambda branches: ['a@pw.live', 'b@pw.live', 'a@pw.live'][:len(branches)])
+        result = importer.run(upload(
+            'EN000000001,A,9000000001,Delhi,Lakshya,50000,40000,20000,Sibling',
+            'EN000000002,B,9000000002,Delhi,Lakshya,50000,40000,16000,Merit',
+            'EN000000003,C,9000000003,Delhi,Lakshya,50000,40000,16000,Merit',
+        ), 'c@pw.live', 'Counselor')
+        self.assertEqual([d['assigned_to'] for d in result.imported], ['a@pw.live', 'b@pw.live', 'a@pw.live'])
+        self.assertEqual(sorted(sent), [(['a@pw.live'], 'Bulk Discount Requests - 2 awaiting L1 approval'),
+                                        (['b@pw.live'], 'Bulk Discount Requests - 1 awaiting L1 approval')])
+
+    def test_invalid_and_duplicate_rows_are_reported(self):
+        client = FakeClient(existing=['EN000000005'])
+        result = make_importer(client).run(upload(
+            'EN000000001,A,9000000001,Delhi,Lakshya,50000,40000,20000,Sibling',
+            'EN000000001,A,9000000001,Delhi,Lakshya,50000,40000,20000,Sibling',
+            'EN12,B,9000000002,Delhi,Lakshya,50000,40000,20000,Merit',
+            'EN000000003,C,9000000003,Delhi,Lakshya,50000,40000,10000,Merit',
+            'EN000000004,D,9000000004,Patna,Lakshya,50000,40000,20000,Merit',
+            'EN000000005,E,9000000005,Delhi,Lakshya,50000,40000,20000,Merit',
+            'EN000000006,,9000000006,Delhi,Lakshya,50000,40000,20000,Merit',
+        ), 'c@pw.live', 'Counselor')
+        self.assertEqual([d['enquiry_no'] for d in result.imported], ['EN000000001'])
+        self.assertEqual([e['row'] for e in result.errors], [3, 4, 5, 6, 7, 8])
+        report = list(csv.DictReader(io.StringIO(error_report_csv(result.errors))))
+        self.assertIn('Duplicate of row 2', report[0]['error'])
+        self.assertIn('ERP', report[2]['error'])
+        self.assertIn('already been submitted', report[4]['error'])
+        self.assertIn('Missing student_name', report[5]['error'])
+
+    def test_rows_not_recorded_are_reported(self):
+        sent = []
+        client = FakeClient(append_error=Exception('backend error'))
+        importer = make_importer(client, notify=lambda to, subject, html, text: sent.append(to) or True,
+                                 event_sourced=True)
+        result = importer.run(upload(
+            'EN000000001,A,9000000001,Delhi,Lakshya,50000,40000,20000,Sibling',
+            'EN000000002,B,9000000002,Delhi,Lakshya,50000,40000,16000,Merit',
+        ), 'c@pw.live', 'Counselor')
+        self.assertEqual(result.imported, [])
+        self.assertEqual([(e['row'], e['errors']) for e in result.errors],
+                         [(2, ['Could not be saved. Please try again.']),
+                          (3, ['Could not be saved. Please try again.'])])
+        self.assertEqual(sent, [])
+
+    def test_dry_run_writes_nothing(self):
+        client = FakeClient()
+        result = make_importer(client).run(upload(
+            'EN000000001,A,9000000001,Delhi,Lakshya,50000,40000,20000,Sibling',
+        ), 'c@pw.live', 'Counselor', dry_run=True)
+        self.assertEqual(len(result.imported), 1)
+        self.assertEqual(client.loads, [])
+        self.assertEqual(client.inserted, [])
+
+    def test_unsupported_file_type(self):
+        with self.assertRaises(ValueError):
+            iter_upload_rows(io.BytesIO(b''), 'requests.pdf')
+
+
+if __name__ == '__main__':
+    unittest.main()
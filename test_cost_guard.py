@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for the BigQuery cost guard.
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from cost_guard import (
+    GuardedClient, PlannedQuery, dummy_parameters, extract_queries, fingerprint, load_baseline,
+    plan_costs, save_baseline
+)
+
+MODULE = '''
+from google.cloud import bigquery
+
+def get_request(client, enquiry_no, statuses):
+    query = f"""
+    SELECT * FROM `{project_id}.{dataset_id}.discount_requests`
+    WHERE enquiry_no = @enquiry_no AND status IN UNNEST(@statuses)
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("enquiry_no", "STRING", enquiry_no),
+        bigquery.ArrayQueryParameter("statuses", "STRING", statuses),
+        bigquery.ScalarQueryParameter("limit", "INT64", 10),
+    ])
+    return client.query(query, job_config=job_config)
+
+def filtered(client, where_clause):
+    return client.query(f"SELECT COUNT(*) FROM `{project_id}.{dataset_id}.students` {where_clause}")
+
+def not_sql():
+    return f"Selected {project_id}", "SELECT but no table"
+'''
+
+
+class FakeJob:
+    def __init__(self, total_bytes_processed=None, error_result=None):
+        self.total_bytes_processed = total_bytes_processed
+        self.error_result = error_result
+        self.callbacks = []
+
+    def add_done_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def finish(self):
+        for callback in self.callbacks:
+            callback(self)
+
+
+class FakeClient:
+    """Dry runs return a byte count looked up by a substring of the query."""
+
+    def __init__(self, costs=None, job=None):
+        self.costs = costs or {}
+        self.job = job
+        self.configs = []
+        self.project = 'p'
+
+    def query(self, query, job_config=None):
+        self.configs.append(job_config)
+        if job_config is not None and job_config.dry_run:
+            for marker, cost in self.costs.items():
+                if marker in query:
+                    if isinstance(cost, Exception):
+                        raise cost
+                    return FakeJob(cost)
+            return FakeJob(0)
+        return self.job
+
+
+class TestPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.module = Path(self.tmp.name) / 'module.py'
+        self.module.write_text(MODULE)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_extracts_queries_with_parameter_types(self):
+        queries = extract_queries(self.module, 'proj', 'ds')
+        self.assertEqual([q.origin for q in queries], ['module.py:5 get_request', 'module.py:17 filtered'])
+
+        request_query, filtered_query = queries
+        self.assertIn('`proj.ds.discount_requests`', request_query.sql)
+        self.assertFalse(request_query.partial)
+        self.assertEqual(request_query.param_types['statuses'], ('ARRAY', 'STRING'))
+        # The unresolvable where clause is left out and flagged
+        self.assertTrue(filtered_query.partial)
+        self.assertEqual(filtered_query.sql, 'SELECT COUNT(*) FROM `proj.ds.students`')
+
+    def test_dummy_parameters_cover_only_parameters_in_the_query(self):
+        request_query = extract_queries(self.module, 'proj', 'ds')[0]
+        params = dummy_parameters(request_query.sql, request_query.param_types)
+        self.assertEqual([p.name for p in params], ['enquiry_no', 'statuses'])
+        self.assertEqual(params[1].values, [])
+
+    def test_plan_dedupes_and_flags_regressions(self):
+        queries = [PlannedQuery('a.py:1 f', 'SELECT * FROM `p.d.big`'),
+                   PlannedQuery('b.py:9 g', 'SELECT *   FROM `p.d.big`'),
+                   PlannedQuery('a.py:5 h', 'SELECT * FROM `p.d.small`'),
+                   PlannedQuery('a.py:7 i', 'SELECT * FROM `p.d.missing`')]
+        client = FakeClient({'big': 5 * 1024 ** 3, 'small': 1024, 'missing': RuntimeError('Not found: Table')})
+        baseline = {fingerprint('SELECT * FROM `p.d.big`'): 1024 ** 3,
+                    fingerprint('SELECT * FROM `p.d.small`'): 512}
+
+        results = plan_costs(client, queries, baseline, max_bytes=4 * 1024 ** 3)
+        self.assertEqual([r['bytes'] for r in results], [5 * 1024 ** 3, 1024, None])
+        big, small, missing = results
+        self.assertEqual(big['origins'], ['a.py:1 f', 'b.py:9 g'])
+        self.assertTrue(big['regression'])
+        self.assertTrue(big['over_limit'])
+        # Doubling a tiny query is below QUERY_COST_MIN_BYTES
+        self.assertFalse(small['regression'])
+        self.assertEqual(missing['error'], 'Not found: Table')
+
+        path = Path(self.tmp.name) / 'costs.json'
+        save_baseline(results, path)
+        self.assertEqual(load_baseline(path), {big['fingerprint']: big['bytes'], small['fingerprint']: 1024})
+
+
+class TestGuardedClient(unittest.TestCase):
+
+    def test_sets_maximum_bytes_billed(self):
+        client = GuardedClient(FakeClient(job=FakeJob(0)), max_bytes_billed=1000, baseline={})
+        client.query('SELECT 1')
+        self.assertEqual(client._client.configs[-1].maximum_bytes_billed, 1000)
+        self.assertEqual(client.project, 'p')
+
+    def test_flags_regressions_and_limit_errors(self):
+        sql = 'SELECT * FROM `p.d.t`'
+        job = FakeJob(total_bytes_processed=100 * 1024 ** 2)
+        client = GuardedClient(FakeClient(job=job), baseline={fingerprint(sql): 1024 ** 2})
+        client.query(sql).finish()
+        self.assertEqual(client.regressions, 1)
+        self.assertIn(f'bigquery_bytes_processed_total{{query="{fingerprint(sql)}"}} {100 * 1024 ** 2}',
+                      client.render_metrics())
+
+        client._client.job = FakeJob(error_result={'reason': 'bytesBilledLimitExceeded', 'message': 'too big'})
+        client.query(sql).finish()
+        self.assertEqual(client.limit_exceeded, 1)
+        self.assertIn('bigquery_bytes_billed_limit_exceeded_total 1', client.render_metrics())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Tests for the declarative discount policy and its batch evaluation.
+"""
+
+import sys
+import json
+import time
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from discount_policy import (
+    DiscountPolicy, MRP_MISMATCH, INSTALLMENT_MISMATCH, EXCEEDS_MRP, BELOW_MINIMUM, ABOVE_MAXIMUM,
+)
+
+RULES = [
+    {'branch': 'Kolkata', 'min_discount_percentage': 20},
+    {'branch': 'Kolkata', 'card': 'NEET', 'min_discount_percentage': 25},
+    {'level': 'L1', 'max_discount_percentage': 50},
+    {'min_discount_percentage': 35},
+]
+
+
+class TestSettings(unittest.TestCase):
+
+    def test_most_specific_rule_wins(self):
+        policy = DiscountPolicy(RULES)
+        self.assertEqual(policy.settings_for('Delhi', 'JEE')['min_discount_percentage'], 35)
+        self.assertEqual(policy.settings_for('Kolkata', 'JEE')['min_discount_percentage'], 20)
+        self.assertEqual(policy.settings_for('Kolkata', 'NEET')['min_discount_percentage'], 25)
+        # Level rules only apply at approval
+        self.assertIsNone(policy.settings_for('Delhi', 'JEE')['max_discount_percentage'])
+        self.assertEqual(policy.settings_for('Delhi', 'JEE', 'L1')['max_discount_percentage'], 50)
+        self.assertEqual(DiscountPolicy().settings_for('Delhi', 'JEE')['min_discount_percentage'], 30)
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'policy.json'
+            self.assertEqual(DiscountPolicy.load(path).rules, [])
+            path.write_text(json.dumps(RULES))
+            self.assertEqual(DiscountPolicy.load(path).rules, RULES)
+            path.write_text('not json')
+            self.assertEqual(DiscountPolicy.load(path).rules, [])
+        with self.assertRaises(ValueError):
+            DiscountPolicy([{'branch': 'Delhi', 'min_discount': 10}])
+
+
+class TestEvaluation(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = DiscountPolicy()
+
+    def test_single_request(self):
+        evaluation = self.policy.evaluate('Delhi', 'JEE', 100000.0, 90000.0, 36000.0, 100000.0, 90000.0)
+        self.assertTrue(evaluation.ok)
+        self.assertEqual(evaluation.fields(), {'discounted_fees': 64000.0, 'discount_amount': 36000.0,
+                                               'discount_percentage': 40.0, 'net_discount': 36000.0})
+
+        evaluation = self.policy.evaluate('Delhi', 'JEE', 100000.0, 90000.0, 27000.0, 100000.5, 90000.0)
+        self.assertEqual([code for code, _ in evaluation.violations], [MRP_MISMATCH, BELOW_MINIMUM])
+        self.assertEqual(evaluation.errors[0], 'MRP mismatch. Expected: ₹100000.0, Provided: ₹100000.5')
+        self.assertIn('Use ERP for the discounts upto 30%', evaluation.errors[1])
+
+    def test_defaults_only_limit_the_discount_to_the_mrp(self):
+        # Above the installment but within the MRP, as before the policy engine
+        self.assertTrue(self.policy.evaluate('Delhi', 'Lakshya', 50000, 40000, 45000, 50000, 40000).ok)
+        self.assertEqual([code for code, _ in self.policy.evaluate('Delhi', 'Lakshya', 50000, 40000, 50001).violations],
+                         [EXCEEDS_MRP])
+        self.assertTrue(self.policy.evaluate_approval('Delhi', 'Lakshya', 'L1', 50000, 40000, 4000).ok)
+
+    def test_approval_applies_the_level_cap_only(self):
+        policy = DiscountPolicy(RULES)
+        # 10% of the installment: below the ERP threshold, still approvable
+        self.assertTrue(policy.evaluate_approval('Delhi', 'JEE', 'L1', 100000.0, 90000.0, 91000.0).ok)
+        capped = policy.evaluate_approval('Delhi', 'JEE', 'L1', 100000.0, 90000.0, 40000.0)
+        self.assertEqual([code for code, _ in capped.violations], [ABOVE_MAXIMUM])
+        self.assertTrue(policy.evaluate_approval('Delhi', 'JEE', 'L2', 100000.0, 90000.0, 40000.0).ok)
+        # Request caps do not apply at approval
+        capped_requests = DiscountPolicy([{'branch': 'Delhi', 'max_discount_percentage': 40}])
+        self.assertFalse(capped_requests.evaluate('Delhi', 'JEE', 100000.0, 90000.0, 45000.0).ok)
+        self.assertTrue(capped_requests.evaluate_approval('Delhi', 'JEE', 'L1', 100000.0, 90000.0, 40000.0).ok)
+        self.assertEqual(policy.evaluate_approval('Delhi', 'JEE', 'L2', 100000.0, 90000.0, 0).errors,
+                         ['Approved amount must be greater than 0.'])
+
+    def test_batch_matches_single_evaluations(self):
+        rng = np.random.default_rng(7)
+        size = 200
+        branches = rng.choice(['Delhi', 'Kolkata'], size).tolist()
+        cards = rng.choice(['JEE', 'NEET'], size).tolist()
+        mrp = rng.choice([50000.0, 100000.0], size)
+        installment = mrp * 0.9
+        discount = rng.uniform(0, 1.1, size) * mrp
+        submitted_mrp = mrp + rng.choice([0, 0, 0, 5], size)
+
+        policy = DiscountPolicy(RULES)
+        batch = policy.evaluate_batch(branches, cards, mrp, installment, discount, submitted_mrp, installment)
+        for i in range(size):
+            single = policy.evaluate(branches[i], cards[i], mrp[i], installment[i], discount[i],
+                                     submitted_mrp[i], installment[i])
+            self.assertEqual(batch.messages(i, submitted_mrp[i], installment[i]), single.violations)
+            self.assertEqual(batch.fields(i), single.fields())
+            self.assertEqual(bool(batch.ok[i]), single.ok)
+        self.assertGreater(batch.counts()[EXCEEDS_MRP], 0)
+        self.assertNotIn(INSTALLMENT_MISMATCH, [code for code, n in batch.counts().items() if n])
+
+    def test_backlog_reevaluation_is_fast(self):
+        size = 200000
+        rows = {'branch_name': ['Delhi', 'Kolkata', 'Patna', 'Siliguri'] * (size // 4),
+                'card_name': ['JEE', 'NEET'] * (size // 2)}
+        mrp = np.full(size, 100000.0)
+        started = time.perf_counter()
+        batch = DiscountPolicy(RULES).evaluate_batch(rows['branch_name'], rows['card_name'], mrp, mrp * 0.9,
+                                                     np.linspace(0, 100000, size))
+        self.assertEqual(len(batch), size)
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for the what-if discount policy simulator.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from discount_simulator import SimulationData, DiscountSimulator, simulate, candidate_policy
+from live_updates import QueueScope
+
+
+def snapshot(rows):
+    """An analytics snapshot table from (branch, card, month, status, mrp, installment, net_discount) rows."""
+    columns = list(zip(*rows))
+    return pa.table({
+        'branch_name': list(columns[0]), 'card_name': list(columns[1]), 'month': list(columns[2]),
+        'mrp': list(columns[4]), 'installment': list(columns[5]), 'net_discount': list(columns[6]),
+        'is_approved': [int(status == 'APPROVED') for status in columns[3]],
+        'is_pending': [int(status.startswith('PENDING')) for status in columns[3]],
+    })
+
+
+ROWS = [
+    ('Delhi', 'JEE', '2026-01', 'APPROVED', 100000.0, 80000.0, 40000.0),      # 50%
+    ('Delhi', 'JEE', '2026-02', 'PENDING_L1', 100000.0, 80000.0, 28000.0),    # 35%
+    ('Delhi', 'NEET', '2026-02', 'APPROVED', 50000.0, 40000.0, 30000.0),      # 75%
+    ('Kolkata', 'JEE', '2026-01', 'PENDING_L2', 100000.0, 80000.0, 60000.0),  # 75%
+    ('Kolkata', 'JEE', '2026-01', 'REJECTED', 100000.0, 80000.0, 70000.0),    # not simulated
+]
+
+
+class FakeAnalytics:
+    def __init__(self, table):
+        self.current = table
+
+    def table(self):
+        return self.current
+
+
+class TestSimulation(unittest.TestCase):
+
+    def setUp(self):
+        self.data = SimulationData(snapshot(ROWS))
+
+    def test_current_policy_changes_nothing(self):
+        groups, totals = simulate(self.data, candidate_policy(), ['branch'])
+        self.assertEqual([(g['branch'], g['requests'], g['approved']) for g in groups],
+                         [('Delhi', 3, 2), ('Kolkata', 1, 0)])
+        self.assertEqual(totals['revenue_delta'], 0)
+        self.assertEqual(totals['baseline_revenue'], 60000.0 + 72000.0 + 20000.0 + 40000.0)
+
+    def test_caps_and_threshold(self):
+        policy = candidate_policy([{'card': 'JEE', 'max_discount_percentage': 60}], min_discount_percentage=40)
+        groups, totals = simulate(self.data, policy, ['branch', 'card'])
+        by_group = {(g['branch'], g['card']): g for g in groups}
+
+        # 75% of 80000 capped at 60% is 12000 more revenue; 50% is under the cap
+        self.assertEqual(by_group[('Kolkata', 'JEE')]['revenue_delta'], 12000.0)
+        self.assertEqual(by_group[('Delhi', 'JEE')]['capped'], 0)
+        # 35% is now at or below the ERP threshold
+        self.assertEqual(by_group[('Delhi', 'JEE')]['routed_to_erp'], 1)
+        self.assertEqual(by_group[('Delhi', 'NEET')]['revenue_delta'], 0)
+        self.assertEqual((totals['capped'], totals['routed_to_erp'], totals['revenue_delta']), (1, 1, 12000.0))
+
+    def test_group_by_month_and_scope(self):
+        scope = QueueScope('PENDING_L1', branch_in=['Kolkata'])
+        groups, totals = simulate(self.data, candidate_policy(max_discount_percentage=50), ['month'], scope)
+        self.assertEqual(groups, [{'month': '2026-01', 'requests': 1, 'approved': 0, 'baseline_revenue': 40000.0,
+                                   'simulated_revenue': 60000.0, 'capped': 1, 'routed_to_erp': 0,
+                                   'revenue_delta': 20000.0}])
+        with self.assertRaises(ValueError):
+            simulate(self.data, candidate_policy(), ['requester'])
+
+    def test_matches_row_by_row_evaluation(self):
+        rng = np.random.default_rng(3)
+        size = 5000
+        installment = rng.choice([40000.0, 80000.0], size)
+        rows = list(zip(rng.choice(['Delhi', 'Kolkata', 'Patna'], size), rng.choice(['JEE', 'NEET'], size),
+                        rng.choice(['2026-01', '2026-02'], size), ['APPROVED'] * size,
+                        installment * 1.25, installment, rng.uniform(0, 1, size) * installment))
+        policy = candidate_policy([{'branch': 'Patna', 'max_discount_percentage': 45},
+                                   {'card': 'NEET', 'max_discount_percentage': 55}])
+        _, totals = simulate(SimulationData(snapshot(rows)), policy)
+
+        expected = 0.0
+        for branch, card, _, _, mrp, installment, discount in rows:
+            maximum = policy.settings_for(branch, card)['max_discount_percentage']
+            cap = discount if maximum is None else maximum * installment / 100
+            expected += mrp - min(discount, cap)
+        self.assertAlmostEqual(totals['simulated_revenue'], round(expected, 2), places=0)
+
+    def test_simulator_reuses_data_until_the_snapshot_changes(self):
+        analytics = FakeAnalytics(snapshot(ROWS))
+        simulator = DiscountSimulator(analytics)
+        data = simulator.data()
+        self.assertIs(simulator.data(), data)
+        analytics.current = snapshot(ROWS[:1])
+        self.assertEqual(simulator.run(candidate_policy())[1]['requests'], 1)
+        self.assertEqual(DiscountSimulator(FakeAnalytics(None)).run(candidate_policy()), ([], None))
+
+
+if __name__ == '__main__':
+    unittest.main()
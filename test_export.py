@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming CSV/Parquet export.
+"""
+
+import io
+import sys
+import unittest
+from datetime import date
+from unittest import mock
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import ArrowRows, FakeClient
+from export import build_export_query, export_stream, stream_export, parse_date, REQUEST_COLUMNS
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+
+class FakeStorageClient:
+    def __init__(self):
+        self.transport = mock.Mock()
+
+
+def request_batch(start, count):
+    return pa.record_batch({
+        'enquiry_no': [f"EN{n:09d}" for n in range(start, start + count)],
+        'branch_name': ['Delhi'] * count,
+        'net_discount': [15000.0] * count,
+    })
+
+
+class TestExportQuery(unittest.TestCase):
+
+    def test_filters_are_parameterized(self):
+        query, params = build_export_query(PROJECT_ID, DATASET_ID, 'requests',
+                                           date_from=date(2025, 1, 1), date_to=date(2025, 1, 31),
+                                           branch="Delhi' OR 1=1", status='APPROVED')
+        self.assertIn('CAST(created_at AS TIMESTAMP) >= @start_at', query)
+        self.assertIn('CAST(created_at AS TIMESTAMP) < @end_at', query)
+        self.assertNotIn('OR 1=1', query)
+        values = {p.name: p.value for p in params}
+        self.assertEqual(values['branch_name'], "Delhi' OR 1=1")
+        self.assertEqual(values['status'], 'APPROVED')
+        # The end date is inclusive
+        self.assertEqual(values['end_at'].date(), date(2025, 2, 1))
+
+    def test_event_sourced_requests_are_read_from_request_state(self):
+        query, _ = build_export_query(PROJECT_ID, DATASET_ID, 'requests')
+        self.assertIn(f'`{PROJECT_ID}.{DATASET_ID}.discount_requests`', query)
+        query, _ = build_export_query(PROJECT_ID, DATASET_ID, 'requests', event_sourced=True)
+        self.assertIn(f'`{PROJECT_ID}.{DATASET_ID}.request_state`', query)
+        query, _ = build_export_query(PROJECT_ID, DATASET_ID, 'analytics', event_sourced=True)
+        self.assertIn(f'`{PROJECT_ID}.{DATASET_ID}.discount_analytics`', query)
+
+    def test_rejects_unsupported_filters(self):
+        with self.assertRaises(ValueError):
+            build_export_query(PROJECT_ID, DATASET_ID, 'analytics', status='APPROVED')
+        with self.assertRaises(ValueError):
+            build_export_query(PROJECT_ID, DATASET_ID, 'students')
+        with self.assertRaises(ValueError):
+            build_export_query(PROJECT_ID, DATASET_ID, 'requests',
+                               date_from=date(2025, 2, 1), date_to=date(2025, 1, 1))
+        with self.assertRaises(ValueError):
+            parse_date('01/02/2025')
+
+
+class TestStreamExport(unittest.TestCase):
+
+    def setUp(self):
+        self.storage_client = FakeStorageClient()
+        patcher = mock.patch('export._storage_client', return_value=self.storage_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_csv_is_written_batch_by_batch(self):
+        client = FakeClient(ArrowRows([request_batch(0, 3), request_batch(3, 2)]))
+        chunks = export_stream(client, PROJECT_ID, DATASET_ID, 'requests', 'csv', branch='Delhi')
+        self.assertEqual(client.queries, [])  # nothing runs until the response is iterated
+
+        first = next(chunks)
+        self.assertEqual(client.rows.pulled, 1)
+        self.assertTrue(first.startswith(b'"enquiry_no","branch_name","net_discount"\n'))
+        lines = (first + b''.join(chunks)).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[-1], '"EN000000004","Delhi",15000')
+        self.storage_client.transport.close.assert_called_once_with()
+
+    def test_parquet_has_one_row_group_per_batch(self):
+        client = FakeClient(ArrowRows([request_batch(0, 3), request_batch(3, 2)]))
+        data = b''.join(export_stream(client, PROJECT_ID, DATASET_ID, 'requests', 'parquet'))
+        parquet = pq.ParquetFile(io.BytesIO(data))
+        self.assertEqual(parquet.num_row_groups, 2)
+        self.assertEqual(parquet.read().num_rows, 5)
+
+    def test_empty_export_is_still_a_valid_file(self):
+        header = b''.join(stream_export(iter([]), 'csv', REQUEST_COLUMNS)).decode()
+        self.assertEqual(header.strip().split(','), [f'"{c}"' for c in REQUEST_COLUMNS])
+        table = pq.read_table(io.BytesIO(b''.join(stream_export(iter([]), 'parquet', REQUEST_COLUMNS))))
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.column_names, REQUEST_COLUMNS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the Server-Sent Events broker.
+"""
+
+import sys
+import json
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from live_updates import LiveUpdateBroker, QueueScope, stats_delta
+
+LATER = '2999-01-01T00:00:00.000000+00:00'
+
+
+def event(enquiry_no):
+    return {'event_id': f'ev-{enquiry_no}', 'enquiry_no': enquiry_no, 'occurred_at': LATER}
+
+
+def row(enquiry_no, status, branch='Delhi'):
+    return {'enquiry_no': enquiry_no, 'status': status, 'branch_name': branch}
+
+
+def drain(subscription):
+    messages = []
+    while not subscription.messages.empty():
+        messages.append(subscription.messages.get_nowait())
+    return messages
+
+
+class StatsDeltaTests(unittest.TestCase):
+
+    def test_deltas(self):
+        self.assertEqual(stats_delta(None, 'PENDING_L1'), {'total': 1, 'pending': 1})
+        self.assertEqual(stats_delta('PENDING_L1', 'PENDING_L2'), {})
+        self.assertEqual(stats_delta('PENDING_L2', 'APPROVED'), {'pending': -1, 'approved': 1})
+
+
+class BrokerTests(unittest.TestCase):
+    """Routing events to subscribers by queue scope."""
+
+    def test_queue_scope_routing(self):
+        broker = LiveUpdateBroker(max_streams=10)
+        east = broker.subscribe(QueueScope('PENDING_L1', branch_in=['Kolkata']))
+        l2 = broker.subscribe(QueueScope('PENDING_L2'))
+        requester = broker.subscribe(QueueScope())
+
+        broker.on_request_event(event('EN1'), row('EN1', 'PENDING_L1', 'Kolkata'), None)
+        broker.on_request_event(event('EN2'), row('EN2', 'PENDING_L1', 'Delhi'), None)
+        broker.on_request_event(event('EN1'), row('EN1', 'PENDING_L2', 'Kolkata'), 'PENDING_L1')
+
+        east_messages = drain(east)
+        self.assertEqual(sum(m.startswith('event: request') for m in east_messages), 2)
+        self.assertEqual(sum(m.startswith('event: request') for m in drain(l2)), 1)
+        requester_messages = drain(requester)
+        self.assertTrue(all(m.startswith('event: stats') for m in requester_messages))
+        self.assertEqual(len(requester_messages), 2)
+
+    def test_replayed_events_are_not_pushed(self):
+        broker = LiveUpdateBroker(max_streams=10)
+        subscription = broker.subscribe(QueueScope('PENDING_L1'))
+        old = dict(event('EN1'), occurred_at='2020-01-01T00:00:00.000000+00:00')
+        broker.on_request_event(old, row('EN1', 'PENDING_L1'), None)
+        self.assertEqual(drain(subscription), [])
+
+    def test_stream_cap_and_overflow(self):
+        broker = LiveUpdateBroker(max_streams=1, max_stream_seconds=1, poll_seconds=0.01)
+        subscription = broker.subscribe(QueueScope())
+        self.assertIsNone(broker.subscribe(QueueScope()))
+        for i in range(200):
+            broker.on_request_event(event(f'EN{i}'), row(f'EN{i}', 'PENDING_L1'), None)
+        body = list(broker.stream(subscription))
+        self.assertTrue(body[0].startswith('retry:'))
+        self.assertTrue(body[-1].startswith('event: resync'))
+        self.assertEqual(broker.stream_count(), 0)
+
+    def test_stream_delivers_messages(self):
+        broker = LiveUpdateBroker(max_streams=1, max_stream_seconds=0.2, poll_seconds=0.01)
+        subscription = broker.subscribe(QueueScope('PENDING_L2'))
+        ticks = []
+        broker.on_request_event(event('EN1'), row('EN1', 'PENDING_L2'), 'PENDING_L1')
+        body = list(broker.stream(subscription, tick=lambda: ticks.append(1)))
+        request_message = [m for m in body if m.startswith('event: request')][0]
+        self.assertEqual(json.loads(request_message.split('data: ')[1])['enquiry_no'], 'EN1')
+        self.assertTrue(ticks)
+
+
+if __name__ == '__main__':
+    unittest.main()
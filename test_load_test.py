@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Smoke test for the load-test runner against the stand-in app.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from google.cloud import bigquery
+
+import load_test
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'loadtest.sqlite3')
+
+
+class TestStandInBigQuery(unittest.TestCase):
+
+    def test_l1_approvers_are_narrowed_to_the_pool(self):
+        client = load_test.StandInBigQueryClient(DB_PATH, latency_ms=0, dml_latency_ms=0)
+        pool = sorted(load_test.ApproverPools.load().pool_for('Kolkata'))
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter('branch_name', 'STRING', 'Kolkata'),
+            bigquery.ScalarQueryParameter('level', 'STRING', 'L1'),
+            bigquery.ArrayQueryParameter('pool', 'STRING', pool),
+        ])
+        rows = client.query("""
+            SELECT email, name FROM `p.d.authorized_persons`
+            WHERE is_active = TRUE AND approver_level = @level
+            AND (@branch_name IN UNNEST(branch_names) OR 'All' IN UNNEST(branch_names))
+            AND email IN UNNEST(@pool)
+        """, job_config=job_config).result()
+        self.assertEqual(sorted(row['email'] for row in rows), pool)
+        load_test.reset_standin_db(DB_PATH)
+
+
+class TestLoadTestRunner(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from werkzeug.serving import make_server
+
+        load_test.reset_standin_db(DB_PATH)
+        # No simulated latency, whatever the LOADTEST_* environment says
+        app = load_test.standin_app(DB_PATH, latency_ms=0, dml_latency_ms=0, smtp_latency_ms=0)
+        cls.server = make_server('127.0.0.1', 0, app, threaded=True)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.thread.join(timeout=10)
+        load_test.reset_standin_db(DB_PATH)
+
+    def test_short_scenario_completes_every_journey(self):
+        runner = load_test.LoadTestRunner(f'http://127.0.0.1:{self.server.server_port}', counselors=8,
+                                          timeout=30, max_in_flight=8)
+        metrics = load_test.MetricsCollector()
+        for _ in range(3):
+            runner.counselor_journey(metrics)
+        # Each submitted request schedules its L1 -> L2 approval chain
+        runner.pool.shutdown(wait=True)
+
+        errors = [sample for sample in metrics.samples if not sample[2]]
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(metrics.journeys), [('approval', True)] * 3 + [('counselor', True)] * 3)
+
+        summary = load_test.summarize(1.0, 3.0, metrics)
+        self.assertEqual(summary['journey_error_pct'], 0.0)
+        self.assertEqual(summary['submitted_per_s'], 1.0)
+        self.assertEqual(summary['steps']['l2_approve']['count'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Tests for the checkpointed migration engine.
+"""
+
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import FakeClient, query_params
+from migrate_database import (
+    MigrationError, MigrationRunner, load_migrations, parse_migration, chunk_ranges
+)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class MigrationClient(FakeClient):
+    """Keeps schema_migrations rows in memory and answers the chunk bounds probe."""
+
+    def __init__(self, low=None, high=None, on_query=None, missing=0):
+        super().__init__()
+        self.low = low
+        self.high = high
+        self.missing = missing
+        self.on_query = on_query
+        self.ledger = []
+
+    def respond(self, query, params):
+        if self.on_query:
+            self.on_query(query, params)
+        with self._lock:
+            if 'SELECT migration, step, chunk, checksum' in query:
+                return [dict(row) for row in self.ledger]
+            if 'MIN(' in query:
+                return [{'low': self.low, 'high': self.high, 'missing': self.missing}]
+            if query.lstrip().startswith('DELETE FROM') and 'schema_migrations' in query:
+                self.ledger = [row for row in self.ledger if row['migration'] != params['migration']]
+            elif 'INSERT INTO' in query and 'schema_migrations' in query:
+                self.ledger.append({'migration': params['ledger_migration'], 'step': params['ledger_step'],
+                                    'chunk': params['ledger_chunk'], 'checksum': params['ledger_checksum']})
+            return []
+
+    @staticmethod
+    def _bookkeeping(query):
+        if 'MIN(' in query:
+            return True
+        statement = query.lstrip()
+        return 'schema_migrations' in query and statement.startswith(
+            ('SELECT migration, step, chunk, checksum', 'DELETE FROM', 'CREATE TABLE IF NOT EXISTS', 'INSERT INTO'))
+
+    def statements(self):
+        """Migration statements run (ledger reads and writes and the bounds probe excluded)."""
+        return [(query, query_params(job_config)) for query, job_config in self.queries
+                if not self._bookkeeping(query)]
+
+
+MIGRATION_001 = """-- Migration 001: tables
+CREATE TABLE IF NOT EXISTS `p.d.a` (id STRING);
+CREATE TABLE IF NOT EXISTS `p.d.b` (id STRING)
+"""
+
+MIGRATION_002 = """-- Migration 002: backfill
+INSERT INTO `p.d.a` SELECT 'x';
+
+-- @chunk_by source.created_at MONTH
+INSERT INTO `p.d.b` SELECT id FROM `p.d.source`
+WHERE CAST(created_at AS TIMESTAMP) >= @chunk_start AND CAST(created_at AS TIMESTAMP) < @chunk_end
+   OR @chunk_start IS NULL AND created_at IS NULL;
+
+-- @parallel children
+INSERT INTO `p.d.c` SELECT 'l1';
+
+-- @parallel children
+INSERT INTO `p.d.c` SELECT 'l2'
+"""
+
+
+class MigrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        (self.dir / '001_tables.sql').write_text(MIGRATION_001)
+        (self.dir / '002_backfill.sql').write_text(MIGRATION_002)
+        (self.dir / 'rollback').mkdir()
+        (self.dir / 'rollback' / '002_backfill.sql').write_text('TRUNCATE TABLE `p.d.b`;\nTRUNCATE TABLE `p.d.c`\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+class TestParsing(MigrationTestCase):
+
+    def test_annotations_and_checksums(self):
+        migration = parse_migration(self.dir / '002_backfill.sql')
+        self.assertEqual(migration.version, '002')
+        self.assertEqual([step.chunk_by for step in migration.steps],
+                         [None, ('source', 'created_at', 'MONTH'), None, None])
+        self.assertEqual([step.parallel for step in migration.steps], [None, None, 'children', 'children'])
+        self.assertTrue(all(step.is_dml for step in migration.steps))
+
+        # Plain comments don't change the checksum, statements and annotations do
+        step = migration.steps[0]
+        (self.dir / 'edited.sql').write_text(MIGRATION_002.replace('-- Migration 002: backfill', '-- reworded'))
+        self.assertEqual(parse_migration(self.dir / 'edited.sql').steps[0].checksum, step.checksum)
+        (self.dir / 'edited.sql').write_text(MIGRATION_002.replace("SELECT 'x'", "SELECT 'y'"))
+        self.assertNotEqual(parse_migration(self.dir / 'edited.sql').steps[0].checksum, step.checksum)
+
+    def test_chunked_statements_must_use_the_chunk_parameters(self):
+        (self.dir / 'bad.sql').write_text('-- @chunk_by source.created_at\nINSERT INTO `p.d.b` SELECT 1')
+        with self.assertRaises(MigrationError):
+            parse_migration(self.dir / 'bad.sql')
+        (self.dir / 'bad.sql').write_text('-- @chunked source.created_at\nINSERT INTO `p.d.b` SELECT 1')
+        with self.assertRaises(MigrationError):
+            parse_migration(self.dir / 'bad.sql')
+        # Rows without a created_at must be picked up by the final chunk
+        (self.dir / 'bad.sql').write_text('-- @chunk_by source.created_at\nINSERT INTO `p.d.b` SELECT 1 '
+                                          'WHERE t >= @chunk_start AND t < @chunk_end')
+        with self.assertRaises(MigrationError):
+            parse_migration(self.dir / 'bad.sql')
+
+    def test_chunk_ranges(self):
+        self.assertEqual(chunk_ranges(utc(2024, 11, 20, 5), utc(2025, 1, 3), 'MONTH'), [
+            (utc(2024, 11, 1), utc(2024, 12, 1)),
+            (utc(2024, 12, 1), utc(2025, 1, 1)),
+            (utc(2025, 1, 1), utc(2025, 2, 1)),
+        ])
+        self.assertEqual(chunk_ranges(utc(2025, 1, 1, 12), utc(2025, 1, 2), 'DAY'),
+                         [(utc(2025, 1, 1), utc(2025, 1, 2)), (utc(2025, 1, 2), utc(2025, 1, 3))])
+        self.assertEqual(chunk_ranges(None, None, 'MONTH'), [])
+
+
+class TestMigrationRunner(MigrationTestCase):
+
+    def test_dml_commits_with_its_ledger_row_and_chunks_are_checkpointed(self):
+        client = MigrationClient(low=utc(2025, 1, 15), high=utc(2025, 3, 2))
+        self.assertTrue(MigrationRunner(client, 'p', 'd').run(load_migrations(self.dir)))
+
+        statements = client.statements()
+        # 2 DDL + 1 insert + 3 monthly chunks + 2 parallel inserts
+        self.assertEqual(len(statements), 8)
+        chunk_scripts = [(q, p) for q, p in statements if 'chunk_start' in p]
+        self.assertEqual([p['chunk_start'] for _, p in chunk_scripts], [utc(2025, 1, 1), utc(2025, 2, 1), utc(2025, 3, 1)])
+        for query, params in chunk_scripts:
+            self.assertTrue(query.startswith('BEGIN TRANSACTION;'))
+            self.assertIn('schema_migrations', query)
+            self.assertEqual(params['ledger_chunk'], params['chunk_start'].isoformat())
+        self.assertIn(('002_backfill', '2', ''), {(r['migration'], r['step'], r['chunk']) for r in client.ledger})
+
+        # A second run finds everything applied
+        client.queries = []
+        self.assertTrue(MigrationRunner(client, 'p', 'd').run(load_migrations(self.dir)))
+        self.assertEqual(client.statements(), [])
+
+    def test_rows_without_a_value_run_in_a_final_chunk(self):
+        client = MigrationClient(low=utc(2025, 1, 15), high=utc(2025, 2, 2), missing=3)
+        self.assertTrue(MigrationRunner(client, 'p', 'd').run(load_migrations(self.dir)))
+        chunks = [p for _, p in client.statements() if 'chunk_start' in p]
+        self.assertEqual([(p['chunk_start'], p['chunk_end'], p['ledger_chunk']) for p in chunks], [
+            (utc(2025, 1, 1), utc(2025, 2, 1), utc(2025, 1, 1).isoformat()),
+            (utc(2025, 2, 1), utc(2025, 3, 1), utc(2025, 2, 1).isoformat()),
+            (None, None, 'null'),
+        ])
+
+    def test_bounded_runs_resume_from_the_last_chunk(self):
+        client = MigrationClient(low=utc(2025, 1, 15), high=utc(2025, 3, 2))
+        self.assertFalse(MigrationRunner(client, 'p', 'd', max_chunks=2).run(load_migrations(self.dir)))
+        self.assertEqual(len([p for _, p in client.statements() if 'chunk_start' in p]), 2)
+
+        client.queries = []
+        self.assertTrue(MigrationRunner(client, 'p', 'd').run(load_migrations(self.dir)))
+        resumed = client.statements()
+        self.assertEqual([p['chunk_start'] for _, p in resumed if 'chunk_start' in p], [utc(2025, 3, 1)])
+        self.assertEqual(len(resumed), 3)  # the last chunk and the two parallel statements
+
+    def test_failure_stops_and_a_rerun_resumes(self):
+        def fail_l2(query, params):
+            if "'l2'" in query:
+                raise RuntimeError('quota exceeded')
+        client = MigrationClient(on_query=fail_l2)
+        with self.assertRaises(MigrationError):
+            MigrationRunner(client, 'p', 'd').run(load_migrations(self.dir))
+
+        client.on_query = None
+        client.queries = []
+        self.assertTrue(MigrationRunner(client, 'p', 'd').run(load_migrations(self.dir)))
+        self.assertEqual(len(client.statements()), 1)
+        self.assertIn("'l2'", client.statements()[0][0])
+
+    def test_parallel_group_runs_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait_for_sibling(query, params):
+            if "'l1'" in query or "'l2'" in query:
+                barrier.wait()
+        client = MigrationClient(on_query=wait_for_sibling)
+        self.assertTrue(MigrationRunner(client, 'p', 'd', workers=2).run(load_migrations(self.dir)))
+
+    def test_concurrent_transaction_aborts_are_retried(self):
+        attempts = []
+
+        def abort_once(query, params):
+            if "'x'" in query:
+                attempts.append(query)
+                if len(attempts) == 1:
+                    raise RuntimeError('Transaction is aborted due to concurrent update')
+        client = MigrationClient(on_query=abort_once)
+        with mock.patch('migrate_database.time.sleep'):
+            self.assertTrue(MigrationRunner(client, 'p', 'd').run(load_migrations(self.dir)))
+        self.assertEqual(len(attempts), 2)
+
+    def test_baseline_and_rollback(self):
+        client = MigrationClient()
+        runner = MigrationRunner(client, 'p', 'd')
+        runner.baseline(load_migrations(self.dir))
+        self.assertEqual(client.statements(), [])
+        self.assertEqual(runner.status(load_migrations(self.dir)), [('001_tables', 2, 2), ('002_backfill', 4, 4)])
+
+        self.assertEqual(runner.rollback(load_migrations(self.dir)), ['002_backfill'])
+        self.assertEqual([q for q, _ in client.statements()], ['TRUNCATE TABLE `p.d.b`', 'TRUNCATE TABLE `p.d.c`'])
+        self.assertEqual(runner.status(load_migrations(self.dir)), [('001_tables', 2, 2), ('002_backfill', 0, 4)])
+
+        # 001 has no rollback script
+        with self.assertRaises(MigrationError):
+            runner.rollback(load_migrations(self.dir), to_version='000')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for digest delivery of approver notifications.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from notifications import build_request_context, L1_APPROVAL_REQUIRED, L2_APPROVAL_REQUIRED
+from notification_digest import DigestScheduler
+
+CC_EMAILS = ['cc1@pw.live', 'cc2@pw.live']
+
+
+def request_context(enquiry_no, percent=40.0):
+    return build_request_context({'enquiry_no': enquiry_no, 'installment': 100.0, 'net_discount': percent})
+
+
+class RecordingSender:
+    def __init__(self, failing=()):
+        self.sent = []
+        self.failing = set(failing)
+
+    def __call__(self, to_emails, subject, body, text_body=None, cc_emails=None):
+        if to_emails[0] in self.failing:
+            if to_emails[0].startswith('raise'):
+                raise OSError('SMTP connection lost')
+            return False
+        self.sent.append({'to': list(to_emails), 'subject': subject, 'body': body, 'cc': cc_emails})
+        return True
+
+
+class DigestTests(unittest.TestCase):
+    """Queueing, urgent bypass and flushing."""
+
+    def test_disabled_sends_immediately(self):
+        sender = RecordingSender()
+        digest = DigestScheduler(sender, CC_EMAILS, interval_minutes=0)
+        digest.notify(['l1@pw.live'], L1_APPROVAL_REQUIRED, request_context('EN1'), 'S', 'B')
+        self.assertEqual(len(sender.sent), 1)
+        self.assertEqual(digest.pending_count(), 0)
+
+    def test_urgent_request_bypasses_queue(self):
+        sender = RecordingSender()
+        digest = DigestScheduler(sender, CC_EMAILS, interval_minutes=60, urgent_percent=60)
+        digest.notify(['l1@pw.live'], L1_APPROVAL_REQUIRED, request_context('EN1', 75.0), 'S', 'B')
+        self.assertEqual(len(sender.sent), 1)
+        self.assertIsNone(sender.sent[0]['cc'])
+
+    def test_flush_sends_one_digest_per_recipient_and_one_to_cc(self):
+        sender = RecordingSender()
+        digest = DigestScheduler(sender, CC_EMAILS, interval_minutes=60)
+        digest._ensure_timer = lambda: None
+        for i in range(50):
+            digest.notify(['l1a@pw.live', 'l1b@pw.live'], L1_APPROVAL_REQUIRED, request_context(f'EN{i}'), 'S', 'B')
+        digest.notify(['l2@pw.live'], L2_APPROVAL_REQUIRED, request_context('EN0'), 'S', 'B')
+        self.assertEqual(sender.sent, [])
+        self.assertEqual(digest.flush(), 4)
+        self.assertEqual([m['to'] for m in sender.sent],
+                         [['l1a@pw.live'], ['l1b@pw.live'], ['l2@pw.live'], ['cc1@pw.live']])
+        self.assertEqual(sender.sent[-1]['cc'], ['cc2@pw.live'])
+        self.assertIn('51 awaiting approval', sender.sent[-1]['subject'])
+        self.assertIn('EN49', sender.sent[0]['body'])
+        self.assertEqual(digest.pending_count(), 0)
+        self.assertEqual(digest.flush(), 0)
+
+    def test_failed_digests_are_retried_then_dropped(self):
+        sender = RecordingSender(failing=['down@pw.live', 'raise@pw.live'])
+        digest = DigestScheduler(sender, CC_EMAILS, interval_minutes=60, max_attempts=2)
+        digest._ensure_timer = lambda: None
+        digest.notify(['down@pw.live', 'raise@pw.live', 'l1@pw.live'], L1_APPROVAL_REQUIRED,
+                      request_context('EN1'), 'S', 'B')
+        # A failing send, or one that raises, does not lose the other recipients' digests
+        self.assertEqual(digest.flush(), 2)
+        self.assertEqual([m['to'] for m in sender.sent], [['l1@pw.live'], ['cc1@pw.live']])
+        self.assertEqual(digest.pending_count(), 2)
+
+        digest.notify(['down@pw.live'], L1_APPROVAL_REQUIRED, request_context('EN2'), 'S', 'B')
+        sender.failing.discard('down@pw.live')
+        self.assertEqual(digest.flush(), 2)
+        self.assertIn('EN1', sender.sent[2]['body'])
+        self.assertIn('EN2', sender.sent[2]['body'])
+        # raise@pw.live failed max_attempts times
+        self.assertEqual((digest.pending_count(), digest.dropped), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
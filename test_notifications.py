@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for notification email rendering.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import notifications
+from notifications import (
+    build_request_context, render_notification, build_message,
+    L1_APPROVAL_REQUIRED, L2_APPROVAL_REQUIRED
+)
+
+REQUEST_ROW = {
+    'enquiry_no': 'EN123456789', 'student_name': 'Asha <Rao>', 'mobile_no': '9876543210',
+    'branch_name': 'Delhi', 'card_name': 'Lakshya', 'mrp': 50000.0, 'installment': 40000.0,
+    'discounted_fees': 30000.0, 'net_discount': 20000.0, 'reason': 'Sibling',
+    'requester_name': 'Counselor', 'requester_email': 'counselor@pw.live',
+}
+
+
+class RenderTests(unittest.TestCase):
+    """Rendering the approval notifications from a request row."""
+
+    def test_l1_notification(self):
+        subject, html, text = render_notification(L1_APPROVAL_REQUIRED, build_request_context(REQUEST_ROW))
+        self.assertEqual(subject, 'New Discount Request - EN123456789')
+        self.assertIn('₹20,000.00', html)
+        self.assertIn('50.00%', html)
+        self.assertIn('Asha &lt;Rao&gt;', html)
+        self.assertIn('Student Name: Asha <Rao>', text)
+        self.assertIn(f"{notifications.APP_BASE_URL}/approve_request", text)
+
+    def test_l2_notification_uses_extra_context(self):
+        context = build_request_context(REQUEST_ROW, l1_approver='l1@pw.live')
+        subject, html, _ = render_notification(L2_APPROVAL_REQUIRED, context)
+        self.assertEqual(subject, 'L2 Approval Required - EN123456789')
+        self.assertIn('l1@pw.live', html)
+
+    def test_render_is_cached_per_event(self):
+        context = build_request_context(REQUEST_ROW)
+        first = render_notification(L1_APPROVAL_REQUIRED, context, cache_key='event-1')
+        second = render_notification(L1_APPROVAL_REQUIRED, dict(context, student_name='Other'),
+                                     cache_key='event-1')
+        self.assertIs(first, second)
+        # Another requester's submission of the same enquiry is a different event
+        other = render_notification(L1_APPROVAL_REQUIRED, dict(context, student_name='Other'),
+                                    cache_key='event-2')
+        self.assertIn('Other', other[1])
+
+    def test_multipart_message(self):
+        msg = build_message('Subject', '<b>hi</b>', 'from@pw.live', 'to@pw.live', ['cc@pw.live'], 'hi')
+        self.assertTrue(msg.is_multipart())
+        self.assertEqual([part.get_content_type() for part in msg.get_payload()], ['text/plain', 'text/html'])
+        self.assertEqual(msg['Cc'], 'cc@pw.live')
+
+
+if __name__ == '__main__':
+    unittest.main()
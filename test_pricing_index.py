@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Tests for price-as-of-date lookups over pricing_history.
+"""
+
+import sys
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import FakeClient
+from pricing_index import PriceIntervals, PricingIndex, reprice_course, recompute_discounts, to_epoch
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+
+def price(effective_date, end_date, mrp, installment=None):
+    return {'effective_date': effective_date, 'end_date': end_date,
+            'mrp': mrp, 'installment': installment or mrp * 0.9}
+
+
+HISTORY = [
+    # Out of order, with the first interval left open by mistake
+    dict(price('2026-03-01T00:00:00', None, 120000.0), course_id='C1'),
+    dict(price('2026-01-01T00:00:00', None, 100000.0), course_id='C1'),
+    dict(price('2025-06-01T00:00:00', None, 50000.0), course_id='C2'),
+]
+COURSES = {'C1': ('Delhi', 'JEE', True), 'C2': ('Kolkata', 'NEET', True), 'C0': ('Delhi', 'JEE', False)}
+
+
+class PricingClient(FakeClient):
+    """Serves pricing_history and discount_requests."""
+
+    def __init__(self, requests=()):
+        super().__init__()
+        self.requests = list(requests)
+
+    def respond(self, query, params):
+        if 'pricing_history` ph' in query:
+            rows = [dict(row, branch_name=COURSES[row['course_id']][0], card_name=COURSES[row['course_id']][1],
+                         is_active=COURSES[row['course_id']][2])
+                    for row in HISTORY + [dict(price('2024-01-01T00:00:00', '2025-01-01T00:00:00', 1.0),
+                                               course_id='C0')]]
+            return rows
+        if 'FROM `' in query and 'discount_requests`' in query:
+            return self.requests
+        return []
+
+
+class TestPriceIntervals(unittest.TestCase):
+
+    def setUp(self):
+        self.intervals = PriceIntervals([
+            price('2026-03-01T00:00:00', None, 120000.0),
+            price('2026-01-01T00:00:00', None, 100000.0),
+            price('2025-06-01T00:00:00', '2025-09-01T00:00:00', 80000.0),
+        ])
+
+    def test_boundaries(self):
+        at = lambda when: (self.intervals.at(to_epoch(when)) or {}).get('mrp')
+        self.assertIsNone(at('2025-05-31T23:59:59'))
+        self.assertEqual(at('2025-06-01T00:00:00'), 80000.0)
+        # A gap between a closed interval and the next one
+        self.assertIsNone(at('2025-10-01T00:00:00'))
+        # The open interval is clamped at the next start
+        self.assertEqual(at('2026-02-28T23:59:59'), 100000.0)
+        self.assertEqual(at('2026-03-01T00:00:00'), 120000.0)
+        self.assertEqual(at('2030-01-01T00:00:00'), 120000.0)
+
+    def test_sweep_matches_bisect(self):
+        start = to_epoch('2025-01-01T00:00:00')
+        times = sorted(start + random.uniform(0, 2 * 365 * 86400) for _ in range(500))
+        self.assertEqual(self.intervals.sweep(times), [self.intervals.at(when) for when in times])
+
+
+class TestPricingIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.client = PricingClient()
+        self.index = PricingIndex(lambda: self.client, PROJECT_ID, DATASET_ID)
+
+    def test_lookups_prefer_the_active_course(self):
+        self.assertEqual(self.index.course_id('Delhi', 'JEE'), 'C1')
+        self.assertEqual([p['mrp'] for p in self.index.history('Delhi', 'JEE')], [100000.0, 120000.0])
+        self.assertEqual(self.index.price_as_of('Delhi', 'JEE', datetime(2026, 2, 1))['mrp'], 100000.0)
+        self.assertEqual(self.index.price_as_of('Delhi', 'JEE', '2026-03-05T10:00:00Z')['mrp'], 120000.0)
+        self.assertIsNone(self.index.price_as_of('Delhi', 'JEE', datetime(2025, 1, 1)))
+        self.assertIsNone(self.index.price_as_of('Mumbai', 'JEE', datetime(2026, 2, 1)))
+        # Loaded once and cached
+        self.assertEqual(len(self.client.queries), 1)
+        self.index.invalidate()
+        self.index.course_id('Delhi', 'JEE')
+        self.assertEqual(len(self.client.queries), 2)
+
+    def test_batch_lookups_keep_their_order(self):
+        lookups = [('Delhi', 'JEE', '2026-04-01T00:00:00'), ('Kolkata', 'NEET', '2026-01-01T00:00:00'),
+                   ('Delhi', 'JEE', '2026-01-15T00:00:00'), ('Mumbai', 'JEE', '2026-01-15T00:00:00'),
+                   ('Delhi', 'JEE', None)]
+        prices = self.index.prices_as_of(lookups)
+        self.assertEqual([p and p['mrp'] for p in prices], [120000.0, 50000.0, 100000.0, None, None])
+        self.assertEqual(prices, [self.index.price_as_of(*lookup) if lookup[2] else None for lookup in lookups])
+
+
+class TestRepricing(unittest.TestCase):
+
+    def test_reprice_runs_one_transaction(self):
+        client = PricingClient()
+        effective = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        reprice_course(client, PROJECT_ID, DATASET_ID, 'C1', 130000.0, 110000.0, effective, 'l2@pw.live')
+
+        self.assertEqual(len(client.queries), 1)
+        script, job_config = client.queries[0]
+        self.assertTrue(script.strip().startswith('BEGIN TRANSACTION'))
+        self.assertIn('COMMIT TRANSACTION', script)
+        for table in ('pricing_history', 'courses', 'branch_cards_fees'):
+            self.assertIn(f"{DATASET_ID}.{table}`", script)
+        params = {p.name: p.value for p in job_config.query_parameters}
+        self.assertEqual((params['course_id'], params['mrp'], params['effective_date']), ('C1', 130000.0, effective))
+
+    def test_reprice_validation(self):
+        client = PricingClient()
+        now = datetime.now(timezone.utc)
+        for mrp, installment, effective in ((0, 0, now), (100.0, 120.0, now), (100.0, 90.0, now + timedelta(days=1))):
+            with self.assertRaises(ValueError):
+                reprice_course(client, PROJECT_ID, DATASET_ID, 'C1', mrp, installment, effective, 'l2@pw.live')
+        self.assertEqual(client.queries, [])
+
+    def test_recompute_discounts(self):
+        client = PricingClient(requests=[
+            # Priced at today's catalog instead of the price in force in February
+            {'enquiry_no': 'EN1', 'requester_email': 'a@pw.live', 'branch_name': 'Delhi', 'card_name': 'JEE',
+             'created_at': datetime(2026, 2, 1), 'mrp': 120000.0, 'installment': 108000.0,
+             'discount_amount': 18000.0, 'discount_percentage': 16.67},
+            {'enquiry_no': 'EN2', 'requester_email': 'a@pw.live', 'branch_name': 'Delhi', 'card_name': 'JEE',
+             'created_at': datetime(2026, 3, 2), 'mrp': 120000.0, 'installment': 108000.0,
+             'discount_amount': 18000.0, 'discount_percentage': 16.67},
+        ])
+        index = PricingIndex(lambda: client, PROJECT_ID, DATASET_ID)
+
+        changes = recompute_discounts(client, PROJECT_ID, DATASET_ID, index)
+        self.assertEqual([(c['enquiry_no'], c['installment'], c['discount_percentage']) for c in changes],
+                         [('EN1', 90000.0, 20.0)])
+        self.assertFalse(any('MERGE' in query for query, _ in client.queries))
+
+        recompute_discounts(client, PROJECT_ID, DATASET_ID, index, apply=True)
+        merge, job_config = client.queries[-1]
+        self.assertIn('MERGE', merge)
+        self.assertEqual(len(job_config.query_parameters[0].values), 1)
+
+    def test_recompute_discounts_keys_on_enquiry_and_requester(self):
+        row = {'enquiry_no': 'EN1', 'branch_name': 'Delhi', 'card_name': 'JEE', 'created_at': datetime(2026, 2, 1),
+               'mrp': 120000.0, 'installment': 108000.0, 'discount_amount': 18000.0, 'discount_percentage': 16.67}
+        client = PricingClient(requests=[
+            # The same enquiry submitted by two requesters, one row duplicated outright
+            dict(row, requester_email='a@pw.live'), dict(row, requester_email='a@pw.live'),
+            dict(row, requester_email='b@pw.live', discount_amount=9000.0),
+            # A legacy timestamp that does not parse
+            dict(row, enquiry_no='EN2', requester_email='a@pw.live', created_at='01/02/2026'),
+        ])
+        index = PricingIndex(lambda: client, PROJECT_ID, DATASET_ID)
+
+        with self.assertLogs('pricing_index', 'WARNING') as logs:
+            changes = recompute_discounts(client, PROJECT_ID, DATASET_ID, index, apply=True)
+        self.assertIn('Skipped 1 requests', logs.output[0])
+        self.assertEqual([(c['enquiry_no'], c['requester_email'], c['discount_percentage']) for c in changes],
+                         [('EN1', 'a@pw.live', 20.0), ('EN1', 'b@pw.live', 10.0)])
+        merge, job_config = client.queries[-1]
+        self.assertIn('dr.requester_email IS NOT DISTINCT FROM c.requester_email', merge)
+        keys = [(struct.struct_values['enquiry_no'], struct.struct_values['requester_email'])
+                for struct in job_config.query_parameters[0].values]
+        self.assertEqual(keys, [('EN1', 'a@pw.live'), ('EN1', 'b@pw.live')])
+
+
+if __name__ == '__main__':
+    unittest.main()
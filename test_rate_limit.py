@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for token-bucket rate limiting.
+"""
+
+import sys
+import time
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from rate_limit import MemoryBucketStore, RateLimiter, parse_rate, client_ip, retry_after_header
+
+LIMITS = {
+    'login': {'methods': ['POST'], 'ip': '10/minute', 'user': '3/minute'},
+    'get_mrp_api': {'ip': '2/second'},
+    'get_cards_api': None,
+}
+
+
+class TestBuckets(unittest.TestCase):
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('5/minute'), (5, 5 / 60))
+        self.assertEqual(parse_rate('2/second'), (2, 2.0))
+        for value in ('5', '5/day', '0/minute', 'x/minute'):
+            with self.assertRaises(ValueError):
+                parse_rate(value)
+
+    def test_burst_then_refill(self):
+        store = MemoryBucketStore()
+        self.assertEqual([store.take('k', 3, 1.0, now=100.0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(store.take('k', 3, 1.0, now=100.0), 1.0)
+        self.assertAlmostEqual(store.take('k', 3, 1.0, now=100.25), 0.75)
+        self.assertEqual(store.take('k', 3, 1.0, now=101.0), 0)
+        # Refills up to capacity only
+        self.assertEqual([store.take('k', 3, 1.0, now=200.0) > 0 for _ in range(4)], [False, False, False, True])
+
+    def test_idle_buckets_are_pruned(self):
+        store = MemoryBucketStore(max_buckets=2)
+        store.take('a', 1, 1.0, now=0.0)
+        store.take('b', 1, 1.0, now=0.0)
+        store.take('c', 1, 1.0, now=5.0)
+        self.assertEqual(set(store._buckets), {'c'})
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = RateLimiter(LIMITS)
+
+    def test_login_limits_per_user_and_ip(self):
+        check = lambda user, ip='10.0.0.1': self.limiter.check('login', 'POST', ip, user, now=0.0)
+        self.assertEqual([check('a@pw.live') for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(check('a@pw.live'), 20.0)
+        # Other users from the same address until the address runs out
+        self.assertEqual([check(f'u{i}@pw.live') for i in range(6)], [0, 0, 0, 0, 0, 0])
+        self.assertGreater(check('b@pw.live'), 0)
+        self.assertEqual(check('b@pw.live', ip='10.0.0.2'), 0)
+        # Showing the login form is not limited
+        self.assertEqual(self.limiter.check('login', 'GET', '10.0.0.1', None, now=0.0), 0)
+        self.assertIn('rate_limited_requests_total{endpoint="login",scope="user"} 1', self.limiter.render_metrics())
+
+    def test_unconfigured_and_disabled(self):
+        self.assertEqual([self.limiter.check('get_mrp_api', 'GET', '10.0.0.1', now=0.0) for _ in range(3)][-1], 0.5)
+        self.assertEqual([self.limiter.check('get_cards_api', 'GET', '10.0.0.1', now=0.0) for _ in range(10)][-1], 0)
+        self.assertEqual([self.limiter.check('dashboard', 'GET', '10.0.0.1', now=0.0) for _ in range(10)][-1], 0)
+        disabled = RateLimiter(LIMITS, enabled=False)
+        self.assertEqual([disabled.check('get_mrp_api', 'GET', '10.0.0.1', now=0.0) for _ in range(10)][-1], 0)
+        with self.assertRaises(ValueError):
+            RateLimiter({'login': {'ips': '5/minute'}})
+
+    def test_allowed_path_is_cheap(self):
+        limiter = RateLimiter({'get_mrp_api': {'ip': '1000000/second'}})
+        started = time.perf_counter()
+        for i in range(20000):
+            limiter.check('get_mrp_api', 'GET', f'10.0.{i % 200}.1')
+        self.assertLess((time.perf_counter() - started) / 20000, 0.0001)
+
+
+class TestHelpers(unittest.TestCase):
+
+    def test_client_ip(self):
+        self.assertEqual(client_ip('1.2.3.4', '169.254.1.1'), '1.2.3.4')
+        # A forged entry from the client comes before the one the proxy appended
+        self.assertEqual(client_ip('6.6.6.6, 1.2.3.4', '169.254.1.1'), '1.2.3.4')
+        self.assertEqual(client_ip('6.6.6.6, 1.2.3.4, 10.0.0.1', '169.254.1.1', hops=2), '1.2.3.4')
+        self.assertEqual(client_ip(None, '127.0.0.1'), '127.0.0.1')
+        self.assertEqual(client_ip('1.2.3.4', '127.0.0.1', hops=0), '127.0.0.1')
+
+    def test_retry_after_header(self):
+        self.assertEqual(retry_after_header(0.2), '1')
+        self.assertEqual(retry_after_header(20.0), '20')
+        self.assertEqual(retry_after_header(20.1), '21')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental request change feed.
+"""
+
+import sys
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from request_events import EVENT_SUBMITTED, build_event, RequestProjection
+from request_changes import (
+    encode_watermark, decode_watermark, settled_until, build_changes_response, EPOCH_KEY
+)
+
+T1 = '2026-01-01T10:00:00.000000+00:00'
+T2 = '2026-01-01T10:05:00.000000+00:00'
+UNTIL = ('2026-01-02T00:00:00.000000+00:00', '\uffff')
+
+
+def submit(projection, enquiry_no, occurred_at, branch='Delhi'):
+    projection.apply(build_event(EVENT_SUBMITTED, enquiry_no, None, 'PENDING_L1', 'c@pw.live', None,
+                                 payload={'enquiry_no': enquiry_no, 'branch_name': branch, 'mrp': 100.0},
+                                 occurred_at=occurred_at))
+
+
+class WatermarkTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        key = (T1, 'EN000000001')
+        self.assertEqual(decode_watermark(encode_watermark(key)), key)
+        self.assertEqual(decode_watermark(''), EPOCH_KEY)
+        with self.assertRaises(ValueError):
+            decode_watermark('not-a-token')
+
+    def test_settle_window(self):
+        now = datetime(2026, 1, 1, 10, 0, 30, tzinfo=timezone.utc)
+        self.assertLess(settled_until(now)[0], '2026-01-01T10:00:30')
+
+
+class ChangeFeedTests(unittest.TestCase):
+    """Paging through projection changes."""
+
+    def setUp(self):
+        self.projection = RequestProjection()
+        for i in range(3):
+            submit(self.projection, f'EN00000000{i}', T1)
+        submit(self.projection, 'EN000000009', T2, branch='Kolkata')
+
+    def poll(self, since, limit):
+        rows = self.projection.changed_since(since, UNTIL, limit + 1)
+        return build_changes_response(rows, since, UNTIL, limit=limit)
+
+    def test_pages_split_ties_exactly(self):
+        seen = []
+        since = EPOCH_KEY
+        while True:
+            body = self.poll(since, limit=2)
+            seen += [c['enquiry_no'] for c in body['changes']]
+            since = decode_watermark(body['watermark'])
+            if not body['has_more']:
+                break
+        self.assertEqual(seen, ['EN000000000', 'EN000000001', 'EN000000002', 'EN000000009'])
+        self.assertEqual(self.poll(since, limit=2)['changes'], [])
+
+    def test_window_stops_at_until(self):
+        rows = self.projection.changed_since(EPOCH_KEY, (T1, '\uffff'))
+        self.assertEqual(len(rows), 3)
+
+    def test_hidden_rows_still_advance_watermark(self):
+        rows = self.projection.changed_since((T1, '\uffff'), UNTIL, 11)
+        body = build_changes_response(rows, (T1, '\uffff'), UNTIL, limit=10,
+                                      visible=lambda row: row['branch_name'] != 'Kolkata')
+        self.assertEqual(body['changes'], [])
+        self.assertEqual(decode_watermark(body['watermark']), UNTIL)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Tests for the request event log fold and its in-memory projection.
+"""
+
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import EventStoreClient
+from request_events import (
+    EVENT_SUBMITTED, EVENT_L1_APPROVED, EVENT_REJECTED,
+    build_event, fold_event, RequestProjection, RequestEventLog
+)
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+
+def submission(enquiry_no, branch='Delhi', occurred_at='2026-01-01T10:00:00+00:00'):
+    payload = {'enquiry_no': enquiry_no, 'branch_name': branch, 'mrp': 50000.0,
+               'discounted_fees': 40000.0, 'net_discount': 10000.0}
+    return build_event(EVENT_SUBMITTED, enquiry_no, None, 'PENDING_L1', 'c@pw.live', None,
+                       payload=payload, occurred_at=occurred_at)
+
+
+def l1_approval(enquiry_no, amount=42000.0, occurred_at='2026-01-01T11:00:00+00:00'):
+    return build_event(EVENT_L1_APPROVED, enquiry_no, 'PENDING_L1', 'PENDING_L2', 'l1@pw.live', 'L1',
+                       payload={'comments': 'ok', 'approved_amount': amount}, occurred_at=occurred_at)
+
+
+class InterleavedClient(EventStoreClient):
+    """After hold(n), holds the next n transactions between their read and their write until all have read."""
+
+    def __init__(self):
+        super().__init__()
+        self.held = 0
+
+    def hold(self, parties=2):
+        self.barrier = threading.Barrier(parties, timeout=10)
+        self.held = parties
+
+    def between_read_and_write(self):
+        with self._lock:
+            hold = self.held > 0
+            self.held -= 1
+        if hold:
+            self.barrier.wait()
+
+
+def run_concurrently(*calls):
+    results = [None] * len(calls)
+
+    def run(index, call):
+        results[index] = call()
+    threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    return results
+
+
+class FoldTests(unittest.TestCase):
+    """Applying single events to a request row."""
+
+    def test_submission_then_approval(self):
+        row = fold_event(None, submission('EN1'))
+        self.assertEqual(row['status'], 'PENDING_L1')
+        row = fold_event(row, l1_approval('EN1'))
+        self.assertEqual(row['status'], 'PENDING_L2')
+        self.assertEqual(row['l1_approver'], 'l1@pw.live')
+        self.assertEqual(row['discounted_fees'], 42000.0)
+        self.assertEqual(row['net_discount'], 8000.0)
+
+    def test_event_from_wrong_status_does_not_apply(self):
+        row = fold_event(None, submission('EN1'))
+        reject = build_event(EVENT_REJECTED, 'EN1', 'PENDING_L2', 'REJECTED', 'l2@pw.live', 'L2')
+        self.assertIsNone(fold_event(row, reject))
+        self.assertIsNone(fold_event(row, submission('EN1')))
+
+
+class ProjectionTests(unittest.TestCase):
+    """Indexes and counters kept by RequestProjection."""
+
+    def test_out_of_order_events_are_refolded(self):
+        projection = RequestProjection()
+        projection.apply(l1_approval('EN1'))
+        projection.apply(submission('EN1'))
+        self.assertEqual(projection.get('EN1')['status'], 'PENDING_L2')
+        self.assertEqual(projection.counters['pending'], 1)
+
+    def test_queue_filters_by_status_and_branch(self):
+        projection = RequestProjection()
+        projection.apply(submission('EN1', 'Kolkata', '2026-01-01T10:00:00+00:00'))
+        projection.apply(submission('EN2', 'Delhi', '2026-01-01T10:05:00+00:00'))
+        projection.apply(submission('EN3', 'Patna', '2026-01-01T10:10:00+00:00'))
+        projection.apply(l1_approval('EN3'))
+        queue = projection.by_status('PENDING_L1', branch_not_in=['Kolkata'])
+        self.assertEqual([r['enquiry_no'] for r in queue], ['EN2'])
+        queue = projection.by_status('PENDING_L1', branch_in=['Kolkata'])
+        self.assertEqual([r['enquiry_no'] for r in queue], ['EN1'])
+        self.assertEqual(projection.counters['total'], 3)
+
+
+class EventLogTests(unittest.TestCase):
+    """Recording transitions against the projection."""
+
+    def test_second_approver_loses(self):
+        client = EventStoreClient()
+        event_log = RequestEventLog(lambda: client, PROJECT_ID, DATASET_ID, sync_interval=0)
+        applied, _ = event_log.record_submission({'enquiry_no': 'EN1', 'branch_name': 'Delhi', 'mrp': 100.0})
+        self.assertTrue(applied)
+        applied, row = event_log.record_transition('EN1', 'L1', 'APPROVE', 'a@pw.live', '', 90.0)
+        self.assertTrue(applied)
+        self.assertEqual(row['status'], 'PENDING_L2')
+        applied, _ = event_log.record_transition('EN1', 'L1', 'REJECT', 'b@pw.live')
+        self.assertFalse(applied)
+        self.assertEqual(len(client.inserted), 2)
+
+    def test_only_one_worker_applies_a_transition(self):
+        client = EventStoreClient()
+        workers = [RequestEventLog(lambda: client, PROJECT_ID, DATASET_ID, sync_interval=60) for _ in range(2)]
+        workers[0].record_submission({'enquiry_no': 'EN1', 'branch_name': 'Delhi', 'mrp': 100.0})
+        for worker in workers:
+            self.assertTrue(worker.ensure_loaded())
+        # Both projections show the request pending when each approver acts
+        applied, row = workers[0].record_transition('EN1', 'L1', 'APPROVE', 'a@pw.live', '', 90.0)
+        self.assertTrue(applied)
+        applied, row = workers[1].record_transition('EN1', 'L1', 'REJECT', 'b@pw.live')
+        self.assertFalse(applied)
+        self.assertEqual(row['status'], 'PENDING_L2')
+        self.assertEqual(len(client.inserted), 2)
+        # An L2 action on a request this worker has not yet seen reach PENDING_L2
+        workers.append(RequestEventLog(lambda: client, PROJECT_ID, DATASET_ID, sync_interval=60))
+        applied, row = workers[2].record_transition('EN1', 'L2', 'APPROVE', 'l2@pw.live', '', 90.0)
+        self.assertTrue(applied)
+        self.assertEqual(row['status'], 'APPROVED')
+
+    def test_concurrent_transitions_commit_once(self):
+        client = InterleavedClient()
+        workers = [RequestEventLog(lambda: client, PROJECT_ID, DATASET_ID, sync_interval=60) for _ in range(2)]
+        workers[0].record_submission({'enquiry_no': 'EN1', 'branch_name': 'Delhi', 'mrp': 100.0})
+        for worker in workers:
+            worker.ensure_loaded()
+        client.hold()
+        # Both read PENDING_L1 before either writes; the second commit is aborted and retried
+        results = run_concurrently(
+            lambda: workers[0].record_transition('EN1', 'L1', 'APPROVE', 'a@pw.live', '', 90.0),
+            lambda: workers[1].record_transition('EN1', 'L1', 'REJECT', 'b@pw.live'),
+        )
+        self.assertEqual(sorted(applied for applied, _ in results), [False, True])
+        self.assertEqual(len(client.inserted), 2)
+        self.assertEqual({row['status'] for _, row in results}, {client.heads['EN1']})
+
+    def test_duplicate_submissions_are_not_applied(self):
+        client = InterleavedClient()
+        workers = [RequestEventLog(lambda: client, PROJECT_ID, DATASET_ID, sync_interval=60) for _ in range(2)]
+        data = {'enquiry_no': 'EN1', 'branch_name': 'Delhi', 'mrp': 100.0}
+        client.hold()
+        results = run_concurrently(*[lambda worker=worker: worker.record_submission(data) for worker in workers])
+        self.assertEqual(sorted(applied for applied, _ in results), [False, True])
+        self.assertEqual(len(client.inserted), 1)
+        # Submitting again later, from a worker that has not synced since
+        applied, row = workers[0].record_submission(data)
+        self.assertFalse(applied)
+        self.assertEqual(row['status'], 'PENDING_L1')
+        self.assertEqual(workers[1].record_submissions([data, dict(data, enquiry_no='EN2')])[0]['enquiry_no'], 'EN2')
+
+
+if __name__ == '__main__':
+    unittest.main()
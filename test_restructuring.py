@@ -18,6 +18,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from enhanced_data_access import DiscountDataAccess
 from migrate_database import get_bigquery_client
+from verify_consistency import ConsistencyVerifier
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -205,48 +206,13 @@ class DatabaseRestructuringTests(unittest.TestCase):
         self.assertLessEqual(len(recent), 5)  # Should return max 5 recent items
     
     def test_data_consistency_between_structures(self):
-        """Test data consistency between old and new structures."""
-        # Skip if original tables don't exist
+        """Test data consistency between old and new structures (every row, by shard fingerprints)."""
         try:
-            original_query = f"""
-                SELECT enquiry_no, student_name, branch_name, discount_amount
-                FROM `{PROJECT_ID}.{DATASET_ID}.discount_requests`
-                LIMIT 10
-            """
-            original_data = list(self.client.query(original_query).result())
-        except Exception:
-            self.skipTest("Original table not available for consistency check")
-        
-        if not original_data:
-            self.skipTest("No data in original table for consistency check")
-        
-        # Compare with legacy view
-        legacy_query = f"""
-            SELECT enquiry_no, student_name, branch_name, net_discount as discount_amount
-            FROM `{PROJECT_ID}.{DATASET_ID}.discount_requests_legacy_view`
-            WHERE enquiry_no IN ({','.join([f"'{row.enquiry_no}'" for row in original_data])})
-        """
-        legacy_data = list(self.client.query(legacy_query).result())
-        
-        # Create dictionaries for comparison
-        original_dict = {row.enquiry_no: row for row in original_data}
-        legacy_dict = {row.enquiry_no: row for row in legacy_data}
+            report = ConsistencyVerifier(self.client, PROJECT_ID, DATASET_ID).verify()
+        except Exception as e:
+            self.skipTest(f"Original table or legacy view not available for consistency check: {e}")
         
-        for enquiry_no in original_dict:
-            with self.subTest(enquiry_no=enquiry_no):
-                self.assertIn(enquiry_no, legacy_dict, f"Enquiry {enquiry_no} missing in legacy view")
-                
-                original_row = original_dict[enquiry_no]
-                legacy_row = legacy_dict[enquiry_no]
-                
-                self.assertEqual(original_row.student_name, legacy_row.student_name)
-                self.assertEqual(original_row.branch_name, legacy_row.branch_name)
-                # Allow small differences in floating point numbers
-                self.assertAlmostEqual(
-                    float(original_row.discount_amount), 
-                    float(legacy_row.discount_amount), 
-                    places=2
-                )
+        self.assertTrue(report.consistent, f"Structures differ:\n{report.summary()}")
     
     def test_referential_integrity(self):
         """Test referential integrity in new structure."""
@@ -345,12 +311,14 @@ def run_tests():
     if result.failures:
         print("\nFAILURES:")
         for test, traceback in result.failures:
-            print(f"- {test}: {traceback.split('AssertionError: ')[-1].split('\\n')[0]}")
+            message = traceback.split('AssertionError: ')[-1].split('\n')[0]
+            print(f"- {test}: {message}")
     
     if result.errors:
         print("\nERRORS:")
         for test, traceback in result.errors:
-            print(f"- {test}: {traceback.split('Exception: ')[-1].split('\\n')[0]}")
+            message = traceback.split('Exception: ')[-1].split('\n')[0]
+            print(f"- {test}: {message}")
     
     success_rate = ((result.testsRun - len(result.failures) - len(result.errors)) / result.testsRun * 100) if result.testsRun > 0 else 0
     print(f"\nSuccess rate: {success_rate:.1f}%")
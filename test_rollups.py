@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for the analytics rollups.
+"""
+
+import sys
+import unittest
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import FakeClient, query_params
+from rollups import refresh_rollups, load_trends, METRIC_COLUMNS, EPOCH_DAY
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+
+def rollup_row(period, branch, **metrics):
+    row = dict.fromkeys(METRIC_COLUMNS, 0)
+    row.update(metrics, period=period, branch_name=branch)
+    return row
+
+
+class RollupClient(FakeClient):
+    """Answers the last rolled-up day, rollup and distribution reads."""
+
+    def __init__(self, last_day=None, rollups=(), distribution=()):
+        super().__init__()
+        self.last_day = last_day
+        self.rollups = rollups
+        self.distribution = distribution
+
+    def respond(self, query, params):
+        if 'MAX(day)' in query:
+            return [{'last_day': self.last_day}]
+        if 'request_discount_distribution_daily' in query and 'SELECT bucket' in query:
+            return self.distribution
+        if 'SELECT day AS period' in query or 'SELECT period_start AS period' in query:
+            return self.rollups
+        return []
+
+
+class TestRefreshRollups(unittest.TestCase):
+
+    def test_recomputes_from_the_last_rolled_up_day(self):
+        client = RollupClient(last_day=date(2025, 3, 10))
+        self.assertEqual(refresh_rollups(client, PROJECT_ID, DATASET_ID), date(2025, 3, 9))
+
+        merges = [(q, query_params(c)) for q, c in client.queries if 'MERGE' in q]
+        targets = [q.split('`')[1].split('.')[-1] for q, _ in merges]
+        # Daily is folded from hourly, so hourly goes first
+        self.assertEqual(targets, ['request_rollups_hourly', 'request_rollups_daily',
+                                   'request_discount_distribution_daily'])
+        for query, params in merges:
+            self.assertEqual(params['since_day'], date(2025, 3, 9))
+            # Rows before the recomputed window are never deleted
+            self.assertRegex(query, r"NOT MATCHED BY SOURCE AND T\.\w+ >= .*@since_day")
+
+    def test_empty_rollups_backfill_everything(self):
+        client = RollupClient(last_day=None)
+        self.assertEqual(refresh_rollups(client, PROJECT_ID, DATASET_ID, 'request_state'), EPOCH_DAY)
+        self.assertIn('discount_management.request_state', client.queries[1][0])
+
+
+class TestLoadTrends(unittest.TestCase):
+
+    def test_aggregates_periods_and_branches(self):
+        client = RollupClient(
+            rollups=[
+                rollup_row(date(2025, 3, 1), 'Delhi', submitted=4, discount_percentage_sum=160.0,
+                           l1_approved=2, l1_approve_seconds_sum=7200, l2_approved=1,
+                           l2_approve_seconds_sum=3600, approved_net_discount_sum=15000.0),
+                rollup_row(date(2025, 3, 3), 'Delhi', l1_rejected=1),
+                rollup_row(date(2025, 3, 3), 'Kolkata', submitted=1, discount_percentage_sum=50.0),
+            ],
+            distribution=[{'bucket': 35, 'requests': 3}, {'bucket': 50, 'requests': 2}],
+        )
+        trends = load_trends(client, PROJECT_ID, DATASET_ID, date(2025, 3, 1), date(2025, 3, 3))
+
+        self.assertEqual([p['period'] for p in trends['periods']], ['2025-03-01', '2025-03-02', '2025-03-03'])
+        first, gap, last = trends['periods']
+        self.assertEqual((first['submitted'], first['l1_hours_to_approve'], first['l2_hours_to_approve']), (4, 1.0, 1.0))
+        self.assertEqual((gap['submitted'], gap['l1_hours_to_approve']), (0, None))
+        self.assertEqual(last['submitted'], 1)
+
+        delhi = trends['branches'][0]
+        self.assertEqual(delhi['branch_name'], 'Delhi')
+        self.assertEqual((delhi['approved'], delhi['rejected'], delhi['approval_rate']), (1, 1, 0.5))
+        self.assertEqual(delhi['avg_discount_percentage'], 40.0)
+        self.assertEqual(trends['discount_distribution'][0], {'bucket': '35-40%', 'requests': 3})
+        self.assertEqual(trends['totals']['submitted'], 5)
+
+    def test_hourly_labels_are_local_hours(self):
+        client = RollupClient(rollups=[
+            rollup_row(datetime(2025, 3, 1, 3, 30, tzinfo=timezone.utc), 'Delhi', submitted=2),
+        ])
+        trends = load_trends(client, PROJECT_ID, DATASET_ID, date(2025, 3, 1), date(2025, 3, 1),
+                             granularity='hour')
+        self.assertEqual(len(trends['periods']), 24)
+        self.assertEqual(trends['periods'][9], dict(trends['periods'][9], period='2025-03-01T09:00', submitted=2))
+
+    def test_rejects_oversized_ranges(self):
+        client = RollupClient()
+        with self.assertRaises(ValueError):
+            load_trends(client, PROJECT_ID, DATASET_ID, date(2025, 3, 1), date(2025, 3, 9), granularity='hour')
+        with self.assertRaises(ValueError):
+            load_trends(client, PROJECT_ID, DATASET_ID, date(2025, 3, 2), date(2025, 3, 1))
+        self.assertEqual(client.queries, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
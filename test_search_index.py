@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-process request search index.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import StateClient
+from request_events import RequestEventLog, build_event, EVENT_SUBMITTED, EVENT_L1_APPROVED
+from search_index import SearchIndex
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+
+def state_row(enquiry_no, student_name, mobile_no, branch='Delhi', requester='counselor@pw.live',
+              status='PENDING_L1', created_at='2026-01-01T00:00:00+00:00'):
+    return {'enquiry_no': enquiry_no, 'student_name': student_name, 'mobile_no': mobile_no,
+            'branch_name': branch, 'requester_email': requester, 'status': status,
+            'created_at': created_at, 'last_event_id': 'seed', 'last_event_at': created_at}
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        client = StateClient([
+            state_row('EN1001', 'Ravi Kumar', '98765 43210'),
+            state_row('EN1002', 'Ravina Sen', '91234 56789', branch='Kolkata', requester='east@pw.live',
+                      created_at='2026-01-02T00:00:00+00:00'),
+            state_row('EN2001', 'Arjun Ravi', '99887 76655', status='APPROVED'),
+        ])
+        self.event_log = RequestEventLog(lambda: client, PROJECT_ID, DATASET_ID, sync_interval=0)
+        self.index = SearchIndex(self.event_log)
+        self.event_log.subscribe(self.index.on_request_event)
+        self.assertTrue(self.index.ensure_seeded())
+
+    def enquiry_nos(self, query, **kwargs):
+        return [row['enquiry_no'] for row in self.index.search(query, **kwargs)]
+
+    def test_ranking_prefers_exact_and_prefix_matches(self):
+        # Field prefix (Ravi Kumar, Ravina Sen) beats a later word (Arjun Ravi); ties go to the newest
+        self.assertEqual(self.enquiry_nos('ravi'), ['EN1002', 'EN1001', 'EN2001'])
+        self.assertEqual(self.enquiry_nos('ravi kum'), ['EN1001'])
+        self.assertEqual(self.enquiry_nos('EN1001'), ['EN1001'])
+        self.assertEqual(self.index.search('EN1001')[0]['score'], 300)
+
+    def test_partial_enquiry_and_mobile_numbers(self):
+        self.assertEqual(self.enquiry_nos('en100'), ['EN1002', 'EN1001'])
+        self.assertEqual(self.enquiry_nos('1001'), ['EN1001'])
+        self.assertEqual(self.enquiry_nos('9876543210'), ['EN1001'])
+        self.assertEqual(self.enquiry_nos('76655'), ['EN2001'])
+
+    def test_short_terms_match_word_prefixes_only(self):
+        self.assertEqual(self.enquiry_nos('ar'), ['EN2001'])
+        self.assertEqual(self.enquiry_nos('un'), [])
+        self.assertEqual(self.enquiry_nos('r'), [])
+        # Trigrams shared across separate words are not a match
+        self.assertEqual(self.enquiry_nos('kumarav'), [])
+
+    def test_other_fields_and_visibility(self):
+        self.assertEqual(self.enquiry_nos('kolkata'), ['EN1002'])
+        self.assertEqual(self.enquiry_nos('east@pw'), ['EN1002'])
+        self.assertEqual(self.enquiry_nos('ravi', visible=lambda row: row['branch_name'] != 'Kolkata'),
+                         ['EN1001', 'EN2001'])
+
+    def test_events_update_the_index(self):
+        self.event_log._apply(build_event(EVENT_SUBMITTED, 'EN3001', None, 'PENDING_L1', 'c@pw.live', None,
+                                          payload={'student_name': 'Meera Das', 'mobile_no': '90000 11111',
+                                                   'branch_name': 'Patna', 'requester_email': 'c@pw.live'},
+                                          occurred_at='2026-01-03T00:00:00+00:00'))
+        self.event_log._apply(build_event(EVENT_L1_APPROVED, 'EN1001', 'PENDING_L1', 'PENDING_L2',
+                                          'rest@pw.live', 'L1', occurred_at='2026-01-03T01:00:00+00:00'))
+
+        self.assertEqual(self.enquiry_nos('meera'), ['EN3001'])
+        self.assertEqual(self.index.search('EN1001')[0]['status'], 'PENDING_L2')
+        self.assertEqual(len(self.index), 4)
+
+        self.index.remove('EN3001')
+        self.assertEqual(self.enquiry_nos('meera'), [])
+        self.assertEqual(self.enquiry_nos('patna'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
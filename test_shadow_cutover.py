@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for the normalized-schema cutover: dual writes and shadow reads.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import EventStoreClient
+from request_events import RequestEventLog, build_event, EVENT_SUBMITTED, EVENT_L1_APPROVED
+from metrics import add_labels
+from shadow_cutover import ShadowWriter, ShadowReader, describe_mismatch
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+SUBMISSION = {
+    'enquiry_no': 'EN12345678', 'student_name': 'Ravi Kumar', 'mobile_no': '9876543210',
+    'branch_name': 'Delhi', 'card_name': 'JEE 2027', 'mrp': 100000.0, 'installment': 90000.0,
+    'discount_amount': 35000.0, 'reason': 'Sibling', 'remarks': '', 'status': 'PENDING_L1',
+    'requester_email': 'counselor@pw.live', 'requester_name': 'Counselor', 'assigned_to': 'l1@pw.live',
+}
+
+
+class FakeDataAccess:
+    """Records the normalized-table writes the shadow writer makes."""
+
+    def __init__(self):
+        self.client = object()
+        self.calls = []
+        self.requests = {}
+
+    def get_course_details(self, branch_name, card_name):
+        return {'course_id': 'C1', 'mrp': 120000.0, 'installment': 95000.0}
+
+    def create_or_get_student(self, enquiry_no, student_name, mobile_no):
+        self.calls.append(('student', enquiry_no))
+        return 'S1'
+
+    def create_discount_request(self, **kwargs):
+        self.calls.append(('request', kwargs['course_details']['mrp'], kwargs['requested_discount_amount'],
+                           kwargs['assigned_to']))
+        self.requests['EN12345678'] = 'R1'
+        return 'R1'
+
+    def get_request_id(self, enquiry_no):
+        return self.requests.get(enquiry_no)
+
+    def approve_or_reject_request(self, **kwargs):
+        self.calls.append(('approval', kwargs['request_id'], kwargs['action'], kwargs['approved_amount']))
+        return True
+
+
+class TestShadowWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.data_access = FakeDataAccess()
+        self.writer = ShadowWriter(lambda: self.data_access)
+        self.client = EventStoreClient()
+        self.event_log = RequestEventLog(lambda: self.client, PROJECT_ID, DATASET_ID, sync_interval=0)
+        self.event_log.subscribe(self.writer.on_request_event, local_only=True)
+
+    def test_recorded_events_are_mirrored_in_order(self):
+        self.event_log.record_submission(SUBMISSION)
+        self.event_log.record_transition('EN12345678', 'L1', 'APPROVE', 'l1@pw.live', 'ok', 60000.0,
+                                         check_state=False)
+        self.writer.join()
+
+        self.assertEqual(self.data_access.calls, [
+            ('student', 'EN12345678'),
+            # The snapshot keeps the price the request was made at
+            ('request', 100000.0, 35000.0, 'l1@pw.live'),
+            ('approval', 'R1', 'APPROVE', 60000.0),
+        ])
+        self.assertEqual(self.writer.counts, {'mirrored': 2, 'failed': 0, 'dropped': 0})
+        self.assertIn('cutover_shadow_writes_total{result="mirrored"} 2', self.writer.render_metrics())
+
+    def test_every_sample_gets_the_worker_label(self):
+        metrics = add_labels(self.writer.render_metrics(), worker=1234)
+        self.assertIn('cutover_shadow_writes_total{worker="1234",result="mirrored"} 0', metrics)
+        self.assertIn('cutover_shadow_write_queue_depth{worker="1234"} 0', metrics)
+        self.assertIn('cutover_shadow_write_lag_seconds_bucket{worker="1234",le="+Inf"} 0', metrics)
+        self.assertIn('# TYPE cutover_shadow_writes_total counter', metrics)
+
+    def test_events_from_other_workers_are_not_mirrored(self):
+        event = build_event(EVENT_SUBMITTED, 'EN12345678', None, 'PENDING_L1', 'counselor@pw.live', None,
+                            payload=SUBMISSION)
+        self.event_log._apply(event)
+        self.writer.join()
+        self.assertEqual(self.data_access.calls, [])
+
+    def test_events_from_the_enhanced_path_are_not_mirrored(self):
+        # DiscountDataAccess wrote this request itself
+        self.event_log.record_submission(SUBMISSION, request_id='R9')
+        self.writer.join()
+        self.assertEqual(self.data_access.calls, [])
+
+    def test_failures_are_counted(self):
+        # An approval for a request that never reached the normalized tables
+        event = build_event(EVENT_L1_APPROVED, 'EN00000000', 'PENDING_L1', 'PENDING_L2', 'l1@pw.live', 'L1')
+        self.assertFalse(self.writer.mirror(event, {}))
+
+        self.data_access.client = None
+        self.assertFalse(self.writer.mirror(event, {}))
+
+
+class TestShadowReader(unittest.TestCase):
+
+    def test_sampled_reads_are_compared_in_the_background(self):
+        reader = ShadowReader(sample_rate=1.0, workers=1)
+        legacy_rows = [{'enquiry_no': 'EN1'}, {'enquiry_no': 'EN2'}]
+        enquiry_numbers = lambda rows: {row['enquiry_no'] for row in rows}
+
+        self.assertIs(reader.read('queue', lambda: legacy_rows, lambda: list(legacy_rows), key=enquiry_numbers),
+                      legacy_rows)
+        reader.read('queue', lambda: legacy_rows, lambda: legacy_rows[:1], key=enquiry_numbers)
+        reader.read('queue', lambda: legacy_rows, lambda: 1 / 0, key=enquiry_numbers)
+        reader.close()
+
+        metrics = reader.render_metrics()
+        self.assertIn('cutover_shadow_reads_total{read="queue"} 2', metrics)
+        self.assertIn('cutover_shadow_read_mismatches_total{read="queue"} 1', metrics)
+        self.assertIn('cutover_shadow_read_errors_total{read="queue"} 1', metrics)
+        self.assertIn('cutover_read_seconds_count{read="queue",stack="normalized"} 2', metrics)
+
+    def test_unsampled_reads_only_hit_the_legacy_stack(self):
+        reader = ShadowReader(sample_rate=0)
+        calls = []
+        self.assertEqual(reader.read('stats', lambda: 1, lambda: calls.append('normalized')), 1)
+        reader.close()
+        self.assertEqual(calls, [])
+
+    def test_describe_mismatch(self):
+        self.assertEqual(describe_mismatch({'EN1', 'EN2'}, {'EN2', 'EN3'}),
+                         "1 missing ['EN1'], 1 extra ['EN3'] (2 legacy, 2 normalized)")
+
+
+if __name__ == '__main__':
+    unittest.main()
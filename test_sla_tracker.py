@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the approval SLA tracker.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import StateClient
+from request_events import RequestEventLog, build_event, EVENT_SUBMITTED, EVENT_L1_APPROVED
+from sla_tracker import SLATracker, to_epoch
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+HOUR = 3600
+
+
+def state_row(enquiry_no, status, branch='Delhi', created_at='2026-01-01T00:00:00+00:00', l1_approved_at=None):
+    return {'enquiry_no': enquiry_no, 'status': status, 'branch_name': branch, 'student_name': 'Student',
+            'created_at': created_at, 'l1_approved_at': l1_approved_at, 'last_event_id': 'seed',
+            'last_event_at': l1_approved_at or created_at}
+
+
+def route(status, branch_name, assigned_to=None):
+    if status == 'PENDING_L1':
+        return 'east@pw.live' if branch_name == 'Kolkata' else 'rest@pw.live'
+    return 'L2'
+
+
+class TestSLATracker(unittest.TestCase):
+
+    def setUp(self):
+        client = StateClient([
+            state_row('EN1', 'PENDING_L1'),
+            state_row('EN2', 'PENDING_L1', branch='Kolkata', created_at='2026-01-01T20:00:00+00:00'),
+            state_row('EN3', 'PENDING_L2', l1_approved_at='2026-01-01T06:00:00+00:00'),
+            state_row('EN4', 'APPROVED'),
+        ])
+        self.event_log = RequestEventLog(lambda: client, PROJECT_ID, DATASET_ID, sync_interval=0)
+        self.tracker = SLATracker(self.event_log, route,
+                                  thresholds={'PENDING_L1': 24 * HOUR, 'PENDING_L2': 48 * HOUR})
+        self.event_log.subscribe(self.tracker.on_request_event)
+        self.assertTrue(self.tracker.ensure_seeded())
+        self.start = to_epoch('2026-01-01T00:00:00+00:00')
+
+    def test_seeded_queues(self):
+        summary = {(q['queue'], q['status']): q for q in self.tracker.summary(now=self.start + 24 * HOUR)}
+        self.assertEqual(set(summary), {('rest@pw.live', 'PENDING_L1'), ('east@pw.live', 'PENDING_L1'),
+                                        ('L2', 'PENDING_L2')})
+        self.assertEqual(summary[('rest@pw.live', 'PENDING_L1')]['oldest_hours'], 24.0)
+        self.assertEqual(summary[('rest@pw.live', 'PENDING_L1')]['breached'], 1)
+        self.assertEqual(summary[('L2', 'PENDING_L2')]['oldest_hours'], 18.0)
+
+    def test_events_move_requests_and_time_the_state(self):
+        approval = build_event(EVENT_L1_APPROVED, 'EN1', 'PENDING_L1', 'PENDING_L2', 'rest@pw.live', 'L1',
+                               payload={'approved_amount': 40000.0}, occurred_at='2026-01-01T05:00:00+00:00')
+        submission = build_event(EVENT_SUBMITTED, 'EN5', None, 'PENDING_L1', 'c@pw.live', None,
+                                 payload={'branch_name': 'Kolkata'}, occurred_at='2026-01-01T07:00:00+00:00')
+        self.event_log._apply(approval)
+        self.event_log._apply(submission)
+
+        summary = {(q['queue'], q['status']): q['depth'] for q in self.tracker.summary(now=self.start + 8 * HOUR)}
+        self.assertNotIn(('rest@pw.live', 'PENDING_L1'), summary)
+        self.assertEqual(summary[('L2', 'PENDING_L2')], 2)
+        self.assertEqual(summary[('east@pw.live', 'PENDING_L1')], 2)
+
+        metrics = self.tracker.render_metrics(now=self.start + 8 * HOUR)
+        # EN1 spent 5 hours in PENDING_L1 before rest@pw.live approved it
+        self.assertIn('discount_request_state_seconds_bucket{status="PENDING_L1",approver="rest@pw.live",le="14400"} 0',
+                      metrics)
+        self.assertIn('discount_request_state_seconds_bucket{status="PENDING_L1",approver="rest@pw.live",le="28800"} 1',
+                      metrics)
+        self.assertIn('discount_request_state_seconds_sum{status="PENDING_L1",approver="rest@pw.live"} 18000',
+                      metrics)
+        self.assertIn('discount_request_queue_depth{queue="L2",status="PENDING_L2"} 2', metrics)
+        # Queue ages: EN3 has waited 2h (since 06:00) and EN1 3h (since 05:00)
+        self.assertIn('discount_request_queue_age_seconds_bucket{queue="L2",status="PENDING_L2",le="3600"} 0', metrics)
+        self.assertIn('discount_request_queue_age_seconds_bucket{queue="L2",status="PENDING_L2",le="14400"} 2', metrics)
+
+    def test_escalation_fires_once_per_request(self):
+        fired = []
+        self.tracker.add_escalation_hook(lambda request, status, age, threshold: fired.append(
+            (request['enquiry_no'], status, round(age / HOUR))))
+
+        self.assertEqual(self.tracker.check_escalations(now=self.start + 23 * HOUR), 0)
+        self.assertEqual(self.tracker.check_escalations(now=self.start + 30 * HOUR), 1)
+        self.assertEqual(self.tracker.check_escalations(now=self.start + 31 * HOUR), 0)
+        self.assertEqual(self.tracker.check_escalations(now=self.start + 60 * HOUR), 2)
+        self.assertEqual(fired, [('EN1', 'PENDING_L1', 30), ('EN2', 'PENDING_L1', 40), ('EN3', 'PENDING_L2', 54)])
+        self.assertIn('discount_request_sla_breaches_total{status="PENDING_L1"} 2', self.tracker.render_metrics())
+
+
+if __name__ == '__main__':
+    unittest.main()
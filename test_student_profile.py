@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for the cached student history.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import FakeClient
+from enhanced_data_access import DiscountDataAccess
+from student_profile import StudentHistoryCache, summarize_history
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+
+def history(enquiry_no, mobile_no, *others):
+    requests = [{'enquiry_no': enquiry_no, 'mobile_no': mobile_no, 'branch_name': 'Delhi', 'status': 'APPROVED'}]
+    requests += [{'enquiry_no': other, 'mobile_no': mobile_no, 'branch_name': 'Patna', 'status': 'PENDING_L1'}
+                 for other in others]
+    return {'student': {'enquiry_no': enquiry_no, 'mobile_no': mobile_no}, 'requests': requests}
+
+
+class FakeRow(dict):
+    def items(self):
+        return list(super().items())
+
+
+class TestStudentHistoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.histories = {
+            'EN1': history('EN1', '98765 43210', 'EN9'),
+            'EN2': history('EN2', '91234 56789'),
+            'EN3': history('EN3', '99999 00000'),
+        }
+        self.loads = []
+        self.cache = StudentHistoryCache(self.load, maxsize=2)
+
+    def load(self, enquiry_no):
+        self.loads.append(enquiry_no)
+        return self.histories.get(enquiry_no)
+
+    def test_hits_and_lru_eviction(self):
+        self.cache.get('EN1')
+        self.cache.get('EN2')
+        self.cache.get('EN1')
+        self.cache.get('EN3')  # evicts EN2, the least recently used
+        self.cache.get('EN1')
+        self.cache.get('EN2')
+        self.assertEqual(self.loads, ['EN1', 'EN2', 'EN3', 'EN2'])
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 4))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_events_invalidate_by_enquiry_or_mobile(self):
+        self.cache.get('EN1')
+        self.cache.get('EN2')
+        # A new request under another enquiry number for EN1's mobile
+        self.cache.on_request_event({}, {'enquiry_no': 'EN7', 'mobile_no': '9876543210'}, None)
+        self.cache.get('EN1')
+        self.cache.get('EN2')
+        self.assertEqual(self.loads, ['EN1', 'EN2', 'EN1'])
+
+        # An approval of a request that only appears inside EN1's history
+        self.cache.on_request_event({}, {'enquiry_no': 'EN9', 'mobile_no': None}, 'PENDING_L1')
+        self.cache.get('EN1')
+        self.assertEqual(self.loads[-1], 'EN1')
+        self.assertEqual(len(self.loads), 4)
+
+    def test_failed_and_racing_loads_are_not_cached(self):
+        self.assertIsNone(self.cache.get('EN404'))
+        self.assertIsNone(self.cache.get('EN404'))
+        self.assertEqual(self.loads, ['EN404', 'EN404'])
+
+        def load_during_event(enquiry_no):
+            self.cache.invalidate('EN5')
+            return self.histories['EN1']
+        self.cache.loader = load_during_event
+        self.assertEqual(self.cache.get('EN1'), self.histories['EN1'])
+        self.assertEqual(len(self.cache), 0)
+
+    def test_summary(self):
+        summary = summarize_history(self.histories['EN1'])
+        self.assertEqual(summary['requests'], 2)
+        self.assertEqual((summary['approved'], summary['pending'], summary['rejected']), (1, 1, 0))
+        self.assertEqual(summary['branches'], ['Delhi', 'Patna'])
+        self.assertEqual(summary['enquiry_numbers'], ['EN1', 'EN9'])
+
+
+class TestStudentHistoryQuery(unittest.TestCase):
+
+    def test_one_joined_query_shaped_into_student_and_requests(self):
+        profile = {'profile_enquiry_no': 'EN1', 'profile_student_name': 'Ravi', 'profile_mobile_no': '98765'}
+        client = FakeClient([
+            FakeRow(profile, request_id='R2', enquiry_no='EN9', status='PENDING_L1', approvals=[]),
+            FakeRow(profile, request_id='R1', enquiry_no='EN1', status='APPROVED',
+                    approvals=[{'approver_level': 'L1', 'action': 'APPROVED'}]),
+        ])
+        result = DiscountDataAccess(client, PROJECT_ID, DATASET_ID).get_student_history('EN1')
+
+        self.assertEqual(len(client.queries), 1)
+        query, job_config = client.queries[0]
+        self.assertIn('request_approvals', query)
+        self.assertEqual(job_config.query_parameters[0].value, 'EN1')
+        self.assertEqual(result['student'], {'enquiry_no': 'EN1', 'student_name': 'Ravi', 'mobile_no': '98765'})
+        self.assertEqual([row['request_id'] for row in result['requests']], ['R2', 'R1'])
+        self.assertNotIn('profile_enquiry_no', result['requests'][0])
+        self.assertEqual(result['requests'][1]['approvals'], [{'approver_level': 'L1', 'action': 'APPROVED'}])
+
+    def test_student_without_requests_and_unknown_student(self):
+        profile = {'profile_enquiry_no': 'EN1', 'profile_student_name': 'Ravi', 'profile_mobile_no': '98765'}
+        access = DiscountDataAccess(FakeClient([FakeRow(profile, request_id=None, approvals=[])]),
+                                    PROJECT_ID, DATASET_ID)
+        self.assertEqual(access.get_student_history('EN1')['requests'], [])
+        self.assertEqual(DiscountDataAccess(FakeClient([]), PROJECT_ID, DATASET_ID).get_student_history('EN2'),
+                         {'student': None, 'requests': []})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for the sharded legacy/normalized consistency verifier.
+"""
+
+import re
+import sys
+import threading
+import unittest
+from datetime import date
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_bigquery import FakeClient
+from verify_consistency import ConsistencyVerifier, LEVELS, COMPARED_COLUMNS, shard_query, diff_shards
+
+PROJECT_ID = 'gewportal2025'
+DATASET_ID = 'discount_management'
+
+# What each level's shard expression computes, for rows held in Python
+SHARD_FUNCTIONS = [
+    lambda row: f"{row['branch_name']}/{(row['created_at'] or 'no-date')[:7]}",
+    lambda row: f"{row['branch_name']}/{(row['created_at'] or 'no-date')[:10]}",
+    lambda row: row['enquiry_no'],
+]
+
+
+def request(enquiry_no, branch='Delhi', created_at='2026-01-05', status='PENDING_L1', discount_amount=35000.0):
+    return {'enquiry_no': enquiry_no, 'student_name': 'Student', 'mobile_no': '9876543210',
+            'branch_name': branch, 'card_name': 'JEE', 'requester_email': 'c@pw.live', 'status': status,
+            'mrp': 100000.0, 'discount_amount': discount_amount, 'created_at': created_at}
+
+
+class ShardClient(FakeClient):
+    """Evaluates the verifier's shard queries over in-memory tables."""
+
+    def __init__(self, legacy, normalized):
+        super().__init__()
+        self.tables = {'discount_requests': legacy, 'discount_requests_legacy_view': normalized}
+        self.shards_read = []
+        self.lock = threading.Lock()
+
+    def respond(self, query, params):
+        table = re.search(r'`[\w-]+\.\w+\.(\w+)`', query).group(1)
+        level = next(i for i, (_, expr) in enumerate(LEVELS) if f"SELECT {expr} AS shard" in query)
+        with self.lock:
+            self.shards_read.append((table, level, params.get('parent')))
+        rows = self.tables[table]
+        if 'parent' in params:
+            rows = [row for row in rows if SHARD_FUNCTIONS[level - 1](row) == params['parent']]
+        if 'since' in params:
+            rows = [row for row in rows if (row['created_at'] or '') >= params['since'].isoformat()]
+        shards = {}
+        for row in rows:
+            shard = SHARD_FUNCTIONS[level](row)
+            count, fingerprint = shards.get(shard, (0, 0))
+            shards[shard] = (count + 1, fingerprint ^ hash(tuple(row[c] for c, _ in COMPARED_COLUMNS)))
+        return [{'shard': shard, 'row_count': count, 'fingerprint': fingerprint}
+                        for shard, (count, fingerprint) in shards.items()]
+
+
+class TestConsistencyVerifier(unittest.TestCase):
+
+    def setUp(self):
+        self.legacy = [request('EN1'), request('EN2', created_at='2026-01-20'),
+                       request('EN3', branch='Kolkata', created_at='2026-02-01'),
+                       request('EN4', created_at='2026-03-03')]
+
+    def verify(self, normalized, since=None):
+        client = ShardClient(self.legacy, normalized)
+        return client, ConsistencyVerifier(client, PROJECT_ID, DATASET_ID, workers=4).verify(since)
+
+    def test_identical_tables_need_one_scan_per_side(self):
+        client, report = self.verify([dict(row) for row in reversed(self.legacy)])
+        self.assertTrue(report.consistent)
+        self.assertEqual(report.shards_checked, [3, 0, 0])
+        self.assertEqual(len(client.shards_read), 2)
+
+    def test_drills_down_only_into_mismatched_shards(self):
+        normalized = [request('EN1'), request('EN2', created_at='2026-01-20', status='APPROVED'),
+                      request('EN3', branch='Kolkata', created_at='2026-02-01'),
+                      request('EN5', created_at='2026-03-03')]
+        client, report = self.verify(normalized)
+
+        self.assertFalse(report.consistent)
+        self.assertEqual(report.mismatched_shards[0], ['Delhi/2026-01', 'Delhi/2026-03'])
+        self.assertEqual(sorted(report.mismatched_shards[1]), ['Delhi/2026-01-20', 'Delhi/2026-03-03'])
+        self.assertEqual(report.rows, {'missing': ['EN4'], 'extra': ['EN5'], 'different': ['EN2']})
+        # Kolkata and Delhi's 5th of January were never queried below their parent shard
+        parents = {parent for _, _, parent in client.shards_read if parent}
+        self.assertEqual(parents, {'Delhi/2026-01', 'Delhi/2026-03', 'Delhi/2026-01-20', 'Delhi/2026-03-03'})
+        self.assertIn('INCONSISTENT', report.summary())
+
+    def test_rows_without_a_date_are_drilled_into_their_own_shard(self):
+        self.legacy.append(request('EN6', created_at=None))
+        normalized = [dict(row) for row in self.legacy if row['enquiry_no'] not in ('EN4', 'EN6')]
+        client, report = self.verify(normalized + [request('EN7', created_at=None)])
+
+        self.assertEqual(report.mismatched_shards[0], ['Delhi/2026-03', 'Delhi/no-date'])
+        self.assertEqual(report.rows, {'missing': ['EN4', 'EN6'], 'extra': ['EN7'], 'different': []})
+        self.assertIn('Delhi/no-date', {parent for _, level, parent in client.shards_read if level == 2})
+        self.assertIn('Delhi/no-date', report.summary())
+
+    def test_since_limits_the_comparison(self):
+        normalized = [dict(row) for row in self.legacy if row['enquiry_no'] != 'EN1']
+        self.assertFalse(self.verify(normalized)[1].consistent)
+        self.assertTrue(self.verify(normalized, since=date(2026, 1, 10))[1].consistent)
+
+    def test_queries_and_diff(self):
+        query = shard_query('p.d.discount_requests', 1, parent_level=0, since=True)
+        self.assertIn('BIT_XOR(FARM_FINGERPRINT(TO_JSON_STRING([', query)
+        self.assertIn(f"{LEVELS[0][1]} = @parent", query)
+        self.assertIn('@since', query)
+        self.assertEqual(diff_shards({'a': (1, 5), 'b': (2, 7)}, {'a': (1, 5), 'c': (1, 1)}),
+                         {'b': ((2, 7), None), 'c': (None, (1, 1))})
+        with self.assertRaises(ValueError):
+            ConsistencyVerifier(None, PROJECT_ID, DATASET_ID, legacy_table='students')
+
+
+if __name__ == '__main__':
+    unittest.main()
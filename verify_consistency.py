@@ -0,0 +1,190 @@
+"""
+Sharded consistency check between the legacy and normalized request tables.
+
+Both sides are fingerprinted server-side: every row is hashed with
+FARM_FINGERPRINT over its compared columns, and the hashes are combined per
+shard with BIT_XOR (order independent) alongside a row count. Only the
+(shard, count, fingerprint) triples leave BigQuery. Shards whose triples
+differ are drilled into, each concurrently, one level at a time:
+
+    branch/month  ->  branch/day  ->  enquiry_no
+
+so a full-table check costs two grouped scans, plus a few small scans when
+something has drifted. The legacy side is `discount_requests` (or
+`request_state` when requests are event sourced); the normalized side is
+`discount_requests_legacy_view`, which renders the new tables in the legacy
+shape. Run it with ``migrate_database.py consistency``.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+VERIFY_WORKERS = int(os.getenv('VERIFY_WORKERS', 8))
+# Mismatching rows listed per kind in the report
+VERIFY_MAX_ROWS = int(os.getenv('VERIFY_MAX_ROWS', 100))
+
+LEGACY_TABLES = ('discount_requests', 'request_state')
+NORMALIZED_VIEW = 'discount_requests_legacy_view'
+
+# Columns both sides must agree on. Approver columns are left out: the legacy
+# table names the L1 approver at submission, the view only once they act.
+COMPARED_COLUMNS = [
+    ('enquiry_no', 'STRING'), ('student_name', 'STRING'), ('mobile_no', 'STRING'),
+    ('branch_name', 'STRING'), ('card_name', 'STRING'), ('requester_email', 'STRING'),
+    ('status', 'STRING'), ('mrp', 'AMOUNT'), ('discount_amount', 'AMOUNT'),
+]
+
+CREATED_DATE = "DATE(SAFE_CAST(created_at AS TIMESTAMP))"
+
+# (level name, shard expression); each level refines the one before it. Rows
+# with a missing or unparseable created_at share a 'no-date' shard per branch.
+LEVELS = [
+    ('branch_month', "CONCAT(IFNULL(branch_name, ''), '/', "
+                     f"IFNULL(FORMAT_DATE('%Y-%m', {CREATED_DATE}), 'no-date'))"),
+    ('branch_day', "CONCAT(IFNULL(branch_name, ''), '/', "
+                   f"IFNULL(FORMAT_DATE('%Y-%m-%d', {CREATED_DATE}), 'no-date'))"),
+    ('enquiry_no', "IFNULL(enquiry_no, '')"),
+]
+
+
+def _normalized(column, column_type):
+    # The same text on both sides, whatever the column types (FLOAT vs NUMERIC, STRING vs INT64)
+    if column_type == 'AMOUNT':
+        return f"FORMAT('%.2f', IFNULL(CAST({column} AS FLOAT64), 0))"
+    return f"IFNULL(CAST({column} AS STRING), '')"
+
+
+ROW_FINGERPRINT = ("FARM_FINGERPRINT(TO_JSON_STRING(["
+                   + ', '.join(_normalized(column, column_type) for column, column_type in COMPARED_COLUMNS)
+                   + "]))")
+
+
+def shard_query(table, level, parent_level=None, since=False):
+    """Per-shard row count and BIT_XOR fingerprint of a table at a level."""
+    conditions = []
+    if parent_level is not None:
+        conditions.append(f"{LEVELS[parent_level][1]} = @parent")
+    if since:
+        conditions.append(f"{CREATED_DATE} >= @since")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"""
+        SELECT {LEVELS[level][1]} AS shard, COUNT(*) AS row_count, BIT_XOR({ROW_FINGERPRINT}) AS fingerprint
+        FROM `{table}`
+        {where}
+        GROUP BY shard
+    """
+
+
+def diff_shards(legacy, normalized):
+    """Shards whose (count, fingerprint) differ: {shard: (legacy, normalized)}, None for a missing side."""
+    return {shard: (legacy.get(shard), normalized.get(shard))
+            for shard in set(legacy) | set(normalized)
+            if legacy.get(shard) != normalized.get(shard)}
+
+
+class ConsistencyReport:
+    def __init__(self):
+        self.shards_checked = [0] * len(LEVELS)
+        self.mismatched_shards = [[] for _ in LEVELS]
+        self.rows = {'missing': [], 'extra': [], 'different': []}
+        self._lock = threading.Lock()
+
+    def record(self, level, checked, mismatched):
+        with self._lock:
+            self.shards_checked[level] += checked
+            self.mismatched_shards[level] += sorted(mismatched)
+
+    @property
+    def consistent(self):
+        return not self.mismatched_shards[0]
+
+    def add_rows(self, kind, enquiry_numbers):
+        with self._lock:
+            self.rows[kind] = sorted(self.rows[kind] + enquiry_numbers)[:VERIFY_MAX_ROWS]
+
+    def summary(self):
+        lines = []
+        for (name, _), checked, mismatched in zip(LEVELS, self.shards_checked, self.mismatched_shards):
+            lines.append(f"{name:14} {checked:6} shards checked, {len(mismatched)} mismatched"
+                         + (f": {', '.join(sorted(mismatched)[:10])}" if mismatched else ''))
+        for kind, label in (('missing', 'missing from normalized'), ('extra', 'only in normalized'),
+                            ('different', 'different')):
+            if self.rows[kind]:
+                lines.append(f"{label}: {', '.join(self.rows[kind])}")
+        lines.append('CONSISTENT' if self.consistent else 'INCONSISTENT')
+        return '\n'.join(lines)
+
+
+class ConsistencyVerifier:
+    """Compares the legacy table with the normalized view, shard by shard."""
+
+    def __init__(self, client, project_id, dataset_id, legacy_table='discount_requests', workers=VERIFY_WORKERS):
+        if legacy_table not in LEGACY_TABLES:
+            raise ValueError(f"legacy_table must be one of {LEGACY_TABLES}")
+        self.client = client
+        self.tables = (f"{project_id}.{dataset_id}.{legacy_table}", f"{project_id}.{dataset_id}.{NORMALIZED_VIEW}")
+        self.workers = workers
+
+    def _fingerprints(self, table, level, parent=None, since=None):
+        """{shard: (row_count, fingerprint)} for one side."""
+        params = []
+        if parent is not None:
+            params.append(bigquery.ScalarQueryParameter('parent', 'STRING', parent))
+        if since is not None:
+            params.append(bigquery.ScalarQueryParameter('since', 'DATE', since))
+        query = shard_query(table, level, level - 1 if parent is not None else None, since is not None)
+        job_config = bigquery.QueryJobConfig(query_parameters=params)
+        return {row['shard']: (row['row_count'], row['fingerprint'])
+                for row in self.client.query(query, job_config=job_config).result()}
+
+    def _compare(self, executor, level, parent=None, since=None):
+        """Both sides of one shard (or the whole table), fetched concurrently."""
+        legacy, normalized = [future.result() for future in
+                              [executor.submit(self._fingerprints, table, level, parent, since)
+                               for table in self.tables]]
+        return diff_shards(legacy, normalized), len(set(legacy) | set(normalized))
+
+    def verify(self, since=None):
+        """Compare rows created on or after since (a date, or everything). Returns a ConsistencyReport."""
+        report = ConsistencyReport()
+        # Drill-downs wait on their fingerprint queries, so the two get separate pools
+        with ThreadPoolExecutor(max_workers=max(2, self.workers)) as queries, \
+                ThreadPoolExecutor(max_workers=max(1, self.workers // 2)) as drills:
+            mismatched, checked = self._compare(queries, 0, since=since)
+            report.record(0, checked, mismatched)
+            logger.info(f"{checked} {LEVELS[0][0]} shards checked, {len(mismatched)} mismatched")
+
+            pending = [drills.submit(self._drill, queries, report, 1, shard, since) for shard in mismatched]
+            while pending:
+                future = pending.pop()
+                pending += [drills.submit(self._drill, queries, report, level, shard, since)
+                            for level, shard in future.result()]
+        return report
+
+    def _drill(self, executor, report, level, parent, since=None):
+        """Compare one mismatched shard at the next level. Returns the (level, shard) pairs to drill next."""
+        mismatched, checked = self._compare(executor, level, parent, since)
+        report.record(level, checked, mismatched)
+        if level + 1 < len(LEVELS):
+            return [(level + 1, shard) for shard in mismatched]
+        for kind, enquiry_numbers in (
+                ('missing', [shard for shard, (legacy, normalized) in mismatched.items() if normalized is None]),
+                ('extra', [shard for shard, (legacy, normalized) in mismatched.items() if legacy is None]),
+                ('different', [shard for shard, (legacy, normalized) in mismatched.items()
+                               if legacy is not None and normalized is not None])):
+            report.add_rows(kind, enquiry_numbers)
+        return []
+
+
+def verify_consistency(client, project_id, dataset_id, legacy_table='discount_requests', since=None,
+                       workers=VERIFY_WORKERS):
+    """Run the verifier and log its summary. Returns the ConsistencyReport."""
+    report = ConsistencyVerifier(client, project_id, dataset_id, legacy_table, workers).verify(since)
+    for line in report.summary().splitlines():
+        logger.info(line)
+    return report